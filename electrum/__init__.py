@@ -12,19 +12,43 @@ if is_local and os.name == 'nt':
 
 
 from .version import ELECTRUM_VERSION
-from .util import format_satoshis
-from .wallet import Wallet
-from .storage import WalletStorage
-from .coinchooser import COIN_CHOOSERS
-from .network import Network, pick_random_server
-from .interface import Interface
-from .simple_config import SimpleConfig
-from . import bitcoin
-from . import transaction
-from . import daemon
-from .transaction import Transaction
-from .plugin import BasePlugin
-from .commands import Commands, known_commands
 
 
 __version__ = ELECTRUM_VERSION
+
+
+# The names below are imported on first use, so that importing a submodule
+# (e.g. to forward a command to the daemon) does not import the whole package.
+_lazy_attributes = {
+    'format_satoshis': ('.util', 'format_satoshis'),
+    'Wallet': ('.wallet', 'Wallet'),
+    'WalletStorage': ('.storage', 'WalletStorage'),
+    'COIN_CHOOSERS': ('.coinchooser', 'COIN_CHOOSERS'),
+    'Network': ('.network', 'Network'),
+    'pick_random_server': ('.network', 'pick_random_server'),
+    'Interface': ('.interface', 'Interface'),
+    'SimpleConfig': ('.simple_config', 'SimpleConfig'),
+    'Transaction': ('.transaction', 'Transaction'),
+    'BasePlugin': ('.plugin', 'BasePlugin'),
+    'Commands': ('.commands', 'Commands'),
+    'known_commands': ('.commands', 'known_commands'),
+}
+
+
+def __getattr__(name):
+    import importlib
+    if name in _lazy_attributes:
+        module_name, attr_name = _lazy_attributes[name]
+        value = getattr(importlib.import_module(module_name, __name__), attr_name)
+    elif name.startswith('__'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    else:
+        # submodules used to be imported as a side effect, e.g. electrum.bitcoin
+        try:
+            value = importlib.import_module('.' + name, __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f'{__name__}.{name}':
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
@@ -24,6 +24,7 @@
 # SOFTWARE.
 
 import hashlib
+import functools
 from typing import List, Tuple, TYPE_CHECKING, Optional, Union, Sequence
 import enum
 from enum import IntEnum, Enum
@@ -458,8 +459,19 @@ def script_to_address(script: str, *, net=None) -> str:
     return get_address_from_output_script(bfh(script), net=net)
 
 
+# max number of entries in the caches of address <-> script conversions
+ADDRESS_CACHE_SIZE = 2 ** 14
+
+
 def address_to_script(addr: str, *, net=None) -> str:
     if net is None: net = constants.net
+    if not isinstance(addr, str):  # not cached
+        return _address_to_script.__wrapped__(addr, net)
+    return _address_to_script(addr, net)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _address_to_script(addr: str, net) -> str:
     if not is_address(addr, net=net):
         raise BitcoinException(f"invalid bitcoin address: {addr}")
     witver, witprog = segwit_addr.decode_segwit_address(net.SEGWIT_HRP, addr)
@@ -549,34 +561,43 @@ assert len(__b43chars) == 43
 class BaseDecodeError(BitcoinException): pass
 
 
+def _make_base_decode_table(chars: bytes) -> bytes:
+    table = bytearray([0xff] * 256)
+    for digit, c in enumerate(chars):
+        table[c] = digit
+    return bytes(table)
+
+
+_BASE_CHARS = {58: __b58chars, 43: __b43chars}
+_BASE_DECODE_TABLES = {base: _make_base_decode_table(chars) for base, chars in _BASE_CHARS.items()}
+# Number of digits that are converted at once using small ints.
+# The big int arithmetic, which is slow, is then only done once per chunk.
+_BASE_CHUNK_DIGITS = {58: 10, 43: 11}  # 58**10 and 43**11 fit in 63 bits
+
+
 def base_encode(v: bytes, *, base: int) -> str:
     """ encode v, which is a string of bytes, to base58."""
     assert_bytes(v)
     if base not in (58, 43):
         raise ValueError('not supported base: {}'.format(base))
-    chars = __b58chars
-    if base == 43:
-        chars = __b43chars
-    long_value = 0
-    power_of_base = 1
-    for c in v[::-1]:
-        # naive but slow variant:   long_value += (256**i) * c
-        long_value += power_of_base * c
-        power_of_base <<= 8
+    chars = _BASE_CHARS[base]
+    chunk_digits = _BASE_CHUNK_DIGITS[base]
+    chunk_base = base ** chunk_digits
+    long_value = int.from_bytes(v, byteorder='big')
     result = bytearray()
-    while long_value >= base:
-        div, mod = divmod(long_value, base)
-        result.append(chars[mod])
-        long_value = div
-    result.append(chars[long_value])
+    while long_value:
+        long_value, chunk = divmod(long_value, chunk_base)
+        for _ in range(chunk_digits):
+            chunk, mod = divmod(chunk, base)
+            result.append(chars[mod])
+    # the most significant chunk was zero-padded
+    while result and result[-1] == chars[0]:
+        result.pop()
+    if not result:
+        result.append(chars[0])
     # Bitcoin does a little leading-zero-compression:
     # leading 0-bytes in the input become leading-1s
-    nPad = 0
-    for c in v:
-        if c == 0x00:
-            nPad += 1
-        else:
-            break
+    nPad = len(v) - len(v.lstrip(b'\x00'))
     result.extend([chars[0]] * nPad)
     result.reverse()
     return result.decode('ascii')
@@ -588,35 +609,25 @@ def base_decode(v: Union[bytes, str], *, base: int, length: int = None) -> Optio
     v = to_bytes(v, 'ascii')
     if base not in (58, 43):
         raise ValueError('not supported base: {}'.format(base))
-    chars = __b58chars
-    if base == 43:
-        chars = __b43chars
+    chars = _BASE_CHARS[base]
+    digits = v.translate(_BASE_DECODE_TABLES[base])
+    if b'\xff' in digits:
+        c = v[digits.index(b'\xff')]
+        raise BaseDecodeError('Forbidden character {} for base {}'.format(c, base))
+    chunk_digits = _BASE_CHUNK_DIGITS[base]
     long_value = 0
-    power_of_base = 1
-    for c in v[::-1]:
-        digit = chars.find(bytes([c]))
-        if digit == -1:
-            raise BaseDecodeError('Forbidden character {} for base {}'.format(c, base))
-        # naive but slow variant:   long_value += digit * (base**i)
-        long_value += digit * power_of_base
-        power_of_base *= base
-    result = bytearray()
-    while long_value >= 256:
-        div, mod = divmod(long_value, 256)
-        result.append(mod)
-        long_value = div
-    result.append(long_value)
-    nPad = 0
-    for c in v:
-        if c == chars[0]:
-            nPad += 1
-        else:
-            break
-    result.extend(b'\x00' * nPad)
+    for i in range(0, len(digits), chunk_digits):
+        chunk = digits[i:i+chunk_digits]
+        chunk_value = 0
+        for digit in chunk:
+            chunk_value = chunk_value * base + digit
+        long_value = long_value * base ** len(chunk) + chunk_value
+    result = long_value.to_bytes(max(1, (long_value.bit_length() + 7) // 8), byteorder='big')
+    nPad = len(v) - len(v.lstrip(chars[0:1]))
+    result = bytes(nPad) + result
     if length is not None and len(result) != length:
         return None
-    result.reverse()
-    return bytes(result)
+    return result
 
 
 class InvalidChecksum(BaseDecodeError):
@@ -750,6 +761,13 @@ def is_b58_address(addr: str, *, net=None) -> bool:
 
 def is_address(addr: str, *, net=None) -> bool:
     if net is None: net = constants.net
+    if not isinstance(addr, str):  # not cached
+        return _is_address.__wrapped__(addr, net)
+    return _is_address(addr, net)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _is_address(addr: str, net) -> bool:
     return is_segwit_address(addr, net=net) \
            or is_b58_address(addr, net=net)
 
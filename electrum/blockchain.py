@@ -636,7 +636,10 @@ class Blockchain(Logger):
             return False
         return True
 
+    @with_lock
     def connect_chunk(self, idx: int, hexdata: str) -> bool:
+        # note: this might run in another thread than the event loop, so the
+        #       chunk is verified and saved without releasing the lock
         assert idx >= 0, idx
         try:
             data = bfh(hexdata)
@@ -36,7 +36,7 @@ from enum import IntEnum
 
 from aiorpcx import NetAddress
 
-from .sql_db import SqlDB, sql
+from .sql_db import SqlDB, sql, sql_batched
 from . import constants, util
 from .util import bh2u, profiler, get_headers_dir, is_ip_address, json_normalize
 from .logging import Logger
@@ -302,6 +302,8 @@ PRIMARY KEY(node_id)
 class ChannelDB(SqlDB):
 
     NUM_MAX_RECENT_PEERS = 20
+    # gossip can be re-downloaded, no need to fsync every transaction
+    SYNCHRONOUS = 'NORMAL'
 
     def __init__(self, network: 'Network'):
         path = os.path.join(get_headers_dir(network.config), 'gossip_db')
@@ -524,11 +526,11 @@ class ChannelDB(SqlDB):
         c.execute(create_channel_info)
         self.conn.commit()
 
-    @sql
-    def _db_save_policy(self, key: bytes, msg: bytes):
-        # 'msg' is a 'channel_update' message
+    @sql_batched
+    def _db_save_policy(self, rows: Sequence[Tuple[bytes, bytes]]):
+        # rows of (key, msg), where 'msg' is a 'channel_update' message
         c = self.conn.cursor()
-        c.execute("""REPLACE INTO policy (key, msg) VALUES (?,?)""", [key, msg])
+        c.executemany("""REPLACE INTO policy (key, msg) VALUES (?,?)""", rows)
 
     @sql
     def _db_delete_policy(self, node_id: bytes, short_channel_id: ShortChannelID):
@@ -536,22 +538,22 @@ class ChannelDB(SqlDB):
         c = self.conn.cursor()
         c.execute("""DELETE FROM policy WHERE key=?""", (key,))
 
-    @sql
-    def _db_save_channel(self, short_channel_id: ShortChannelID, msg: bytes):
-        # 'msg' is a 'channel_announcement' message
+    @sql_batched
+    def _db_save_channel(self, rows: Sequence[Tuple[ShortChannelID, bytes]]):
+        # rows of (short_channel_id, msg), where 'msg' is a 'channel_announcement' message
         c = self.conn.cursor()
-        c.execute("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", [short_channel_id, msg])
+        c.executemany("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", rows)
 
     @sql
     def _db_delete_channel(self, short_channel_id: ShortChannelID):
         c = self.conn.cursor()
         c.execute("""DELETE FROM channel_info WHERE short_channel_id=?""", (short_channel_id,))
 
-    @sql
-    def _db_save_node_info(self, node_id: bytes, msg: bytes):
-        # 'msg' is a 'node_announcement' message
+    @sql_batched
+    def _db_save_node_info(self, rows: Sequence[Tuple[bytes, bytes]]):
+        # rows of (node_id, msg), where 'msg' is a 'node_announcement' message
         c = self.conn.cursor()
-        c.execute("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", [node_id, msg])
+        c.executemany("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", rows)
 
     @sql
     def _db_save_node_address(self, peer: LNPeerAddr, timestamp: int):
@@ -24,7 +24,7 @@
 # SOFTWARE.
 from collections import defaultdict
 from math import floor, log10
-from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple
+from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple, Optional
 from decimal import Decimal
 
 from .bitcoin import sha256, COIN, is_address
@@ -87,6 +87,19 @@ class ScoredCandidate(NamedTuple):
     buckets: List[Bucket]
 
 
+class SelectionParams(NamedTuple):
+    """What make_tx knows about the tx being built, for choosers that
+    want to reason about candidates without constructing transactions."""
+    input_value: int              # value of fixed inputs. in satoshis
+    spent_amount: int             # value of fixed outputs. in satoshis
+    base_weight: int              # weight of tx without new inputs and change
+    output_values: List[int]      # values of fixed outputs. in satoshis
+    change_addrs: Sequence[str]
+    fixed_inputs: List[PartialTxInput]
+    fee_estimator_w: Callable[[int], int]
+    dust_threshold: int
+
+
 def strip_unneeded(bkts: List[Bucket], sufficient_funds) -> List[Bucket]:
     '''Remove buckets that are unnecessary in achieving the spend amount'''
     if sufficient_funds([], bucket_value_sum=0):
@@ -324,6 +337,15 @@ class CoinChooserBase(Logger):
                                                             dust_threshold=dust_threshold,
                                                             base_weight=base_weight)
 
+        self.params = SelectionParams(input_value=input_value,
+                                      spent_amount=spent_amount,
+                                      base_weight=base_weight,
+                                      output_values=[o.value for o in base_tx.outputs()],
+                                      change_addrs=change_addrs,
+                                      fixed_inputs=inputs,
+                                      fee_estimator_w=fee_estimator_w,
+                                      dust_threshold=dust_threshold)
+
         # Collect the coins into buckets
         all_buckets = self.bucketize_coins(coins, fee_estimator_vb=fee_estimator_vb)
         # Filter some buckets out. Only keep those that have positive effective value.
@@ -459,25 +481,206 @@ class CoinChooserPrivacy(CoinChooserRandom):
             badness = len(buckets) - 1
             tx, change_outputs = tx_from_buckets(buckets)
             change = sum(o.value for o in change_outputs)
-            # Penalize change not roughly in output range
-            if change == 0:
-                pass  # no change is great!
-            elif change < min_change:
-                badness += (min_change - change) / (min_change + 10000)
-                # Penalize really small change; under 1 mBTC ~= using 1 more input
-                if change < COIN / 1000:
-                    badness += 1
-            elif change > max_change:
-                badness += (change - max_change) / (max_change + 10000)
-                # Penalize large change; 5 BTC excess ~= using 1 more input
-                badness += change / (COIN * 5)
+            badness += self.change_penalty(change, min_change=min_change, max_change=max_change)
             return ScoredCandidate(badness, tx, buckets)
 
         return penalty
 
+    @classmethod
+    def change_penalty(cls, change: int, *, min_change, max_change) -> float:
+        # Penalize change not roughly in output range
+        badness = 0
+        if change == 0:
+            pass  # no change is great!
+        elif change < min_change:
+            badness += (min_change - change) / (min_change + 10000)
+            # Penalize really small change; under 1 mBTC ~= using 1 more input
+            if change < COIN / 1000:
+                badness += 1
+        elif change > max_change:
+            badness += (change - max_change) / (max_change + 10000)
+            # Penalize large change; 5 BTC excess ~= using 1 more input
+            badness += change / (COIN * 5)
+        return badness
+
+
+class CoinChooserBranchAndBound(CoinChooserPrivacy):
+    """Tries to avoid creating change.
+    Coins are grouped by address, as with the Privacy coin chooser.
+    A branch-and-bound search looks for a set of coins that pays for
+    the outputs and the fee, with the excess being less than what a change
+    output would cost. Such a transaction has no change output at all,
+    which is cheaper and leaks less information about the sender.
+    If no such set is found, falls back to the Privacy coin chooser.
+    Candidates are compared using weight estimates, and only the selected
+    one is turned into a transaction, which makes this chooser fast for
+    wallets with many coins.
+    """
+
+    # max number of search steps, see Bitcoin Core's SelectCoinsBnB
+    BNB_MAX_TRIES = 100_000
+
+    def _change_output_weight(self, buckets: Sequence[Bucket]) -> int:
+        params = self.params
+        if params.change_addrs:
+            change_addr = params.change_addrs[0]
+        else:
+            # change would be sent back to the first input's address
+            coins = list(params.fixed_inputs) + [coin for b in buckets for coin in b.coins]
+            change_addr = coins[0].address if coins else None
+        if not change_addr:
+            return 4 * 43  # guess p2wsh; the largest common scriptpubkey
+        return 4 * Transaction.estimated_output_size_for_address(change_addr)
+
+    def _estimated_change(self, buckets: Sequence[Bucket], *, value_sum: int, change_weight: int) -> int:
+        """Estimate the total value of change outputs, if we spent buckets.
+        Returns a negative number if the buckets are insufficient.
+        """
+        params = self.params
+        tx_weight = self._get_tx_weight(buckets, base_weight=params.base_weight)
+        excess = params.input_value + value_sum - params.spent_amount
+        fee = params.fee_estimator_w(tx_weight)
+        if excess < fee:
+            return excess - fee
+        change = excess - params.fee_estimator_w(tx_weight + change_weight)
+        return change if change >= params.dust_threshold else 0
+
+    def branch_and_bound(self, buckets: List[Bucket], *, change_weight: int) -> Optional[List[Bucket]]:
+        """Returns a set of buckets for which no change output is needed,
+        or None if we could not find one.
+
+        This is a depth-first search over the buckets sorted by decreasing
+        effective value, where at each step we either include or omit the
+        next bucket. Branches that overshoot the target by more than the
+        cost of change, or that can no longer reach it, are pruned.
+        Sums are tracked incrementally, so that each step is constant time.
+        Of all solutions found, the one spending the least value
+        (i.e. paying the least fee plus excess) is returned.
+        """
+        params = self.params
+        fee_w = params.fee_estimator_w
+        base_weight = params.base_weight
+        # fees paid by the parts of the tx that are already fixed
+        target = params.spent_amount - params.input_value + fee_w(base_weight)
+        # if the excess is below this, the change output would not be created anyway
+        cost_of_change = (fee_w(base_weight + change_weight) - fee_w(base_weight)
+                          + params.dust_threshold)
+
+        # as effective values are positive, a bucket that overshoots on its own
+        # cannot be part of any solution
+        pool = [b for b in buckets if b.effective_value <= target + cost_of_change]
+        pool.sort(key=lambda b: b.effective_value, reverse=True)
+        eff_values = [b.effective_value for b in pool]
+        values = [b.value for b in pool]
+        weights = [b.weight for b in pool]
+        witness = [b.witness for b in pool]
+        num_legacy = [0 if b.witness else len(b.coins) for b in pool]
+
+        lookahead = sum(eff_values)
+        if lookahead < target:
+            return None
+        # note: the pool might be empty here, if the fixed inputs are sufficient
+
+        selection = []  # type: List[int]  # indices into pool
+        curr_eff_value = 0
+        curr_value = 0
+        curr_weight = 0
+        curr_num_witness = 0
+        curr_num_legacy = 0
+        best_selection = None
+        best_value = None
+        index = 0
+        for _ in range(self.BNB_MAX_TRIES):
+            backtrack = False
+            if (curr_eff_value + lookahead < target
+                    or curr_eff_value > target + cost_of_change
+                    or (best_value is not None and curr_value >= best_value)):
+                backtrack = True
+            elif curr_eff_value >= target:
+                backtrack = True
+                # effective values are only an estimate; check with the actual tx weight
+                tx_weight = base_weight + curr_weight
+                if curr_num_witness:
+                    tx_weight += 2 + curr_num_legacy  # see _get_tx_weight
+                excess = params.input_value + curr_value - params.spent_amount - fee_w(tx_weight)
+                # note: any bitcoin tx must have at least 1 input by consensus
+                has_inputs = bool(selection or params.fixed_inputs)
+                if has_inputs and 0 <= excess < cost_of_change:
+                    # both the fee and the excess are lost to the miner,
+                    # so the best solution is the one that spends the least
+                    best_selection = selection[:]
+                    best_value = curr_value
+            if backtrack:
+                if not selection:
+                    break  # search space exhausted
+                # put omitted buckets back into lookahead, then omit the last included one
+                index -= 1
+                while index > selection[-1]:
+                    lookahead += eff_values[index]
+                    index -= 1
+                selection.pop()
+                curr_eff_value -= eff_values[index]
+                curr_value -= values[index]
+                curr_weight -= weights[index]
+                curr_num_witness -= witness[index]
+                curr_num_legacy -= num_legacy[index]
+            else:
+                lookahead -= eff_values[index]
+                # omitting a bucket and then including an equivalent one
+                # results in the same sums as the branch already explored
+                if (not selection or index - 1 == selection[-1]
+                        or eff_values[index] != eff_values[index - 1]
+                        or weights[index] != weights[index - 1]):
+                    selection.append(index)
+                    curr_eff_value += eff_values[index]
+                    curr_value += values[index]
+                    curr_weight += weights[index]
+                    curr_num_witness += witness[index]
+                    curr_num_legacy += num_legacy[index]
+            index += 1
+        if best_selection is None:
+            return None
+        return [pool[i] for i in best_selection]
+
+    def choose_buckets(self, buckets, sufficient_funds, penalty_func):
+        # prefer confirmed coins, similar to bucket_candidates_prefer_confirmed
+        conf_buckets = [bkt for bkt in buckets if bkt.min_height > 0]
+        unconf_buckets = [bkt for bkt in buckets if bkt.min_height == 0]
+        other_buckets = [bkt for bkt in buckets if bkt.min_height < 0]
+        change_weight = self._change_output_weight(buckets)
+        bucket_sets = [conf_buckets, conf_buckets + unconf_buckets, buckets]
+        if not (unconf_buckets or other_buckets):
+            bucket_sets = bucket_sets[:1]
+        for bkts in bucket_sets:
+            selected = self.branch_and_bound(bkts, change_weight=change_weight)
+            if selected is not None:
+                self.logger.info(f"Total number of buckets: {len(buckets)}")
+                self.logger.info(f"found changeless solution with {len(selected)} buckets")
+                return penalty_func(selected)
+
+        # No changeless solution. Score the random candidates without
+        # building transactions, and only build the tx for the winner.
+        candidates = self.bucket_candidates_prefer_confirmed(buckets, sufficient_funds)
+        output_values = self.params.output_values
+        min_change = min(output_values) * 0.75
+        max_change = max(output_values) * 1.33
+
+        def estimated_penalty(cand: List[Bucket]) -> float:
+            change = self._estimated_change(cand, value_sum=sum(b.value for b in cand),
+                                            change_weight=change_weight)
+            return len(cand) - 1 + self.change_penalty(max(change, 0), min_change=min_change,
+                                                       max_change=max_change)
+
+        winner = min(candidates, key=estimated_penalty)
+        self.logger.info(f"Total number of buckets: {len(buckets)}")
+        self.logger.info(f"Num candidates considered: {len(candidates)}. "
+                         f"Winning estimated penalty: {estimated_penalty(winner)}")
+        return penalty_func(winner)
+
 
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
+    'BranchAndBound': CoinChooserBranchAndBound,
 }
 
 def get_name(config):
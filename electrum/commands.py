@@ -23,6 +23,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import sys
 import datetime
 import copy
@@ -33,40 +34,32 @@ import base64
 import operator
 import asyncio
 import inspect
+import concurrent.futures
+import weakref
 from collections import defaultdict
 from functools import wraps, partial
+import itertools
 from itertools import repeat
 from decimal import Decimal
-from typing import Optional, TYPE_CHECKING, Dict, List
+from typing import Optional, TYPE_CHECKING, Dict, List, Iterable, Iterator, Callable, Tuple, Any
 
 from .import util, ecc
 from .util import (bfh, bh2u, format_satoshis, json_decode, json_normalize,
-                   is_hash256_str, is_hex_str, to_bytes, parse_max_spend)
+                   is_hash256_str, is_hex_str, to_bytes, parse_max_spend, MyEncoder)
 from . import bitcoin
 from .bitcoin import is_address,  hash_160, COIN
-from .bip32 import BIP32Node
 from .i18n import _
-from .transaction import (Transaction, multisig_script, TxOutput, PartialTransaction, PartialTxOutput,
-                          tx_from_any, PartialTxInput, TxOutpoint)
-from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED
-from .synchronizer import Notifier
-from .wallet import Abstract_Wallet, create_new_wallet, restore_wallet_from_text, Deterministic_Wallet, BumpFeeStrategy
-from .address_synchronizer import TX_HEIGHT_LOCAL
-from .mnemonic import Mnemonic
-from .lnutil import SENT, RECEIVED
-from .lnutil import LnFeatures
-from .lnutil import extract_nodeid
-from .lnpeer import channel_id_from_funding_tx
-from .plugin import run_hook
 from .version import ELECTRUM_VERSION
 from .simple_config import SimpleConfig
-from .invoices import LNInvoice
-from . import submarine_swaps
 
+# note: the wallet, transaction and lightning modules are imported inside the
+#       commands that use them. This module is also imported to parse the
+#       command line of a client that only forwards the command to the daemon.
 
 if TYPE_CHECKING:
     from .network import Network
     from .daemon import Daemon
+    from .wallet import Abstract_Wallet
 
 
 known_commands = {}  # type: Dict[str, Command]
@@ -87,6 +80,97 @@ def format_satoshis(x):
     return str(Decimal(x)/COIN) if x is not None else None
 
 
+# Commands that are defined as regular functions (not coroutines) are considered
+# CPU-bound. They are run on these threads, so that they do not block the event loop.
+# note: they rely on the wallet's own locking, as the wallet is also used from the
+#       event loop meanwhile. Holding the wallet lock for the whole command would block
+#       the event loop again.
+_cpu_bound_commands_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4,
+    thread_name_prefix='cpu_bound_command',
+)
+
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """Runs func on the thread pool of CPU-bound commands."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_cpu_bound_commands_executor, partial(func, *args, **kwargs))
+
+
+# Coin selection runs on the thread pool, and the resulting tx is only added to the
+# wallet afterwards. Commands that do both hold this lock, so that concurrent
+# calls (e.g. in a batch request) do not select the same coins.
+_wallet_spend_locks = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary[Abstract_Wallet, asyncio.Lock]
+
+
+def get_wallet_spend_lock(wallet: 'Abstract_Wallet') -> asyncio.Lock:
+    lock = _wallet_spend_locks.get(wallet)
+    if lock is None:
+        lock = _wallet_spend_locks[wallet] = asyncio.Lock()
+    return lock
+
+
+def skip_past(items: Iterable, *, key: Callable[[Any], str], after: Optional[str]) -> Iterator:
+    """Yields the items following the one whose key is 'after' (a pagination cursor)."""
+    items = iter(items)
+    if after is not None:
+        for item in items:
+            if key(item) == after:
+                break
+        else:
+            raise Exception(f'cursor not found: {after}')
+    yield from items
+
+
+def take_page(items: Iterable, *, key: Callable[[Any], str], limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    """Returns the first 'limit' items, and the cursor of the next page,
+    or None if there are no more items.
+    """
+    if limit is None:
+        return list(items), None
+    if limit < 1:
+        raise Exception('limit must be positive')
+    page = list(itertools.islice(items, limit + 1))
+    if len(page) <= limit:
+        return page, None
+    del page[limit:]
+    return page, key(page[-1])
+
+
+def write_ndjson(path: str, items: Iterable) -> int:
+    """Writes items to a file as newline-delimited JSON, one at a time.
+    Returns the number of items written.
+    """
+    path = os.path.expanduser(path)
+    if not os.path.isabs(path):
+        raise Exception('output_file must be an absolute path')
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item, cls=MyEncoder))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def paginate(items: Iterable, name: str, *, key: Callable[[Any], str],
+             limit: Optional[int], output_file: Optional[str], normalize=None) -> dict:
+    """Common implementation of the 'limit' and 'output_file' options of list commands.
+    note: the 'after' cursor should be applied by the caller, before filtering,
+          so that the cursor can still be found if the filtered item changed.
+    """
+    if output_file is not None:
+        if limit is not None:
+            items = itertools.islice(items, limit)
+        if normalize:
+            items = map(normalize, items)
+        return {'output_file': output_file, 'count': write_ndjson(output_file, items)}
+    page, next_cursor = take_page(items, key=key, limit=limit)
+    if normalize:
+        page = [normalize(x) for x in page]
+    return {name: json_normalize(page), 'next': next_cursor}
+
+
 class Command:
     def __init__(self, func, s):
         self.name = func.__name__
@@ -94,6 +178,7 @@ class Command:
         self.requires_wallet = 'w' in s
         self.requires_password = 'p' in s
         self.requires_lightning = 'l' in s
+        self.is_cpu_bound = not asyncio.iscoroutinefunction(func)
         self.description = func.__doc__
         self.help = self.description.split('.')[0] if self.description else None
         varnames = func.__code__.co_varnames[1:func.__code__.co_argcount]
@@ -148,6 +233,8 @@ def command(s):
                 raise Exception('Password required')
             if cmd.requires_lightning and (not wallet or not wallet.has_lightning()):
                 raise Exception('Lightning not enabled in this wallet')
+            if cmd.is_cpu_bound:
+                return await run_cpu_bound(func, *args, **kwargs)
             return await func(*args, **kwargs)
         return func_wrapper
     return decorator
@@ -220,6 +307,34 @@ class Commands:
         await self.daemon.stop()
         return "Daemon stopped"
 
+    @command('n')
+    async def getrpcstats(self):
+        """Call counts and latency histograms of the JSON-RPC methods of the daemon.
+        Histogram buckets ('histogram') are upper bounds in seconds."""
+        if not self.daemon.commands_server:
+            raise Exception('JSON-RPC server is not running')
+        return self.daemon.commands_server.rpc_stats.to_json()
+
+    @command('n')
+    async def getlooplag(self):
+        """How late the event loop of the daemon ran its timers, because it was busy.
+        Histogram buckets ('histogram') are upper bounds in seconds."""
+        return self.daemon.loop_lag_monitor.lag_stats.to_json()
+
+    @command('n')
+    async def getsubscriptionstats(self):
+        """Number of subscriptions to the server per method, shared by all wallets,
+        and the number of requests that were shared between wallets."""
+        return self.network.get_subscription_stats()
+
+    @command('n')
+    async def getmetrics(self):
+        """Metrics of the daemon, in the Prometheus text format: event loop lag,
+        JSON-RPC latencies and requests of the network jobs. Event fan-out,
+        callback durations and profiled functions are included if the daemon
+        runs with the 'enable_metrics' config variable set."""
+        return self.daemon.get_metrics()
+
     @command('n')
     async def list_wallets(self):
         """List wallets open in daemon"""
@@ -229,6 +344,7 @@ class Commands:
     @command('n')
     async def load_wallet(self, wallet_path=None, password=None):
         """Open wallet in daemon"""
+        from .plugin import run_hook
         wallet = self.daemon.load_wallet(wallet_path, password, manual_upgrades=False)
         if wallet is not None:
             run_hook('load_wallet', wallet, None)
@@ -245,6 +361,7 @@ class Commands:
         """Create a new wallet.
         If you want to be prompted for an argument, type '?' or ':' (concealed)
         """
+        from .wallet import create_new_wallet
         d = create_new_wallet(path=wallet_path,
                               passphrase=passphrase,
                               password=password,
@@ -264,6 +381,7 @@ class Commands:
         or bitcoin private keys.
         If you want to be prompted for an argument, type '?' or ':' (concealed)
         """
+        from .wallet import restore_wallet_from_text
         # TODO create a separate command that blocks until wallet is synced
         d = restore_wallet_from_text(text,
                                      path=wallet_path,
@@ -277,7 +395,7 @@ class Commands:
         }
 
     @command('wp')
-    async def password(self, password=None, new_password=None, wallet: Abstract_Wallet = None):
+    async def password(self, password=None, new_password=None, wallet: 'Abstract_Wallet' = None):
         """Change wallet password. """
         if wallet.storage.is_encrypted_with_hw_device() and new_password:
             raise Exception("Can't change the password of a wallet encrypted with a hw device.")
@@ -287,7 +405,7 @@ class Commands:
         return {'password':wallet.has_password()}
 
     @command('w')
-    async def get(self, key, wallet: Abstract_Wallet = None):
+    async def get(self, key, wallet: 'Abstract_Wallet' = None):
         """Return item from wallet storage"""
         return wallet.db.get(key)
 
@@ -340,7 +458,7 @@ class Commands:
         return await self.network.get_history_for_scripthash(sh)
 
     @command('w')
-    async def listunspent(self, wallet: Abstract_Wallet = None):
+    def listunspent(self, wallet: 'Abstract_Wallet' = None):
         """List unspent outputs. Returns the list of unspent transaction
         outputs in your wallet."""
         coins = []
@@ -365,6 +483,7 @@ class Commands:
         Inputs must have a redeemPubkey.
         Outputs must be a list of {'address':address, 'value':satoshi_amount}.
         """
+        from .transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
         keypairs = {}
         inputs = []  # type: List[PartialTxInput]
         locktime = jsontx.get('locktime', 0)
@@ -397,8 +516,9 @@ class Commands:
         return tx.serialize()
 
     @command('')
-    async def signtransaction_with_privkey(self, tx, privkey):
+    def signtransaction_with_privkey(self, tx, privkey):
         """Sign a transaction. The provided list of private keys will be used to sign the transaction."""
+        from .transaction import tx_from_any
         tx = tx_from_any(tx)
 
         txins_dict = defaultdict(list)
@@ -421,8 +541,9 @@ class Commands:
         return tx.serialize()
 
     @command('wp')
-    async def signtransaction(self, tx, password=None, wallet: Abstract_Wallet = None):
+    def signtransaction(self, tx, password=None, wallet: 'Abstract_Wallet' = None):
         """Sign a transaction. The wallet keys will be used to sign the transaction."""
+        from .transaction import tx_from_any
         tx = tx_from_any(tx)
         wallet.sign_transaction(tx, password)
         return tx.serialize()
@@ -430,12 +551,14 @@ class Commands:
     @command('')
     async def deserialize(self, tx):
         """Deserialize a serialized transaction"""
+        from .transaction import tx_from_any
         tx = tx_from_any(tx)
         return tx.to_json()
 
     @command('n')
     async def broadcast(self, tx):
         """Broadcast a transaction to the network. """
+        from .transaction import Transaction
         tx = Transaction(tx)
         await self.network.broadcast_transaction(tx)
         return tx.txid()
@@ -443,35 +566,36 @@ class Commands:
     @command('')
     async def createmultisig(self, num, pubkeys):
         """Create multisig address"""
+        from .transaction import multisig_script
         assert isinstance(pubkeys, list), (type(num), type(pubkeys))
         redeem_script = multisig_script(pubkeys, num)
         address = bitcoin.hash160_to_p2sh(hash_160(bfh(redeem_script)))
         return {'address':address, 'redeemScript':redeem_script}
 
     @command('w')
-    async def freeze(self, address: str, wallet: Abstract_Wallet = None):
+    async def freeze(self, address: str, wallet: 'Abstract_Wallet' = None):
         """Freeze address. Freeze the funds at one of your wallet\'s addresses"""
         return wallet.set_frozen_state_of_addresses([address], True)
 
     @command('w')
-    async def unfreeze(self, address: str, wallet: Abstract_Wallet = None):
+    async def unfreeze(self, address: str, wallet: 'Abstract_Wallet' = None):
         """Unfreeze address. Unfreeze the funds at one of your wallet\'s address"""
         return wallet.set_frozen_state_of_addresses([address], False)
 
     @command('w')
-    async def freeze_utxo(self, coin: str, wallet: Abstract_Wallet = None):
+    async def freeze_utxo(self, coin: str, wallet: 'Abstract_Wallet' = None):
         """Freeze a UTXO so that the wallet will not spend it."""
         wallet.set_frozen_state_of_coins([coin], True)
         return True
 
     @command('w')
-    async def unfreeze_utxo(self, coin: str, wallet: Abstract_Wallet = None):
+    async def unfreeze_utxo(self, coin: str, wallet: 'Abstract_Wallet' = None):
         """Unfreeze a UTXO so that the wallet might spend it."""
         wallet.set_frozen_state_of_coins([coin], False)
         return True
 
     @command('wp')
-    async def getprivatekeys(self, address, password=None, wallet: Abstract_Wallet = None):
+    async def getprivatekeys(self, address, password=None, wallet: 'Abstract_Wallet' = None):
         """Get private keys of addresses. You may pass a single wallet address, or a list of wallet addresses."""
         if isinstance(address, str):
             address = address.strip()
@@ -481,14 +605,14 @@ class Commands:
         return [wallet.export_private_key(address, password) for address in domain]
 
     @command('wp')
-    async def getprivatekeyforpath(self, path, password=None, wallet: Abstract_Wallet = None):
+    async def getprivatekeyforpath(self, path, password=None, wallet: 'Abstract_Wallet' = None):
         """Get private key corresponding to derivation path (address index).
         'path' can be either a str such as "m/0/50", or a list of ints such as [0, 50].
         """
         return wallet.export_private_key_for_path(path, password)
 
     @command('w')
-    async def ismine(self, address, wallet: Abstract_Wallet = None):
+    async def ismine(self, address, wallet: 'Abstract_Wallet' = None):
         """Check if address is in wallet. Return true if and only address is in wallet"""
         return wallet.is_mine(address)
 
@@ -503,12 +627,12 @@ class Commands:
         return is_address(address)
 
     @command('w')
-    async def getpubkeys(self, address, wallet: Abstract_Wallet = None):
+    async def getpubkeys(self, address, wallet: 'Abstract_Wallet' = None):
         """Return the public keys for a wallet address. """
         return wallet.get_public_keys(address)
 
     @command('w')
-    async def getbalance(self, wallet: Abstract_Wallet = None):
+    async def getbalance(self, wallet: 'Abstract_Wallet' = None):
         """Return the balance of your wallet. """
         c, u, x = wallet.get_balance()
         l = wallet.lnworker.get_balance() if wallet.lnworker else None
@@ -550,18 +674,19 @@ class Commands:
         return ELECTRUM_VERSION
 
     @command('w')
-    async def getmpk(self, wallet: Abstract_Wallet = None):
+    async def getmpk(self, wallet: 'Abstract_Wallet' = None):
         """Get master public key. Return your wallet\'s master public key"""
         return wallet.get_master_public_key()
 
     @command('wp')
-    async def getmasterprivate(self, password=None, wallet: Abstract_Wallet = None):
+    async def getmasterprivate(self, password=None, wallet: 'Abstract_Wallet' = None):
         """Get master private key. Return your wallet\'s master private key"""
         return str(wallet.keystore.get_master_private_key(password))
 
     @command('')
     async def convert_xkey(self, xkey, xtype):
         """Convert xtype of a master key. e.g. xpub -> ypub"""
+        from .bip32 import BIP32Node
         try:
             node = BIP32Node.from_xkey(xkey)
         except:
@@ -569,13 +694,13 @@ class Commands:
         return node._replace(xtype=xtype).to_xkey()
 
     @command('wp')
-    async def getseed(self, password=None, wallet: Abstract_Wallet = None):
+    async def getseed(self, password=None, wallet: 'Abstract_Wallet' = None):
         """Get seed phrase. Print the generation seed of your wallet."""
         s = wallet.get_seed(password)
         return s
 
     @command('wp')
-    async def importprivkey(self, privkey, password=None, wallet: Abstract_Wallet = None):
+    async def importprivkey(self, privkey, password=None, wallet: 'Abstract_Wallet' = None):
         """Import a private key."""
         if not wallet.can_import_privkey():
             return "Error: This type of wallet cannot import private keys. Try to create a new wallet with that key."
@@ -615,7 +740,7 @@ class Commands:
         return tx.serialize() if tx else None
 
     @command('wp')
-    async def signmessage(self, address, message, password=None, wallet: Abstract_Wallet = None):
+    async def signmessage(self, address, message, password=None, wallet: 'Abstract_Wallet' = None):
         """Sign a message with a key. Use quotes if your message contains
         whitespaces"""
         sig = wallet.sign_message(address, message, password)
@@ -630,8 +755,9 @@ class Commands:
 
     @command('wp')
     async def payto(self, destination, amount, fee=None, feerate=None, from_addr=None, from_coins=None, change_addr=None,
-                    nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, addtransaction=False, wallet: Abstract_Wallet = None):
+                    nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, addtransaction=False, wallet: 'Abstract_Wallet' = None):
         """Create a transaction. """
+        from .transaction import PartialTxOutput
         self.nocheck = nocheck
         tx_fee = satoshis(fee)
         domain_addr = from_addr.split(',') if from_addr else None
@@ -640,7 +766,8 @@ class Commands:
         domain_addr = None if domain_addr is None else map(self._resolver, domain_addr, repeat(wallet))
         amount_sat = satoshis_or_max(amount)
         outputs = [PartialTxOutput.from_address_and_value(destination, amount_sat)]
-        tx = wallet.create_transaction(
+        return await self._create_transaction(
+            wallet,
             outputs,
             fee=tx_fee,
             feerate=feerate,
@@ -650,16 +777,14 @@ class Commands:
             unsigned=unsigned,
             rbf=rbf,
             password=password,
-            locktime=locktime)
-        result = tx.serialize()
-        if addtransaction:
-            await self.addtransaction(result, wallet=wallet)
-        return result
+            locktime=locktime,
+            addtransaction=addtransaction)
 
     @command('wp')
     async def paytomany(self, outputs, fee=None, feerate=None, from_addr=None, from_coins=None, change_addr=None,
-                        nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, addtransaction=False, wallet: Abstract_Wallet = None):
+                        nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, addtransaction=False, wallet: 'Abstract_Wallet' = None):
         """Create a multi-output transaction. """
+        from .transaction import PartialTxOutput
         self.nocheck = nocheck
         tx_fee = satoshis(fee)
         domain_addr = from_addr.split(',') if from_addr else None
@@ -671,7 +796,8 @@ class Commands:
             address = self._resolver(address, wallet)
             amount_sat = satoshis_or_max(amount)
             final_outputs.append(PartialTxOutput.from_address_and_value(address, amount_sat))
-        tx = wallet.create_transaction(
+        return await self._create_transaction(
+            wallet,
             final_outputs,
             fee=tx_fee,
             feerate=feerate,
@@ -681,16 +807,24 @@ class Commands:
             unsigned=unsigned,
             rbf=rbf,
             password=password,
-            locktime=locktime)
-        result = tx.serialize()
-        if addtransaction:
+            locktime=locktime,
+            addtransaction=addtransaction)
+
+    async def _create_transaction(self, wallet: 'Abstract_Wallet', outputs, *, addtransaction: bool, **kwargs) -> str:
+        if not addtransaction:
+            tx = await run_cpu_bound(wallet.create_transaction, outputs, **kwargs)
+            return tx.serialize()
+        async with get_wallet_spend_lock(wallet):
+            tx = await run_cpu_bound(wallet.create_transaction, outputs, **kwargs)
+            result = tx.serialize()
             await self.addtransaction(result, wallet=wallet)
         return result
 
     @command('w')
-    async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
+    def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: 'Abstract_Wallet' = None,
+                        from_height=None, to_height=None, limit=None, after=None, output_file=None):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        With limit or after, returns a page of transactions (without summary) and the cursor of the next page."""
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
@@ -707,11 +841,18 @@ class Commands:
             fx = FxThread(self.config, None)
             kwargs['fx'] = fx
 
+        if limit is not None or after is not None or output_file is not None:
+            # note: the cursor is applied by the wallet, so that we do not compute details of skipped items
+            items = wallet.get_detailed_history_items(after_txid=after, **kwargs)
+            return paginate(items, 'transactions', key=lambda item: item['txid'],
+                            limit=limit, output_file=output_file)
         return json_normalize(wallet.get_detailed_history(**kwargs))
 
     @command('wp')
-    async def bumpfee(self, tx, new_fee_rate, from_coins=None, strategies=None, password=None, unsigned=False, wallet: Abstract_Wallet = None):
+    async def bumpfee(self, tx, new_fee_rate, from_coins=None, strategies=None, password=None, unsigned=False, wallet: 'Abstract_Wallet' = None):
         """ Bump the Fee for an unconfirmed Transaction """
+        from .transaction import Transaction
+        from .wallet import BumpFeeStrategy
         tx = Transaction(tx)
         domain_coins = from_coins.split(',') if from_coins else None
         coins = wallet.get_spendable_coins(None)
@@ -741,29 +882,35 @@ class Commands:
         return new_tx.serialize()
 
     @command('wl')
-    async def lightning_history(self, show_fiat=False, wallet: Abstract_Wallet = None):
-        """ lightning history """
+    async def lightning_history(self, show_fiat=False, limit=None, after=None, output_file=None, wallet: 'Abstract_Wallet' = None):
+        """ lightning history.
+        With limit or after, returns a page of items and the cursor of the next page."""
+        if limit is not None or after is not None or output_file is not None:
+            # note: the cursor is applied by lnworker, so that we do not look at skipped payments
+            items = wallet.lnworker.get_history_items(after=after) if wallet.lnworker else []
+            return paginate(items, 'history', key=lambda item: item.get('payment_hash') or item['txid'],
+                            limit=limit, output_file=output_file)
         lightning_history = wallet.lnworker.get_history() if wallet.lnworker else []
         return json_normalize(lightning_history)
 
     @command('w')
-    async def setlabel(self, key, label, wallet: Abstract_Wallet = None):
+    async def setlabel(self, key, label, wallet: 'Abstract_Wallet' = None):
         """Assign a label to an item. Item may be a bitcoin address or a
         transaction ID"""
         wallet.set_label(key, label)
 
     @command('w')
-    async def listcontacts(self, wallet: Abstract_Wallet = None):
+    async def listcontacts(self, wallet: 'Abstract_Wallet' = None):
         """Show your list of contacts"""
         return wallet.contacts
 
     @command('w')
-    async def getalias(self, key, wallet: Abstract_Wallet = None):
+    async def getalias(self, key, wallet: 'Abstract_Wallet' = None):
         """Retrieve alias. Lookup in your list of contacts, and for an OpenAlias DNS record."""
         return wallet.contacts.resolve(key)
 
     @command('w')
-    async def searchcontacts(self, query, wallet: Abstract_Wallet = None):
+    async def searchcontacts(self, query, wallet: 'Abstract_Wallet' = None):
         """Search through contacts, return matching entries. """
         results = {}
         for key, value in wallet.contacts.items():
@@ -772,20 +919,25 @@ class Commands:
         return results
 
     @command('w')
-    async def listaddresses(self, receiving=False, change=False, labels=False, frozen=False, unused=False, funded=False, balance=False, wallet: Abstract_Wallet = None):
-        """List wallet addresses. Returns the list of all addresses in your wallet. Use optional arguments to filter the results."""
-        out = []
-        for addr in wallet.get_addresses():
-            if frozen and not wallet.is_frozen_address(addr):
-                continue
-            if receiving and wallet.is_change(addr):
-                continue
-            if change and not wallet.is_change(addr):
-                continue
-            if unused and wallet.is_used(addr):
-                continue
-            if funded and wallet.is_empty(addr):
-                continue
+    def listaddresses(self, receiving=False, change=False, labels=False, frozen=False, unused=False, funded=False, balance=False,
+                      limit=None, after=None, output_file=None, wallet: 'Abstract_Wallet' = None):
+        """List wallet addresses. Returns the list of all addresses in your wallet. Use optional arguments to filter the results.
+        With limit or after, returns a page of addresses and the cursor of the next page."""
+        def filtered_addresses(addresses):
+            for addr in addresses:
+                if frozen and not wallet.is_frozen_address(addr):
+                    continue
+                if receiving and wallet.is_change(addr):
+                    continue
+                if change and not wallet.is_change(addr):
+                    continue
+                if unused and wallet.is_used(addr):
+                    continue
+                if funded and wallet.is_empty(addr):
+                    continue
+                yield addr
+
+        def to_item(addr):
             item = addr
             if labels or balance:
                 item = (item,)
@@ -793,21 +945,23 @@ class Commands:
                 item += (format_satoshis(sum(wallet.get_addr_balance(addr))),)
             if labels:
                 item += (repr(wallet.get_label(addr)),)
-            out.append(item)
-        return out
+            return item
+
+        addresses = wallet.get_addresses()
+        if limit is not None or after is not None or output_file is not None:
+            addresses = skip_past(addresses, key=lambda addr: addr, after=after)
+            return paginate(filtered_addresses(addresses), 'addresses', key=lambda addr: addr, normalize=to_item,
+                            limit=limit, output_file=output_file)
+        return [to_item(addr) for addr in filtered_addresses(addresses)]
 
     @command('n')
-    async def gettransaction(self, txid, wallet: Abstract_Wallet = None):
+    async def gettransaction(self, txid, wallet: 'Abstract_Wallet' = None):
         """Retrieve a transaction. """
         tx = None
         if wallet:
             tx = wallet.db.get_transaction(txid)
         if tx is None:
-            raw = await self.network.get_transaction(txid)
-            if raw:
-                tx = Transaction(raw)
-            else:
-                raise Exception("Unknown transaction")
+            tx = await self.network.get_parsed_transaction(txid)
         if tx.txid() != txid:
             raise Exception("Mismatching txid")
         return tx.serialize()
@@ -826,7 +980,7 @@ class Commands:
         return encrypted.decode('utf-8')
 
     @command('wp')
-    async def decrypt(self, pubkey, encrypted, password=None, wallet: Abstract_Wallet = None) -> str:
+    async def decrypt(self, pubkey, encrypted, password=None, wallet: 'Abstract_Wallet' = None) -> str:
         """Decrypt a message encrypted with a public key."""
         if not is_hex_str(pubkey):
             raise Exception(f"pubkey must be a hex string instead of {repr(pubkey)}")
@@ -836,7 +990,7 @@ class Commands:
         return decrypted.decode('utf-8')
 
     @command('w')
-    async def getrequest(self, key, wallet: Abstract_Wallet = None):
+    async def getrequest(self, key, wallet: 'Abstract_Wallet' = None):
         """Return a payment request"""
         r = wallet.get_request(key)
         if not r:
@@ -849,8 +1003,11 @@ class Commands:
     #    pass
 
     @command('w')
-    async def list_requests(self, pending=False, expired=False, paid=False, wallet: Abstract_Wallet = None):
-        """List the payment requests you made."""
+    async def list_requests(self, pending=False, expired=False, paid=False,
+                            limit=None, after=None, output_file=None, wallet: 'Abstract_Wallet' = None):
+        """List the payment requests you made.
+        With limit or after, returns a page of requests and the cursor of the next page."""
+        from .invoices import PR_PAID, PR_UNPAID, PR_EXPIRED
         if pending:
             f = PR_UNPAID
         elif expired:
@@ -859,20 +1016,26 @@ class Commands:
             f = PR_PAID
         else:
             f = None
-        out = wallet.get_sorted_requests()
+        paginated = limit is not None or after is not None or output_file is not None
+        if not paginated:
+            return [wallet.export_request(x) for x in wallet.get_sorted_requests(status=f)]
+        # note: the cursor might be a request that no longer has status f
+        out = skip_past(wallet.get_sorted_requests(), key=wallet.get_key_for_receive_request, after=after)
         if f is not None:
-            out = [req for req in out
-                   if f == wallet.get_request_status(wallet.get_key_for_receive_request(req))]
-        return [wallet.export_request(x) for x in out]
+            keys = wallet.request_index.get_keys(status=f)
+            out = (req for req in out if wallet.get_key_for_receive_request(req) in keys)
+        return paginate(out, 'requests', key=wallet.get_key_for_receive_request, normalize=wallet.export_request,
+                        limit=limit, output_file=output_file)
 
     @command('w')
-    async def createnewaddress(self, wallet: Abstract_Wallet = None):
+    async def createnewaddress(self, wallet: 'Abstract_Wallet' = None):
         """Create a new receiving address, beyond the gap limit of the wallet"""
         return wallet.create_new_address(False)
 
     @command('w')
-    async def changegaplimit(self, new_limit, iknowwhatimdoing=False, wallet: Abstract_Wallet = None):
+    async def changegaplimit(self, new_limit, iknowwhatimdoing=False, wallet: 'Abstract_Wallet' = None):
         """Change the gap limit of the wallet."""
+        from .wallet import Deterministic_Wallet
         if not iknowwhatimdoing:
             raise Exception("WARNING: Are you SURE you want to change the gap limit?\n"
                             "It makes recovering your wallet from seed difficult!\n"
@@ -884,10 +1047,11 @@ class Commands:
         return wallet.change_gap_limit(new_limit)
 
     @command('wn')
-    async def getminacceptablegap(self, wallet: Abstract_Wallet = None):
+    async def getminacceptablegap(self, wallet: 'Abstract_Wallet' = None):
         """Returns the minimum value for gap limit that would be sufficient to discover all
         known addresses in the wallet.
         """
+        from .wallet import Deterministic_Wallet
         if not isinstance(wallet, Deterministic_Wallet):
             raise Exception("This wallet is not deterministic.")
         if not wallet.is_up_to_date():
@@ -895,13 +1059,13 @@ class Commands:
         return wallet.min_acceptable_gap()
 
     @command('w')
-    async def getunusedaddress(self, wallet: Abstract_Wallet = None):
+    async def getunusedaddress(self, wallet: 'Abstract_Wallet' = None):
         """Returns the first unused address of the wallet, or None if all addresses are used.
         An address is considered as used if it has received a transaction, or if it is used in a payment request."""
         return wallet.get_unused_address()
 
     @command('w')
-    async def add_request(self, amount, memo='', expiration=3600, force=False, wallet: Abstract_Wallet = None):
+    async def add_request(self, amount, memo='', expiration=3600, force=False, wallet: 'Abstract_Wallet' = None):
         """Create a payment request, using the first unused address of the wallet.
         The address will be considered as used after this operation.
         If no payment is received, the address will be considered as unused if the payment request is deleted from the wallet."""
@@ -918,14 +1082,15 @@ class Commands:
         return wallet.export_request(req)
 
     @command('wnl')
-    async def add_lightning_request(self, amount, memo='', expiration=3600, wallet: Abstract_Wallet = None):
+    async def add_lightning_request(self, amount, memo='', expiration=3600, wallet: 'Abstract_Wallet' = None):
         amount_sat = int(satoshis(amount))
         key = wallet.lnworker.add_request(amount_sat, memo, expiration)
         return wallet.get_formatted_request(key)
 
     @command('w')
-    async def addtransaction(self, tx, wallet: Abstract_Wallet = None):
+    async def addtransaction(self, tx, wallet: 'Abstract_Wallet' = None):
         """ Add a transaction to the wallet history """
+        from .transaction import Transaction
         tx = Transaction(tx)
         if not wallet.add_transaction(tx):
             return False
@@ -933,7 +1098,7 @@ class Commands:
         return tx.txid()
 
     @command('wp')
-    async def signrequest(self, address, password=None, wallet: Abstract_Wallet = None):
+    async def signrequest(self, address, password=None, wallet: 'Abstract_Wallet' = None):
         "Sign payment request with an OpenAlias"
         alias = self.config.get('alias')
         if not alias:
@@ -942,18 +1107,18 @@ class Commands:
         wallet.sign_payment_request(address, alias, alias_addr, password)
 
     @command('w')
-    async def rmrequest(self, address, wallet: Abstract_Wallet = None):
+    async def rmrequest(self, address, wallet: 'Abstract_Wallet' = None):
         """Remove a payment request"""
         return wallet.remove_payment_request(address)
 
     @command('w')
-    async def clear_requests(self, wallet: Abstract_Wallet = None):
+    async def clear_requests(self, wallet: 'Abstract_Wallet' = None):
         """Remove all payment requests"""
         wallet.clear_requests()
         return True
 
     @command('w')
-    async def clear_invoices(self, wallet: Abstract_Wallet = None):
+    async def clear_invoices(self, wallet: 'Abstract_Wallet' = None):
         """Remove all invoices"""
         wallet.clear_invoices()
         return True
@@ -963,6 +1128,7 @@ class Commands:
         """Watch an address. Every time the address changes, a http POST is sent to the URL.
         Call with an empty URL to stop watching an address.
         """
+        from .synchronizer import Notifier
         if not hasattr(self, "_notifier"):
             self._notifier = Notifier(self.network)
         if URL:
@@ -972,7 +1138,7 @@ class Commands:
         return True
 
     @command('wn')
-    async def is_synchronized(self, wallet: Abstract_Wallet = None):
+    async def is_synchronized(self, wallet: 'Abstract_Wallet' = None):
         """ return wallet synchronization status """
         return wallet.is_up_to_date()
 
@@ -996,10 +1162,11 @@ class Commands:
         return self.config.fee_per_kb(dyn=dyn, mempool=mempool, fee_level=fee_level)
 
     @command('w')
-    async def removelocaltx(self, txid, wallet: Abstract_Wallet = None):
+    async def removelocaltx(self, txid, wallet: 'Abstract_Wallet' = None):
         """Remove a 'local' transaction from the wallet, and its dependent
         transactions.
         """
+        from .address_synchronizer import TX_HEIGHT_LOCAL
         if not is_hash256_str(txid):
             raise Exception(f"{repr(txid)} is not a txid")
         height = wallet.get_tx_height(txid).height
@@ -1010,7 +1177,7 @@ class Commands:
         wallet.save_db()
 
     @command('wn')
-    async def get_tx_status(self, txid, wallet: Abstract_Wallet = None):
+    async def get_tx_status(self, txid, wallet: 'Abstract_Wallet' = None):
         """Returns some information regarding the tx. For now, only confirmations.
         The transaction must be related to the wallet.
         """
@@ -1029,13 +1196,14 @@ class Commands:
 
     # lightning network commands
     @command('wnl')
-    async def add_peer(self, connection_string, timeout=20, gossip=False, wallet: Abstract_Wallet = None):
+    async def add_peer(self, connection_string, timeout=20, gossip=False, wallet: 'Abstract_Wallet' = None):
         lnworker = self.network.lngossip if gossip else wallet.lnworker
         await lnworker.add_peer(connection_string)
         return True
 
     @command('wnl')
-    async def list_peers(self, gossip=False, wallet: Abstract_Wallet = None):
+    async def list_peers(self, gossip=False, wallet: 'Abstract_Wallet' = None):
+        from .lnutil import LnFeatures
         lnworker = self.network.lngossip if gossip else wallet.lnworker
         return [{
             'node_id':p.pubkey.hex(),
@@ -1043,10 +1211,12 @@ class Commands:
             'initialized':p.is_initialized(),
             'features': str(LnFeatures(p.features)),
             'channels': [c.funding_outpoint.to_str() for c in p.channels.values()],
+            'traffic': p.transport.get_stats(),
         } for p in lnworker.peers.values()]
 
     @command('wpnl')
-    async def open_channel(self, connection_string, amount, push_amount=0, password=None, wallet: Abstract_Wallet = None):
+    async def open_channel(self, connection_string, amount, push_amount=0, password=None, wallet: 'Abstract_Wallet' = None):
+        from .lnutil import extract_nodeid
         funding_sat = satoshis(amount)
         push_sat = satoshis(push_amount)
         coins = wallet.get_spendable_coins(None)
@@ -1066,11 +1236,13 @@ class Commands:
 
     @command('')
     async def decode_invoice(self, invoice: str):
+        from .invoices import LNInvoice
         invoice = LNInvoice.from_bech32(invoice)
         return invoice.to_debug_json()
 
     @command('wnl')
-    async def lnpay(self, invoice, attempts=1, timeout=30, wallet: Abstract_Wallet = None):
+    async def lnpay(self, invoice, attempts=1, timeout=30, wallet: 'Abstract_Wallet' = None):
+        from .invoices import LNInvoice
         lnworker = wallet.lnworker
         lnaddr = lnworker._check_invoice(invoice)
         payment_hash = lnaddr.paymenthash
@@ -1084,14 +1256,14 @@ class Commands:
         }
 
     @command('wl')
-    async def nodeid(self, wallet: Abstract_Wallet = None):
+    async def nodeid(self, wallet: 'Abstract_Wallet' = None):
         listen_addr = self.config.get('lightning_listen')
         return bh2u(wallet.lnworker.node_keypair.pubkey) + (('@' + listen_addr) if listen_addr else '')
 
     @command('wl')
-    async def list_channels(self, wallet: Abstract_Wallet = None):
+    async def list_channels(self, wallet: 'Abstract_Wallet' = None):
         # FIXME: we need to be online to display capacity of backups
-        from .lnutil import LOCAL, REMOTE, format_short_channel_id
+        from .lnutil import LOCAL, REMOTE, SENT, format_short_channel_id
         channels = list(wallet.lnworker.channels.items())
         backups = list(wallet.lnworker.channel_backups.items())
         return [
@@ -1121,7 +1293,7 @@ class Commands:
         ]
 
     @command('wnl')
-    async def dumpgraph(self, wallet: Abstract_Wallet = None):
+    async def dumpgraph(self, wallet: 'Abstract_Wallet' = None):
         return wallet.lnworker.channel_db.to_dict()
 
     @command('n')
@@ -1131,7 +1303,7 @@ class Commands:
         self.network.update_fee_estimates(fee_est=fee_est)
 
     @command('wnl')
-    async def enable_htlc_settle(self, b: bool, wallet: Abstract_Wallet = None):
+    async def enable_htlc_settle(self, b: bool, wallet: 'Abstract_Wallet' = None):
         wallet.lnworker.enable_htlc_settle = b
 
     @command('n')
@@ -1145,41 +1317,45 @@ class Commands:
             self.network.path_finder.liquidity_hints.reset_liquidity_hints()
 
     @command('w')
-    async def list_invoices(self, wallet: Abstract_Wallet = None):
+    async def list_invoices(self, wallet: 'Abstract_Wallet' = None):
         l = wallet.get_invoices()
         return [wallet.export_invoice(x) for x in l]
 
     @command('wnl')
-    async def close_channel(self, channel_point, force=False, wallet: Abstract_Wallet = None):
+    async def close_channel(self, channel_point, force=False, wallet: 'Abstract_Wallet' = None):
+        from .lnpeer import channel_id_from_funding_tx
         txid, index = channel_point.split(':')
         chan_id, _ = channel_id_from_funding_tx(txid, int(index))
         coro = wallet.lnworker.force_close_channel(chan_id) if force else wallet.lnworker.close_channel(chan_id)
         return await coro
 
     @command('wnl')
-    async def request_force_close(self, channel_point, connection_string=None, wallet: Abstract_Wallet = None):
+    async def request_force_close(self, channel_point, connection_string=None, wallet: 'Abstract_Wallet' = None):
         """
         Requests the remote to force close a channel.
         If a connection string is passed, can be used without having state or any backup for the channel.
         Assumes that channel was originally opened with the same local peer (node_keypair).
         """
+        from .lnpeer import channel_id_from_funding_tx
         txid, index = channel_point.split(':')
         chan_id, _ = channel_id_from_funding_tx(txid, int(index))
         await wallet.lnworker.request_force_close(chan_id, connect_str=connection_string)
 
     @command('wl')
-    async def export_channel_backup(self, channel_point, wallet: Abstract_Wallet = None):
+    async def export_channel_backup(self, channel_point, wallet: 'Abstract_Wallet' = None):
+        from .lnpeer import channel_id_from_funding_tx
         txid, index = channel_point.split(':')
         chan_id, _ = channel_id_from_funding_tx(txid, int(index))
         return wallet.lnworker.export_channel_backup(chan_id)
 
     @command('wl')
-    async def import_channel_backup(self, encrypted, wallet: Abstract_Wallet = None):
+    async def import_channel_backup(self, encrypted, wallet: 'Abstract_Wallet' = None):
         return wallet.lnworker.import_channel_backup(encrypted)
 
     @command('wnl')
-    async def get_channel_ctx(self, channel_point, iknowwhatimdoing=False, wallet: Abstract_Wallet = None):
+    async def get_channel_ctx(self, channel_point, iknowwhatimdoing=False, wallet: 'Abstract_Wallet' = None):
         """ return the current commitment transaction of a channel """
+        from .lnpeer import channel_id_from_funding_tx
         if not iknowwhatimdoing:
             raise Exception("WARNING: this command is potentially unsafe.\n"
                             "To proceed, try again, with the --iknowwhatimdoing option.")
@@ -1190,12 +1366,12 @@ class Commands:
         return tx.serialize()
 
     @command('wnl')
-    async def get_watchtower_ctn(self, channel_point, wallet: Abstract_Wallet = None):
+    async def get_watchtower_ctn(self, channel_point, wallet: 'Abstract_Wallet' = None):
         """ return the local watchtower's ctn of channel. used in regtests """
         return await self.network.local_watchtower.sweepstore.get_ctn(channel_point, None)
 
     @command('wnpl')
-    async def normal_swap(self, onchain_amount, lightning_amount, password=None, wallet: Abstract_Wallet = None):
+    async def normal_swap(self, onchain_amount, lightning_amount, password=None, wallet: 'Abstract_Wallet' = None):
         """
         Normal submarine swap: send on-chain BTC, receive on Lightning
         Note that your funds will be locked for 24h if you do not have enough incoming capacity.
@@ -1226,7 +1402,7 @@ class Commands:
         }
 
     @command('wnl')
-    async def reverse_swap(self, lightning_amount, onchain_amount, wallet: Abstract_Wallet = None):
+    async def reverse_swap(self, lightning_amount, onchain_amount, wallet: 'Abstract_Wallet' = None):
         """Reverse submarine swap: send on Lightning, receive on-chain
         """
         sm = wallet.lnworker.swap_manager
@@ -1329,6 +1505,9 @@ command_options = {
     'fee_level':   (None, "Float between 0.0 and 1.0, representing fee slider position"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'limit':       (None, "Maximum number of items to return. The result then includes the cursor of the next page"),
+    'after':       (None, "Cursor: only return the items after this one (txid, address, payment hash or request key)"),
+    'output_file': (None, "Write the items to this file (absolute path) as newline-delimited JSON, instead of returning them"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
@@ -1337,8 +1516,12 @@ command_options = {
 }
 
 
+def convert_raw_tx_to_hex(raw):
+    from .transaction import convert_raw_tx_to_hex
+    return convert_raw_tx_to_hex(raw)
+
+
 # don't use floats because of rounding errors
-from .transaction import convert_raw_tx_to_hex
 json_loads = lambda x: json.loads(x, parse_float=lambda x: str(Decimal(x)))
 arg_types = {
     'num': int,
@@ -1347,6 +1530,7 @@ arg_types = {
     'year': int,
     'from_height': int,
     'to_height': int,
+    'limit': int,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
     'jsontx': json_loads,
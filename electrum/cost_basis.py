@@ -0,0 +1,237 @@
+# Copyright (C) 2022 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+# Acquisition price (cost basis) of the bitcoins of a wallet, for capital gains.
+#
+# Two methods are supported:
+#  - 'average': coins keep their identity. A coin received from someone else
+#    costs its fiat value when it was received. A coin created by one of our
+#    own transactions costs the average price of the coins spent by it.
+#  - 'fifo': the wallet holds a single pool of lots, and spending consumes the
+#    oldest lots first. This does not need coin identities, so it also covers
+#    lightning payments.
+
+import threading
+from collections import deque
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Callable, Optional, List, Tuple, NamedTuple, Any
+
+from .bitcoin import COIN
+
+if TYPE_CHECKING:
+    from .wallet import Abstract_Wallet
+
+
+COST_BASIS_METHODS = ('average', 'fifo')
+
+
+class FifoCheckpoint(NamedTuple):
+    """State of the fifo pool where a page of the history stopped."""
+    txid: str  # first transaction of the next page, already applied to pool
+    fiat_fields: Dict[str, Any]  # of that transaction
+    pool: 'FifoPool'
+
+
+class CostBasisLedger:
+    """Acquisition prices of the coins of a wallet, with the 'average' method.
+
+    The average price of the inputs of each of our transactions is computed
+    once, parents first, and kept until the transaction, or one of its
+    ancestors, changes. Results that depend on a missing exchange rate are
+    not kept, as the rate might be downloaded later.
+
+    With the 'fifo' method, the pool of lots at the end of the pages of the
+    history is kept until any transaction changes, so that the next page
+    does not apply the earlier transactions again.
+    """
+
+    MAX_FIFO_CHECKPOINTS = 10
+
+    def __init__(self, wallet: 'Abstract_Wallet'):
+        self.wallet = wallet
+        self.db = wallet.db
+        # note: the wallet calls invalidate() while holding its own locks,
+        #       so this lock must not be held while calling into the wallet
+        self.lock = threading.RLock()
+        # ccy -> txid -> average acquisition price of the inputs, per BTC
+        self._avg_prices: Dict[str, Dict[str, Decimal]] = {}
+        # (ccy, txid of the last item of a page) -> fifo checkpoint
+        self._fifo_checkpoints: Dict[Tuple[str, str], FifoCheckpoint] = {}
+        # incremented on each invalidation, so that prices computed
+        # from outdated data are not kept
+        self._generation = 0
+
+    def get_generation(self) -> int:
+        with self.lock:
+            return self._generation
+
+    def clear(self) -> None:
+        with self.lock:
+            self._avg_prices.clear()
+            self._fifo_checkpoints.clear()
+            self._generation += 1
+
+    def invalidate(self, txid: str) -> None:
+        """To be called when a transaction changes: when it is added or removed,
+        gets mined or reorged, or when the user sets its fiat value."""
+        with self.lock:
+            self._generation += 1
+            # the pool depends on all earlier transactions
+            self._fifo_checkpoints.clear()
+            if not self._avg_prices:
+                return
+        txids = {txid} | self.wallet.get_depending_transactions(txid)
+        with self.lock:
+            for avg_prices in self._avg_prices.values():
+                for t in txids:
+                    avg_prices.pop(t, None)
+
+    def get_fifo_checkpoint(self, ccy: str, after_txid: str) -> Optional[FifoCheckpoint]:
+        with self.lock:
+            checkpoint = self._fifo_checkpoints.get((ccy, after_txid))
+        if checkpoint is None:
+            return None
+        return checkpoint._replace(pool=checkpoint.pool.copy(), fiat_fields=dict(checkpoint.fiat_fields))
+
+    def add_fifo_checkpoint(self, ccy: str, after_txid: str, checkpoint: FifoCheckpoint, *, generation: int) -> None:
+        """generation is the one at which the pool was computed."""
+        with self.lock:
+            if generation != self._generation:
+                return
+            self._fifo_checkpoints.pop((ccy, after_txid), None)
+            self._fifo_checkpoints[(ccy, after_txid)] = checkpoint
+            while len(self._fifo_checkpoints) > self.MAX_FIFO_CHECKPOINTS:
+                del self._fifo_checkpoints[next(iter(self._fifo_checkpoints))]
+
+    def _get_inputs(self, txid: str) -> List[Tuple[str, int]]:
+        """Returns the (prev_txid, value) of our inputs of txid."""
+        return [(ser.split(':')[0], v)
+                for addr in self.db.get_txi_addresses(txid)
+                for ser, v in self.db.get_txi_addr(txid, addr)]
+
+    def _get_cached(self, ccy: str, txid: str) -> Optional[Decimal]:
+        with self.lock:
+            return self._avg_prices.get(ccy, {}).get(txid)
+
+    def average_price(self, txid: str, price_func: Callable, ccy: str) -> Decimal:
+        """Average acquisition price of the inputs of a transaction, per BTC."""
+        if not self.db.get_txi_addresses(txid):
+            return Decimal('NaN')
+        with self.lock:
+            generation = self._generation
+        cached = self._get_cached(ccy, txid)
+        if cached is not None:
+            return cached
+        results = {}  # includes the prices that are not kept
+        # iterate instead of recursing, as chains of our own transactions can be long
+        stack = [txid]
+        while stack:
+            t = stack[-1]
+            if t in results:
+                stack.pop()
+                continue
+            inputs = self._get_inputs(t)
+            missing = []
+            for prev_txid, v in inputs:
+                if prev_txid in results or not self.db.get_txi_addresses(prev_txid):
+                    continue
+                cached = self._get_cached(ccy, prev_txid)
+                if cached is not None:
+                    results[prev_txid] = cached
+                else:
+                    missing.append(prev_txid)
+            if missing:
+                stack += missing
+                continue
+            stack.pop()
+            input_value = 0
+            total_price = 0
+            for prev_txid, v in inputs:
+                input_value += v
+                if prev_txid in results:
+                    total_price += results[prev_txid] * v / Decimal(COIN)
+                else:
+                    total_price += self._received_coin_price(prev_txid, price_func, ccy, v)
+            results[t] = total_price / (input_value / Decimal(COIN))
+        with self.lock:
+            if generation == self._generation:
+                avg_prices = self._avg_prices.setdefault(ccy, {})
+                for t, result in results.items():
+                    if not result.is_nan():
+                        avg_prices[t] = result
+        return results[txid]
+
+    def coin_price(self, txid: str, price_func: Callable, ccy: str, txin_value: Optional[int]) -> Decimal:
+        """Acquisition price of a coin created by txid.
+        This assumes that either all inputs are mine, or no input is mine.
+        """
+        if txin_value is None:
+            return Decimal('NaN')
+        if self.db.get_txi_addresses(txid):
+            return self.average_price(txid, price_func, ccy) * txin_value / Decimal(COIN)
+        return self._received_coin_price(txid, price_func, ccy, txin_value)
+
+    def _received_coin_price(self, txid: str, price_func: Callable, ccy: str, txin_value: int) -> Decimal:
+        fiat_value = self.wallet.get_fiat_value(txid, ccy)
+        if fiat_value is not None:
+            return fiat_value
+        p = self.wallet.price_at_timestamp(txid, price_func)
+        return p * txin_value / Decimal(COIN)
+
+
+class FifoPool:
+    """Lots of bitcoins held by a wallet, for the 'fifo' method.
+    Transactions must be applied in chronological order.
+    """
+
+    def __init__(self):
+        self._lots = deque()  # of [amount_sat, cost]
+        self.holdings_cost = Decimal(0)  # cost of the lots held
+        self.holdings_cost_before = Decimal(0)  # cost of the lots held before the last transaction
+
+    def copy(self) -> 'FifoPool':
+        pool = FifoPool()
+        pool.restore(self)
+        return pool
+
+    def restore(self, other: 'FifoPool') -> None:
+        """Sets the state of this pool to the one of other."""
+        self._lots = deque([lot[:] for lot in other._lots])  # lots are modified when spent
+        self.holdings_cost = other.holdings_cost
+        self.holdings_cost_before = other.holdings_cost_before
+
+    def apply(self, value_sat, fiat_value: Decimal) -> Optional[Decimal]:
+        """Adds a lot if value_sat is positive. Otherwise, consumes the oldest
+        lots and returns the acquisition price of what was spent.
+        fiat_value is the (signed) fiat value of the transaction.
+        """
+        self.holdings_cost_before = self.holdings_cost
+        if value_sat >= 0:
+            # without an exchange rate, the lot has no known cost.
+            # it is left out, so that its coins are priced when they are spent
+            if value_sat > 0 and not fiat_value.is_nan():
+                self._lots.append([value_sat, fiat_value])
+                self.holdings_cost += fiat_value
+            return None
+        to_spend = -value_sat
+        cost = Decimal(0)
+        while to_spend > 0 and self._lots:
+            lot = self._lots[0]
+            lot_amount, lot_cost = lot
+            if lot_amount <= to_spend:
+                self._lots.popleft()
+                to_spend -= lot_amount
+                cost += lot_cost
+            else:
+                spent_cost = lot_cost * Decimal(to_spend) / Decimal(lot_amount)
+                lot[0] = lot_amount - to_spend
+                lot[1] = lot_cost - spent_cost
+                to_spend = 0
+                cost += spent_cost
+        self.holdings_cost -= cost
+        if to_spend > 0:
+            # more was spent than we know of (e.g. incomplete history):
+            # the rest is priced at the time of spending, i.e. without gain
+            cost += fiat_value / Decimal(value_sat) * Decimal(to_spend)
+        return cost
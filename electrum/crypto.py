@@ -366,7 +366,8 @@ def chacha20_poly1305_decrypt(
     assert isinstance(key, (bytes, bytearray))
     assert isinstance(nonce, (bytes, bytearray))
     assert isinstance(associated_data, (bytes, bytearray, type(None)))
-    assert isinstance(data, (bytes, bytearray))
+    # note: data can be a memoryview, to decrypt part of a buffer without copying it first
+    assert isinstance(data, (bytes, bytearray, memoryview))
     assert len(key) == 32, f"unexpected key size: {len(key)} (expected: 32)"
     assert len(nonce) == 12, f"unexpected nonce size: {len(nonce)} (expected: 12)"
     if HAS_CRYPTODOME:
@@ -376,6 +377,8 @@ def chacha20_poly1305_decrypt(
         # raises ValueError if not valid (e.g. incorrect MAC)
         return cipher.decrypt_and_verify(ciphertext=data[:-16], received_mac_tag=data[-16:])
     if HAS_CRYPTOGRAPHY:
+        if isinstance(data, memoryview):
+            data = bytes(data)  # older versions of cryptography only accept bytes
         a = CG_aead.ChaCha20Poly1305(key)
         try:
             return a.decrypt(nonce, data, associated_data)
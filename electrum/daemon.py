@@ -23,27 +23,24 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import asyncio
-import ast
 import os
 import time
 import traceback
 import sys
 import threading
 from typing import Dict, Optional, Tuple, Iterable, Callable, Union, Sequence, Mapping, TYPE_CHECKING
-from base64 import b64decode, b64encode
+from base64 import b64decode
 from collections import defaultdict
 import json
-import socket
 
-import aiohttp
-from aiohttp import web, client_exceptions
+from aiohttp import web
 from aiorpcx import timeout_after, TaskTimeout, ignore_after
 
 from . import util
 from .network import Network
 from .util import (json_decode, to_bytes, to_string, profiler, standardize_path, constant_time_compare)
 from .invoices import PR_PAID, PR_EXPIRED
-from .util import log_exceptions, ignore_exceptions, randrange, OldTaskGroup
+from .util import log_exceptions, ignore_exceptions, OldTaskGroup
 from .wallet import Wallet, Abstract_Wallet
 from .storage import WalletStorage
 from .wallet_db import WalletDB
@@ -51,6 +48,10 @@ from .commands import known_commands, Commands
 from .simple_config import SimpleConfig
 from .exchange_rate import FxThread
 from .logging import get_logger, Logger
+from . import metrics
+from .metrics import LatencyStats
+from .daemon_client import (get_rpcsock_defaultpath, get_rpcsock_default_type,
+                            get_lockfile, remove_lockfile, get_file_descriptor, get_rpc_credentials)
 
 if TYPE_CHECKING:
     from electrum import gui
@@ -59,129 +60,70 @@ if TYPE_CHECKING:
 _logger = get_logger(__name__)
 
 
-class DaemonNotRunning(Exception):
+class AuthenticationError(Exception):
     pass
 
-def get_rpcsock_defaultpath(config: SimpleConfig):
-    return os.path.join(config.path, 'daemon_rpc_socket')
-
-def get_rpcsock_default_type(config: SimpleConfig):
-    if config.get('rpchost') and config.get('rpcport'):
-        return 'tcp'
-    # Use unix domain sockets when available,
-    # with the extra paranoia that in case windows "implements" them,
-    # we want to test it before making it the default there.
-    if hasattr(socket, 'AF_UNIX') and sys.platform != 'win32':
-        return 'unix'
-    return 'tcp'
-
-def get_lockfile(config: SimpleConfig):
-    return os.path.join(config.path, 'daemon')
-
-def remove_lockfile(lockfile):
-    os.unlink(lockfile)
-
-
-def get_file_descriptor(config: SimpleConfig):
-    '''Tries to create the lockfile, using O_EXCL to
-    prevent races.  If it succeeds, it returns the FD.
-    Otherwise, try and connect to the server specified in the lockfile.
-    If this succeeds, the server is returned.  Otherwise, remove the
-    lockfile and try again.'''
-    lockfile = get_lockfile(config)
-    while True:
-        try:
-            return os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
-        except OSError:
-            pass
-        try:
-            request(config, 'ping')
-            return None
-        except DaemonNotRunning:
-            # Couldn't connect; remove lockfile and try again.
-            remove_lockfile(lockfile)
+class AuthenticationInvalidOrMissing(AuthenticationError):
+    pass
 
+class AuthenticationCredentialsInvalid(AuthenticationError):
+    pass
 
+class RPCStats:
+    """Call counts and latency histograms of RPC methods."""
 
-def request(config: SimpleConfig, endpoint, args=(), timeout=60):
-    lockfile = get_lockfile(config)
-    while True:
-        create_time = None
-        try:
-            with open(lockfile) as f:
-                socktype, address, create_time = ast.literal_eval(f.read())
-                if socktype == 'unix':
-                    path = address
-                    (host, port) = "127.0.0.1", 0
-                    # We still need a host and port for e.g. HTTP Host header
-                elif socktype == 'tcp':
-                    (host, port) = address
-                else:
-                    raise Exception(f"corrupt lockfile; socktype={socktype!r}")
-        except Exception:
-            raise DaemonNotRunning()
-        rpc_user, rpc_password = get_rpc_credentials(config)
-        server_url = 'http://%s:%d' % (host, port)
-        auth = aiohttp.BasicAuth(login=rpc_user, password=rpc_password)
-        loop = asyncio.get_event_loop()
-        async def request_coroutine():
-            if socktype == 'unix':
-                connector = aiohttp.UnixConnector(path=path)
-            elif socktype == 'tcp':
-                connector = None # This will transform into TCP.
-            else:
-                raise Exception(f"impossible socktype ({socktype!r})")
-            async with aiohttp.ClientSession(auth=auth, connector=connector) as session:
-                c = util.JsonRPCClient(session, server_url)
-                return await c.request(endpoint, *args)
-        try:
-            fut = asyncio.run_coroutine_threadsafe(request_coroutine(), loop)
-            return fut.result(timeout=timeout)
-        except aiohttp.client_exceptions.ClientConnectorError as e:
-            _logger.info(f"failed to connect to JSON-RPC server {e}")
-            if not create_time or create_time < time.time() - 1.0:
-                raise DaemonNotRunning()
-        # Sleep a bit and try again; it might have just been started
-        time.sleep(1.0)
-
-
-def get_rpc_credentials(config: SimpleConfig) -> Tuple[str, str]:
-    rpc_user = config.get('rpcuser', None)
-    rpc_password = config.get('rpcpassword', None)
-    if rpc_user == '':
-        rpc_user = None
-    if rpc_password == '':
-        rpc_password = None
-    if rpc_user is None or rpc_password is None:
-        rpc_user = 'user'
-        bits = 128
-        nbytes = bits // 8 + (bits % 8 > 0)
-        pw_int = randrange(pow(2, bits))
-        pw_b64 = b64encode(
-            pw_int.to_bytes(nbytes, 'big'), b'-_')
-        rpc_password = to_string(pw_b64, 'ascii')
-        config.set_key('rpcuser', rpc_user)
-        config.set_key('rpcpassword', rpc_password, save=True)
-    return rpc_user, rpc_password
+    def __init__(self):
+        self._methods = defaultdict(LatencyStats)  # type: Dict[str, LatencyStats]
 
+    def record(self, method: str, elapsed: float, *, error: bool) -> None:
+        self._methods[method].record(elapsed, error=error)
 
-class AuthenticationError(Exception):
-    pass
+    def to_json(self) -> dict:
+        return {method: stats.to_json() for method, stats in sorted(self._methods.items())}
 
-class AuthenticationInvalidOrMissing(AuthenticationError):
-    pass
+    def to_prometheus(self) -> Sequence[str]:
+        return metrics.format_histogram(
+            'electrum_rpc_duration_seconds', 'Duration of the JSON-RPC methods of the daemon.',
+            [({'method': method}, stats) for method, stats in sorted(self._methods.items())])
+
+
+class EventLoopLagMonitor(Logger):
+    """Measures how late the event loop wakes up from sleeping.
+    This is the time that other coroutines and callbacks kept it busy,
+    e.g. synchronous code that ran on the loop for too long.
+    """
+
+    INTERVAL = 0.1  # seconds
+    LOG_THRESHOLD = 1.0  # seconds
+
+    def __init__(self):
+        Logger.__init__(self)
+        self.lag_stats = LatencyStats()
+
+    async def run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.INTERVAL)
+            lag = max(0.0, time.monotonic() - start - self.INTERVAL)
+            self.lag_stats.record(lag)
+            if lag > self.LOG_THRESHOLD:
+                self.logger.info(f"event loop was blocked for {lag:.3f} sec")
 
-class AuthenticationCredentialsInvalid(AuthenticationError):
-    pass
 
 class AuthenticatedServer(Logger):
 
+    # max number of requests of a JSON-RPC batch that are executed concurrently
+    MAX_CONCURRENT_BATCH_REQUESTS = 16
+    # batch responses are sent in chunks of (at least) this many bytes
+    BATCH_RESPONSE_CHUNK_SIZE = 64 * 1024
+
     def __init__(self, rpc_user, rpc_password):
         Logger.__init__(self)
         self.rpc_user = rpc_user
         self.rpc_password = rpc_password
         self.auth_lock = asyncio.Lock()
         self._methods = {}  # type: Dict[str, Callable]
+        self.rpc_stats = RPCStats()
 
     def register_method(self, f):
         assert f.__name__ not in self._methods, f"name collision for {f.__name__}"
@@ -202,34 +144,51 @@ class AuthenticatedServer(Logger):
         username, _, password = credentials.partition(':')
         if not (constant_time_compare(username, self.rpc_user)
                 and constant_time_compare(password, self.rpc_password)):
-            await asyncio.sleep(0.050)
+            # failed attempts are delayed one after the other, to slow down brute-forcing.
+            # Valid requests are not serialized.
+            async with self.auth_lock:
+                await asyncio.sleep(0.050)
             raise AuthenticationCredentialsInvalid('Invalid Credentials')
 
     async def handle(self, request):
-        async with self.auth_lock:
-            try:
-                await self.authenticate(request.headers)
-            except AuthenticationInvalidOrMissing:
-                return web.Response(headers={"WWW-Authenticate": "Basic realm=Electrum"},
-                                    text='Unauthorized', status=401)
-            except AuthenticationCredentialsInvalid:
-                return web.Response(text='Forbidden', status=403)
         try:
-            request = await request.text()
-            request = json.loads(request)
-            method = request['method']
-            _id = request['id']
-            params = request.get('params', [])  # type: Union[Sequence, Mapping]
-            if method not in self._methods:
-                raise Exception(f"attempting to use unregistered method: {method}")
-            f = self._methods[method]
+            await self.authenticate(request.headers)
+        except AuthenticationInvalidOrMissing:
+            return web.Response(headers={"WWW-Authenticate": "Basic realm=Electrum"},
+                                text='Unauthorized', status=401)
+        except AuthenticationCredentialsInvalid:
+            return web.Response(text='Forbidden', status=403)
+        try:
+            text = await request.text()
+            payload = json.loads(text)
+            if isinstance(payload, list):
+                if not payload:
+                    raise Exception("empty batch")
+            else:
+                method, _id, params = self._parse_request(payload)
         except Exception as e:
             self.logger.exception("invalid request")
             return web.Response(text='Invalid Request', status=500)
+        if isinstance(payload, list):
+            return await self._handle_batch(request, payload)
+        response = await self._execute(method, _id, params)
+        return web.json_response(response)
+
+    def _parse_request(self, payload) -> Tuple[str, object, Union[Sequence, Mapping]]:
+        method = payload['method']
+        _id = payload['id']
+        params = payload.get('params', [])  # type: Union[Sequence, Mapping]
+        if method not in self._methods:
+            raise Exception(f"attempting to use unregistered method: {method}")
+        return method, _id, params
+
+    async def _execute(self, method: str, _id, params: Union[Sequence, Mapping]) -> dict:
+        f = self._methods[method]
         response = {
             'id': _id,
             'jsonrpc': '2.0',
         }
+        start = time.monotonic()
         try:
             if isinstance(params, dict):
                 response['result'] = await f(**params)
@@ -241,7 +200,59 @@ class AuthenticatedServer(Logger):
                 'code': 1,
                 'message': str(e),
             }
-        return web.json_response(response)
+        self.rpc_stats.record(method, time.monotonic() - start, error='error' in response)
+        return response
+
+    async def _handle_batch(self, request, payloads: Sequence) -> web.StreamResponse:
+        """Executes the requests of a JSON-RPC batch concurrently.
+        The responses are streamed in the order of the requests, so that
+        the whole response does not need to be held in memory.
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_BATCH_REQUESTS)
+
+        async def run_one(payload) -> dict:
+            try:
+                method, _id, params = self._parse_request(payload)
+            except Exception as e:
+                _id = payload.get('id') if isinstance(payload, dict) else None
+                return {
+                    'id': _id,
+                    'jsonrpc': '2.0',
+                    'error': {'code': -32600, 'message': f'Invalid Request: {e!r}'},
+                }
+            async with semaphore:
+                return await self._execute(method, _id, params)
+
+        tasks = [asyncio.ensure_future(run_one(payload)) for payload in payloads]
+        try:
+            response = web.StreamResponse()
+            response.content_type = 'application/json'
+            await response.prepare(request)
+            buf = bytearray(b'[')
+            for i, task in enumerate(tasks):
+                if i > 0:
+                    buf += b','
+                # note: the response has started, so a failure must not abort it
+                try:
+                    data = json.dumps(await task)
+                except Exception as e:
+                    self.logger.exception("internal error while encoding RPC response")
+                    data = json.dumps({
+                        'id': payloads[i].get('id') if isinstance(payloads[i], dict) else None,
+                        'jsonrpc': '2.0',
+                        'error': {'code': -32603, 'message': f'Internal error: {e!r}'},
+                    })
+                buf += data.encode('utf8')
+                if len(buf) >= self.BATCH_RESPONSE_CHUNK_SIZE:
+                    await response.write(bytes(buf))
+                    buf.clear()
+            buf += b']'
+            await response.write(bytes(buf))
+            await response.write_eof()
+            return response
+        finally:
+            for task in tasks:
+                task.cancel()
 
 
 class CommandsServer(AuthenticatedServer):
@@ -267,7 +278,9 @@ class CommandsServer(AuthenticatedServer):
         self.register_method(self.run_cmdline)
 
     async def run(self):
-        self.runner = web.AppRunner(self.app)
+        # clients sending many requests can reuse their connection
+        keepalive_timeout = self.config.get('rpckeepalive', 75)
+        self.runner = web.AppRunner(self.app, keepalive_timeout=keepalive_timeout)
         await self.runner.setup()
         if self.socktype == 'unix':
             site = web.UnixSite(self.runner, self.sockpath)
@@ -340,6 +353,7 @@ class WatchTowerServer(AuthenticatedServer):
         self.app.router.add_post("/", self.handle)
         self.register_method(self.get_ctn)
         self.register_method(self.add_sweep_tx)
+        self.register_method(self.add_sweep_txs)
 
     async def run(self):
         self.runner = web.AppRunner(self.app)
@@ -354,6 +368,10 @@ class WatchTowerServer(AuthenticatedServer):
     async def add_sweep_tx(self, *args):
         return await self.lnwatcher.sweepstore.add_sweep_tx(*args)
 
+    async def add_sweep_txs(self, sweep_txs):
+        # list of [funding_outpoint, ctn, prevout, raw_tx]
+        return await self.lnwatcher.sweepstore.add_sweep_txs(sweep_txs)
+
 
 class PayServer(Logger):
 
@@ -463,6 +481,9 @@ class Daemon(Logger):
             fd = get_file_descriptor(config)
             if fd is None:
                 raise Exception('failed to lock daemon; already running?')
+        if config.get('enable_metrics', False):
+            # note: metrics are collected for the whole process
+            metrics.registry.enabled = True
         if 'wallet_path' in config.cmdline_options:
             self.logger.warning("Ignoring parameter 'wallet_path' for daemon. "
                                 "Use the load_wallet command instead.")
@@ -475,6 +496,8 @@ class Daemon(Logger):
         # path -> wallet;   make sure path is standardized.
         self._wallets = {}  # type: Dict[str, Abstract_Wallet]
         daemon_jobs = []
+        self.loop_lag_monitor = EventLoopLagMonitor()
+        daemon_jobs.append(self.loop_lag_monitor.run())
         # Setup commands server
         self.commands_server = None
         if listen_jsonrpc:
@@ -560,6 +583,28 @@ class Daemon(Logger):
     def get_wallets(self) -> Dict[str, Abstract_Wallet]:
         return dict(self._wallets)  # copy
 
+    def get_metrics(self) -> str:
+        """Metrics of the daemon, in the Prometheus text format.
+        Durations of callbacks and @profiler functions are only collected
+        if the 'enable_metrics' config variable is set."""
+        lines = []
+        lines += metrics.format_histogram(
+            'electrum_event_loop_lag_seconds', 'How late the event loop ran its timers, because it was busy.',
+            [({}, self.loop_lag_monitor.lag_stats)])
+        if self.commands_server:
+            lines += self.commands_server.rpc_stats.to_prometheus()
+        counters = sorted(util.NetworkJobOnDefaultServer.get_request_counters())
+        lines += metrics.format_metric(
+            'electrum_network_job_requests_sent', 'gauge',
+            'Requests sent to the server by a network job, since it last restarted.',
+            [({'job': job, 'name': name}, sent) for job, name, sent, answered in counters])
+        lines += metrics.format_metric(
+            'electrum_network_job_requests_answered', 'gauge',
+            'Requests of a network job answered by the server, since it last restarted.',
+            [({'job': job, 'name': name}, answered) for job, name, sent, answered in counters])
+        lines += metrics.registry.to_prometheus()
+        return '\n'.join(lines) + '\n'
+
     def delete_wallet(self, path: str) -> bool:
         self.stop_wallet(path)
         if os.path.exists(path):
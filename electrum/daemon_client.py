@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2015 Thomas Voegtlin
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Client side of the daemon's JSON-RPC interface, i.e. what is needed to
+# forward a command to a running daemon. This module is imported by the
+# command line client, so it should not import the wallet or the network,
+# nor aiohttp: requests are sent with the (blocking) http client of the
+# standard library.
+
+import ast
+import os
+import sys
+import time
+import json
+import socket
+import http.client
+from base64 import b64encode
+from typing import Tuple, Optional, TYPE_CHECKING
+
+from .util import to_string, randrange
+from .logging import get_logger
+
+if TYPE_CHECKING:
+    from .simple_config import SimpleConfig
+
+
+_logger = get_logger(__name__)
+
+
+class DaemonNotRunning(Exception):
+    pass
+
+def get_rpcsock_defaultpath(config: 'SimpleConfig'):
+    return os.path.join(config.path, 'daemon_rpc_socket')
+
+def get_rpcsock_default_type(config: 'SimpleConfig'):
+    if config.get('rpchost') and config.get('rpcport'):
+        return 'tcp'
+    # Use unix domain sockets when available,
+    # with the extra paranoia that in case windows "implements" them,
+    # we want to test it before making it the default there.
+    if hasattr(socket, 'AF_UNIX') and sys.platform != 'win32':
+        return 'unix'
+    return 'tcp'
+
+def get_lockfile(config: 'SimpleConfig'):
+    return os.path.join(config.path, 'daemon')
+
+def remove_lockfile(lockfile):
+    os.unlink(lockfile)
+
+
+def get_file_descriptor(config: 'SimpleConfig'):
+    '''Tries to create the lockfile, using O_EXCL to
+    prevent races.  If it succeeds, it returns the FD.
+    Otherwise, try and connect to the server specified in the lockfile.
+    If this succeeds, the server is returned.  Otherwise, remove the
+    lockfile and try again.'''
+    lockfile = get_lockfile(config)
+    while True:
+        try:
+            return os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except OSError:
+            pass
+        try:
+            request(config, 'ping')
+            return None
+        except DaemonNotRunning:
+            # Couldn't connect; remove lockfile and try again.
+            remove_lockfile(lockfile)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str, *, timeout: Optional[float]):
+        # the host is only used for the HTTP Host header
+        http.client.HTTPConnection.__init__(self, '127.0.0.1', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(config: 'SimpleConfig', endpoint, args=(), timeout=60):
+    lockfile = get_lockfile(config)
+    while True:
+        create_time = None
+        try:
+            with open(lockfile) as f:
+                socktype, address, create_time = ast.literal_eval(f.read())
+                if socktype == 'unix':
+                    conn = UnixHTTPConnection(address, timeout=timeout or None)
+                elif socktype == 'tcp':
+                    (host, port) = address
+                    conn = http.client.HTTPConnection(host, port, timeout=timeout or None)
+                else:
+                    raise Exception(f"corrupt lockfile; socktype={socktype!r}")
+        except Exception:
+            raise DaemonNotRunning()
+        rpc_user, rpc_password = get_rpc_credentials(config)
+        try:
+            try:
+                conn.connect()
+            except OSError as e:
+                _logger.info(f"failed to connect to JSON-RPC server {e!r}")
+                if not create_time or create_time < time.time() - 1.0:
+                    raise DaemonNotRunning()
+            else:
+                return _jsonrpc_request(conn, endpoint, args, rpc_user=rpc_user, rpc_password=rpc_password)
+        finally:
+            conn.close()
+        # Sleep a bit and try again; it might have just been started
+        time.sleep(1.0)
+
+
+def _jsonrpc_request(conn: http.client.HTTPConnection, endpoint, args, *, rpc_user: str, rpc_password: str):
+    # note: errors are returned as strings, like util.JsonRPCClient
+    data = json.dumps({"jsonrpc": "2.0", "id": "1", "method": endpoint, "params": list(args)})
+    credentials = b64encode(f'{rpc_user}:{rpc_password}'.encode('utf8')).decode('ascii')
+    conn.request('POST', '/', body=data.encode('utf8'), headers={
+        'Authorization': f'Basic {credentials}',
+        'Content-Type': 'application/json',
+    })
+    resp = conn.getresponse()
+    text = resp.read().decode('utf8')
+    if resp.status != 200:
+        return 'Error: ' + text
+    r = json.loads(text)
+    error = r.get('error')
+    if error:
+        return 'Error: ' + str(error)
+    return r.get('result')
+
+
+def get_rpc_credentials(config: 'SimpleConfig') -> Tuple[str, str]:
+    rpc_user = config.get('rpcuser', None)
+    rpc_password = config.get('rpcpassword', None)
+    if rpc_user == '':
+        rpc_user = None
+    if rpc_password == '':
+        rpc_password = None
+    if rpc_user is None or rpc_password is None:
+        rpc_user = 'user'
+        bits = 128
+        nbytes = bits // 8 + (bits % 8 > 0)
+        pw_int = randrange(pow(2, bits))
+        pw_b64 = b64encode(
+            pw_int.to_bytes(nbytes, 'big'), b'-_')
+        rpc_password = to_string(pw_b64, 'ascii')
+        config.set_key('rpcuser', rpc_user)
+        config.set_key('rpcpassword', rpc_password, save=True)
+    return rpc_user, rpc_password
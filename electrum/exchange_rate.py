@@ -1,5 +1,6 @@
 import asyncio
-from datetime import datetime
+from array import array
+from datetime import datetime, date
 import inspect
 import sys
 import os
@@ -7,14 +8,16 @@ import json
 import time
 import csv
 import decimal
+import struct
 from decimal import Decimal
-from typing import Sequence, Optional
+from typing import Sequence, Optional, Dict
 
 from aiorpcx.curio import timeout_after, TaskTimeout
 import aiohttp
 
 from . import util
 from .bitcoin import COIN
+from .cost_basis import COST_BASIS_METHODS
 from .i18n import _
 from .util import (ThreadJob, make_dir, log_exceptions, OldTaskGroup,
                    make_aiohttp_session, resource_path)
@@ -37,11 +40,91 @@ CCY_PRECISIONS = {'BHD': 3, 'BIF': 0, 'BYR': 0, 'CLF': 4, 'CLP': 0,
                   'VUV': 0, 'XAF': 0, 'XAU': 4, 'XOF': 0, 'XPF': 0}
 
 
+EPOCH_DAY = date(1970, 1, 1).toordinal()
+
+
+def timestamp_to_day(timestamp: float) -> int:
+    """Returns the ordinal of the local date of a timestamp,
+    i.e. timestamp_to_datetime(timestamp).toordinal(), without creating a datetime."""
+    return (int(timestamp) + time.localtime(timestamp).tm_gmtoff) // 86400 + EPOCH_DAY
+
+
+class HistoricalRates:
+    """Daily exchange rates of a currency, in an array indexed by day.
+    Missing days are NaN.
+    """
+
+    MAGIC = b'EFXR'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBiI')  # magic, version, first day, number of days
+
+    def __init__(self, first_day: int, rates: array, *, timestamp: float = None):
+        self.first_day = first_day
+        self.rates = rates  # type: array  # of doubles
+        self.timestamp = time.time() if timestamp is None else timestamp  # when the rates were downloaded
+        self._decimals = {}  # type: Dict[int, Decimal]
+
+    @classmethod
+    def from_dict(cls, h: dict, *, timestamp: float = None) -> 'HistoricalRates':
+        """h maps 'YYYY-MM-DD' to a rate, as returned by ExchangeBase.request_history."""
+        by_day = {}
+        for k, v in h.items():
+            try:
+                by_day[date.fromisoformat(k).toordinal()] = float(v)
+            except (TypeError, ValueError):
+                continue
+        if not by_day:
+            return cls(0, array('d'), timestamp=timestamp)
+        first_day = min(by_day)
+        rates = array('d', [float('nan')]) * (max(by_day) - first_day + 1)
+        for day, rate in by_day.items():
+            rates[day - first_day] = rate
+        return cls(first_day, rates, timestamp=timestamp)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, *, timestamp: float = None) -> 'HistoricalRates':
+        magic, version, first_day, num_days = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError('unknown fx history format')
+        rates = array('d')
+        rates.frombytes(data[cls.HEADER.size:cls.HEADER.size + 8 * num_days])
+        if len(rates) != num_days:
+            raise ValueError('truncated fx history')
+        if sys.byteorder == 'big':
+            rates.byteswap()
+        return cls(first_day, rates, timestamp=timestamp)
+
+    def to_bytes(self) -> bytes:
+        rates = array('d', self.rates)
+        if sys.byteorder == 'big':
+            rates.byteswap()
+        return self.HEADER.pack(self.MAGIC, self.VERSION, self.first_day, len(rates)) + rates.tobytes()
+
+    def __len__(self):
+        return len(self.rates)
+
+    def get_rate(self, day: int) -> Optional[Decimal]:
+        """Rate of a day, given as a date ordinal. None if unknown."""
+        rate = self._decimals.get(day)
+        if rate is not None:
+            return rate
+        i = day - self.first_day
+        if not 0 <= i < len(self.rates):
+            return None
+        r = self.rates[i]
+        if r != r:  # NaN
+            return None
+        # note: repr gives the shortest string that round-trips, e.g. '0.1'
+        #       instead of the exact binary expansion of the double
+        rate = self._decimals[day] = Decimal(repr(r))
+        return rate
+
+
 class ExchangeBase(Logger):
 
     def __init__(self, on_quotes, on_history):
         Logger.__init__(self)
-        self.history = {}
+        self.history = {}  # type: Dict[str, HistoricalRates]
         self.quotes = {}
         self.on_quotes = on_quotes
         self.on_history = on_history
@@ -88,28 +171,46 @@ class ExchangeBase(Logger):
             self.quotes = {}
         self.on_quotes()
 
-    def read_historical_rates(self, ccy, cache_dir) -> Optional[dict]:
-        filename = os.path.join(cache_dir, self.name() + '_'+ ccy)
-        if not os.path.exists(filename):
-            return None
-        timestamp = os.stat(filename).st_mtime
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                h = json.loads(f.read())
-        except:
-            return None
+    def _history_filename(self, ccy, cache_dir) -> str:
+        return os.path.join(cache_dir, self.name() + '_' + ccy)
+
+    def read_historical_rates(self, ccy, cache_dir) -> Optional[HistoricalRates]:
+        """Loads the cached rates. Their age is the mtime of the cache file."""
+        filename = self._history_filename(ccy, cache_dir)
+        h = None
+        if os.path.exists(filename + '.bin'):
+            timestamp = os.stat(filename + '.bin').st_mtime
+            try:
+                with open(filename + '.bin', 'rb') as f:
+                    h = HistoricalRates.from_bytes(f.read(), timestamp=timestamp)
+            except Exception:
+                h = None
+        if h is None and os.path.exists(filename):
+            # json cache of older versions
+            timestamp = os.stat(filename).st_mtime
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    h = HistoricalRates.from_dict(json.loads(f.read()), timestamp=timestamp)
+            except Exception:
+                h = None
         if not h:  # e.g. empty dict
             return None
-        h['timestamp'] = timestamp
         self.history[ccy] = h
         self.on_history()
         return h
 
+    def write_historical_rates(self, ccy, cache_dir, h: HistoricalRates) -> None:
+        filename = self._history_filename(ccy, cache_dir) + '.bin'
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(h.to_bytes())
+        os.replace(tmp_filename, filename)
+
     @log_exceptions
     async def get_historical_rates_safe(self, ccy, cache_dir):
         try:
             self.logger.info(f"requesting fx history for {ccy}")
-            h = await self.request_history(ccy)
+            h = HistoricalRates.from_dict(await self.request_history(ccy))
             self.logger.info(f"received fx history for {ccy}")
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             self.logger.info(f"failed fx history: {repr(e)}")
@@ -117,10 +218,7 @@ class ExchangeBase(Logger):
         except Exception as e:
             self.logger.exception(f"failed fx history: {repr(e)}")
             return
-        filename = os.path.join(cache_dir, self.name() + '_' + ccy)
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(json.dumps(h))
-        h['timestamp'] = time.time()
+        self.write_historical_rates(ccy, cache_dir, h)
         self.history[ccy] = h
         self.on_history()
 
@@ -130,14 +228,19 @@ class ExchangeBase(Logger):
         h = self.history.get(ccy)
         if h is None:
             h = self.read_historical_rates(ccy, cache_dir)
-        if h is None or h['timestamp'] < time.time() - 24*3600:
+        if h is None or h.timestamp < time.time() - 24*3600:
             asyncio.get_event_loop().create_task(self.get_historical_rates_safe(ccy, cache_dir))
 
     def history_ccys(self):
         return []
 
     def historical_rate(self, ccy, d_t):
-        return self.history.get(ccy, {}).get(d_t.strftime('%Y-%m-%d'), 'NaN')
+        rate = self.historical_rate_for_day(ccy, d_t.toordinal())
+        return 'NaN' if rate is None else rate
+
+    def historical_rate_for_day(self, ccy, day: int) -> Optional[Decimal]:
+        h = self.history.get(ccy)
+        return h.get_rate(day) if h is not None else None
 
     async def request_history(self, ccy):
         raise NotImplementedError()  # implemented by subclasses
@@ -558,6 +661,15 @@ class FxThread(ThreadJob):
     def set_history_capital_gains_config(self, b):
         self.config.set_key('history_rates_capital_gains', bool(b))
 
+    def get_cost_basis_method(self) -> str:
+        """How acquisition prices are computed for capital gains: 'average' or 'fifo'."""
+        method = self.config.get('history_cost_basis', 'average')
+        return method if method in COST_BASIS_METHODS else 'average'
+
+    def set_cost_basis_method(self, method: str):
+        assert method in COST_BASIS_METHODS, method
+        self.config.set_key('history_cost_basis', method)
+
     def get_fiat_address_config(self):
         return bool(self.config.get('fiat_address'))
 
@@ -644,14 +756,19 @@ class FxThread(ThreadJob):
     def history_rate(self, d_t: Optional[datetime]) -> Decimal:
         if d_t is None:
             return Decimal('NaN')
-        rate = self.exchange.historical_rate(self.ccy, d_t)
+        return self._day_rate(d_t.toordinal())
+
+    def _day_rate(self, day: int) -> Decimal:
+        rate = self.exchange.historical_rate_for_day(self.ccy, day)
+        if rate is not None:
+            return rate
         # Frequently there is no rate for today, until tomorrow :)
         # Use spot quotes in that case
-        if rate in ('NaN', None) and (datetime.today().date() - d_t.date()).days <= 2:
-            rate = self.exchange.quotes.get(self.ccy, 'NaN')
+        if date.today().toordinal() - day <= 2:
+            rate = self.exchange.quotes.get(self.ccy)
             self.history_used_spot = True
         if rate is None:
-            rate = 'NaN'
+            return Decimal('NaN')
         return Decimal(rate)
 
     def historical_value_str(self, satoshis, d_t: Optional[datetime]) -> str:
@@ -661,9 +778,9 @@ class FxThread(ThreadJob):
         return self.fiat_value(satoshis, self.history_rate(d_t))
 
     def timestamp_rate(self, timestamp: Optional[int]) -> Decimal:
-        from .util import timestamp_to_datetime
-        date = timestamp_to_datetime(timestamp)
-        return self.history_rate(date)
+        if timestamp is None:
+            return Decimal('NaN')
+        return self._day_rate(timestamp_to_day(timestamp))
 
 
 assert globals().get(DEFAULT_EXCHANGE), f"default exchange {DEFAULT_EXCHANGE} does not exist"
@@ -3,14 +3,21 @@
 
 from PyQt5 import QtCore, QtWidgets
 
+from electrum.util import OrderedDictWithIndex
+
+
 class CustomNode:
 
     def __init__(self, model, data):
         self.model = model
         self._data = data
-        self._children = []
+        # children are indexed by position, so that rows can be inserted and removed anywhere
+        self._children = OrderedDictWithIndex()
+        # incremented when the rows of children change, to invalidate their cached row
+        self._children_version = 0
         self._parent = None
-        self._row = 0
+        self._row = None
+        self._row_version = None
 
     def get_data(self):
         return self._data
@@ -24,18 +31,44 @@ class CustomNode:
 
     def child(self, row):
         if row >= 0 and row < self.childCount():
-            return self._children[row]
+            return self._children.key_from_pos(row)
+
+    def children(self):
+        return list(self._children)
 
     def parent(self):
         return self._parent
 
     def row(self):
+        parent = self._parent
+        if parent is None:
+            return 0
+        if self._row_version != parent._children_version:
+            self._row = parent._children.pos_from_key(self)
+            self._row_version = parent._children_version
         return self._row
 
-    def addChild(self, child):
+    def _set_row(self, child, row):
         child._parent = self
-        child._row = len(self._children)
-        self._children.append(child)
+        child._row = row
+        child._row_version = self._children_version
+
+    def addChild(self, child):
+        self._children[child] = None
+        self._set_row(child, len(self._children) - 1)
+
+    def insertChild(self, row, child):
+        if row < len(self._children):
+            self._children_version += 1  # the following rows move
+        self._children.insert(row, child, None)
+        self._set_row(child, min(row, len(self._children) - 1))
+
+    def removeChild(self, child):
+        if child.row() < len(self._children) - 1:
+            self._children_version += 1  # the following rows move
+        del self._children[child]
+        child._parent = None
+        child._row_version = None
 
 
 
@@ -35,7 +35,7 @@ from decimal import Decimal
 
 from PyQt5.QtGui import QMouseEvent, QFont, QBrush, QColor
 from PyQt5.QtCore import (Qt, QPersistentModelIndex, QModelIndex, QAbstractItemModel,
-                          QSortFilterProxyModel, QVariant, QItemSelectionModel, QDate, QPoint)
+                          QSortFilterProxyModel, QVariant, QDate, QPoint)
 from PyQt5.QtWidgets import (QMenu, QHeaderView, QLabel, QMessageBox,
                              QPushButton, QComboBox, QVBoxLayout, QCalendarWidget,
                              QGridLayout)
@@ -44,7 +44,7 @@ from electrum.gui import messages
 from electrum.address_synchronizer import TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE
 from electrum.i18n import _
 from electrum.util import (block_explorer_URL, profiler, TxMinedInfo,
-                           OrderedDictWithIndex, timestamp_to_datetime,
+                           OrderedDictWithIndex, longest_increasing_subsequence, timestamp_to_datetime,
                            Satoshis, Fiat, format_time)
 from electrum.logging import get_logger, Logger
 
@@ -234,6 +234,8 @@ class HistoryModel(CustomModel, Logger):
         self.parent = parent
         self.view = None  # type: HistoryList
         self.transactions = OrderedDictWithIndex()
+        self._nodes = {}  # type: Dict[str, HistoryNode]  # top-level nodes, by key
+        self._item_nodes = {}  # type: Dict[str, HistoryNode]  # node of each item, by item key
         self.tx_status_cache = {}  # type: Dict[str, Tuple[int, str]]
 
     def set_view(self, history_list: 'HistoryList'):
@@ -264,10 +266,6 @@ class HistoryModel(CustomModel, Logger):
         assert self.view, 'view not set'
         if self.view.maybe_defer_update():
             return
-        selected = self.view.selectionModel().currentIndex()
-        selected_row = None
-        if selected:
-            selected_row = selected.row()
         fx = self.parent.fx
         if fx: fx.history_used_spot = False
         wallet = self.parent.wallet
@@ -278,24 +276,38 @@ class HistoryModel(CustomModel, Logger):
             include_lightning=self.should_include_lightning_payments())
         if transactions == self.transactions:
             return
-        old_length = self._root.childCount()
-        if old_length != 0:
-            self.beginRemoveRows(QModelIndex(), 0, old_length)
-            self.transactions.clear()
-            self._root = HistoryNode(self, None)
-            self.endRemoveRows()
-        parents = {}
+        self.update_rows(self.create_nodes(transactions))
+        self.transactions = transactions
+        self.view.filter()
+        # update time filter
+        if not self.view.years and self.transactions:
+            start_date = date.today()
+            end_date = date.today()
+            if len(self.transactions) > 0:
+                start_date = self.transactions.value_from_pos(0).get('date') or start_date
+                end_date = self.transactions.value_from_pos(len(self.transactions) - 1).get('date') or end_date
+            self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
+            self.view.period_combo.insertItems(1, self.view.years)
+        # update tx_status_cache
+        self.tx_status_cache.clear()
+        for txid, tx_item in self.transactions.items():
+            if not tx_item.get('lightning', False):
+                tx_mined_info = self.tx_mined_info_from_tx_item(tx_item)
+                self.tx_status_cache[txid] = self.parent.wallet.get_tx_status(txid, tx_mined_info)
+
+    def create_nodes(self, transactions: OrderedDictWithIndex) -> Dict[str, HistoryNode]:
+        """Returns the top-level nodes, by key. Items of a group are children of its node."""
+        nodes = {}
         for tx_item in transactions.values():
             node = HistoryNode(self, tx_item)
             group_id = tx_item.get('group_id')
             if group_id is None:
-                self._root.addChild(node)
+                nodes[get_item_key(tx_item)] = node
             else:
-                parent = parents.get(group_id)
+                parent = nodes.get(group_id)
                 if parent is None:
                     # create parent if it does not exist
-                    self._root.addChild(node)
-                    parents[group_id] = node
+                    nodes[group_id] = node
                 else:
                     # if parent has no children, create two children
                     if parent.childCount() == 0:
@@ -324,30 +336,64 @@ class HistoryModel(CustomModel, Logger):
                         parent._data['timestamp'] = tx_item['timestamp']
                         parent._data['height'] = tx_item['height']
                         parent._data['confirmations'] = tx_item['confirmations']
-
-        new_length = self._root.childCount()
-        self.beginInsertRows(QModelIndex(), 0, new_length-1)
-        self.transactions = transactions
-        self.endInsertRows()
-
-        if selected_row:
-            self.view.selectionModel().select(self.createIndex(selected_row, 0), QItemSelectionModel.Rows | QItemSelectionModel.SelectCurrent)
-        self.view.filter()
-        # update time filter
-        if not self.view.years and self.transactions:
-            start_date = date.today()
-            end_date = date.today()
-            if len(self.transactions) > 0:
-                start_date = self.transactions.value_from_pos(0).get('date') or start_date
-                end_date = self.transactions.value_from_pos(len(self.transactions) - 1).get('date') or end_date
-            self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
-            self.view.period_combo.insertItems(1, self.view.years)
-        # update tx_status_cache
-        self.tx_status_cache.clear()
-        for txid, tx_item in self.transactions.items():
-            if not tx_item.get('lightning', False):
-                tx_mined_info = self.tx_mined_info_from_tx_item(tx_item)
-                self.tx_status_cache[txid] = self.parent.wallet.get_tx_status(txid, tx_mined_info)
+        return nodes
+
+    def update_rows(self, nodes: Dict[str, HistoryNode]):
+        """Replaces the top-level rows with nodes, with incremental row
+        removals, insertions and data changes, so that the view keeps
+        its selection and scroll position.
+        """
+        old_nodes = self._nodes
+        # rows that stay, and keep their relative order
+        common = [key for key in nodes
+                  if key in old_nodes and old_nodes[key].childCount() == nodes[key].childCount()]
+        old_rows = [old_nodes[key].row() for key in common]
+        kept = {common[i] for i in longest_increasing_subsequence(old_rows)}
+        if not kept:
+            old_length = self._root.childCount()
+            if old_length != 0:
+                self.beginRemoveRows(QModelIndex(), 0, old_length - 1)
+                self._root = HistoryNode(self, None)
+                self.endRemoveRows()
+            if nodes:
+                self.beginInsertRows(QModelIndex(), 0, len(nodes) - 1)
+                for node in nodes.values():
+                    self._root.addChild(node)
+                self.endInsertRows()
+            self._set_nodes(nodes)
+            return
+        for key, node in old_nodes.items():
+            if key not in kept:
+                row = node.row()
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self._root.removeChild(node)
+                self.endRemoveRows()
+        last_column = len(HistoryColumns) - 1
+        for row, (key, node) in enumerate(nodes.items()):
+            if key not in kept:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._root.insertChild(row, node)
+                self.endInsertRows()
+                continue
+            old_node = old_nodes[key]
+            for old_child, child in zip([old_node] + old_node.children(), [node] + node.children()):
+                changed = old_child.get_data() != child.get_data()
+                old_child._data = child.get_data()
+                if changed:
+                    child_row = old_child.row()
+                    self.dataChanged.emit(
+                        self.createIndex(child_row, 0, old_child),
+                        self.createIndex(child_row, last_column, old_child))
+            nodes[key] = old_node
+        self._set_nodes(nodes)
+
+    def _set_nodes(self, nodes: Dict[str, HistoryNode]):
+        self._nodes = nodes
+        # items of a group are the children of its node
+        self._item_nodes = {}
+        for node in nodes.values():
+            for item_node in (node.children() or [node]):
+                self._item_nodes[get_item_key(item_node.get_data())] = item_node
 
     def set_visibility_of_columns(self):
         def set_visible(col: int, b: bool):
@@ -373,20 +419,29 @@ class HistoryModel(CustomModel, Logger):
 
     def update_tx_mined_status(self, tx_hash: str, tx_mined_info: TxMinedInfo):
         try:
-            row = self.transactions.pos_from_key(tx_hash)
             tx_item = self.transactions[tx_hash]
+            node = self._item_nodes[tx_hash]
         except KeyError:
             return
         self.tx_status_cache[tx_hash] = self.parent.wallet.get_tx_status(tx_hash, tx_mined_info)
-        tx_item.update({
+        mined_fields = {
             'confirmations':  tx_mined_info.conf,
             'timestamp':      tx_mined_info.timestamp,
             'txpos_in_block': tx_mined_info.txpos,
             'date':           timestamp_to_datetime(tx_mined_info.timestamp),
-        })
-        topLeft = self.createIndex(row, 0)
-        bottomRight = self.createIndex(row, len(HistoryColumns) - 1)
-        self.dataChanged.emit(topLeft, bottomRight)
+        }
+        tx_item.update(mined_fields)
+        # the row of a group shows the status of the group's transaction too
+        parent_node = node.parent()
+        rows = [node] if parent_node is self._root else [node, parent_node]
+        for n in rows:
+            # note: nodes might display a copy of tx_item
+            if n.get_data().get('txid') == tx_hash:
+                n.get_data().update(mined_fields)
+            row = n.row()
+            topLeft = self.createIndex(row, 0, n)
+            bottomRight = self.createIndex(row, len(HistoryColumns) - 1, n)
+            self.dataChanged.emit(topLeft, bottomRight)
 
     def on_fee_histogram(self):
         for tx_hash, tx_item in list(self.transactions.items()):
@@ -38,7 +38,7 @@ import hashlib
 import functools
 
 import aiorpcx
-from aiorpcx import RPCSession, Notification, NetAddress, NewlineFramer
+from aiorpcx import RPCSession, Notification, NetAddress, NewlineFramer, run_in_thread
 from aiorpcx.curio import timeout_after, TaskTimeout
 from aiorpcx.jsonrpc import JSONRPC, CodeMessageError
 from aiorpcx.rawsocket import RSClient
@@ -52,7 +52,7 @@ from . import x509
 from . import pem
 from . import version
 from . import blockchain
-from .blockchain import Blockchain, HEADER_SIZE
+from .blockchain import Blockchain, HEADER_SIZE, hash_raw_header
 from . import bitcoin
 from . import constants
 from .i18n import _
@@ -137,6 +137,9 @@ class NotificationSession(RPCSession):
         super(NotificationSession, self).__init__(*args, **kwargs)
         self.subscriptions = defaultdict(list)
         self.cache = {}
+        self._subscription_methods = {}  # type: Dict[str, str]  # key -> method
+        self._pending_subscriptions = {}  # type: Dict[str, asyncio.Future]
+        self.num_shared_requests = 0
         self.default_timeout = NetworkTimeout.Generic.NORMAL
         self._msg_counter = itertools.count(start=1)
         self.interface = interface
@@ -185,14 +188,23 @@ class NotificationSession(RPCSession):
         self.max_send_delay = timeout
 
     async def subscribe(self, method: str, params: List, queue: asyncio.Queue):
-        # note: until the cache is written for the first time,
-        # each 'subscribe' call might make a request on the network.
+        # note: the same key might be subscribed to by many consumers, e.g. the
+        # synchronizers of several wallets. Only the first 'subscribe' call makes
+        # a request on the network, concurrent calls wait for its response.
         key = self.get_hashable_key_for_rpc_call(method, params)
+        self._subscription_methods[key] = method
         self.subscriptions[key].append(queue)
         if key in self.cache:
             result = self.cache[key]
         else:
-            result = await self.send_request(method, params)
+            fut = self._pending_subscriptions.get(key)
+            if fut is None:
+                fut = asyncio.ensure_future(self.send_request(method, params))
+                self._pending_subscriptions[key] = fut
+                fut.add_done_callback(lambda f: self._pending_subscriptions.pop(key, None))
+            else:
+                self.num_shared_requests += 1
+            result = await asyncio.shield(fut)
             self.cache[key] = result
         await queue.put(params + [result])
 
@@ -204,6 +216,17 @@ class NotificationSession(RPCSession):
             if queue in v:
                 v.remove(queue)
 
+    def get_subscription_counts(self) -> Dict[str, int]:
+        """Number of distinct subscriptions per method that have consumers."""
+        counts = defaultdict(int)
+        for key, queues in self.subscriptions.items():
+            if queues:
+                counts[self._subscription_methods[key]] += 1
+        return dict(counts)
+
+    def get_num_subscribers(self) -> int:
+        return sum(len(queues) for queues in self.subscriptions.values())
+
     @classmethod
     def get_hashable_key_for_rpc_call(cls, method, params):
         """Hashable index for subscriptions and cache"""
@@ -358,6 +381,91 @@ def _get_cert_path_for_host(*, config: 'SimpleConfig', host: str) -> str:
     return os.path.join(config.path, 'certs', filename)
 
 
+def _get_chunk_size(index: int, tip: Optional[int]) -> int:
+    size = 2016
+    if tip is not None:
+        size = min(size, tip - index * 2016 + 1)
+        size = max(size, 0)
+    return size
+
+
+class _HeaderChunkFetcher:
+    """Fetches the header chunks that Interface.sync_until will need next,
+    in parallel, from the syncing interface and from the other connected interfaces.
+
+    A chunk from another interface is only used if the hash of its last header
+    matches the one of the syncing interface, otherwise it is fetched again
+    from the syncing interface. Chunks are still verified and connected
+    in order, by the syncing interface.
+    """
+
+    # number of chunks requested ahead of the one being connected
+    NUM_CHUNKS_AHEAD = 8
+
+    def __init__(self, interface: 'Interface', *, tip: int):
+        self.interface = interface
+        self.tip = tip
+        self._tasks = {}  # type: Dict[Tuple[int, int], asyncio.Task]
+        self._counter = itertools.count()
+
+    async def get_chunk(self, index: int, size: int) -> str:
+        self._schedule(index)
+        task = self._tasks.pop((index, size), None)
+        if task is None:
+            return await self.interface.fetch_chunk(index, size)
+        return await task
+
+    def _schedule(self, first_index: int) -> None:
+        last_index = min(first_index + self.NUM_CHUNKS_AHEAD, self.tip // 2016)
+        for index in range(first_index, last_index + 1):
+            size = _get_chunk_size(index, self.tip)
+            if size > 0 and (index, size) not in self._tasks:
+                self._tasks[(index, size)] = asyncio.ensure_future(self._fetch_chunk(index, size))
+
+    def _get_interface_for_chunk(self, index: int, size: int) -> 'Interface':
+        network = self.interface.network
+        with network.interfaces_lock:
+            candidates = list(network.interfaces.values())
+        last_height = index * 2016 + size - 1
+        candidates = [iface for iface in candidates
+                      if iface is not self.interface
+                      and iface.ready.done() and not iface.got_disconnected.is_set()
+                      and iface.session and iface.tip >= last_height]
+        candidates.insert(0, self.interface)
+        return candidates[next(self._counter) % len(candidates)]
+
+    async def _fetch_chunk(self, index: int, size: int) -> str:
+        iface = self._get_interface_for_chunk(index, size)
+        if iface is not self.interface:
+            last_height = index * 2016 + size - 1
+            # note: if the other interface gets disconnected, the request
+            #       might get cancelled, and we must not be cancelled with it.
+            task = asyncio.ensure_future(asyncio.gather(
+                iface.fetch_chunk(index, size),
+                self.interface.get_block_header_hash(last_height)))
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            if task.cancelled() or task.exception():
+                e = None if task.cancelled() else task.exception()
+                self.interface.logger.info(f"failed to get chunk {index} from {iface.server}: {repr(e)}")
+            else:
+                hexdata, last_hash = task.result()
+                if hash_raw_header(hexdata[-HEADER_SIZE * 2:]) == last_hash:
+                    return hexdata
+                self.interface.logger.info(f"chunk {index} from {iface.server} does not match our server")
+        return await self.interface.fetch_chunk(index, size)
+
+    def clear(self) -> None:
+        for task in self._tasks.values():
+            if task.done() and not task.cancelled():
+                task.exception()  # mark as retrieved
+            task.cancel()
+        self._tasks.clear()
+
+
 class Interface(Logger):
 
     LOGGING_SHORTCUT = 'i'
@@ -375,6 +483,9 @@ class Interface(Logger):
         self.proxy = MySocksProxy.from_proxy_dict(proxy)
         self.session = None  # type: Optional[NotificationSession]
         self._ipaddr_bucket = None
+        # requests that are in flight, shared by all callers, see _shared_request
+        self._pending_requests = {}  # type: Dict[Tuple, asyncio.Future]
+        self.num_shared_requests = 0
 
         # Latest block header and corresponding height, as claimed by the server.
         # Note that these values are updated before they are verified.
@@ -604,22 +715,42 @@ class Interface(Logger):
         res = await self.session.send_request('blockchain.block.header', [height], timeout=timeout)
         return blockchain.deserialize_header(bytes.fromhex(res), height)
 
-    async def request_chunk(self, height: int, tip=None, *, can_return_early=False):
+    async def get_block_header_hash(self, height: int) -> str:
+        timeout = self.network.get_network_timeout_seconds(NetworkTimeout.Urgent)
+        res = await self.session.send_request('blockchain.block.header', [height], timeout=timeout)
+        assert_hex_str(res)
+        if len(res) != HEADER_SIZE * 2:
+            raise RequestCorrupted(f'unexpected header size: {len(res)}')
+        return hash_raw_header(res)
+
+    async def request_chunk(self, height: int, tip=None, *, can_return_early=False,
+                            chunk_fetcher: _HeaderChunkFetcher = None):
         if not is_non_negative_integer(height):
             raise Exception(f"{repr(height)} is not a block height")
         index = height // 2016
         if can_return_early and index in self._requested_chunks:
             return
-        self.logger.info(f"requesting chunk from height {height}")
-        size = 2016
-        if tip is not None:
-            size = min(size, tip - index * 2016 + 1)
-            size = max(size, 0)
+        size = _get_chunk_size(index, tip)
         try:
             self._requested_chunks.add(index)
-            res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
+            if chunk_fetcher:
+                hexdata = await chunk_fetcher.get_chunk(index, size)
+            else:
+                hexdata = await self.fetch_chunk(index, size)
         finally:
             self._requested_chunks.discard(index)
+        # verify and write the chunk in a thread, so that
+        # chunks requested ahead keep downloading meanwhile.
+        # connect_chunk holds the lock of the blockchain while it runs
+        conn = await run_in_thread(self.blockchain.connect_chunk, index, hexdata)
+        if not conn:
+            return conn, 0
+        return conn, size
+
+    async def fetch_chunk(self, index: int, size: int) -> str:
+        """Returns the raw headers of a chunk, without verifying them."""
+        self.logger.info(f"requesting chunk from height {index * 2016}")
+        res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
         assert_dict_contains_field(res, field_name='count')
         assert_dict_contains_field(res, field_name='hex')
         assert_dict_contains_field(res, field_name='max')
@@ -633,10 +764,7 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        return res['hex']
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -757,22 +885,29 @@ class Interface(Logger):
         if next_height is None:
             next_height = self.tip
         last = None
-        while last is None or height <= next_height:
-            prev_last, prev_height = last, height
-            if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
-                if not could_connect:
-                    if height <= constants.net.max_checkpoint():
-                        raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+        chunk_fetcher = _HeaderChunkFetcher(self, tip=next_height)
+        try:
+            while last is None or height <= next_height:
+                prev_last, prev_height = last, height
+                if next_height > height + 10:
+                    could_connect, num_headers = await self.request_chunk(
+                        height, next_height, chunk_fetcher=chunk_fetcher)
+                    if not could_connect:
+                        # chunks fetched ahead might not connect either
+                        chunk_fetcher.clear()
+                        if height <= constants.net.max_checkpoint():
+                            raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+                        last, height = await self.step(height)
+                        continue
+                    util.trigger_callback('network_updated')
+                    height = (height // 2016 * 2016) + num_headers
+                    assert height <= next_height+1, (height, self.tip)
+                    last = 'catchup'
+                else:
                     last, height = await self.step(height)
-                    continue
-                util.trigger_callback('network_updated')
-                height = (height // 2016 * 2016) + num_headers
-                assert height <= next_height+1, (height, self.tip)
-                last = 'catchup'
-            else:
-                last, height = await self.step(height)
-            assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
+                assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
+        finally:
+            chunk_fetcher.clear()
         return last, height
 
     async def step(self, height, header=None):
@@ -928,11 +1063,46 @@ class Interface(Logger):
             self._ipaddr_bucket = do_bucket()
         return self._ipaddr_bucket
 
+    async def _shared_request(self, key: Tuple, coro_func, *args, timeout=None):
+        """Awaits coro_func(*args), unless an identical request, with the same key,
+        is already in flight. In that case, its result is shared.
+        This avoids sending the same request many times when several wallets
+        or watchers that use this interface need the same data.
+
+        note: the request is not cancelled if one of the callers is cancelled.
+        """
+        fut = self._pending_requests.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(coro_func(*args))
+            self._pending_requests[key] = fut
+            fut.add_done_callback(lambda f: self._pending_requests.pop(key, None))
+        else:
+            self.num_shared_requests += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError as e:
+            raise RequestTimedOut(f'request timed out: {key}') from e
+
+    def get_subscription_stats(self) -> dict:
+        session = self.session
+        return {
+            'server': str(self.server),
+            'subscriptions': session.get_subscription_counts() if session else {},
+            'subscribers': session.get_num_subscribers() if session else 0,
+            'shared_requests': self.num_shared_requests + (session.num_shared_requests if session else 0),
+            'pending_requests': len(self._pending_requests),
+        }
+
     async def get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         if not is_non_negative_integer(tx_height):
             raise Exception(f"{repr(tx_height)} is not a block height")
+        return await self._shared_request(
+            ('blockchain.transaction.get_merkle', tx_hash, tx_height),
+            self._get_merkle_for_transaction, tx_hash, tx_height)
+
+    async def _get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
         # do request
         res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
         # check response
@@ -950,10 +1120,47 @@ class Interface(Logger):
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
+        raw = self.network.raw_tx_cache.get(tx_hash)
+        if raw is not None:
+            return raw
+        raw = await self._shared_request(
+            ('blockchain.transaction.get', tx_hash),
+            self._get_transaction, tx_hash, timeout, timeout=timeout)
+        self._check_transaction(tx_hash, raw)
+        self.network.raw_tx_cache.add(tx_hash, raw)
+        return raw
+
+    async def get_parsed_transaction(self, tx_hash: str, *, timeout=None) -> Transaction:
+        """Returns the transaction, already deserialized and with its txid checked.
+        The raw tx cache of the network is used, and filled.
+        Each caller gets its own Transaction object.
+        """
+        if not is_hash256_str(tx_hash):
+            raise Exception(f"{repr(tx_hash)} is not a txid")
+        raw = self.network.raw_tx_cache.get(tx_hash)
+        if raw is not None:
+            # note: the cache only holds transactions that were checked
+            tx = Transaction(raw)
+            tx.deserialize()
+            return tx
+        raw = await self._shared_request(
+            ('blockchain.transaction.get', tx_hash),
+            self._get_transaction, tx_hash, timeout, timeout=timeout)
+        # the object that was checked is passed on, with its txid cached
+        tx = self._check_transaction(tx_hash, raw)
+        self.network.raw_tx_cache.add(tx_hash, raw)
+        return tx
+
+    async def _get_transaction(self, tx_hash: str, timeout=None) -> str:
         raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
         # validate response
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
+        return raw
+
+    @classmethod
+    def _check_transaction(cls, tx_hash: str, raw: str) -> Transaction:
+        """Deserializes a received transaction, and checks its txid."""
         tx = Transaction(raw)
         try:
             tx.deserialize()  # see if raises
@@ -961,11 +1168,13 @@ class Interface(Logger):
             raise RequestCorrupted(f"cannot deserialize received transaction (txid {tx_hash})") from e
         if tx.txid() != tx_hash:
             raise RequestCorrupted(f"received tx does not match expected txid {tx_hash} (got {tx.txid()})")
-        return raw
+        return tx
 
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
             raise Exception(f"{repr(sh)} is not a scripthash")
+        # note: not shared with requests in flight, as the history has to be
+        #       at least as recent as the status that triggered the request
         # do request
         res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
         # check response
@@ -1,12 +1,14 @@
 #! /usr/bin/env python3
 # This was forked from https://github.com/rustyrussell/lightning-payencode/tree/acc16ec13a3fa1dc16c07af6ec67c261bd8aff23
 
+import copy
+import functools
 import re
 import time
 from hashlib import sha256
 from binascii import hexlify
 from decimal import Decimal
-from typing import Optional, TYPE_CHECKING, Type
+from typing import Optional, TYPE_CHECKING, Type, Sequence
 
 import random
 import bitstring
@@ -91,6 +93,27 @@ def bitarray_to_u5(barr):
     return ret
 
 
+# 5-bit values are converted as base-32 digits, which int() parses in linear time
+_U5_TO_DIGIT = bytes.maketrans(bytes(range(32)), b'0123456789abcdefghijklmnopqrstuv')
+
+def u5_to_int(arr: Sequence[int]) -> int:
+    """Big-endian integer of 5-bit values."""
+    if not arr:
+        return 0
+    return int(bytes(arr).translate(_U5_TO_DIGIT), 32)
+
+def u5_to_bytes(arr: Sequence[int], *, pad: bool = False) -> bytes:
+    """Converts 5-bit values to bytes. Trailing bits that do not make
+    a full byte are dropped, or zero-padded if pad is set.
+    """
+    nbits = 5 * len(arr)
+    n = u5_to_int(arr)
+    if pad:
+        extra = -nbits % 8
+        return (n << extra).to_bytes((nbits + extra) // 8, 'big')
+    return (n >> (nbits % 8)).to_bytes(nbits // 8, 'big')
+
+
 def encode_fallback(fallback: str, net: Type[AbstractNet]):
     """ Encode all supported fallback addresses.
     """
@@ -109,16 +132,15 @@ def encode_fallback(fallback: str, net: Type[AbstractNet]):
     return tagged('f', bitstring.pack("uint:5", wver) + wprog)
 
 
-def parse_fallback(fallback, net: Type[AbstractNet]):
-    wver = fallback[0:5].uint
+def parse_fallback(fallback: Sequence[int], net: Type[AbstractNet]):
+    """Parses the 5-bit values of an `f` field."""
+    wver = fallback[0]
     if wver == 17:
-        addr = hash160_to_b58_address(fallback[5:].tobytes(), net.ADDRTYPE_P2PKH)
+        addr = hash160_to_b58_address(u5_to_bytes(fallback[1:], pad=True), net.ADDRTYPE_P2PKH)
     elif wver == 18:
-        addr = hash160_to_b58_address(fallback[5:].tobytes(), net.ADDRTYPE_P2SH)
+        addr = hash160_to_b58_address(u5_to_bytes(fallback[1:], pad=True), net.ADDRTYPE_P2SH)
     elif wver <= 16:
-        witprog = fallback[5:]  # cut witver
-        witprog = witprog[:len(witprog) // 8 * 8]  # can only be full bytes
-        witprog = witprog.tobytes()
+        witprog = u5_to_bytes(fallback[1:])  # can only be full bytes
         addr = segwit_addr.encode_segwit_address(net.SEGWIT_HRP, wver, witprog)
     else:
         return None
@@ -156,20 +178,6 @@ def trim_to_min_length(bits):
         bits = bits[5:]
     return bits
 
-# Discard trailing bits, convert to bytes.
-def trim_to_bytes(barr):
-    # Adds a byte if necessary.
-    b = barr.tobytes()
-    if barr.len % 8 != 0:
-        return b[:-1]
-    return b
-
-# Try to pull out tagged data: returns tag, tagged data and remainder.
-def pull_tagged(stream):
-    tag = stream.read(5).uint
-    length = stream.read(5).uint * 32 + stream.read(5).uint
-    return (CHARSET[tag], stream.read(length * 5), stream)
-
 def lnencode(addr: 'LnAddr', privkey) -> str:
     if addr.amount:
         amount = addr.net.BOLT11_HRP + shorten_amount(addr.amount)
@@ -317,6 +325,13 @@ class LnAddr(object):
         from .lnutil import LnFeatures
         return LnFeatures(self.get_tag('9') or 0)
 
+    def copy(self) -> 'LnAddr':
+        """Returns a copy whose tags can be modified independently."""
+        addr = copy.copy(self)
+        addr.tags = list(self.tags)
+        addr.unknown_tags = list(self.unknown_tags)
+        return addr
+
     def __str__(self):
         return "LnAddr[{}, amount={}{} tags=[{}]]".format(
             hexlify(self.pubkey.serialize()).decode('utf-8') if self.pubkey else None,
@@ -355,9 +370,24 @@ class SerializableKey:
     def serialize(self):
         return self.pubkey.get_public_key_bytes(True)
 
+# decoded invoices, shared by the whole process. lndecode returns copies.
+LNDECODE_CACHE_SIZE = 10_000
+
+
 def lndecode(invoice: str, *, verbose=False, net=None) -> LnAddr:
     if net is None:
         net = constants.net
+    if verbose:
+        return _lndecode(invoice, verbose=True, net=net)
+    return _lndecode_cached(invoice, net).copy()
+
+
+@functools.lru_cache(maxsize=LNDECODE_CACHE_SIZE)
+def _lndecode_cached(invoice: str, net: Type[AbstractNet]) -> LnAddr:
+    return _lndecode(invoice, verbose=False, net=net)
+
+
+def _lndecode(invoice: str, *, verbose: bool, net: Type[AbstractNet]) -> LnAddr:
     decoded_bech32 = bech32_decode(invoice, ignore_long_length=True)
     hrp = decoded_bech32.hrp
     data = decoded_bech32.data
@@ -375,13 +405,13 @@ def lndecode(invoice: str, *, verbose=False, net=None) -> LnAddr:
     if not hrp[2:].startswith(net.BOLT11_HRP):
         raise LnDecodeException(f"Wrong Lightning invoice HRP {hrp[2:]}, should be {net.BOLT11_HRP}")
 
-    data = u5_to_bitarray(data)
-
-    # Final signature 65 bytes, split it off.
-    if len(data) < 65*8:
+    # Final signature 65 bytes (104 5-bit values), split it off.
+    if len(data) < 104:
         raise LnDecodeException("Too short to contain signature")
-    sigdecoded = data[-65*8:].tobytes()
-    data = bitstring.ConstBitStream(data[:-65*8])
+    sigdecoded = u5_to_bytes(data[-104:])
+    data = data[:-104]
+    if len(data) < 7:
+        raise LnDecodeException("Too short to contain timestamp")
 
     addr = LnAddr()
     addr.pubkey = None
@@ -398,17 +428,26 @@ def lndecode(invoice: str, *, verbose=False, net=None) -> LnAddr:
         if amountstr != '':
             addr.amount = unshorten_amount(amountstr)
 
-    addr.date = data.read(35).uint
-
-    while data.pos != data.len:
-        tag, tagdata, data = pull_tagged(data)
+    addr.date = u5_to_int(data[:7])
+
+    pos = 7
+    while pos != len(data):
+        # tagged field: type (5 bits), data_length (10 bits), data
+        if pos + 3 > len(data):
+            raise LnDecodeException("Truncated tagged field")
+        tag = CHARSET[data[pos]]
+        data_length = data[pos + 1] * 32 + data[pos + 2]
+        pos += 3
+        if pos + data_length > len(data):
+            raise LnDecodeException(f"Truncated tagged field {tag!r}")
+        tagdata = data[pos:pos + data_length]
+        pos += data_length
 
         # BOLT #11:
         #
         # A reader MUST skip over unknown fields, an `f` field with unknown
         # `version`, or a `p`, `h`, or `n` field which does not have
         # `data_length` 52, 52, or 53 respectively.
-        data_length = len(tagdata) / 5
 
         if tag == 'r':
             # BOLT #11:
@@ -421,88 +460,93 @@ def lndecode(invoice: str, *, verbose=False, net=None) -> LnAddr:
             #    * `feebase` (32 bits, big-endian)
             #    * `feerate` (32 bits, big-endian)
             #    * `cltv_expiry_delta` (16 bits, big-endian)
-            route=[]
-            s = bitstring.ConstBitStream(tagdata)
-            while s.pos + 264 + 64 + 32 + 32 + 16 < s.len:
-                route.append((s.read(264).tobytes(),
-                              s.read(64).tobytes(),
-                              s.read(32).uintbe,
-                              s.read(32).uintbe,
-                              s.read(16).uintbe))
-            addr.tags.append(('r',route))
+            route = []
+            b = u5_to_bytes(tagdata)
+            i = 0
+            while 8 * (i + 51) < 5 * data_length:
+                route.append((b[i:i+33],
+                              b[i+33:i+41],
+                              int.from_bytes(b[i+41:i+45], 'big'),
+                              int.from_bytes(b[i+45:i+49], 'big'),
+                              int.from_bytes(b[i+49:i+51], 'big')))
+                i += 51
+            addr.tags.append(('r', route))
         elif tag == 't':
-            s = bitstring.ConstBitStream(tagdata)
-            e = (s.read(264).tobytes(),
-                 s.read(32).uintbe,
-                 s.read(32).uintbe,
-                 s.read(16).uintbe)
+            b = u5_to_bytes(tagdata)
+            if len(b) < 43:
+                raise LnDecodeException("Truncated trampoline routing info")
+            e = (b[0:33],
+                 int.from_bytes(b[33:37], 'big'),
+                 int.from_bytes(b[37:41], 'big'),
+                 int.from_bytes(b[41:43], 'big'))
             addr.tags.append(('t', e))
         elif tag == 'f':
-            fallback = parse_fallback(tagdata, addr.net)
+            fallback = parse_fallback(tagdata, addr.net) if tagdata else None
             if fallback:
                 addr.tags.append(('f', fallback))
             else:
                 # Incorrect version.
-                addr.unknown_tags.append((tag, tagdata))
+                addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
                 continue
 
         elif tag == 'd':
-            addr.tags.append(('d', trim_to_bytes(tagdata).decode('utf-8')))
+            addr.tags.append(('d', u5_to_bytes(tagdata).decode('utf-8')))
 
         elif tag == 'h':
             if data_length != 52:
-                addr.unknown_tags.append((tag, tagdata))
+                addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
                 continue
-            addr.tags.append(('h', trim_to_bytes(tagdata)))
+            addr.tags.append(('h', u5_to_bytes(tagdata)))
 
         elif tag == 'x':
-            addr.tags.append(('x', tagdata.uint))
+            addr.tags.append(('x', u5_to_int(tagdata)))
 
         elif tag == 'p':
             if data_length != 52:
-                addr.unknown_tags.append((tag, tagdata))
+                addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
                 continue
-            addr.paymenthash = trim_to_bytes(tagdata)
+            addr.paymenthash = u5_to_bytes(tagdata)
 
         elif tag == 's':
             if data_length != 52:
-                addr.unknown_tags.append((tag, tagdata))
+                addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
                 continue
-            addr.payment_secret = trim_to_bytes(tagdata)
+            addr.payment_secret = u5_to_bytes(tagdata)
 
         elif tag == 'n':
             if data_length != 53:
-                addr.unknown_tags.append((tag, tagdata))
+                addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
                 continue
-            pubkeybytes = trim_to_bytes(tagdata)
+            pubkeybytes = u5_to_bytes(tagdata)
             addr.pubkey = pubkeybytes
 
         elif tag == 'c':
-            addr._min_final_cltv_expiry = tagdata.uint
+            addr._min_final_cltv_expiry = u5_to_int(tagdata)
 
         elif tag == '9':
-            features = tagdata.uint
+            features = u5_to_int(tagdata)
             addr.tags.append(('9', features))
             from .lnutil import validate_features
             validate_features(features)
 
         else:
-            addr.unknown_tags.append((tag, tagdata))
+            addr.unknown_tags.append((tag, u5_to_bitarray(tagdata)))
 
+    signed_data = hrp.encode("ascii") + u5_to_bytes(data, pad=True)
     if verbose:
         print('hex of signature data (32 byte r, 32 byte s): {}'
               .format(hexlify(sigdecoded[0:64])))
         print('recovery flag: {}'.format(sigdecoded[64]))
         print('hex of data for signing: {}'
-              .format(hexlify(hrp.encode("ascii") + data.tobytes())))
-        print('SHA256 of above: {}'.format(sha256(hrp.encode("ascii") + data.tobytes()).hexdigest()))
+              .format(hexlify(signed_data)))
+        print('SHA256 of above: {}'.format(sha256(signed_data).hexdigest()))
 
     # BOLT #11:
     #
     # A reader MUST check that the `signature` is valid (see the `n` tagged
     # field specified below).
     addr.signature = sigdecoded[:65]
-    hrp_hash = sha256(hrp.encode("ascii") + data.tobytes()).digest()
+    hrp_hash = sha256(signed_data).digest()
     if addr.pubkey: # Specified by `n`
         # BOLT #11:
         #
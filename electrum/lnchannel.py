@@ -744,16 +744,28 @@ class Channel(AbstractChannel):
     def get_next_feerate(self, subject: HTLCOwner) -> int:
         return self.hm.get_feerate_in_next_ctx(subject)
 
+    def get_htlc_status(self, direction: Direction, htlc_id: int) -> str:
+        """Returns 'settled', 'failed' or 'inflight'. The first two are final."""
+        htlc_proposer = LOCAL if direction is SENT else REMOTE
+        if self.hm.was_htlc_failed(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+            return 'failed'
+        elif self.hm.was_htlc_preimage_released(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+            return 'settled'
+        else:
+            return 'inflight'
+
+    def get_htlcs_from_id(self, direction: Direction, htlc_id: int) -> Sequence[UpdateAddHtlc]:
+        """Returns the HTLCs in direction whose id is at least htlc_id.
+        HTLC ids are assigned sequentially, so this is used to learn about new HTLCs."""
+        htlc_proposer = LOCAL if direction is SENT else REMOTE
+        adds = self.hm.log[htlc_proposer]['adds']
+        next_htlc_id = self.hm.get_next_htlc_id(htlc_proposer)
+        return [adds[i] for i in range(htlc_id, next_htlc_id) if i in adds]
+
     def get_payments(self, status=None) -> Mapping[bytes, List[HTLCWithStatus]]:
         out = defaultdict(list)
         for direction, htlc in self.hm.all_htlcs_ever():
-            htlc_proposer = LOCAL if direction is SENT else REMOTE
-            if self.hm.was_htlc_failed(htlc_id=htlc.htlc_id, htlc_proposer=htlc_proposer):
-                _status = 'failed'
-            elif self.hm.was_htlc_preimage_released(htlc_id=htlc.htlc_id, htlc_proposer=htlc_proposer):
-                _status = 'settled'
-            else:
-                _status = 'inflight'
+            _status = self.get_htlc_status(direction, htlc.htlc_id)
             if status and status != _status:
                 continue
             htlc_with_status = HTLCWithStatus(
@@ -24,8 +24,11 @@
 # SOFTWARE.
 
 import io
+import time
 import hashlib
-from typing import Sequence, List, Tuple, NamedTuple, TYPE_CHECKING, Dict, Any, Optional
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Sequence, List, Tuple, NamedTuple, TYPE_CHECKING, Dict, Any, Optional, Hashable
 from enum import IntEnum, IntFlag
 
 from . import ecc
@@ -49,6 +52,7 @@ PER_HOP_HMAC_SIZE = 32
 class UnsupportedOnionPacketVersion(Exception): pass
 class InvalidOnionMac(Exception): pass
 class InvalidOnionPubkey(Exception): pass
+class ReplayedOnionPacket(Exception): pass
 
 
 class LegacyHopDataPayload:
@@ -246,11 +250,10 @@ def new_onion_packet(payment_path_pubkeys: Sequence[bytes], session_key: bytes,
         rho_key = get_bolt04_onion_key(b'rho', hop_shared_secrets[i])
         mu_key = get_bolt04_onion_key(b'mu', hop_shared_secrets[i])
         hops_data[i].hmac = next_hmac
-        stream_bytes = generate_cipher_stream(rho_key, data_size)
         hop_data_bytes = hops_data[i].to_bytes()
         mix_header = mix_header[:-len(hop_data_bytes)]
         mix_header = hop_data_bytes + mix_header
-        mix_header = xor_bytes(mix_header, stream_bytes)
+        mix_header = xor_cipher_stream(rho_key, mix_header)
         if i == num_hops - 1 and len(filler) != 0:
             mix_header = mix_header[:-len(filler)] + filler
         packet = mix_header + associated_data
@@ -348,6 +351,12 @@ def generate_cipher_stream(stream_key: bytes, num_bytes: int) -> bytes:
                             data=bytes(num_bytes))
 
 
+def xor_cipher_stream(stream_key: bytes, data: bytes) -> bytes:
+    """Same as xor_bytes(data, generate_cipher_stream(stream_key, len(data))),
+    without materializing the stream."""
+    return chacha20_encrypt(key=stream_key, nonce=bytes(8), data=data)
+
+
 class ProcessedOnionPacket(NamedTuple):
     are_we_final: bool
     hop_data: OnionHopsDataSingle
@@ -355,15 +364,72 @@ class ProcessedOnionPacket(NamedTuple):
     trampoline_onion_packet: OnionPacket
 
 
-# TODO replay protection
+class OnionReplayCache:
+    """Shared secrets of the onions we processed recently, to detect replays:
+    an onion that was already received in another HTLC.
+
+    Memory is bounded: secrets are forgotten after WINDOW seconds, and the
+    oldest ones are dropped if more than MAX_SIZE onions are received within
+    the window. Detection is therefore best-effort.
+    """
+
+    MAX_SIZE = 100_000
+    WINDOW = 24 * 3600  # seconds
+
+    def __init__(self):
+        # hash of shared secret -> (htlc key, time added). Ordered by time added.
+        self._entries = OrderedDict()  # type: OrderedDict[bytes, Tuple[Hashable, float]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def check_and_add(self, shared_secret: bytes, htlc_key: Hashable, *, now: float = None) -> bool:
+        """Returns False if the onion was seen in an HTLC other than htlc_key.
+        The same HTLC can be processed several times.
+        """
+        if now is None:
+            now = time.monotonic()
+        while self._entries:
+            oldest_key, (_, added_at) = next(iter(self._entries.items()))
+            if added_at > now - self.WINDOW:
+                break
+            del self._entries[oldest_key]
+        key = sha256(shared_secret)[:16]
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry[0] == htlc_key
+        self._entries[key] = (htlc_key, now)
+        if len(self._entries) > self.MAX_SIZE:
+            self._entries.popitem(last=False)
+        return True
+
+
+@lru_cache(maxsize=1024)
+def _get_shared_secret_and_next_pubkey(our_onion_private_key: bytes, public_key: bytes) -> Tuple[bytes, bytes]:
+    # note: the onions of pending HTLCs are processed again on each iteration of the
+    #       htlc switch, so we cache the two EC multiplications per onion
+    if not ecc.ECPubkey.is_pubkey_bytes(public_key):
+        raise InvalidOnionPubkey()
+    shared_secret = get_ecdh(our_onion_private_key, public_key)
+    # calc next ephemeral key
+    blinding_factor = sha256(public_key + shared_secret)
+    blinding_factor_int = int.from_bytes(blinding_factor, byteorder="big")
+    next_public_key_int = ecc.ECPubkey(public_key) * blinding_factor_int
+    return shared_secret, next_public_key_int.get_public_key_bytes()
+
+
 def process_onion_packet(
         onion_packet: OnionPacket,
         associated_data: bytes,
         our_onion_private_key: bytes,
-        is_trampoline=False) -> ProcessedOnionPacket:
-    if not ecc.ECPubkey.is_pubkey_bytes(onion_packet.public_key):
-        raise InvalidOnionPubkey()
-    shared_secret = get_ecdh(our_onion_private_key, onion_packet.public_key)
+        is_trampoline=False,
+        *,
+        replay_cache: OnionReplayCache = None,
+        htlc_key: Hashable = None) -> ProcessedOnionPacket:
+    """If replay_cache is given, raises ReplayedOnionPacket if the onion
+    was already received in another HTLC than htlc_key."""
+    shared_secret, next_public_key = _get_shared_secret_and_next_pubkey(
+        our_onion_private_key, onion_packet.public_key)
     # check message integrity
     mu_key = get_bolt04_onion_key(b'mu', shared_secret)
     calculated_mac = hmac_oneshot(
@@ -371,31 +437,24 @@ def process_onion_packet(
         digest=hashlib.sha256)
     if onion_packet.hmac != calculated_mac:
         raise InvalidOnionMac()
+    if replay_cache is not None and not replay_cache.check_and_add(shared_secret, htlc_key):
+        raise ReplayedOnionPacket()
     # peel an onion layer off
     rho_key = get_bolt04_onion_key(b'rho', shared_secret)
     data_size = TRAMPOLINE_HOPS_DATA_SIZE if is_trampoline else HOPS_DATA_SIZE
-    stream_bytes = generate_cipher_stream(rho_key, 2 * data_size)
-    padded_header = onion_packet.hops_data + bytes(data_size)
-    next_hops_data = xor_bytes(padded_header, stream_bytes)
+    next_hops_data = xor_cipher_stream(rho_key, onion_packet.hops_data + bytes(data_size))
     next_hops_data_fd = io.BytesIO(next_hops_data)
     hop_data = OnionHopsDataSingle.from_fd(next_hops_data_fd)
     # trampoline
     trampoline_onion_packet = hop_data.payload.get('trampoline_onion_packet')
     if trampoline_onion_packet:
-        top_version = trampoline_onion_packet.get('version')
         top_public_key = trampoline_onion_packet.get('public_key')
         top_hops_data = trampoline_onion_packet.get('hops_data')
-        top_hops_data_fd = io.BytesIO(top_hops_data)
         top_hmac = trampoline_onion_packet.get('hmac')
         trampoline_onion_packet = OnionPacket(
             public_key=top_public_key,
-            hops_data=top_hops_data_fd.read(TRAMPOLINE_HOPS_DATA_SIZE),
+            hops_data=top_hops_data[:TRAMPOLINE_HOPS_DATA_SIZE],
             hmac=top_hmac)
-    # calc next ephemeral key
-    blinding_factor = sha256(onion_packet.public_key + shared_secret)
-    blinding_factor_int = int.from_bytes(blinding_factor, byteorder="big")
-    next_public_key_int = ecc.ECPubkey(onion_packet.public_key) * blinding_factor_int
-    next_public_key = next_public_key_int.get_public_key_bytes()
     next_onion_packet = OnionPacket(
         public_key=next_public_key,
         hops_data=next_hops_data_fd.read(data_size),
@@ -464,14 +523,13 @@ def construct_onion_error(
     error_packet += pad_len.to_bytes(2, byteorder="big")
     error_packet += bytes(pad_len)
     # add hmac
-    shared_secret = get_ecdh(our_onion_private_key, onion_packet.public_key)
+    shared_secret, _ = _get_shared_secret_and_next_pubkey(our_onion_private_key, onion_packet.public_key)
     um_key = get_bolt04_onion_key(b'um', shared_secret)
     hmac_ = hmac_oneshot(um_key, msg=error_packet, digest=hashlib.sha256)
     error_packet = hmac_ + error_packet
     # obfuscate
     ammag_key = get_bolt04_onion_key(b'ammag', shared_secret)
-    stream_bytes = generate_cipher_stream(ammag_key, len(error_packet))
-    error_packet = xor_bytes(error_packet, stream_bytes)
+    error_packet = xor_cipher_stream(ammag_key, error_packet)
     return error_packet
 
 
@@ -483,8 +541,7 @@ def _decode_onion_error(error_packet: bytes, payment_path_pubkeys: Sequence[byte
     for i in range(num_hops):
         ammag_key = get_bolt04_onion_key(b'ammag', hop_shared_secrets[i])
         um_key = get_bolt04_onion_key(b'um', hop_shared_secrets[i])
-        stream_bytes = generate_cipher_stream(ammag_key, len(error_packet))
-        error_packet = xor_bytes(error_packet, stream_bytes)
+        error_packet = xor_cipher_stream(ammag_key, error_packet)
         hmac_computed = hmac_oneshot(um_key, msg=error_packet[32:], digest=hashlib.sha256)
         hmac_found = error_packet[:32]
         if hmac_computed == hmac_found:
@@ -0,0 +1,146 @@
+# Copyright (C) 2022 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+import bisect
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Tuple, Set, Mapping, Optional
+
+from .lnchannel import HTLCWithStatus
+from .lnutil import Direction, UpdateAddHtlc, SENT, RECEIVED
+
+if TYPE_CHECKING:
+    from .lnworker import LNWallet
+
+
+class PaymentLedger:
+    """Settled HTLCs of all channels, grouped by payment hash, ordered by time.
+
+    An HTLC is settled or failed once and for all, so settled HTLCs are only
+    ever appended. Each channel is tracked with a cursor on its HTLC ids and
+    the set of HTLCs that are still in flight, so that an update only looks
+    at new and in-flight HTLCs instead of the full HTLC log.
+    """
+
+    def __init__(self, lnworker: 'LNWallet'):
+        self.lnworker = lnworker
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self.lock:
+            self._settled: Dict[bytes, List[HTLCWithStatus]] = defaultdict(list)
+            # payment_hash -> timestamp of first htlc
+            self._timestamps: Dict[bytes, int] = {}
+            self._by_time: List[Tuple[int, bytes]] = []
+            # payment_hash -> signed amount
+            self._amounts: Dict[bytes, int] = {}
+            # running sums of the amounts of _by_time, valid up to _num_valid_sums
+            self._sums: List[int] = []
+            self._num_valid_sums = 0
+            # channel_id -> direction -> next htlc_id
+            self._next_htlc_ids: Dict[bytes, Dict[Direction, int]] = {}
+            # channel_id -> (direction, htlc_id) -> htlc
+            self._inflight: Dict[bytes, Dict[Tuple[Direction, int], UpdateAddHtlc]] = {}
+
+    def _update(self) -> None:
+        channels = self.lnworker.channels
+        if any(channel_id not in channels for channel_id in self._next_htlc_ids):
+            self.clear()  # a channel was removed, with its htlcs
+        for chan in list(channels.values()):
+            channel_id = chan.channel_id
+            next_htlc_ids = self._next_htlc_ids.setdefault(channel_id, {SENT: 0, RECEIVED: 0})
+            inflight = self._inflight.setdefault(channel_id, {})
+            for direction in (SENT, RECEIVED):
+                for htlc in chan.get_htlcs_from_id(direction, next_htlc_ids[direction]):
+                    inflight[(direction, htlc.htlc_id)] = htlc
+                    next_htlc_ids[direction] = max(next_htlc_ids[direction], htlc.htlc_id + 1)
+            for (direction, htlc_id), htlc in list(inflight.items()):
+                status = chan.get_htlc_status(direction, htlc_id)
+                if status == 'inflight':
+                    continue
+                del inflight[(direction, htlc_id)]
+                if status == 'settled':
+                    self._add_settled(HTLCWithStatus(
+                        channel_id=channel_id, htlc=htlc, direction=direction, status=status))
+
+    def _add_settled(self, htlc_with_status: HTLCWithStatus) -> None:
+        htlc = htlc_with_status.htlc
+        payment_hash = htlc.payment_hash
+        self._settled[payment_hash].append(htlc_with_status)
+        self._amounts[payment_hash] = self._amounts.get(payment_hash, 0) + int(htlc_with_status.direction) * htlc.amount_msat
+        old_timestamp = self._timestamps.get(payment_hash)
+        if old_timestamp is not None:
+            i = bisect.bisect_left(self._by_time, (old_timestamp, payment_hash))
+            if old_timestamp <= htlc.timestamp:
+                self._num_valid_sums = min(self._num_valid_sums, i)
+                return
+            del self._by_time[i]
+        self._timestamps[payment_hash] = htlc.timestamp
+        i = bisect.bisect_left(self._by_time, (htlc.timestamp, payment_hash))
+        self._by_time.insert(i, (htlc.timestamp, payment_hash))
+        self._num_valid_sums = min(self._num_valid_sums, i)
+
+    def _get_amount_before(self, i: int) -> int:
+        """Returns the sum of the amounts of the first i payments of _by_time.
+        Payments are mostly added at the end, so the running sums are only
+        extended, instead of summing all the earlier payments.
+        """
+        sums = self._sums
+        del sums[self._num_valid_sums:]
+        while len(sums) < i:
+            payment_hash = self._by_time[len(sums)][1]
+            sums.append((sums[-1] if sums else 0) + self._amounts[payment_hash])
+        self._num_valid_sums = len(sums)
+        return sums[i - 1] if i else 0
+
+    def get_settled_payments(self) -> Mapping[bytes, List[HTLCWithStatus]]:
+        """Returns the settled HTLCs by payment hash,
+        like LNWallet.get_payments(status='settled')."""
+        with self.lock:
+            self._update()
+            return {k: list(v) for k, v in self._settled.items()}
+
+    def get_settled_payment(self, payment_hash: bytes) -> List[HTLCWithStatus]:
+        with self.lock:
+            self._update()
+            return list(self._settled.get(payment_hash, []))
+
+    def get_settled_payments_by_time(self) -> List[Tuple[bytes, List[HTLCWithStatus]]]:
+        """Returns (payment_hash, settled HTLCs) of settled payments, ordered by timestamp."""
+        with self.lock:
+            self._update()
+            return [(payment_hash, list(self._settled[payment_hash])) for timestamp, payment_hash in self._by_time]
+
+    def get_timestamp(self, payment_hash: bytes) -> Optional[int]:
+        """Returns the timestamp by which a settled payment is ordered."""
+        with self.lock:
+            self._update()
+            return self._timestamps.get(payment_hash)
+
+    def get_settled_payments_after(
+            self, timestamp: Optional[int] = None, payment_hash: bytes = None, *, limit: int,
+    ) -> Tuple[int, List[Tuple[int, bytes, List[HTLCWithStatus]]]]:
+        """Returns a page of the settled payments ordered by timestamp: at most limit
+        (timestamp, payment_hash, settled HTLCs), starting after (timestamp, payment_hash),
+        and the sum of the amounts of the payments before the page.
+        Without payment_hash, starts after all the payments of timestamp.
+        Without timestamp, starts with the first payment.
+        """
+        with self.lock:
+            self._update()
+            if timestamp is None:
+                i = 0
+            elif payment_hash is None:
+                # note: timestamps are integers, and a shorter tuple is smaller
+                i = bisect.bisect_left(self._by_time, (timestamp + 1,))
+            else:
+                i = bisect.bisect_right(self._by_time, (timestamp, payment_hash))
+            page = [(t, h, list(self._settled[h])) for t, h in self._by_time[i:i + limit]]
+            return self._get_amount_before(i), page
+
+    def get_inflight_payment_hashes(self) -> Set[bytes]:
+        with self.lock:
+            self._update()
+            return {htlc.payment_hash for inflight in self._inflight.values() for htlc in inflight.values()}
@@ -30,7 +30,7 @@ from .logging import Logger
 from .lnonion import (new_onion_packet, OnionFailureCode, calc_hops_data_for_payment,
                       process_onion_packet, OnionPacket, construct_onion_error, OnionRoutingFailure,
                       ProcessedOnionPacket, UnsupportedOnionPacketVersion, InvalidOnionMac, InvalidOnionPubkey,
-                      OnionFailureCodeMetaFlag)
+                      OnionFailureCodeMetaFlag, ReplayedOnionPacket)
 from .lnchannel import Channel, RevokeAndAck, RemoteCtnTooFarInFuture, ChannelState, PeerState
 from . import lnutil
 from .lnutil import (Outpoint, LocalConfig, RECEIVED, UpdateAddHtlc, ChannelConfig,
@@ -2259,7 +2259,8 @@ class Peer(Logger):
         processed_onion = self.process_onion_packet(
             onion_packet,
             payment_hash=payment_hash,
-            onion_packet_bytes=onion_packet_bytes)
+            onion_packet_bytes=onion_packet_bytes,
+            htlc_key=(chan.channel_id, htlc.htlc_id))
         if processed_onion.are_we_final:
             # either we are final recipient; or if trampoline, see cases below
             preimage, trampoline_onion_packet = self.maybe_fulfill_htlc(
@@ -2328,15 +2329,22 @@ class Peer(Logger):
             onion_packet: OnionPacket, *,
             payment_hash: bytes,
             onion_packet_bytes: bytes,
-            is_trampoline: bool = False) -> ProcessedOnionPacket:
-
+            is_trampoline: bool = False,
+            htlc_key: Tuple[bytes, int] = None) -> ProcessedOnionPacket:
+        """If htlc_key is given, the onion is checked against the onions
+        received in other HTLCs, to detect replays."""
         failure_data = sha256(onion_packet_bytes)
         try:
             processed_onion = process_onion_packet(
                 onion_packet,
                 associated_data=payment_hash,
                 our_onion_private_key=self.privkey,
-                is_trampoline=is_trampoline)
+                is_trampoline=is_trampoline,
+                replay_cache=self.lnworker.onion_replay_cache if htlc_key else None,
+                htlc_key=htlc_key)
+        except ReplayedOnionPacket:
+            self.logger.info(f"replayed onion packet. payment_hash={payment_hash.hex()}")
+            raise OnionRoutingFailure(code=OnionFailureCode.TEMPORARY_NODE_FAILURE, data=b'')
         except UnsupportedOnionPacketVersion:
             raise OnionRoutingFailure(code=OnionFailureCode.INVALID_ONION_VERSION, data=failure_data)
         except InvalidOnionPubkey:
@@ -7,8 +7,9 @@
 
 import hashlib
 import asyncio
+import time
 from asyncio import StreamReader, StreamWriter
-from typing import Optional
+from typing import Optional, List
 from functools import cached_property
 
 from .crypto import sha256, hmac_oneshot, chacha20_poly1305_encrypt, chacha20_poly1305_decrypt
@@ -95,6 +96,22 @@ class LNTransportBase:
     privkey: bytes
     peer_addr: Optional[LNPeerAddr] = None
 
+    # max number of bytes read from the socket at once. Reads return what is
+    # available, so a large size costs nothing for small messages, while gossip
+    # and bursts of messages are read with few calls.
+    READ_SIZE = 2**16
+    # pending writes are flushed right away once they reach this size
+    MAX_PENDING_WRITES_SIZE = 2**16
+
+    def __init__(self):
+        self._pending_writes: List[bytes] = []
+        self._pending_writes_size = 0
+        self._connected_at: Optional[float] = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.msgs_sent = 0
+        self.msgs_received = 0
+
     def name(self) -> str:
         pubkey = self.remote_pubkey()
         pubkey_hex = pubkey.hex() if pubkey else pubkey
@@ -112,32 +129,79 @@ class LNTransportBase:
         c = aead_encrypt(self.sk, self.sn(), b'', msg)
         assert len(lc) == 18
         assert len(c) == len(msg) + 16
-        self.writer.write(lc+c)
+        self.msgs_sent += 1
+        self.bytes_sent += len(lc) + len(c)
+        # messages sent in the same iteration of the event loop are written together
+        self._pending_writes += (lc, c)
+        self._pending_writes_size += len(lc) + len(c)
+        if self._pending_writes_size >= self.MAX_PENDING_WRITES_SIZE:
+            self._flush_writes()
+        elif len(self._pending_writes) == 2:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._flush_writes()
+            else:
+                loop.call_soon(self._flush_writes)
+
+    def _flush_writes(self) -> None:
+        if not self._pending_writes:
+            return
+        pending_writes = self._pending_writes
+        self._pending_writes = []
+        self._pending_writes_size = 0
+        self.writer.writelines(pending_writes)
 
     async def read_messages(self):
         buffer = bytearray()
+        pos = 0  # start of the next unread ciphertext in buffer
+        length = None  # length of the next message, once its header is decrypted
         while True:
-            rn_l, rk_l = self.rn()
-            rn_m, rk_m = self.rn()
-            while True:
-                if len(buffer) >= 18:
-                    lc = bytes(buffer[:18])
-                    l = aead_decrypt(rk_l, rn_l, b'', lc)
-                    length = int.from_bytes(l, 'big')
-                    offset = 18 + length + 16
-                    if len(buffer) >= offset:
-                        c = bytes(buffer[18:offset])
-                        del buffer[:offset]  # much faster than: buffer=buffer[offset:]
-                        msg = aead_decrypt(rk_m, rn_m, b'', c)
-                        yield msg
+            # decrypt all complete messages in the buffer. Ciphertexts are not copied
+            # out of the buffer, and the buffer is shifted once per read.
+            msgs = []
+            with memoryview(buffer) as view:
+                while True:
+                    if length is None:
+                        if len(buffer) - pos < 18:
+                            break
+                        rn_l, rk_l = self.rn()
+                        l = aead_decrypt(rk_l, rn_l, b'', view[pos:pos + 18])
+                        length = int.from_bytes(l, 'big')
+                        pos += 18
+                    offset = pos + length + 16
+                    if len(buffer) < offset:
                         break
-                try:
-                    s = await self.reader.read(2**10)
-                except Exception:
-                    s = None
-                if not s:
-                    raise LightningPeerConnectionClosed()
-                buffer += s
+                    rn_m, rk_m = self.rn()
+                    msgs.append(aead_decrypt(rk_m, rn_m, b'', view[pos:offset]))
+                    pos = offset
+                    length = None
+            del buffer[:pos]
+            pos = 0
+            for msg in msgs:
+                self.msgs_received += 1
+                yield msg
+            try:
+                s = await self.reader.read(self.READ_SIZE)
+            except Exception:
+                s = None
+            if not s:
+                raise LightningPeerConnectionClosed()
+            self.bytes_received += len(s)
+            buffer += s
+
+    def get_stats(self) -> dict:
+        """Traffic of the connection, in total and per second since the handshake."""
+        elapsed = max(time.monotonic() - self._connected_at, 1e-3) if self._connected_at else None
+        stats = {
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'msgs_sent': self.msgs_sent,
+            'msgs_received': self.msgs_received,
+        }
+        for k, v in list(stats.items()):
+            stats[k + '_per_sec'] = round(v / elapsed, 1) if elapsed else 0
+        return stats
 
     def rn(self):
         o = self._rn, self.rk
@@ -161,8 +225,10 @@ class LNTransportBase:
         self._rn = 0
         self.r_ck = ck
         self.s_ck = ck
+        self._connected_at = time.monotonic()
 
     def close(self):
+        self._flush_writes()
         self.writer.close()
 
     def remote_pubkey(self) -> Optional[bytes]:
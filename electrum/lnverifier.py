@@ -35,7 +35,6 @@ from . import constants
 from .util import bh2u, bfh, NetworkJobOnDefaultServer
 from .lnutil import funding_output_script_from_keys, ShortChannelID
 from .verifier import verify_tx_is_in_block, MerkleVerificationFailure
-from .transaction import Transaction
 from .interface import GracefulDisconnect
 from .crypto import sha256d
 from .lnmsg import decode_msg, encode_msg
@@ -131,24 +130,12 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
             raise GracefulDisconnect(e) from e
         try:
             async with self._network_request_semaphore:
-                raw_tx = await self.network.get_transaction(tx_hash)
+                # note: the tx is already deserialized, and its txid checked
+                tx = await self.network.get_parsed_transaction(tx_hash)
         except aiorpcx.jsonrpc.RPCError as e:
             # the electrum server can't find the tx; but it was the
             # one who told us about the txid!! blame is on server
             raise GracefulDisconnect(e) from e
-        tx = Transaction(raw_tx)
-        try:
-            tx.deserialize()
-        except Exception:
-            # either bug in client, or electrum server is evil.
-            # if we connect to a diff server at some point, let's try again.
-            self.logger.warning(f"cannot deserialize transaction, skipping {tx_hash}")
-            return
-        if tx_hash != tx.txid():
-            # either bug in client, or electrum server is evil.
-            # if we connect to a diff server at some point, let's try again.
-            self.logger.info(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
-            return
         # check funding output
         chan_ann_msg = self.unverified_channel_info[short_channel_id]
         redeem_script = funding_output_script_from_keys(chan_ann_msg['bitcoin_key_1'], chan_ann_msg['bitcoin_key_2'])
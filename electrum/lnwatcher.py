@@ -4,14 +4,16 @@
 
 from typing import NamedTuple, Iterable, TYPE_CHECKING
 import os
+import zlib
 import asyncio
 from enum import IntEnum, auto
-from typing import NamedTuple, Dict
+from typing import NamedTuple, Dict, Set, Sequence, Tuple
+from collections import defaultdict
 
 from . import util
-from .sql_db import SqlDB, sql
+from .sql_db import SqlDB, sql, sql_read, sql_batched
 from .wallet_db import WalletDB
-from .util import bh2u, bfh, log_exceptions, ignore_exceptions, TxMinedInfo, random_shuffled_copy
+from .util import bfh, log_exceptions, ignore_exceptions, TxMinedInfo, random_shuffled_copy
 from .address_synchronizer import AddressSynchronizer, TX_HEIGHT_LOCAL, TX_HEIGHT_UNCONF_PARENT, TX_HEIGHT_UNCONFIRMED
 from .transaction import Transaction, TxOutpoint
 
@@ -42,6 +44,12 @@ prevout VARCHAR(34),
 tx VARCHAR
 )"""
 
+# get_ctn and get_num_tx look up by funding_outpoint, get_sweep_tx by (funding_outpoint, prevout)
+create_sweep_txs_indexes = [
+    "CREATE INDEX IF NOT EXISTS sweep_txs_ctn ON sweep_txs (funding_outpoint, ctn)",
+    "CREATE INDEX IF NOT EXISTS sweep_txs_prevout ON sweep_txs (funding_outpoint, prevout)",
+]
+
 create_channel_info="""
 CREATE TABLE IF NOT EXISTS channel_info (
 outpoint VARCHAR(34) NOT NULL,
@@ -49,6 +57,29 @@ address VARCHAR(32),
 PRIMARY KEY(outpoint)
 )"""
 
+# the format of stored transactions, see _compress_tx
+SWEEPSTORE_VERSION = 1
+
+TX_FORMAT_RAW = 0
+TX_FORMAT_ZLIB = 1
+
+
+def _compress_tx(raw_tx: bytes) -> bytes:
+    """Returns a format byte followed by the (possibly zlib-compressed) tx.
+    Signatures and hashes do not compress, so zlib is only used if it helps.
+    """
+    compressed = zlib.compress(raw_tx, 9)
+    if len(compressed) < len(raw_tx):
+        return bytes([TX_FORMAT_ZLIB]) + compressed
+    return bytes([TX_FORMAT_RAW]) + raw_tx
+
+
+def _decompress_tx(data: bytes) -> bytes:
+    if data[0] == TX_FORMAT_ZLIB:
+        return zlib.decompress(data[1:])
+    assert data[0] == TX_FORMAT_RAW, f"unknown tx format {data[0]}"
+    return data[1:]
+
 
 class SweepStore(SqlDB):
 
@@ -59,28 +90,56 @@ class SweepStore(SqlDB):
         c = self.conn.cursor()
         c.execute(create_channel_info)
         c.execute(create_sweep_txs)
+        for create_index in create_sweep_txs_indexes:
+            c.execute(create_index)
+        c.execute("PRAGMA user_version")
+        version = c.fetchone()[0]
+        if version < 1:
+            # sweep txs used to be stored raw, without format byte
+            c.execute("SELECT rowid, tx FROM sweep_txs")
+            rows = [(_compress_tx(r[1]), r[0]) for r in c.fetchall()]
+            c.executemany("UPDATE sweep_txs SET tx=? WHERE rowid=?", rows)
+        c.execute(f"PRAGMA user_version={SWEEPSTORE_VERSION}")
         self.conn.commit()
 
-    @sql
+    @sql_read
     def get_sweep_tx(self, funding_outpoint, prevout):
         c = self.conn.cursor()
         c.execute("SELECT tx FROM sweep_txs WHERE funding_outpoint=? AND prevout=?", (funding_outpoint, prevout))
-        return [Transaction(bh2u(r[0])) for r in c.fetchall()]
+        return [Transaction(_decompress_tx(r[0])) for r in c.fetchall()]
 
-    @sql
+    @sql_read
     def list_sweep_tx(self):
         c = self.conn.cursor()
-        c.execute("SELECT funding_outpoint FROM sweep_txs")
+        c.execute("SELECT DISTINCT funding_outpoint FROM sweep_txs")
         return set([r[0] for r in c.fetchall()])
 
-    @sql
     def add_sweep_tx(self, funding_outpoint, ctn, prevout, raw_tx):
+        return self.add_sweep_txs([(funding_outpoint, ctn, prevout, raw_tx)])
+
+    def add_sweep_txs(self, sweep_txs: Sequence[Tuple[str, int, str, str]]):
+        """Stores (funding_outpoint, ctn, prevout, raw_tx) tuples, in a single transaction.
+
+        returns an awaitable asyncio.Future
+        """
+        rows = []
+        for funding_outpoint, ctn, prevout, raw_tx in sweep_txs:
+            tx = Transaction(raw_tx)
+            tx.deserialize()  # reject garbage before it joins a batch
+            assert tx.is_complete()
+            rows.append((funding_outpoint, ctn, prevout, _compress_tx(bfh(raw_tx))))
+        return self._insert_sweep_txs(rows)
+
+    @sql_batched
+    def _insert_sweep_txs(self, batches: Sequence[Tuple[Sequence[tuple]]]):
+        # consecutive calls, e.g. from different clients, share one commit
         c = self.conn.cursor()
-        assert Transaction(raw_tx).is_complete()
-        c.execute("""INSERT INTO sweep_txs (funding_outpoint, ctn, prevout, tx) VALUES (?,?,?,?)""", (funding_outpoint, ctn, prevout, bfh(raw_tx)))
+        c.executemany(
+            "INSERT INTO sweep_txs (funding_outpoint, ctn, prevout, tx) VALUES (?,?,?,?)",
+            [row for (rows,) in batches for row in rows])
         self.conn.commit()
 
-    @sql
+    @sql_read
     def get_num_tx(self, funding_outpoint):
         c = self.conn.cursor()
         c.execute("SELECT count(*) FROM sweep_txs WHERE funding_outpoint=?", (funding_outpoint,))
@@ -112,19 +171,21 @@ class SweepStore(SqlDB):
         self.conn.commit()
 
     def _has_channel(self, outpoint):
+        # note: only called by get_ctn, on the sql thread. get_ctn cannot use
+        #       a reader thread, as it writes, and has to see pending writes
         c = self.conn.cursor()
         c.execute("SELECT * FROM channel_info WHERE outpoint=?", (outpoint,))
         r = c.fetchone()
         return r is not None
 
-    @sql
+    @sql_read
     def get_address(self, outpoint):
         c = self.conn.cursor()
         c.execute("SELECT address FROM channel_info WHERE outpoint=?", (outpoint,))
         r = c.fetchone()
         return r[0] if r else None
 
-    @sql
+    @sql_read
     def list_channels(self):
         c = self.conn.cursor()
         c.execute("SELECT outpoint, address FROM channel_info")
@@ -136,6 +197,13 @@ class LNWatcher(AddressSynchronizer):
     LOGGING_SHORTCUT = 'W'
 
     def __init__(self, network: 'Network'):
+        # note: the index has to exist before AddressSynchronizer.__init__ loads the db
+        self._callbacks_by_address = defaultdict(set)  # type: Dict[str, Set[str]]  # address -> callback keys
+        self._related_addresses = {}  # type: Dict[str, Set[str]]  # callback key -> addresses
+        # callbacks that need to run on the next event, because something they depend on changed
+        self._dirty_callbacks = set()  # type: Set[str]
+        # callbacks whose result does not depend on the block height or on fees
+        self._settled_callbacks = set()  # type: Set[str]
         AddressSynchronizer.__init__(self, WalletDB({}, manual_upgrades=False))
         self.config = network.config
         self.callbacks = {} # address -> lambda: coroutine
@@ -166,10 +234,58 @@ class LNWatcher(AddressSynchronizer):
 
     def remove_callback(self, address):
         self.callbacks.pop(address, None)
+        self._set_related_addresses(address, set())
+        self._dirty_callbacks.discard(address)
+        self._settled_callbacks.discard(address)
 
     def add_callback(self, address, callback):
         self.add_address(address)
         self.callbacks[address] = callback
+        self._set_related_addresses(address, {address})
+        self._settled_callbacks.discard(address)
+        self._dirty_callbacks.add(address)
+
+    def _set_related_addresses(self, key: str, addresses: Set[str]) -> None:
+        """Sets the addresses whose history the callback with the given key depends on."""
+        for addr in self._related_addresses.pop(key, set()) - addresses:
+            self._callbacks_by_address[addr].discard(key)
+            if not self._callbacks_by_address[addr]:
+                del self._callbacks_by_address[addr]
+        for addr in addresses:
+            self._callbacks_by_address[addr].add(key)
+        if addresses:
+            self._related_addresses[key] = addresses
+
+    def _mark_callbacks_dirty(self, addresses: Iterable[str]) -> None:
+        for addr in addresses:
+            self._dirty_callbacks.update(self._callbacks_by_address.get(addr, ()))
+
+    def _mark_tx_dirty(self, tx_hash: str) -> None:
+        self._mark_callbacks_dirty(self.db.get_txi_addresses(tx_hash))
+        self._mark_callbacks_dirty(self.db.get_txo_addresses(tx_hash))
+
+    def _mark_address_history_changed(self, addr: str) -> None:
+        super()._mark_address_history_changed(addr)
+        self._mark_callbacks_dirty([addr])
+
+    def _remove_tx_from_local_history(self, txid):
+        self._mark_tx_dirty(txid)
+        super()._remove_tx_from_local_history(txid)
+
+    def receive_history_callback(self, addr: str, hist, tx_fees: Dict[str, int]):
+        # note: the heights of transactions might have changed
+        super().receive_history_callback(addr, hist, tx_fees)
+        self._mark_callbacks_dirty([addr])
+
+    def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
+        self._mark_tx_dirty(tx_hash)
+        super().add_verified_tx(tx_hash, info)
+
+    def undo_verifications(self, blockchain, above_height: int) -> Set[str]:
+        txs = super().undo_verifications(blockchain, above_height)
+        for tx_hash in txs:
+            self._mark_tx_dirty(tx_hash)
+        return txs
 
     @log_exceptions
     async def on_network_update(self, event, *args):
@@ -179,20 +295,42 @@ class LNWatcher(AddressSynchronizer):
         if not self.synchronizer:
             self.logger.info("synchronizer not set yet")
             return
-        for address, callback in list(self.callbacks.items()):
-            await callback()
+        if event in ('blockchain_updated', 'fee'):
+            # the number of confirmations, timelocks and fees only matter
+            # for callbacks that are not settled
+            self._dirty_callbacks.update(key for key in self.callbacks if key not in self._settled_callbacks)
+        for address in list(self._dirty_callbacks):
+            callback = self.callbacks.get(address)
+            self._dirty_callbacks.discard(address)
+            if callback is None:
+                continue
+            try:
+                await callback()
+            except BaseException:
+                self._dirty_callbacks.add(address)
+                raise
+            if not self.is_up_to_date():
+                # the callback might have returned early, run it again once we are up to date
+                self._dirty_callbacks.add(address)
 
     async def check_onchain_situation(self, address, funding_outpoint):
         # early return if address has not been added yet
         if not self.is_mine(address):
             return
         spenders = self.inspect_tx_candidate(funding_outpoint, 0)
+        self._set_related_addresses(address, self._get_related_addresses(address, spenders))
         # inspect_tx_candidate might have added new addresses, in which case we return ealy
         if not self.is_up_to_date():
             return
         funding_txid = funding_outpoint.split(':')[0]
         funding_height = self.get_tx_height(funding_txid)
         closing_txid = spenders.get(funding_outpoint)
+        # once the funding tx is deeply mined, nothing changes until the funding output is spent
+        if (closing_txid is None and self.is_deeply_mined(funding_txid)
+                and self.can_settle_open_channel(funding_outpoint)):
+            self._settled_callbacks.add(address)
+        else:
+            self._settled_callbacks.discard(address)
         closing_height = self.get_tx_height(closing_txid)
         if closing_txid:
             closing_tx = self.db.get_transaction(closing_txid)
@@ -213,6 +351,10 @@ class LNWatcher(AddressSynchronizer):
         if not keep_watching:
             await self.unwatch_channel(address, funding_outpoint)
 
+    def can_settle_open_channel(self, funding_outpoint: str) -> bool:
+        """Whether the callback of an open channel can skip new blocks and fee updates."""
+        return True
+
     async def do_breach_remedy(self, funding_outpoint, closing_tx, spenders) -> bool:
         raise NotImplementedError()  # implemented by subclasses
 
@@ -221,6 +363,17 @@ class LNWatcher(AddressSynchronizer):
                                    closing_height: TxMinedInfo, keep_watching: bool) -> None:
         raise NotImplementedError()  # implemented by subclasses
 
+    def _get_related_addresses(self, address: str, spenders: Dict[str, str]) -> Set[str]:
+        """The funding address, and the output addresses of the
+        transactions that spend from the channel."""
+        addresses = {address}
+        for txid in spenders.values():
+            tx = self.db.get_transaction(txid) if txid else None
+            if tx is None:
+                continue
+            addresses.update(o.address for o in tx.outputs() if o.address is not None)
+        return addresses
+
     def inspect_tx_candidate(self, outpoint, n):
         prev_txid, index = outpoint.split(':')
         txid = self.db.get_spent_outpoint(prev_txid, int(index))
@@ -357,6 +510,11 @@ class LNWalletWatcher(LNWatcher):
     def diagnostic_name(self):
         return f"{self.lnworker.wallet.diagnostic_name()}-LNW"
 
+    def can_settle_open_channel(self, funding_outpoint):
+        # on each block, lnworker force-closes channels with expiring htlcs,
+        # and updates the fee of open channels
+        return False
+
     @ignore_exceptions
     @log_exceptions
     async def update_channel_state(self, *, funding_outpoint: str, funding_txid: str,
@@ -8,7 +8,7 @@ from decimal import Decimal
 import random
 import time
 from typing import (Optional, Sequence, Tuple, List, Set, Dict, TYPE_CHECKING,
-                    NamedTuple, Union, Mapping, Any, Iterable, AsyncGenerator, DefaultDict)
+                    NamedTuple, Union, Mapping, Any, Iterable, Iterator, AsyncGenerator, DefaultDict)
 import threading
 import socket
 import aiohttp
@@ -64,7 +64,8 @@ from .lnutil import (Outpoint, LNPeerAddr,
                      NoPathFound, InvalidGossipMsg)
 from .lnutil import ln_dummy_address, ln_compare_features, IncompatibleLightningFeatures
 from .transaction import PartialTxOutput, PartialTransaction, PartialTxInput
-from .lnonion import OnionFailureCode, OnionRoutingFailure
+from .lnonion import OnionFailureCode, OnionRoutingFailure, OnionReplayCache
+from .lnpayments import PaymentLedger
 from .lnmsg import decode_msg
 from .i18n import _
 from .lnrouter import (RouteEdge, LNPaymentRoute, LNPaymentPath, is_route_sane_to_use,
@@ -598,11 +599,26 @@ class LNGossip(LNWorker):
             self.logger.debug(f'on_channel_update: {len(categorized_chan_upds.good)}/{len(chan_upds)}')
 
 
+def is_watchtower_error(result) -> bool:
+    # note: JsonRPCClient returns errors as strings
+    return isinstance(result, str) and result.startswith('Error')
+
+
+def is_unknown_method_error(result) -> bool:
+    """Whether a remote watchtower replied that it does not have the method."""
+    if not is_watchtower_error(result):
+        return False
+    # 'Invalid Request' is the reply of Electrum watchtowers to unregistered methods
+    return result == 'Error: Invalid Request' or "'code': -32601" in result
+
+
 class LNWallet(LNWorker):
 
     lnwatcher: Optional['LNWalletWatcher']
     MPP_EXPIRY = 120
     TIMEOUT_SHUTDOWN_FAIL_PENDING_HTLCS = 3  # seconds
+    # max number of sweep txs sent to the watchtower in one request (whole ctns are sent)
+    WATCHTOWER_BATCH_SIZE = 500
 
     def __init__(self, wallet: 'Abstract_Wallet', xprv):
         self.wallet = wallet
@@ -640,14 +656,18 @@ class LNWallet(LNWorker):
         self.received_mpp_htlcs = dict()                  # RHASH -> mpp_status, htlc_set
 
         self.swap_manager = SwapManager(wallet=self.wallet, lnworker=self)
+        self.payment_ledger = PaymentLedger(self)
+        self._lightning_history_items = {}  # type: Dict[bytes, Tuple[int, dict]]  # payment_hash -> (num_htlcs, item)
         # detect inflight payments
         self.inflight_payments = set()        # (not persisted) keys of invoices that are in PR_INFLIGHT state
-        for payment_hash in self.get_payments(status='inflight').keys():
+        for payment_hash in self.payment_ledger.get_inflight_payment_hashes():
             self.set_invoice_status(payment_hash.hex(), PR_INFLIGHT)
 
         self.trampoline_forwarding_failures = {} # todo: should be persisted
         # map forwarded htlcs (fw_info=(scid_hex, htlc_id)) to originating peer pubkeys
         self.downstream_htlc_to_upstream_peer_map = {}  # type: Dict[Tuple[str, int], bytes]
+        # shared secrets of the onions received in HTLCs, from any peer
+        self.onion_replay_cache = OnionReplayCache()
 
     def has_deterministic_node_id(self) -> bool:
         return bool(self.db.get('lightning_xprv'))
@@ -711,6 +731,7 @@ class LNWallet(LNWorker):
                     watchtower = JsonRPCClient(session, watchtower_url)
                     watchtower.add_method('get_ctn')
                     watchtower.add_method('add_sweep_tx')
+                    watchtower.add_method('add_sweep_txs')
                     for chan in self.channels.values():
                         await self.sync_channel_with_watchtower(chan, watchtower)
             except aiohttp.client_exceptions.ClientConnectorError:
@@ -721,10 +742,29 @@ class LNWallet(LNWorker):
         addr = chan.get_funding_address()
         current_ctn = chan.get_oldest_unrevoked_ctn(REMOTE)
         watchtower_ctn = await watchtower.get_ctn(outpoint, addr)
+        sweep_txs = []
         for ctn in range(watchtower_ctn + 1, current_ctn):
-            sweeptxs = chan.create_sweeptxs(ctn)
-            for tx in sweeptxs:
-                await watchtower.add_sweep_tx(outpoint, ctn, tx.inputs()[0].prevout.to_str(), tx.serialize())
+            for tx in chan.create_sweeptxs(ctn):
+                sweep_txs.append((outpoint, ctn, tx.inputs()[0].prevout.to_str(), tx.serialize()))
+            # the watchtower resumes after the highest ctn it has, so only complete ctns are sent
+            if sweep_txs and (len(sweep_txs) >= self.WATCHTOWER_BATCH_SIZE or ctn == current_ctn - 1):
+                result = await self._add_sweep_txs_to_watchtower(watchtower, sweep_txs)
+                if is_watchtower_error(result):
+                    self.logger.warning(f'failed to add sweep txs to watchtower for {chan.get_id_for_log()}: {result}')
+                    return
+                sweep_txs = []
+
+    async def _add_sweep_txs_to_watchtower(self, watchtower, sweep_txs):
+        result = await watchtower.add_sweep_txs(sweep_txs)
+        if not is_unknown_method_error(result):
+            return result
+        # older remote watchtowers only have add_sweep_tx
+        self.logger.info('watchtower does not have add_sweep_txs, falling back to single inserts')
+        for args in sweep_txs:
+            result = await watchtower.add_sweep_tx(*args)
+            if is_watchtower_error(result):
+                break
+        return result
 
     def start_network(self, network: 'Network'):
         assert network
@@ -807,43 +847,55 @@ class LNWallet(LNWorker):
         timestamp = min([htlc_with_status.htlc.timestamp for htlc_with_status in plist])
         return amount_msat, fee_msat, timestamp
 
+    def _get_lightning_history_item(self, payment_hash: bytes, plist: List[HTLCWithStatus]) -> dict:
+        # settled htlcs are only ever added to a payment, so the item is cached
+        # until that happens. labels and swaps are not cached.
+        cached = self._lightning_history_items.get(payment_hash)
+        if cached is not None and cached[0] == len(plist):
+            return dict(cached[1])
+        key = payment_hash.hex()
+        info = self.get_payment_info(payment_hash)
+        amount_msat, fee_msat, timestamp = self.get_payment_value(info, plist)
+        if info is not None:
+            direction = ('sent' if info.direction == SENT else 'received') if len(plist)==1 else 'self-payment'
+        else:
+            direction = 'forwarding'
+        preimage = self.get_preimage(payment_hash).hex()
+        item = {
+            'type': 'payment',
+            'timestamp': timestamp or 0,
+            'date': timestamp_to_datetime(timestamp),
+            'direction': direction,
+            'amount_msat': amount_msat,
+            'fee_msat': fee_msat,
+            'payment_hash': key,
+            'preimage': preimage,
+        }
+        self._lightning_history_items[payment_hash] = len(plist), item
+        return dict(item)
+
+    def get_lightning_history_item(self, payment_hash: bytes, plist: List[HTLCWithStatus]) -> dict:
+        item = self._get_lightning_history_item(payment_hash, plist)
+        if item['direction'] == 'forwarding':
+            item['label'] = _('Forwarding')
+        else:
+            item['label'] = self.wallet.get_label(item['payment_hash'])
+        # add group_id to swap transactions
+        swap = self.swap_manager.get_swap(payment_hash)
+        if swap:
+            if swap.is_reverse:
+                item['group_id'] = swap.spending_txid
+                item['group_label'] = 'Reverse swap' + ' ' + self.config.format_amount_and_units(swap.lightning_amount)
+            else:
+                item['group_id'] = swap.funding_txid
+                item['group_label'] = 'Forward swap' + ' ' + self.config.format_amount_and_units(swap.onchain_amount)
+        return item
+
     def get_lightning_history(self):
+        """Settled payments, ordered by timestamp."""
         out = {}
-        for payment_hash, plist in self.get_payments(status='settled').items():
-            if len(plist) == 0:
-                continue
-            key = payment_hash.hex()
-            info = self.get_payment_info(payment_hash)
-            amount_msat, fee_msat, timestamp = self.get_payment_value(info, plist)
-            if info is not None:
-                label = self.wallet.get_label(key)
-                direction = ('sent' if info.direction == SENT else 'received') if len(plist)==1 else 'self-payment'
-            else:
-                direction = 'forwarding'
-                label = _('Forwarding')
-            preimage = self.get_preimage(payment_hash).hex()
-            item = {
-                'type': 'payment',
-                'label': label,
-                'timestamp': timestamp or 0,
-                'date': timestamp_to_datetime(timestamp),
-                'direction': direction,
-                'amount_msat': amount_msat,
-                'fee_msat': fee_msat,
-                'payment_hash': key,
-                'preimage': preimage,
-            }
-            # add group_id to swap transactions
-            swap = self.swap_manager.get_swap(payment_hash)
-            if swap:
-                if swap.is_reverse:
-                    item['group_id'] = swap.spending_txid
-                    item['group_label'] = 'Reverse swap' + ' ' + self.config.format_amount_and_units(swap.lightning_amount)
-                else:
-                    item['group_id'] = swap.funding_txid
-                    item['group_label'] = 'Forward swap' + ' ' + self.config.format_amount_and_units(swap.onchain_amount)
-            # done
-            out[payment_hash] = item
+        for payment_hash, plist in self.payment_ledger.get_settled_payments_by_time():
+            out[payment_hash] = self.get_lightning_history_item(payment_hash, plist)
         return out
 
     def get_onchain_history(self):
@@ -894,14 +946,13 @@ class LNWallet(LNWorker):
             }
             out[closing_txid] = item
         # add info about submarine swaps
-        settled_payments = self.get_payments(status='settled')
         for payment_hash_hex, swap in self.swap_manager.swaps.items():
             txid = swap.spending_txid if swap.is_reverse else swap.funding_txid
             if txid is None:
                 continue
             payment_hash = bytes.fromhex(payment_hash_hex)
-            if payment_hash in settled_payments:
-                plist = settled_payments[payment_hash]
+            plist = self.payment_ledger.get_settled_payment(payment_hash)
+            if plist:
                 info = self.get_payment_info(payment_hash)
                 amount_msat, fee_msat, timestamp = self.get_payment_value(info, plist)
             else:
@@ -924,14 +975,60 @@ class LNWallet(LNWorker):
         return out
 
     def get_history(self):
-        out = list(self.get_lightning_history().values()) + list(self.get_onchain_history().values())
-        # sort by timestamp
-        out.sort(key=lambda x: (x.get('timestamp') or float("inf")))
-        balance_msat = 0
-        for item in out:
+        return list(self.get_history_items())
+
+    def get_history_items(self, *, after: str = None, chunk_size: int = 100) -> Iterator[dict]:
+        """Yields the settled payments and the on-chain events of the channels,
+        ordered by timestamp, with the balance after each item.
+        If after is given (a payment hash or a txid), starts after that item.
+        Payments are read from the payment ledger chunk_size at a time, so that
+        only the yielded ones are looked at.
+        """
+        # note: payments come before on-chain items with the same timestamp
+        def onchain_timestamp(item):
+            return item.get('timestamp') or float("inf")
+        onchain_history = sorted(self.get_onchain_history().values(), key=onchain_timestamp)
+        onchain_pos = 0
+        ln_cursor = ()
+        if after is not None:
+            try:
+                timestamp = self.payment_ledger.get_timestamp(bytes.fromhex(after))
+            except ValueError:
+                timestamp = None
+            if timestamp is not None:
+                ln_cursor = timestamp, bytes.fromhex(after)
+                onchain_pos = len([x for x in onchain_history if onchain_timestamp(x) < timestamp])
+            else:
+                txids = [x['txid'] for x in onchain_history]
+                if after not in txids:
+                    raise Exception(f'cursor not found: {after}')
+                onchain_pos = txids.index(after) + 1
+                ln_cursor = (onchain_timestamp(onchain_history[onchain_pos - 1]),)
+        balance_msat, chunk = self.payment_ledger.get_settled_payments_after(*ln_cursor, limit=chunk_size)
+        balance_msat += sum(x['amount_msat'] for x in onchain_history[:onchain_pos])
+
+        def get_payments(chunk):
+            while True:
+                yield from chunk
+                if len(chunk) < chunk_size:
+                    return
+                timestamp, payment_hash, plist = chunk[-1]
+                _, chunk = self.payment_ledger.get_settled_payments_after(timestamp, payment_hash, limit=chunk_size)
+
+        payments = get_payments(chunk)
+        payment = next(payments, None)
+        while payment is not None or onchain_pos < len(onchain_history):
+            onchain_item = onchain_history[onchain_pos] if onchain_pos < len(onchain_history) else None
+            if payment is not None and (onchain_item is None or payment[0] <= onchain_timestamp(onchain_item)):
+                timestamp, payment_hash, plist = payment
+                item = self.get_lightning_history_item(payment_hash, plist)
+                payment = next(payments, None)
+            else:
+                item = onchain_item
+                onchain_pos += 1
             balance_msat += item['amount_msat']
             item['balance_msat'] = balance_msat
-        return out
+            yield item
 
     def channel_peers(self) -> List[bytes]:
         node_ids = [chan.node_id for chan in self.channels.values() if not chan.is_closed()]
@@ -1103,7 +1200,7 @@ class LNWallet(LNWorker):
             raise PaymentFailure(_("This invoice has been paid already"))
         if status == PR_INFLIGHT:
             raise PaymentFailure(_("A payment was already initiated for this invoice"))
-        if payment_hash in self.get_payments(status='inflight'):
+        if payment_hash in self.payment_ledger.get_inflight_payment_hashes():
             raise PaymentFailure(_("A previous attempt to pay this invoice did not clear"))
         info = PaymentInfo(payment_hash, amount_to_pay, SENT, PR_UNPAID)
         self.save_payment_info(info)
@@ -1821,6 +1918,7 @@ class LNWallet(LNWorker):
         assert info.status in SAVED_PR_STATUS
         with self.lock:
             self.payments[key] = info.amount_msat, info.direction, info.status
+        self.wallet.invalidate_request_status(key)
         if write_to_disk:
             self.wallet.save_db()
 
@@ -2031,6 +2129,7 @@ class LNWallet(LNWorker):
                 del self.payments[payment_hash_hex]
         except KeyError:
             return
+        self.wallet.invalidate_request_status(payment_hash_hex)
         self.wallet.save_db()
 
     def get_balance(self):
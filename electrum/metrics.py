@@ -0,0 +1,156 @@
+# Copyright (C) 2022 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+# Opt-in instrumentation of the daemon, exported in the Prometheus text format.
+# note: this module is imported by util, so it must not import other electrum modules.
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Tuple, Sequence, Mapping, Callable, Awaitable, List
+
+
+class LatencyStats:
+    """Count and histogram of durations."""
+
+    # upper bounds of the histogram buckets, in seconds
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, float('inf'))
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(self.BUCKETS)
+
+    def record(self, elapsed: float, *, error: bool = False) -> None:
+        self.count += 1
+        self.errors += bool(error)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+
+    def to_json(self) -> dict:
+        bucket_names = ['+Inf' if x == float('inf') else str(x) for x in self.BUCKETS]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            # number of durations of at most this many seconds (and more than the previous bucket)
+            'histogram': dict(zip(bucket_names, self.buckets)),
+        }
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ''
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def format_metric(name: str, type_: str, help_: str,
+                  samples: Sequence[Tuple[Mapping[str, str], float]]) -> List[str]:
+    """Lines of a counter or gauge, with one sample per set of labels."""
+    lines = [f'# HELP {name} {help_}', f'# TYPE {name} {type_}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    return lines
+
+
+def format_histogram(name: str, help_: str,
+                     samples: Sequence[Tuple[Mapping[str, str], LatencyStats]]) -> List[str]:
+    """Lines of a histogram, with one LatencyStats per set of labels."""
+    lines = [f'# HELP {name} {help_}', f'# TYPE {name} histogram']
+    for labels, stats in samples:
+        cumulative = 0
+        for upper_bound, count in zip(stats.BUCKETS, stats.buckets):
+            cumulative += count
+            le = '+Inf' if upper_bound == float('inf') else str(upper_bound)
+            lines.append(f'{name}_bucket{_format_labels({**labels, "le": le})} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {stats.total_time}')
+        lines.append(f'{name}_count{_format_labels(labels)} {stats.count}')
+    return lines
+
+
+class MetricsRegistry:
+    """Collects the durations of callbacks and of @profiler functions.
+
+    Collection is disabled by default, as it adds some overhead to every
+    callback. The daemon enables it if the 'enable_metrics' config variable is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # note: durations are recorded from several threads
+        self._lock = threading.Lock()
+        self._triggers: Dict[str, int] = defaultdict(int)
+        self._callbacks_scheduled: Dict[str, int] = defaultdict(int)
+        self._callback_durations: Dict[Tuple[str, str], LatencyStats] = defaultdict(LatencyStats)
+        self._profiler_durations: Dict[str, LatencyStats] = defaultdict(LatencyStats)
+
+    def record_trigger(self, event: str, num_callbacks: int) -> None:
+        with self._lock:
+            self._triggers[event] += 1
+            self._callbacks_scheduled[event] += num_callbacks
+
+    def record_callback(self, event: str, callback_name: str, elapsed: float, *, error: bool = False) -> None:
+        with self._lock:
+            self._callback_durations[(event, callback_name)].record(elapsed, error=error)
+
+    def record_profiler(self, func_name: str, elapsed: float) -> None:
+        with self._lock:
+            self._profiler_durations[func_name].record(elapsed)
+
+    def timed_callback(self, event: str, callback: Callable) -> Callable:
+        name = callback_name(callback)
+        def wrapper(*args):
+            t0 = time.monotonic()
+            error = True
+            try:
+                callback(*args)
+                error = False
+            finally:
+                self.record_callback(event, name, time.monotonic() - t0, error=error)
+        return wrapper
+
+    async def timed_coroutine(self, event: str, name: str, coro: Awaitable) -> None:
+        t0 = time.monotonic()
+        error = True
+        try:
+            await coro
+            error = False
+        finally:
+            self.record_callback(event, name, time.monotonic() - t0, error=error)
+
+    def to_prometheus(self) -> List[str]:
+        with self._lock:
+            triggers = sorted(self._triggers.items())
+            scheduled = sorted(self._callbacks_scheduled.items())
+            callback_durations = sorted(self._callback_durations.items())
+            profiler_durations = sorted(self._profiler_durations.items())
+        lines = []
+        lines += format_metric(
+            'electrum_event_triggers_total', 'counter', 'Number of times an event was triggered.',
+            [({'event': event}, n) for event, n in triggers])
+        lines += format_metric(
+            'electrum_event_callbacks_total', 'counter', 'Number of callbacks scheduled for an event (fan-out).',
+            [({'event': event}, n) for event, n in scheduled])
+        lines += format_histogram(
+            'electrum_callback_duration_seconds',
+            'Duration of event callbacks. For coroutines, this includes the time spent awaiting.',
+            [({'event': event, 'callback': name}, stats) for (event, name), stats in callback_durations])
+        lines += format_histogram(
+            'electrum_profiler_duration_seconds', 'Duration of the functions decorated with @profiler.',
+            [({'function': name}, stats) for name, stats in profiler_durations])
+        return lines
+
+
+def callback_name(callback: Callable) -> str:
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+registry = MetricsRegistry()
@@ -26,7 +26,7 @@ import queue
 import os
 import random
 import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import threading
 import socket
 import json
@@ -74,6 +74,41 @@ if TYPE_CHECKING:
 _logger = get_logger(__name__)
 
 
+class RawTxCache:
+    """LRU cache of raw transactions fetched from servers, shared by all
+    wallets and lnwatchers. Transactions are immutable, so entries never go stale.
+    The size is bounded by the total length of the cached (hex) transactions.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._size = 0
+        self._raw_txs = OrderedDict()  # type: OrderedDict[str, str]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, txid: str) -> Optional[str]:
+        raw = self._raw_txs.get(txid)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._raw_txs.move_to_end(txid)
+        return raw
+
+    def add(self, txid: str, raw: str) -> None:
+        if txid in self._raw_txs or len(raw) > self.max_size:
+            return
+        self._raw_txs[txid] = raw
+        self._size += len(raw)
+        while self._size > self.max_size:
+            _, old_raw = self._raw_txs.popitem(last=False)
+            self._size -= len(old_raw)
+
+    def __len__(self):
+        return len(self._raw_txs)
+
+
 NUM_TARGET_CONNECTED_SERVERS = 10
 NUM_STICKY_SERVERS = 4
 NUM_RECENT_SERVERS = 20
@@ -280,6 +315,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.config = config
 
         self.daemon = daemon
+        self.raw_tx_cache = RawTxCache(max_size=2 * self.config.get('raw_tx_cache_size', 20_000_000))
 
         blockchain.read_blockchains(self.config)
         blockchain.init_headers_file_for_best_chain()
@@ -1097,6 +1133,11 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         return await self.interface.get_transaction(tx_hash=tx_hash, timeout=timeout)
 
+    @best_effort_reliable
+    @catch_server_exceptions
+    async def get_parsed_transaction(self, tx_hash: str, *, timeout=None) -> Transaction:
+        return await self.interface.get_parsed_transaction(tx_hash=tx_hash, timeout=timeout)
+
     @best_effort_reliable
     @catch_server_exceptions
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
@@ -1177,6 +1218,12 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         interface = self.interface
         return interface.tip if interface else 0
 
+    def get_subscription_stats(self) -> Optional[dict]:
+        """Subscriptions and shared requests on the main interface.
+        These are shared by all wallets and watchers of this network."""
+        interface = self.interface
+        return interface.get_subscription_stats() if interface else None
+
     def get_local_height(self):
         """Length of header chain, POW-verified.
         In case of a chain split, this is for the branch the main interface is on,
@@ -0,0 +1,164 @@
+# Copyright (C) 2022 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+import heapq
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Set, List, Tuple, Iterable, Optional
+
+from .invoices import Invoice, PR_UNPAID, PR_EXPIRED, PR_UNKNOWN
+
+if TYPE_CHECKING:
+    from .wallet import Abstract_Wallet
+
+
+class RequestStatusIndex:
+    """Statuses of the payment requests of a wallet, indexed by status.
+
+    The status of a request only changes when a transaction paying to its
+    address changes (added, removed, mined, reorged), when the lightning
+    payment is updated, or when the request expires. The wallet marks the
+    affected requests as dirty, and their statuses are recomputed on the next
+    query. Expirations are flipped from a heap ordered by expiry time.
+    Queries are proportional to the number of changes and to the result.
+    """
+
+    def __init__(self, wallet: 'Abstract_Wallet'):
+        self.wallet = wallet
+        self._dirty_lock = threading.Lock()  # never held while acquiring another lock
+        self._built = False
+        self._lnworker = None  # used to compute the statuses of lightning requests
+        self._base_status: Dict[str, int] = {}  # status, not considering expiry
+        self._status: Dict[str, int] = {}
+        self._by_status: Dict[int, Set[str]] = {}
+        self._expiry: Dict[str, int] = {}  # key -> expiry time
+        self._expiry_heap: List[Tuple[int, str]] = []
+        self._expired: Set[str] = set()
+        self._dirty: Set[str] = set()
+
+    @property
+    def lock(self):
+        # computing statuses takes the wallet lock anyway: share it, to avoid lock ordering issues
+        return self.wallet.lock
+
+    def clear(self) -> None:
+        with self.lock:
+            self._built = False
+            self._base_status.clear()
+            self._status.clear()
+            self._by_status.clear()
+            self._expiry.clear()
+            self._expiry_heap.clear()
+            self._expired.clear()
+            with self._dirty_lock:
+                self._dirty.clear()
+
+    def mark_dirty(self, keys: Iterable[str]) -> None:
+        """The statuses of these requests might have changed.
+        Keys that are not requests are ignored.
+        """
+        with self._dirty_lock:
+            self._dirty.update(keys)
+
+    def mark_all_dirty(self) -> None:
+        self.mark_dirty(list(self.wallet.receive_requests.keys()))
+
+    def add(self, key: str, req: Invoice) -> None:
+        with self.lock:
+            if not self._built:
+                return
+            self._set_expiry(key, req)
+            self.mark_dirty([key])
+
+    def remove(self, key: str) -> None:
+        with self.lock:
+            if not self._built:
+                return
+            self._set_status(key, None)
+            self._base_status.pop(key, None)
+            self._expiry.pop(key, None)
+            self._expired.discard(key)
+
+    def get_status(self, key: str) -> int:
+        with self.lock:
+            self._refresh()
+            return self._status.get(key, PR_UNKNOWN)
+
+    def get_keys(self, *, status: int = None, exclude: int = None) -> Set[str]:
+        """Returns the keys of the requests with the given status,
+        or of those without the excluded status.
+        """
+        with self.lock:
+            self._refresh()
+            if status is not None:
+                return set(self._by_status.get(status, ()))
+            keys = set()
+            for s, s_keys in self._by_status.items():
+                if s != exclude:
+                    keys |= s_keys
+            return keys
+
+    def _set_expiry(self, key: str, req: Invoice) -> None:
+        self._expired.discard(key)
+        if req.exp > 0:
+            expiry = req.time + req.exp
+            self._expiry[key] = expiry
+            heapq.heappush(self._expiry_heap, (expiry, key))
+        else:
+            self._expiry.pop(key, None)
+
+    def _set_status(self, key: str, status: Optional[int]) -> None:
+        old_status = self._status.get(key)
+        if old_status == status:
+            return
+        if old_status is not None:
+            self._by_status[old_status].discard(key)
+        if status is None:
+            self._status.pop(key, None)
+        else:
+            self._status[key] = status
+            self._by_status.setdefault(status, set()).add(key)
+
+    def _update_status(self, key: str) -> None:
+        req = self.wallet.receive_requests.get(key)
+        base_status = self._base_status.get(key)
+        if req is None or base_status is None:
+            self._set_status(key, None)
+            return
+        status = base_status
+        if req.is_lightning() and req.exp == 0:
+            status = PR_EXPIRED  # for BOLT-11 invoices, exp==0 means 0 seconds
+        elif status == PR_UNPAID and key in self._expired:
+            status = PR_EXPIRED
+        self._set_status(key, status)
+
+    def _refresh(self) -> None:
+        if not self._built:
+            self._built = True
+            for key, req in list(self.wallet.receive_requests.items()):
+                self._set_expiry(key, req)
+            self.mark_dirty(self.wallet.receive_requests.keys())
+        lnworker = self.wallet.lnworker
+        if lnworker is not self._lnworker:
+            self._lnworker = lnworker
+            self.mark_dirty([key for key, req in self.wallet.receive_requests.items() if req.is_lightning()])
+        # flip expirations
+        now = time.time()
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expiry, key = heapq.heappop(heap)
+            if self._expiry.get(key) != expiry:
+                continue  # request was removed or replaced
+            self._expired.add(key)
+            self._update_status(key)
+        # recompute the statuses of dirty requests
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        for key in dirty:
+            req = self.wallet.receive_requests.get(key)
+            if req is None:
+                self._base_status.pop(key, None)
+            else:
+                self._base_status[key] = self.wallet.compute_request_status(req)
+            self._update_status(key)
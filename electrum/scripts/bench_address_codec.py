@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# Micro-benchmarks for address encoding and decoding.
+# usage: bench_address_codec.py [num_addresses ...]
+
+import os
+import sys
+import time
+
+from electrum import bitcoin
+from electrum.transaction import get_address_from_output_script
+
+
+def timeit(name: str, func, items):
+    t0 = time.monotonic()
+    results = [func(x) for x in items]
+    elapsed = time.monotonic() - t0
+    print(f"{len(items):>8} x {name:>32}: {elapsed:7.3f} sec, "
+          f"{1e6 * elapsed / len(items):6.2f} us/op")
+    return results
+
+
+def bench(num_addresses: int):
+    hashes = [os.urandom(20) for _ in range(num_addresses)]
+    p2pkh = timeit('hash160_to_p2pkh', bitcoin.hash160_to_p2pkh, hashes)
+    p2wpkh = timeit('hash_to_segwit_addr', lambda h: bitcoin.hash_to_segwit_addr(h, witver=0), hashes)
+    timeit('is_address(p2pkh)', bitcoin.is_address, p2pkh)
+    timeit('is_address(p2wpkh)', bitcoin.is_address, p2wpkh)
+    scripts = timeit('address_to_script(p2pkh)', bitcoin.address_to_script, p2pkh)
+    scripts += timeit('address_to_script(p2wpkh)', bitcoin.address_to_script, p2wpkh)
+    timeit('address_to_scripthash', bitcoin.address_to_scripthash, p2pkh + p2wpkh)
+    scripts = [bytes.fromhex(s) for s in scripts]
+    timeit('get_address_from_output_script', get_address_from_output_script, scripts)
+    # a working set that fits in the caches, e.g. the addresses of a wallet
+    n = bitcoin.ADDRESS_CACHE_SIZE // 2
+    addresses = p2pkh[:n] + p2wpkh[:n]
+    scripts = scripts[:n] + scripts[num_addresses:num_addresses + n]
+    for _ in range(2):
+        timeit('address_to_scripthash (cached)', bitcoin.address_to_scripthash, addresses)
+        timeit('get_address_from_output_script (cached)', get_address_from_output_script, scripts)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000]
+    for size in sizes:
+        bench(size)
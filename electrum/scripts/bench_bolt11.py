@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to decode BOLT-11 invoices, without and with
+# the cache of decoded invoices.
+# usage: bench_bolt11.py [num_decodes]
+
+import os
+import sys
+import time
+from decimal import Decimal
+
+from electrum import constants
+from electrum.lnaddr import LnAddr, lnencode, lndecode, _lndecode, _lndecode_cached
+
+
+NUM_INVOICES = 1000
+
+
+def bench(num_decodes: int):
+    privkey = os.urandom(32)
+    route = [(bytes.fromhex('02' + 32 * 'ab'), os.urandom(8), 1000, 100, 144)]
+    invoices = [
+        lnencode(LnAddr(paymenthash=os.urandom(32), amount=Decimal(i + 1) / 10**6, payment_secret=os.urandom(32),
+                        tags=[('d', f'invoice {i}'), ('x', 3600), ('c', 144), ('r', route), ('9', 33282)]),
+                 privkey)
+        for i in range(NUM_INVOICES)]
+    t0 = time.monotonic()
+    for i in range(num_decodes):
+        _lndecode(invoices[i % NUM_INVOICES], verbose=False, net=constants.net)
+    print(f"decode         : {1e6 * (time.monotonic() - t0) / num_decodes:8.2f} us/invoice")
+    _lndecode_cached.cache_clear()
+    for invoice in invoices:
+        lndecode(invoice)
+    t0 = time.monotonic()
+    for i in range(num_decodes):
+        lndecode(invoices[i % NUM_INVOICES])
+    print(f"decode (cached): {1e6 * (time.monotonic() - t0) / num_decodes:8.2f} us/invoice")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Reports how long the command line client takes to import its modules when
+# forwarding a command to the daemon (here: failing to, as no daemon runs),
+# based on python -X importtime, and the slowest modules it imports.
+# usage: bench_cli_startup.py [num_runs]
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from typing import Dict, Tuple
+
+
+RUN_ELECTRUM = os.path.join(os.path.dirname(__file__), '..', '..', 'run_electrum')
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """Returns the total import time and the cumulative time of each module, in seconds."""
+    total = 0
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return total / 1e6, cumulative
+
+
+def run_client(datadir: str) -> Tuple[float, float, Dict[str, float]]:
+    t0 = time.monotonic()
+    p = subprocess.run([sys.executable, '-X', 'importtime', RUN_ELECTRUM, '-D', datadir, '--regtest', 'getinfo'],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.monotonic() - t0
+    assert 'Daemon not running' in p.stdout, p.stdout + p.stderr
+    total, cumulative = parse_importtime(p.stderr)
+    return elapsed, total, cumulative
+
+
+def bench(num_runs: int):
+    datadir = tempfile.mkdtemp()
+    results = sorted((run_client(datadir) for i in range(num_runs)), key=lambda x: x[1])
+    elapsed, total, cumulative = results[len(results) // 2]
+    print(f"median of {num_runs} runs: {elapsed:.3f} sec wall clock, {total:.3f} sec importing")
+    print("slowest top-level imports:")
+    for name, t in sorted(cumulative.items(), key=lambda x: -x[1])[:15]:
+        print(f"  {t:.3f} {name}")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
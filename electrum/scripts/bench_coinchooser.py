@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Benchmarks coin choosers against synthetic UTXO sets.
+# usage: bench_coinchooser.py [num_utxos ...]
+
+import sys
+import time
+import random
+
+from electrum.bitcoin import sha256, hash_to_segwit_addr, COIN
+from electrum.coinchooser import COIN_CHOOSERS
+from electrum.transaction import PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum.util import NotEnoughFunds
+
+
+def make_utxos(num_utxos: int, *, rng: random.Random):
+    coins = []
+    for i in range(num_utxos):
+        h = sha256(f"coin_{i}")
+        coin = PartialTxInput(prevout=TxOutpoint(txid=h, out_idx=0))
+        # log-uniform values between 1k sat and 1 BTC
+        coin._trusted_value_sats = int(10 ** rng.uniform(3, 8))
+        # a few addresses get reused
+        coin._trusted_address = hash_to_segwit_addr(h[:20] if rng.random() > 0.1 else bytes(20), witver=0)
+        coin.script_type = 'p2wpkh'
+        coin.block_height = rng.choice([0] + [100] * 9)
+        coins.append(coin)
+    return coins
+
+
+def bench(num_utxos: int):
+    rng = random.Random(num_utxos)
+    coins = make_utxos(num_utxos, rng=rng)
+    dest_addr = hash_to_segwit_addr(b'\x02' * 20, witver=0)
+    change_addr = hash_to_segwit_addr(b'\x03' * 20, witver=0)
+    for amount in (COIN // 100, COIN // 10, COIN):
+        outputs = [PartialTxOutput.from_address_and_value(dest_addr, amount)]
+        for name, klass in sorted(COIN_CHOOSERS.items()):
+            coin_chooser = klass(enable_output_value_rounding=False)
+            t0 = time.monotonic()
+            try:
+                tx = coin_chooser.make_tx(coins=coins, inputs=[], outputs=outputs,
+                                          change_addrs=[change_addr],
+                                          fee_estimator_vb=lambda size: 5 * size,
+                                          dust_threshold=546)
+            except NotEnoughFunds:
+                print(f"{num_utxos:>7} utxos, amount {amount:>10}, {name:>15}: not enough funds")
+                continue
+            elapsed = time.monotonic() - t0
+            print(f"{num_utxos:>7} utxos, amount {amount:>10}, {name:>15}: "
+                  f"{elapsed:7.3f} sec, {len(tx.inputs()):>3} inputs, "
+                  f"{len(tx.outputs()) - 1} change, fee {tx.get_fee()} sat")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [100, 1000, 10000]
+    for size in sizes:
+        bench(size)
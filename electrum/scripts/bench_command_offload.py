@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Measures the event loop lag caused by a CPU-bound command, when it runs
+# on the event loop, and when it runs on the worker threads.
+# usage: bench_command_offload.py [num_addresses]
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+from electrum.bitcoin import hash_to_segwit_addr
+from electrum.commands import Commands
+from electrum.daemon import EventLoopLagMonitor
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+from electrum.wallet import restore_wallet_from_text
+
+
+def bench(num_addresses: int):
+    loop, stop_loop, loop_thread = create_and_start_event_loop()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = SimpleConfig({'electrum_path': tmpdir})
+        addresses = [hash_to_segwit_addr(os.urandom(20), witver=0) for _ in range(num_addresses)]
+        wallet = restore_wallet_from_text(' '.join(addresses), path=os.path.join(tmpdir, 'wallet'),
+                                          config=config)['wallet']
+        cmds = Commands(config=config)
+        listaddresses = Commands.listaddresses.__wrapped__
+
+        async def run_on_loop():
+            return listaddresses(cmds, balance=True, labels=True, wallet=wallet)
+
+        async def run_offloaded():
+            return await cmds.listaddresses(balance=True, labels=True, wallet=wallet)
+
+        for name, coro_func in (('on event loop', run_on_loop), ('offloaded', run_offloaded)):
+            monitor = EventLoopLagMonitor()
+            monitor.INTERVAL = 0.01
+            monitor_task = asyncio.run_coroutine_threadsafe(monitor.run(), loop)
+            time.sleep(0.1)
+            t0 = time.monotonic()
+            asyncio.run_coroutine_threadsafe(coro_func(), loop).result()
+            elapsed = time.monotonic() - t0
+            time.sleep(0.1)
+            monitor_task.cancel()
+            print(f"{num_addresses:>7} addresses, listaddresses {name:>14}: {elapsed:6.3f} sec, "
+                  f"max event loop lag {monitor.lag_stats.max_time:6.3f} sec")
+    loop.call_soon_threadsafe(stop_loop.set_result, 1)
+    loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
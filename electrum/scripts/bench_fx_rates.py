@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to look up the historical exchange rate of many
+# timestamps, and to load the cached rates.
+# usage: bench_fx_rates.py [num_timestamps]
+
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from electrum.exchange_rate import ExchangeBase, FxThread, HistoricalRates
+
+
+class BenchExchange(ExchangeBase):
+    def __init__(self):
+        super().__init__(lambda: None, lambda: None)
+
+
+class BenchFxThread:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.ccy = 'EUR'
+        self.history_used_spot = False
+
+    timestamp_rate = FxThread.timestamp_rate
+    _day_rate = FxThread._day_rate
+
+
+def bench(num_timestamps: int):
+    start = date(2013, 1, 1)
+    history = {(start + timedelta(days=i)).isoformat(): random.uniform(100, 60000) for i in range(3650)}
+    cache_dir = tempfile.mkdtemp()
+    try:
+        exchange = BenchExchange()
+        with open(f'{cache_dir}/BenchExchange_EUR', 'w', encoding='utf-8') as f:
+            f.write(json.dumps(history))
+        t0 = time.monotonic()
+        exchange.read_historical_rates('EUR', cache_dir)
+        print(f"load json cache  : {1e3 * (time.monotonic() - t0):7.2f} ms")
+        exchange.write_historical_rates('EUR', cache_dir, exchange.history['EUR'])
+        t0 = time.monotonic()
+        BenchExchange().read_historical_rates('EUR', cache_dir)
+        print(f"load binary cache: {1e3 * (time.monotonic() - t0):7.2f} ms")
+    finally:
+        shutil.rmtree(cache_dir)
+
+    fx = BenchFxThread(exchange)
+    t_start = time.mktime(start.timetuple())
+    timestamps = sorted(random.uniform(t_start, t_start + 3650 * 86400) for i in range(num_timestamps))
+    t0 = time.monotonic()
+    for t in timestamps:
+        fx.timestamp_rate(t)
+    print(f"lookups          : {1e6 * (time.monotonic() - t0) / num_timestamps:7.2f} us/timestamp")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Measures how fast gossip-like rows can be written through SqlDB,
+# one statement per request (@sql) vs merged requests (@sql_batched),
+# and how long reads wait while the writer is busy.
+# usage: bench_gossip_db.py [num_rows ...]
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+from electrum.sql_db import SqlDB, sql, sql_batched, sql_read
+from electrum.crypto import sha256
+
+
+class GossipDB(SqlDB):
+    SYNCHRONOUS = 'NORMAL'
+
+    def create_database(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS policy (key BLOB(41), msg BLOB, PRIMARY KEY(key))")
+        self.conn.commit()
+
+    @sql
+    def save_policy(self, key: bytes, msg: bytes):
+        self.conn.execute("REPLACE INTO policy (key, msg) VALUES (?,?)", [key, msg])
+
+    @sql_batched
+    def save_policy_batched(self, rows):
+        self.conn.executemany("REPLACE INTO policy (key, msg) VALUES (?,?)", rows)
+
+    @sql_read
+    def count_policies(self):
+        return self.conn.execute("SELECT COUNT(*) FROM policy").fetchone()[0]
+
+
+async def bench(num_rows: int):
+    loop = asyncio.get_running_loop()
+    rows = [(sha256(str(i)) + bytes(9), os.urandom(136)) for i in range(num_rows)]
+    for name in ('save_policy', 'save_policy_batched'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = GossipDB(loop, os.path.join(tmpdir, 'gossip_db'), commit_interval=100)
+            save = getattr(db, name)
+            t0 = time.monotonic()
+            futs = [save(key, msg) for key, msg in rows]
+            t_read = time.monotonic()
+            await db.count_policies()
+            read_latency = time.monotonic() - t_read
+            await asyncio.gather(*futs)
+            elapsed = time.monotonic() - t0
+            db.stop()
+            await db.stopped_event.wait()
+        print(f"{num_rows:>7} rows, {name:>20}: {elapsed:7.3f} sec, "
+              f"{num_rows / elapsed:9.0f} rows/sec, read latency {1000 * read_latency:7.1f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        asyncio.run(bench(size))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Reports the throughput of the initial header sync, against local mock
+# servers that serve a synthetic regtest chain with some added latency.
+# usage: bench_header_sync.py [num_chunks] [latency_ms]
+
+import sys
+import time
+import asyncio
+import logging
+import contextlib
+import tempfile
+import threading
+
+import aiorpcx
+from aiorpcx import RPCSession, serve_rs, connect_rs
+
+from electrum import constants, blockchain
+from electrum.blockchain import serialize_header, hash_raw_header, HEADER_SIZE
+from electrum.crypto import sha256
+from electrum.interface import Interface, ServerAddr, NotificationSession, _HeaderChunkFetcher, NetworkTimeout
+from electrum.network import RawTxCache
+from electrum.simple_config import SimpleConfig
+
+
+REGTEST_GENESIS = {
+    'version': 1,
+    'prev_block_hash': '00' * 32,
+    'merkle_root': '4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b',
+    'timestamp': 1296688602,
+    'bits': 0x207fffff,
+    'nonce': 2,
+}
+
+
+def make_chain(num_headers: int) -> bytes:
+    # regtest does not check proof of work, headers only need to link up
+    headers = [serialize_header(REGTEST_GENESIS)]
+    assert hash_raw_header(headers[0]) == constants.net.GENESIS
+    for height in range(1, num_headers):
+        headers.append(serialize_header({
+            'version': 0x20000000,
+            'prev_block_hash': hash_raw_header(headers[-1]),
+            'merkle_root': sha256(str(height)).hex(),
+            'timestamp': REGTEST_GENESIS['timestamp'] + 600 * height,
+            'bits': REGTEST_GENESIS['bits'],
+            'nonce': 0,
+        }))
+    return bytes.fromhex(''.join(headers))
+
+
+class MockServerSession(RPCSession):
+    chain = b''
+    latency = 0.0
+
+    async def handle_request(self, request):
+        await asyncio.sleep(self.latency)
+        if request.method == 'blockchain.block.headers':
+            start, count = request.args
+            data = self.chain[start * HEADER_SIZE:(start + count) * HEADER_SIZE]
+            return {'count': len(data) // HEADER_SIZE, 'hex': data.hex(), 'max': 2016}
+        if request.method == 'blockchain.block.header':
+            height, = request.args
+            return self.chain[height * HEADER_SIZE:(height + 1) * HEADER_SIZE].hex()
+        raise aiorpcx.RPCError(-32601, f'unknown method {request.method}')
+
+
+class MockTask:
+    def set_name(self, name): pass
+
+
+class MockTaskGroup:
+    async def spawn(self, coro):
+        coro.close()
+        return MockTask()
+
+
+class MockNetwork:
+    taskgroup = MockTaskGroup()
+    debug = False
+
+    def __init__(self, config):
+        self.config = config
+        self.asyncio_loop = asyncio.get_event_loop()
+        self.interfaces = {}
+        self.interfaces_lock = threading.Lock()
+        self.raw_tx_cache = RawTxCache(max_size=0)
+
+    def get_network_timeout_seconds(self, request_type=NetworkTimeout.Generic):
+        return request_type.NORMAL
+
+
+async def sync(*, chain: bytes, ports, chunks_ahead: int) -> float:
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    blockchain.blockchains.clear()
+    blockchain.read_blockchains(config)
+    blockchain.init_headers_file_for_best_chain()
+    network = MockNetwork(config)
+    tip = len(chain) // HEADER_SIZE - 1
+    async with contextlib.AsyncExitStack() as stack:
+        interfaces = []
+        for port in ports:
+            iface = Interface(network=network, server=ServerAddr('127.0.0.1', port, protocol='t'), proxy=None)
+            session = await stack.enter_async_context(connect_rs('127.0.0.1', port, session_factory=(
+                lambda *args, iface=iface, **kwargs: NotificationSession(*args, interface=iface, **kwargs))))
+            iface.session = session
+            iface.blockchain = blockchain.get_best_chain()
+            iface.tip = tip
+            iface.ready.set_result(1)
+            network.interfaces[iface.server] = iface
+            interfaces.append(iface)
+        _HeaderChunkFetcher.NUM_CHUNKS_AHEAD = chunks_ahead
+        t0 = time.monotonic()
+        await interfaces[0].sync_until(0, next_height=tip)
+        elapsed = time.monotonic() - t0
+        assert interfaces[0].blockchain.height() == tip
+    return elapsed
+
+
+async def bench(num_chunks: int, latency: float):
+    chain = make_chain(num_chunks * 2016)
+    MockServerSession.chain = chain
+    MockServerSession.latency = latency
+    servers = [await serve_rs(MockServerSession, '127.0.0.1', 0) for i in range(4)]
+    ports = [server.sockets[0].getsockname()[1] for server in servers]
+    num_headers = len(chain) // HEADER_SIZE
+    for num_servers, chunks_ahead in ((1, 0), (1, 8), (4, 8)):
+        elapsed = await sync(chain=chain, ports=ports[:num_servers], chunks_ahead=chunks_ahead)
+        print(f"{num_chunks} chunks, {num_servers} server(s), {chunks_ahead} chunks ahead: "
+              f"{elapsed:6.2f} sec, {num_headers / elapsed:8.0f} headers/sec")
+    for server in servers:
+        server.close()
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    constants.set_regtest()
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = int(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.1
+    asyncio.run(bench(num_chunks, latency))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to build an OrderedDictWithIndex the size of a
+# large wallet history, to remove items from it, and to look up positions.
+# usage: bench_history_index.py [num_items]
+
+import random
+import sys
+import time
+
+from electrum.util import OrderedDictWithIndex
+
+
+def bench(num_items: int):
+    keys = [f'{i:064x}' for i in range(num_items)]
+    t0 = time.monotonic()
+    d = OrderedDictWithIndex()
+    for key in keys:
+        d[key] = {'txid': key}
+    print(f"build            : {1e3 * (time.monotonic() - t0):9.2f} ms")
+    removed = random.sample(keys, 200)
+    t0 = time.monotonic()
+    for key in removed:
+        d.pop(key)
+    print(f"remove           : {1e6 * (time.monotonic() - t0) / len(removed):9.2f} us/item")
+    lookups = random.sample(list(d.keys()), 1000)
+    t0 = time.monotonic()
+    for key in lookups:
+        d.value_from_pos(d.pos_from_key(key))
+    print(f"position lookups : {1e6 * (time.monotonic() - t0) / len(lookups):9.2f} us/item")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
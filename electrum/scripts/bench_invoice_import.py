@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to import invoices into a wallet one at a time,
+# as before, and in bulk, and to export them.
+# usage: bench_invoice_import.py [num_invoices]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from electrum import constants
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop, read_json_array_file
+from electrum.invoices import Invoice
+from electrum.wallet import restore_wallet_from_text
+
+SEED = "small rapid pattern language comic denial donate extend tide fever burden barrel"
+
+
+def bench(num_invoices: int):
+    constants.set_testnet()
+    loop, stop_loop, loop_thread = create_and_start_event_loop()
+    electrum_path = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path})
+        w1 = restore_wallet_from_text(SEED, path=f'{electrum_path}/w1', config=config)['wallet']
+        addr = w1.get_receiving_address()
+        invoices = [w1.make_payment_request(addr, 1000 + i, f'invoice {i}', 3600) for i in range(num_invoices)]
+        for i, invoice in enumerate(invoices):
+            invoice.id = f'{i:010x}'
+        w1.save_invoices(invoices)
+        path = os.path.join(electrum_path, 'invoices.json')
+        t0 = time.monotonic()
+        w1.export_invoices(path)
+        print(f"export             : {1e3 * (time.monotonic() - t0):9.2f} ms")
+
+        num_slow = min(num_invoices, 1000)
+        w2 = restore_wallet_from_text(SEED, path=f'{electrum_path}/w2', config=config)['wallet']
+        t0 = time.monotonic()
+        for i, x in enumerate(read_json_array_file(path)):
+            if i == num_slow:
+                break
+            w2.save_invoice(Invoice.from_json(x))
+        print(f"one at a time      : {1e6 * (time.monotonic() - t0) / num_slow:9.2f} us/invoice ({num_slow} invoices)")
+
+        w3 = restore_wallet_from_text(SEED, path=f'{electrum_path}/w3', config=config)['wallet']
+        t0 = time.monotonic()
+        w3.import_invoices(path)
+        print(f"bulk import        : {1e6 * (time.monotonic() - t0) / num_invoices:9.2f} us/invoice")
+    finally:
+        shutil.rmtree(electrum_path)
+        loop.call_soon_threadsafe(stop_loop.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
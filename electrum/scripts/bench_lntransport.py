@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Reports how fast a BOLT-8 transport encrypts and decrypts a stream of
+# gossip-sized messages, for a few socket read sizes.
+# usage: bench_lntransport.py [num_messages] [message_size]
+
+import sys
+import time
+import asyncio
+
+from electrum.lnutil import LNPeerAddr
+from electrum.lntransport import LNTransport, LNResponderTransport
+
+
+class Writer:
+    def __init__(self):
+        self.chunks = []
+        self.num_writes = 0
+
+    def writelines(self, data):
+        self.num_writes += 1
+        self.chunks += data
+
+
+def make_transport_pair():
+    ck, k1, k2 = b'\x01' * 32, b'\x02' * 32, b'\x03' * 32
+    sender = LNTransport(b'\x04' * 32, LNPeerAddr('127.0.0.1', 9735, b'\x02' * 33), proxy=None)
+    receiver = LNResponderTransport(b'\x05' * 32, None, None)
+    sender.sk, sender.rk = k1, k2
+    receiver.sk, receiver.rk = k2, k1
+    sender.init_counters(ck)
+    receiver.init_counters(ck)
+    return sender, receiver
+
+
+async def bench(num_messages: int, message_size: int):
+    msg = b'\x01\x02' + bytes(message_size - 2)
+    for read_size in (2**10, 2**14, 2**16):
+        sender, receiver = make_transport_pair()
+        sender.writer = writer = Writer()
+        t0 = time.monotonic()
+        for i in range(num_messages):
+            sender.send_bytes(msg)
+        await asyncio.sleep(0)
+        t_send = time.monotonic() - t0
+        reader = asyncio.StreamReader(limit=2**20)
+        reader.feed_data(b''.join(writer.chunks))
+        reader.feed_eof()
+        receiver.reader = reader
+        receiver.READ_SIZE = read_size
+        t0 = time.monotonic()
+        n = 0
+        async for msg in receiver.read_messages():
+            n += 1
+            if n == num_messages:
+                break
+        t_recv = time.monotonic() - t0
+        print(f"read size {read_size:6}: send {num_messages / t_send:8.0f} msgs/sec ({writer.num_writes} writes), "
+              f"receive {num_messages / t_recv:8.0f} msgs/sec, {receiver.bytes_received / t_recv / 1e6:6.1f} MB/sec")
+
+
+if __name__ == '__main__':
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    message_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(bench(num_messages, message_size))
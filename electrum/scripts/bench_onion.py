@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to peel an onion per HTLC, the first time an onion
+# is received and when a pending HTLC is processed again by the htlc switch.
+# usage: bench_onion.py [num_htlcs]
+
+import os
+import sys
+import time
+
+from electrum.ecc import ECPrivkey
+from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet, process_onion_packet,
+                              OnionReplayCache)
+
+
+def make_packets(pubkey: bytes, num_htlcs: int, associated_data: bytes):
+    packets = []
+    for i in range(num_htlcs):
+        hops_data = [OnionHopsDataSingle(is_tlv_payload=True, payload={
+            "amt_to_forward": {"amt_to_forward": 1000},
+            "outgoing_cltv_value": {"outgoing_cltv_value": 500},
+            "short_channel_id": {"short_channel_id": bytes(8)},
+        }), OnionHopsDataSingle(is_tlv_payload=True, payload={
+            "amt_to_forward": {"amt_to_forward": 1000},
+            "outgoing_cltv_value": {"outgoing_cltv_value": 500},
+        })]
+        next_pubkey = ECPrivkey.generate_random_key().get_public_key_bytes()
+        packets.append(new_onion_packet([pubkey, next_pubkey], os.urandom(32), hops_data, associated_data))
+    return packets
+
+
+def bench(num_htlcs: int):
+    privkey = ECPrivkey.generate_random_key()
+    associated_data = bytes(32)
+    packets = make_packets(privkey.get_public_key_bytes(), num_htlcs, associated_data)
+    replay_cache = OnionReplayCache()
+    for label in ('first time', 'again'):
+        t0 = time.monotonic()
+        for i, packet in enumerate(packets):
+            processed = process_onion_packet(packet, associated_data, privkey.get_secret_bytes(),
+                                             replay_cache=replay_cache, htlc_key=i)
+            assert not processed.are_we_final
+        elapsed = time.monotonic() - t0
+        print(f"{label:10}: {1e6 * elapsed / num_htlcs:7.1f} us/htlc")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to list the unpaid payment requests of a wallet,
+# computing every status as before, and with the request status index.
+# usage: bench_requests.py [num_requests]
+
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from electrum import constants
+from electrum.invoices import PR_PAID
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+from electrum.wallet import Abstract_Wallet, restore_wallet_from_text
+
+
+def bench(num_requests: int):
+    constants.set_testnet()
+    loop, stop_loop, loop_thread = create_and_start_event_loop()
+    electrum_path = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path})
+        with mock.patch.object(Abstract_Wallet, 'save_db'):
+            w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                         path=f'{electrum_path}/wallet', gap_limit=num_requests,
+                                         config=config)['wallet']
+            for addr in w.get_receiving_addresses()[:num_requests]:
+                w.add_payment_request(w.make_payment_request(addr, 1000, '', 3600), write_to_disk=False)
+
+        t0 = time.monotonic()
+        unpaid = [r for k, r in w.receive_requests.items()
+                  if w.check_expired_status(r, w.compute_request_status(r)) != PR_PAID]
+        print(f"computing each status: {1e3 * (time.monotonic() - t0):8.2f} ms")
+        t0 = time.monotonic()
+        assert len(w.get_unpaid_requests()) == len(unpaid)
+        print(f"building the index   : {1e3 * (time.monotonic() - t0):8.2f} ms")
+        w.request_index.mark_dirty(list(w.receive_requests.keys())[:num_requests // 100])
+        t0 = time.monotonic()
+        w.get_unpaid_requests()
+        print(f"indexed, 1% changed  : {1e3 * (time.monotonic() - t0):8.2f} ms")
+        t0 = time.monotonic()
+        w.get_sorted_requests(status=PR_PAID)
+        print(f"listing paid requests: {1e3 * (time.monotonic() - t0):8.2f} ms")
+    finally:
+        shutil.rmtree(electrum_path)
+        loop.call_soon_threadsafe(stop_loop.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
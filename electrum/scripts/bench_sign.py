@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Reports the time it takes to sign transactions with many inputs.
+# usage: bench_sign.py [num_inputs ...]
+
+import sys
+import time
+
+from electrum import ecc
+from electrum.bitcoin import sha256, pubkey_to_address
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+
+
+def make_tx(num_inputs: int, txin_type: str):
+    privkey = ecc.ECPrivkey(sha256(b'bench_sign'))
+    pubkey = privkey.get_public_key_bytes(compressed=True)
+    address = pubkey_to_address(txin_type, pubkey.hex())
+    inputs = []
+    for i in range(num_inputs):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=sha256(str(i)), out_idx=0))
+        txin.script_type = txin_type
+        txin.pubkeys = [pubkey]
+        txin.num_sig = 1
+        txin._trusted_value_sats = 10_000
+        txin._trusted_address = address
+        inputs.append(txin)
+    outputs = [PartialTxOutput.from_address_and_value(address, num_inputs * 9_000)]
+    tx = PartialTransaction.from_io(inputs, outputs)
+    keypairs = {pubkey.hex(): (privkey.get_secret_bytes(), True)}
+    return tx, keypairs
+
+
+def bench(num_inputs: int):
+    for txin_type in ('p2pkh', 'p2wpkh'):
+        tx, keypairs = make_tx(num_inputs, txin_type)
+        t0 = time.monotonic()
+        tx.sign(keypairs)
+        elapsed = time.monotonic() - t0
+        assert tx.is_complete()
+        print(f"{num_inputs:>5} {txin_type:>6} inputs: "
+              f"{elapsed:7.3f} sec, {1000 * elapsed / num_inputs:6.2f} ms/input")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10, 100, 500, 1000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Reports how long it takes to list the spendable coins of a wallet with many
+# small unconfirmed coins, received in transactions with many inputs.
+# usage: bench_spendable_coins.py [num_funding_txs]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from electrum import constants, bitcoin
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import Transaction
+from electrum.util import create_and_start_event_loop
+from electrum.wallet import Abstract_Wallet, restore_wallet_from_text
+
+NUM_INPUTS = 50
+NUM_OUTPUTS = 10
+
+
+def make_tx(prevouts, outputs) -> Transaction:
+    """A legacy tx without signatures, serialized by hand."""
+    raw = bytes.fromhex('01000000') + bytes([len(prevouts)])
+    for txid, n in prevouts:
+        raw += bytes.fromhex(txid)[::-1] + n.to_bytes(4, 'little') + b'\x00' + b'\xff' * 4
+    raw += bytes([len(outputs)])
+    for address, value in outputs:
+        script = bytes.fromhex(bitcoin.address_to_script(address))
+        raw += value.to_bytes(8, 'little') + bytes([len(script)]) + script
+    raw += b'\x00' * 4
+    return Transaction(raw.hex())
+
+
+def bench(num_funding_txs: int):
+    constants.set_testnet()
+    loop, stop_loop, loop_thread = create_and_start_event_loop()
+    electrum_path = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path})
+        with mock.patch.object(Abstract_Wallet, 'save_db'):
+            w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                         path=f'{electrum_path}/wallet', gap_limit=NUM_OUTPUTS, config=config)['wallet']
+            addrs = w.get_receiving_addresses()[:NUM_OUTPUTS]
+            external = bitcoin.hash160_to_p2pkh(os.urandom(20))
+            for i in range(num_funding_txs):
+                parents = [make_tx([(os.urandom(32).hex(), 0)], [(external, 10_000)]) for j in range(NUM_INPUTS)]
+                for parent in parents:
+                    w.add_transaction(parent, allow_unrelated=True)
+                w.add_transaction(make_tx([(parent.txid(), 0) for parent in parents],
+                                          [(addr, 1000) for addr in addrs]))
+        num_coins = len(w.get_utxos())
+        t0 = time.monotonic()
+        w.get_spendable_coins(None)
+        print(f"first query : {1e3 * (time.monotonic() - t0):8.2f} ms ({num_coins} coins)")
+        t0 = time.monotonic()
+        assert w.get_spendable_coins(None) == []
+        print(f"second query: {1e3 * (time.monotonic() - t0):8.2f} ms")
+    finally:
+        shutil.rmtree(electrum_path)
+        loop.call_soon_threadsafe(stop_loop.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Load generator for the watchtower sweep store. Reports how fast sweep txs
+# are ingested, one per call and in bulk, and how long it takes to look up
+# the sweep txs of a breached channel.
+# usage: bench_watchtower.py [num_channels] [num_ctns] [txs_per_ctn]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+from electrum.lnwatcher import SweepStore
+
+
+# any complete transaction will do
+RAW_TX = '0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00'
+BULK_SIZE = 500
+
+
+class UnindexedSweepStore(SweepStore):
+    # for comparison with how lookups used to scan the table
+
+    def create_database(self):
+        super().create_database()
+        self.conn.execute("DROP INDEX sweep_txs_ctn")
+        self.conn.execute("DROP INDEX sweep_txs_prevout")
+        self.conn.commit()
+
+
+class MockNetwork:
+    def __init__(self):
+        self.asyncio_loop = asyncio.get_event_loop()
+
+
+def sweep_txs_for_channel(channel: int, num_ctns: int, txs_per_ctn: int):
+    outpoint = f'{channel:064x}:0'
+    return [(outpoint, ctn, f'{ctn:064x}:{i}', RAW_TX)
+            for ctn in range(1, num_ctns + 1) for i in range(txs_per_ctn)]
+
+
+async def ingest(store: SweepStore, sweep_txs, *, bulk: bool) -> float:
+    t0 = time.monotonic()
+    if bulk:
+        for i in range(0, len(sweep_txs), BULK_SIZE):
+            await store.add_sweep_txs(sweep_txs[i:i + BULK_SIZE])
+    else:
+        for args in sweep_txs:
+            await store.add_sweep_tx(*args)
+    return time.monotonic() - t0
+
+
+async def breach_lookups(store: SweepStore, num_channels: int, num_ctns: int, txs_per_ctn: int) -> float:
+    # what the tower does when it sees a revoked commitment: get the ctn, then the sweep txs of each output
+    t0 = time.monotonic()
+    for channel in range(num_channels):
+        outpoint = f'{channel:064x}:0'
+        ctn = num_ctns // 2 + 1
+        await store.get_ctn(outpoint, None)
+        for i in range(txs_per_ctn):
+            sweep_txs = await store.get_sweep_tx(outpoint, f'{ctn:064x}:{i}')
+            assert len(sweep_txs) == 1
+    return (time.monotonic() - t0) / num_channels
+
+
+async def run_store(path, coro_func, *, store_cls=SweepStore):
+    store = store_cls(path, MockNetwork())
+    try:
+        return await coro_func(store)
+    finally:
+        store.stop()
+        await store.stopped_event.wait()
+
+
+async def bench(num_channels: int, num_ctns: int, txs_per_ctn: int):
+    path = os.path.join(tempfile.mkdtemp(), 'watchtower_db')
+    single = sweep_txs_for_channel(num_channels, num_ctns, txs_per_ctn)
+    bulk = [x for channel in range(num_channels) for x in sweep_txs_for_channel(channel, num_ctns, txs_per_ctn)]
+
+    async def f(store):
+        return await ingest(store, single, bulk=False), await ingest(store, bulk, bulk=True)
+    t_single, t_bulk = await run_store(path, f)
+    print(f"ingestion, one per call: {len(single):8} txs, {len(single) / t_single:8.0f} txs/sec")
+    print(f"ingestion, bulk:         {len(bulk):8} txs, {len(bulk) / t_bulk:8.0f} txs/sec")
+    print(f"db size: {os.stat(path).st_size / len(single + bulk):.0f} bytes/tx")
+
+    async def g(store):
+        return await breach_lookups(store, num_channels, num_ctns, txs_per_ctn)
+    print(f"breach reaction, indexed:   {1000 * await run_store(path, g):8.2f} ms/channel")
+    print(f"breach reaction, unindexed: {1000 * await run_store(path, g, store_cls=UnindexedSweepStore):8.2f} ms/channel")
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    num_ctns = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    txs_per_ctn = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    asyncio.run(bench(num_channels, num_ctns, txs_per_ctn))
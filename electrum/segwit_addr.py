@@ -21,6 +21,7 @@
 
 """Reference implementation for Bech32/Bech32m and segwit addresses."""
 
+import functools
 from enum import Enum
 from typing import Tuple, Optional, Sequence, NamedTuple, List
 
@@ -43,26 +44,47 @@ class DecodedBech32(NamedTuple):
     data: Optional[Sequence[int]]  # 5-bit ints
 
 
-def bech32_polymod(values):
-    """Internal function that computes the Bech32 checksum."""
+def _make_polymod_table() -> Sequence[int]:
     generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
-    chk = 1
-    for value in values:
-        top = chk >> 25
-        chk = (chk & 0x1ffffff) << 5 ^ value
+    table = []
+    for top in range(32):
+        chk = 0
         for i in range(5):
             chk ^= generator[i] if ((top >> i) & 1) else 0
+        table.append(chk)
+    return tuple(table)
+
+
+# xor of the generators selected by the 5 bits shifted out of the checksum
+_POLYMOD_TABLE = _make_polymod_table()
+
+
+def _polymod_update(chk: int, values) -> int:
+    table = _POLYMOD_TABLE
+    for value in values:
+        chk = ((chk & 0x1ffffff) << 5 ^ value) ^ table[chk >> 25]
     return chk
 
 
+def bech32_polymod(values):
+    """Internal function that computes the Bech32 checksum."""
+    return _polymod_update(1, values)
+
+
 def bech32_hrp_expand(hrp):
     """Expand the HRP into values for checksum computation."""
     return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
 
 
+@functools.lru_cache(maxsize=16)
+def _hrp_polymod(hrp: str) -> int:
+    """Checksum state after processing the expanded HRP."""
+    return bech32_polymod(bech32_hrp_expand(hrp))
+
+
 def bech32_verify_checksum(hrp, data):
     """Verify a checksum given HRP and converted data characters."""
-    check = bech32_polymod(bech32_hrp_expand(hrp) + data)
+    check = _polymod_update(_hrp_polymod(hrp), data)
     if check == BECH32_CONST:
         return Encoding.BECH32
     elif check == BECH32M_CONST:
@@ -73,9 +95,8 @@ def bech32_verify_checksum(hrp, data):
 
 def bech32_create_checksum(encoding: Encoding, hrp: str, data: List[int]) -> List[int]:
     """Compute the checksum values given HRP and data."""
-    values = bech32_hrp_expand(hrp) + data
     const = BECH32M_CONST if encoding == Encoding.BECH32M else BECH32_CONST
-    polymod = bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ const
+    polymod = _polymod_update(_hrp_polymod(hrp), data + [0, 0, 0, 0, 0, 0]) ^ const
     return [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
 
 
@@ -131,6 +152,40 @@ def convertbits(data, frombits, tobits, pad=True):
     return ret
 
 
+def _bytes_to_5bit(data: bytes) -> List[int]:
+    """Same as convertbits(data, 8, 5, pad=True), for bytes."""
+    out = []
+    num_groups = (8 * len(data) + 4) // 5
+    # 5 bytes are 8 groups of 5 bits
+    data = bytes(data) + bytes(-len(data) % 5)
+    for i in range(0, len(data), 5):
+        acc = int.from_bytes(data[i:i+5], 'big')
+        out.extend((acc >> shift) & 31 for shift in (35, 30, 25, 20, 15, 10, 5, 0))
+    del out[num_groups:]
+    return out
+
+
+def _5bit_to_bytes(data: Sequence[int]) -> Optional[bytes]:
+    """Same as convertbits(data, 5, 8, pad=False), for valid 5-bit ints."""
+    num_bytes, leftover_bits = divmod(5 * len(data), 8)
+    if leftover_bits >= 5 or (data and data[-1] & ((1 << leftover_bits) - 1)):
+        return None
+    out = bytearray()
+    data = list(data) + [0] * (-len(data) % 8)
+    for i in range(0, len(data), 8):
+        acc = 0
+        for value in data[i:i+8]:
+            acc = acc << 5 | value
+        out += acc.to_bytes(5, 'big')
+    return bytes(out[:num_bytes])
+
+
+@functools.lru_cache(maxsize=16)
+def _is_valid_hrp(hrp: str) -> bool:
+    return (len(hrp) >= 1 and hrp == hrp.lower()
+            and all(33 <= ord(x) <= 126 for x in hrp))
+
+
 def decode_segwit_address(hrp: str, addr: Optional[str]) -> Tuple[Optional[int], Optional[Sequence[int]]]:
     """Decode a segwit address."""
     if addr is None:
@@ -138,7 +193,9 @@ def decode_segwit_address(hrp: str, addr: Optional[str]) -> Tuple[Optional[int],
     encoding, hrpgot, data = bech32_decode(addr)
     if hrpgot != hrp:
         return (None, None)
-    decoded = convertbits(data[1:], 5, 8, False)
+    if not data:
+        return (None, None)
+    decoded = _5bit_to_bytes(data[1:])
     if decoded is None or len(decoded) < 2 or len(decoded) > 40:
         return (None, None)
     if data[0] > 16:
@@ -147,13 +204,20 @@ def decode_segwit_address(hrp: str, addr: Optional[str]) -> Tuple[Optional[int],
         return (None, None)
     if (data[0] == 0 and encoding != Encoding.BECH32) or (data[0] != 0 and encoding != Encoding.BECH32M):
         return (None, None)
-    return (data[0], decoded)
+    return (data[0], list(decoded))
 
 
 def encode_segwit_address(hrp: str, witver: int, witprog: bytes) -> Optional[str]:
     """Encode a segwit address."""
+    # note: these are the same checks decode_segwit_address does
+    if not (0 <= witver <= 16) or not (2 <= len(witprog) <= 40):
+        return None
+    if witver == 0 and len(witprog) != 20 and len(witprog) != 32:
+        return None
+    if not _is_valid_hrp(hrp):
+        return None
     encoding = Encoding.BECH32 if witver == 0 else Encoding.BECH32M
-    ret = bech32_encode(encoding, hrp, [witver] + convertbits(witprog, 8, 5))
-    if decode_segwit_address(hrp, ret) == (None, None):
+    ret = bech32_encode(encoding, hrp, [witver] + _bytes_to_5bit(witprog))
+    if len(ret) > 90:
         return None
     return ret
@@ -3,11 +3,21 @@ import queue
 import threading
 import asyncio
 import sqlite3
+import concurrent.futures
+from typing import NamedTuple, Callable, Optional, List, Tuple, Any
 
 from .logging import Logger
 from .util import test_read_write_permissions
 
 
+class _SqlRequest(NamedTuple):
+    future: asyncio.Future
+    func: Callable
+    args: tuple
+    kwargs: dict
+    batched: bool
+
+
 def sql(func):
     """wrapper for sql methods
 
@@ -16,13 +26,60 @@ def sql(func):
     def wrapper(self: 'SqlDB', *args, **kwargs):
         assert threading.current_thread() != self.sql_thread
         f = self.asyncio_loop.create_future()
-        self.db_requests.put((f, func, args, kwargs))
+        self.db_requests.put(_SqlRequest(f, func, args, kwargs, batched=False))
         return f
     return wrapper
 
 
+def sql_batched(func):
+    """wrapper for sql methods that write many rows of the same kind
+
+    Callers pass the values of a single row. Consecutive queued calls are
+    merged, and func is called once with the list of all their argument
+    tuples, e.g. to use executemany. If that fails, func is called again
+    for each call on its own, so that only the failing calls fail.
+
+    returns an awaitable asyncio.Future
+    """
+    def wrapper(self: 'SqlDB', *args):
+        assert threading.current_thread() != self.sql_thread
+        f = self.asyncio_loop.create_future()
+        self.db_requests.put(_SqlRequest(f, func, args, {}, batched=True))
+        return f
+    return wrapper
+
+
+def sql_read(func):
+    """wrapper for sql methods that only read
+
+    These run on a separate connection, on one of the reader threads, so
+    they are not queued behind writes. Note that they only see writes that
+    have already been committed.
+
+    returns an awaitable asyncio.Future
+    """
+    def wrapper(self: 'SqlDB', *args, **kwargs):
+        def run_read():
+            self._db_ready.wait()
+            return func(self, *args, **kwargs)
+        cf = self._read_executor.submit(run_read)
+        return asyncio.wrap_future(cf, loop=self.asyncio_loop)
+    return wrapper
+
+
 class SqlDB(Logger):
 
+    # max number of queued requests executed in a single transaction
+    MAX_BATCH_SIZE = 1000
+    NUM_READER_THREADS = 2
+    # with WAL journaling, readers do not block the writer and vice versa
+    JOURNAL_MODE = 'WAL'
+    # 'FULL' by default, for stores that must not lose committed data (e.g. the
+    # sweep txs of a watchtower). Subclasses whose data can be recovered may use
+    # 'NORMAL': in WAL mode, it cannot corrupt the database, but the last
+    # transactions might be lost on power failure.
+    SYNCHRONOUS = 'FULL'
+
     def __init__(self, asyncio_loop: asyncio.BaseEventLoop, path, commit_interval=None):
         Logger.__init__(self)
         self.asyncio_loop = asyncio_loop
@@ -32,45 +89,155 @@ class SqlDB(Logger):
         test_read_write_permissions(path)
         self.commit_interval = commit_interval
         self.db_requests = queue.Queue()
+        self._db_ready = threading.Event()
+        self._thread_local = threading.local()
+        self._read_conns = []  # type: List[sqlite3.Connection]
+        self._read_conns_lock = threading.Lock()
+        self._read_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.NUM_READER_THREADS,
+            thread_name_prefix='sql_reader',
+            initializer=self._init_reader_thread)
         self.sql_thread = threading.Thread(target=self.run_sql)
         self.sql_thread.start()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # the writer thread and each reader thread have their own connection
+        return self._thread_local.conn
+
     def stop(self):
         self.stopping = True
+        self.db_requests.put(None)  # wake up the sql thread
 
     def filesize(self):
         return os.stat(self.path).st_size
 
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, **kwargs)
+        conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS}")
+        return conn
+
+    def _init_reader_thread(self):
+        self._db_ready.wait()
+        # note: check_same_thread=False so that the sql thread can close it on shutdown
+        conn = self._connect(check_same_thread=False)
+        self._thread_local.conn = conn
+        with self._read_conns_lock:
+            self._read_conns.append(conn)
+
     def run_sql(self):
         self.logger.info("SQL thread started")
-        self.conn = sqlite3.connect(self.path)
+        self._thread_local.conn = self._connect()
+        self.conn.execute(f"PRAGMA journal_mode={self.JOURNAL_MODE}")
         self.logger.info("Creating database")
         self.create_database()
-        i = 0
+        self._db_ready.set()
+        num_uncommitted = 0
         while not self.stopping and self.asyncio_loop.is_running():
+            # note: the timeout is only used to notice if the event loop has stopped.
+            #       New requests and stop() wake us up immediately.
             try:
-                future, func, args, kwargs = self.db_requests.get(timeout=0.1)
+                request = self.db_requests.get(timeout=1)
             except queue.Empty:
                 continue
-            try:
-                result = func(self, *args, **kwargs)
-            except BaseException as e:
-                self.asyncio_loop.call_soon_threadsafe(future.set_exception, e)
-                continue
-            if not future.cancelled():
-                self.asyncio_loop.call_soon_threadsafe(future.set_result, result)
+            if request is None:
+                break
+            requests = [request]
+            while len(requests) < self.MAX_BATCH_SIZE:
+                try:
+                    request = self.db_requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.stopping = True
+                    break
+                requests.append(request)
+            self._run_requests(requests)
             # note: in sweepstore session.commit() is called inside
             # the sql-decorated methods, so commiting to disk is awaited
             if self.commit_interval:
-                i = (i + 1) % self.commit_interval
-                if i == 0:
+                num_uncommitted += len(requests)
+                if num_uncommitted >= self.commit_interval:
                     self.conn.commit()
+                    num_uncommitted = 0
         # write
         self.conn.commit()
+        self._read_executor.shutdown(wait=True)
+        for conn in self._read_conns:
+            conn.close()
         self.conn.close()
 
         self.logger.info("SQL thread terminated")
         self.asyncio_loop.call_soon_threadsafe(self.stopped_event.set)
 
+    def _run_requests(self, requests: List[_SqlRequest]) -> None:
+        """Executes requests in order, within the current transaction.
+        Consecutive requests for the same sql_batched method are merged.
+        """
+        outcomes: List[Tuple[asyncio.Future, Optional[BaseException], Any]] = []
+        i = 0
+        while i < len(requests):
+            request = requests[i]
+            if request.batched:
+                j = i + 1
+                while j < len(requests) and requests[j].batched and requests[j].func is request.func:
+                    j += 1
+                outcomes.extend(self._run_batch(request.func, requests[i:j]))
+                i = j
+                continue
+            try:
+                result = request.func(self, *request.args, **request.kwargs)
+            except BaseException as e:
+                outcomes.append((request.future, e, None))
+            else:
+                outcomes.append((request.future, None, result))
+            i += 1
+
+        def set_results():
+            for future, exc, result in outcomes:
+                if future.cancelled():
+                    continue
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+        self.asyncio_loop.call_soon_threadsafe(set_results)
+
+    def _run_batch(self, func, group: List[_SqlRequest]) -> List[Tuple[asyncio.Future, Optional[BaseException], Any]]:
+        try:
+            self._call_in_savepoint(func, [r.args for r in group])
+        except BaseException as e:
+            if len(group) == 1:
+                return [(group[0].future, e, None)]
+        else:
+            return [(r.future, None, None) for r in group]
+        # one of the calls failed, the others should not
+        outcomes = []
+        for r in group:
+            try:
+                self._call_in_savepoint(func, [r.args])
+            except BaseException as e:
+                outcomes.append((r.future, e, None))
+            else:
+                outcomes.append((r.future, None, None))
+        return outcomes
+
+    def _call_in_savepoint(self, func, rows: List[tuple]) -> None:
+        """Calls func, and rolls back what it wrote if it raises."""
+        conn = self.conn
+        # note: the savepoint is nested in a transaction, so that releasing it does not commit
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT sql_batch")
+        try:
+            func(self, rows)
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK TO sql_batch")
+                conn.execute("RELEASE sql_batch")
+            raise
+        if conn.in_transaction:  # func might have committed
+            conn.execute("RELEASE sql_batch")
+
     def create_database(self):
         raise NotImplementedError()
@@ -33,8 +33,6 @@ from enum import IntEnum
 from . import ecc
 from .util import (profiler, InvalidPassword, WalletFileException, bfh, standardize_path,
                    test_read_write_permissions)
-
-from .wallet_db import WalletDB
 from .logging import Logger
 
 
@@ -210,3 +208,12 @@ class WalletStorage(Logger):
     def basename(self) -> str:
         return os.path.basename(self.path)
 
+
+
+def __getattr__(name):
+    # WalletDB used to be importable from here. It is imported on first use,
+    # as the command line client imports this module but not the wallet db.
+    if name == 'WalletDB':
+        from .wallet_db import WalletDB
+        return WalletDB
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -31,7 +31,7 @@ import logging
 from aiorpcx import run_in_thread, RPCError
 
 from . import util
-from .transaction import Transaction, PartialTransaction
+from .transaction import PartialTransaction
 from .util import bh2u, make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup
 from .bitcoin import address_to_scripthash, is_address
 from .logging import Logger
@@ -217,7 +217,7 @@ class Synchronizer(SynchronizerBase):
         self._requests_sent += 1
         try:
             async with self._network_request_semaphore:
-                raw_tx = await self.interface.get_transaction(tx_hash)
+                tx = await self.interface.get_parsed_transaction(tx_hash)
         except RPCError as e:
             # most likely, "No such mempool or blockchain transaction"
             if allow_server_not_finding_tx:
@@ -227,12 +227,10 @@ class Synchronizer(SynchronizerBase):
                 raise
         finally:
             self._requests_answered += 1
-        tx = Transaction(raw_tx)
-        if tx_hash != tx.txid():
-            raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
+        # note: the interface has already checked the txid
         tx_height = self.requested_tx.pop(tx_hash)
         self.wallet.receive_tx_callback(tx_hash, tx, tx_height)
-        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
+        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(tx.serialize()) // 2}")
         # callbacks
         util.trigger_callback('new_transaction', self.wallet, tx)
 
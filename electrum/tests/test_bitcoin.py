@@ -1,4 +1,5 @@
 import base64
+import random
 import sys
 
 from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
@@ -8,7 +9,8 @@ from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
                               is_b58_address, address_to_scripthash, is_minikey,
                               is_compressed_privkey, EncodeBase58Check, DecodeBase58Check,
                               script_num_to_hex, push_script, add_number_to_script, int_to_hex,
-                              opcodes, base_encode, base_decode, BitcoinException)
+                              opcodes, base_encode, base_decode, BitcoinException,
+                              BaseDecodeError, hash_to_segwit_addr, script_to_address)
 from electrum import bip32
 from electrum import segwit_addr
 from electrum.segwit_addr import DecodedBech32
@@ -652,6 +654,37 @@ class Test_bitcoin(ElectrumTestCase):
         self.assertEqual(DecodedBech32(None, None, None),
                          segwit_addr.bech32_decode('1p2gdwpf'))
 
+    def test_segwit_address_fast_path_matches_convertbits(self):
+        rng = random.Random(42)
+        for witver in (0, 1, 16):
+            for length in range(2, 41):
+                witprog = bytes(rng.randrange(256) for _ in range(length))
+                data5 = segwit_addr.convertbits(witprog, 8, 5)
+                self.assertEqual(data5, segwit_addr._bytes_to_5bit(witprog))
+                self.assertEqual(list(witprog), segwit_addr.convertbits(data5, 5, 8, False))
+                self.assertEqual(witprog, segwit_addr._5bit_to_bytes(data5))
+                addr = segwit_addr.encode_segwit_address('bc', witver, witprog)
+                if witver == 0 and length not in (20, 32):
+                    self.assertIsNone(addr)
+                    continue
+                encoding = segwit_addr.Encoding.BECH32 if witver == 0 else segwit_addr.Encoding.BECH32M
+                self.assertEqual(addr, segwit_addr.bech32_encode(encoding, 'bc', [witver] + data5))
+                self.assertEqual((witver, list(witprog)), segwit_addr.decode_segwit_address('bc', addr))
+        # non-zero padding bits
+        self.assertIsNone(segwit_addr._5bit_to_bytes([31] * 4))
+        self.assertIsNone(segwit_addr.encode_segwit_address('bc', 17, bytes(20)))
+        self.assertIsNone(segwit_addr.encode_segwit_address('BC', 0, bytes(20)))
+
+    def test_address_caches_depend_on_net(self):
+        h = bytes(range(20))
+        for net in (constants.BitcoinMainnet, constants.BitcoinTestnet):
+            addr = hash_to_segwit_addr(h, witver=0, net=net)
+            script = address_to_script(addr, net=net)
+            self.assertEqual(addr, script_to_address(script, net=net))
+        mainnet_addr = hash_to_segwit_addr(h, witver=0, net=constants.BitcoinMainnet)
+        self.assertTrue(is_address(mainnet_addr, net=constants.BitcoinMainnet))
+        self.assertFalse(is_address(mainnet_addr, net=constants.BitcoinTestnet))
+
 
 class Test_bitcoin_testnet(TestCaseForTestnet):
 
@@ -1173,3 +1206,19 @@ class TestBaseEncode(ElectrumTestCase):
                          data_base58check)
         self.assertEqual(data_bytes,
                          DecodeBase58Check(data_base58check))
+
+    def test_base58_roundtrip(self):
+        rng = random.Random(42)
+        for length in range(0, 80):
+            for num_leading_zeros in (0, 1, 3):
+                data = bytes(num_leading_zeros) + bytes(rng.randrange(256) for _ in range(length))
+                for base in (58, 43):
+                    encoded = base_encode(data, base=base)
+                    decoded = base_decode(encoded, base=base)
+                    if data.strip(b'\x00'):
+                        self.assertEqual(data, decoded)
+                    else:  # quirk: zero values are encoded with an extra digit
+                        self.assertEqual(bytes(2) + data, decoded)
+        with self.assertRaises(BaseDecodeError):
+            base_decode('1I1', base=58)
+        self.assertIsNone(base_decode('11', base=58, length=2))
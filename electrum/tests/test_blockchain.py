@@ -1,6 +1,7 @@
 import shutil
 import tempfile
 import os
+import threading
 
 from electrum import constants, blockchain
 from electrum.simple_config import SimpleConfig
@@ -341,6 +342,27 @@ class TestBlockchain(ElectrumTestCase):
         header_hash = hash_header(header)
         return blockchain.get_chains_that_contain_header(height, header_hash)
 
+    def test_connect_chunk_holds_the_lock(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        hexdata = ''.join(blockchain.serialize_header(self.HEADERS[name]) for name in 'ABCDEFOPQRSTU')
+        # connect_chunk runs in a thread: the chain must not change between verifying and saving
+        verify_chunk = chain_u.verify_chunk
+        lock_owned = []
+        def verify_and_check_lock(index, data):
+            lock_owned.append(chain_u.lock._is_owned())
+            verify_chunk(index, data)
+        chain_u.verify_chunk = verify_and_check_lock
+        results = []
+        thread = threading.Thread(target=lambda: results.append(chain_u.connect_chunk(0, hexdata)))
+        thread.start()
+        thread.join(timeout=5)
+        self.assertEqual([True], lock_owned)
+        self.assertEqual([True], results)
+        self.assertEqual(12, chain_u.height())
+
     def test_get_chains_that_contain_header(self):
         blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
             config=self.config, forkpoint=0, parent=None,
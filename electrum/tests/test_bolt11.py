@@ -4,7 +4,8 @@ from binascii import unhexlify, hexlify
 import pprint
 import unittest
 
-from electrum.lnaddr import shorten_amount, unshorten_amount, LnAddr, lnencode, lndecode, u5_to_bitarray, bitarray_to_u5
+from electrum.lnaddr import (shorten_amount, unshorten_amount, LnAddr, lnencode, lndecode, u5_to_bitarray, bitarray_to_u5,
+                             LnDecodeException, _lndecode_cached)
 from electrum.segwit_addr import bech32_encode, bech32_decode
 from electrum import segwit_addr
 from electrum.lnutil import UnknownEvenFeatureBits, derive_payment_secret_from_payment_preimage, LnFeatures
@@ -166,3 +167,25 @@ class TestBolt11(ElectrumTestCase):
         preimage = bytes.fromhex("cc3fc000bdeff545acee53ada12ff96060834be263f77d645abbebc3a8d53b92")
         self.assertEqual("bfd660b559b3f452c6bb05b8d2906f520c151c107b733863ed0cc53fc77021a8",
                          derive_payment_secret_from_payment_preimage(preimage).hex())
+
+    def test_decoded_invoices_are_cached(self):
+        invoice = lnencode(LnAddr(paymenthash=RHASH, amount=24, tags=[('d', 'coffee'), ('x', 60)]), PRIVKEY)
+        lnaddr1 = lndecode(invoice)
+        hits = _lndecode_cached.cache_info().hits
+        lnaddr2 = lndecode(invoice)
+        self.assertEqual(hits + 1, _lndecode_cached.cache_info().hits)
+        # callers get copies, that they are free to modify
+        self.assertIsNot(lnaddr1, lnaddr2)
+        lnaddr1.tags.append(('d', 'tea'))
+        lnaddr1.amount = Decimal(1)
+        self.assertEqual('coffee', lndecode(invoice).get_description())
+        self.assertEqual(24, lndecode(invoice).amount)
+        self.assertEqual(PUBKEY, lndecode(invoice).pubkey.serialize())
+
+    def test_truncated_tagged_field(self):
+        date = [0] * 7
+        tag_p = [1, 1, 20] + [0] * 10  # claims 52 values, has 10
+        signature = [0] * 104
+        invoice = bech32_encode(segwit_addr.Encoding.BECH32, 'lnbc', date + tag_p + signature)
+        with self.assertRaises(LnDecodeException):
+            lndecode(invoice)
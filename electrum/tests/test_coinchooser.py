@@ -1,4 +1,6 @@
-from electrum.coinchooser import CoinChooserPrivacy
+from electrum.coinchooser import CoinChooserPrivacy, CoinChooserBranchAndBound
+from electrum.bitcoin import sha256, hash_to_segwit_addr
+from electrum.transaction import PartialTxInput, PartialTxOutput, TxOutpoint
 from electrum.util import NotEnoughFunds
 
 from . import ElectrumTestCase
@@ -18,3 +20,64 @@ class TestCoinChooser(ElectrumTestCase):
             coin_chooser.bucket_candidates_any([], sufficient_funds)
         with self.assertRaises(NotEnoughFunds):
             coin_chooser.bucket_candidates_prefer_confirmed([], sufficient_funds)
+
+
+def make_coin(value: int, *, idx: int, address: str = None, height: int = 100) -> PartialTxInput:
+    coin = PartialTxInput(prevout=TxOutpoint(txid=sha256(str(idx)), out_idx=0))
+    coin._trusted_value_sats = value
+    coin._trusted_address = address or hash_to_segwit_addr(sha256(str(idx))[:20], witver=0)
+    coin.script_type = 'p2wpkh'
+    coin.block_height = height
+    return coin
+
+
+class TestCoinChooserBranchAndBound(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.coin_chooser = CoinChooserBranchAndBound(enable_output_value_rounding=False)
+        self.dest_addr = hash_to_segwit_addr(bytes(20), witver=0)
+        self.change_addr = hash_to_segwit_addr(b'\x01' * 20, witver=0)
+
+    def _make_tx(self, coins, amount, *, feerate=1):
+        outputs = [PartialTxOutput.from_address_and_value(self.dest_addr, amount)]
+        return self.coin_chooser.make_tx(
+            coins=coins, inputs=[], outputs=outputs, change_addrs=[self.change_addr],
+            fee_estimator_vb=lambda size: round(size * feerate), dust_threshold=546)
+
+    def test_finds_changeless_solution(self):
+        values = [10_000_000, 3_000_000, 2_500_000, 1_000_000, 700_000, 400_000]
+        coins = [make_coin(v, idx=i) for i, v in enumerate(values)]
+        # 3_000_000 + 1_000_000 covers the amount and the fee without change
+        tx = self._make_tx(coins, 4_000_000 - 300)
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertEqual({3_000_000, 1_000_000}, {txin.value_sats() for txin in tx.inputs()})
+        self.assertTrue(0 <= tx.get_fee() < 300 + 546 + 31)
+
+    def test_falls_back_when_no_changeless_solution(self):
+        values = [10_000_000, 5_000_000]
+        coins = [make_coin(v, idx=i) for i, v in enumerate(values)]
+        tx = self._make_tx(coins, 1_000_000)
+        self.assertEqual(2, len(tx.outputs()))
+        self.assertEqual(1_000_000, tx.outputs()[0].value)
+        self.assertEqual(tx.estimated_size(), tx.get_fee())
+
+    def test_prefers_confirmed_coins(self):
+        coins = [make_coin(2_000_000, idx=0, height=0),
+                 make_coin(1_000_000, idx=1),
+                 make_coin(1_000_000, idx=2)]
+        tx = self._make_tx(coins, 2_000_000 - 300)
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertEqual({100}, {txin.block_height for txin in tx.inputs()})
+
+    def test_not_enough_funds(self):
+        coins = [make_coin(v, idx=i) for i, v in enumerate([100_000, 200_000])]
+        with self.assertRaises(NotEnoughFunds):
+            self._make_tx(coins, 300_000)
+
+    def test_many_coins(self):
+        coins = [make_coin(10_000 + 997 * i, idx=i) for i in range(2000)]
+        tx = self._make_tx(coins, 5_000_000, feerate=2)
+        self.assertEqual(5_000_000, tx.outputs()[0].value)
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertTrue(tx.get_fee() >= 2 * tx.estimated_size())
@@ -1,9 +1,13 @@
+import asyncio
+import json
+import os
+import threading
 import unittest
 from unittest import mock
 from decimal import Decimal
 
 from electrum.util import create_and_start_event_loop
-from electrum.commands import Commands, eval_bool
+from electrum.commands import Commands, eval_bool, known_commands, take_page
 from electrum import storage, wallet
 from electrum.wallet import restore_wallet_from_text
 from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED
@@ -130,6 +134,26 @@ class TestCommands(ElectrumTestCase):
         self.assertEqual(['p2wpkh:L15oxP24NMNAXxq5r2aom24pHPtt3Fet8ZutgL155Bad93GSubM2', 'p2wpkh:L4rYY5QpfN6wJEF4SEKDpcGhTPnCe9zcGs6hiSnhpprZqVywFifN'],
                          cmds._run('getprivatekeys', (['bc1q3g5tmkmlvxryhh843v4dz026avatc0zzr6h3af', 'bc1q9pzjpjq4nqx5ycnywekcmycqz0wjp2nq604y2n'],), wallet=wallet))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_cpu_bound_commands_run_off_the_event_loop(self, mock_save_db):
+        self.assertTrue(known_commands['listaddresses'].is_cpu_bound)
+        self.assertFalse(known_commands['getinfo'].is_cpu_bound)
+        wallet = restore_wallet_from_text('bitter grass shiver impose acquire brush forget axis eager alone wine silver',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        cmds = Commands(config=self.config)
+        addresses = wallet.get_addresses()
+        threads = []
+        def get_addresses():
+            threads.append(threading.current_thread())
+            return addresses
+        with mock.patch.object(wallet, 'get_addresses', side_effect=get_addresses):
+            self.assertEqual(addresses, cmds._run('listaddresses', (), wallet=wallet))
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(self._loop_thread, threads[0])
+        self.assertTrue(threads[0].name.startswith('cpu_bound_command'))
+
 
 class TestCommandsTestnet(TestCaseForTestnet):
 
@@ -248,6 +272,107 @@ class TestCommandsTestnet(TestCaseForTestnet):
         self.assertEqual("02000000000101a0a8800d2d6bb0a4a8b93b793f39439c4139a40d30e634cf5cd601e5391de6ed0100000000fdffffff0240e2010000000000160014810480bbaf62145abf945ebe5f657c665a3a3732462b060000000000160014a5103285eb519f826520a9f7d3227e1eaa7ec5f802473044022057a6f4b1ec63336c7d0ba233e785ec9f2e2d9c2d67617a50e069f4498ee6a3b7022032fb331e0bef06f46e9cb77bfe94413142653c4912516835e941fa7f170c1a53012103001b55f19541faaf7e6d57dd1bdb9fdc37725fc500e12f2418cc11e0aed4154978181e00",
                          tx_str)
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_concurrent_payto_do_not_share_inputs(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        wallet.receive_tx_callback(funding_tx.txid(), funding_tx, TX_HEIGHT_UNCONFIRMED)
+        cmds = Commands(config=self.config)
+
+        async def pay_twice():
+            return await asyncio.gather(*[
+                cmds.payto(destination="tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy", amount="0.00123456",
+                           feerate=50, addtransaction=True, wallet=wallet)
+                for i in range(2)])
+        tx_strs = asyncio.run_coroutine_threadsafe(pay_twice(), self.asyncio_loop).result()
+        inputs = [{txin.prevout.to_str() for txin in tx_from_any(tx_str).inputs()} for tx_str in tx_strs]
+        self.assertEqual(set(), inputs[0] & inputs[1])
+        self.assertEqual(3, len(wallet.get_history()))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_pagination_of_list_commands(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        wallet.receive_tx_callback(funding_tx.txid(), funding_tx, TX_HEIGHT_UNCONFIRMED)
+        cmds = Commands(config=self.config)
+        spending_tx = tx_from_any(cmds._run(
+            'payto', (), destination="tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy", amount="0.00123456",
+            feerate=50, locktime=1972344, addtransaction=True, wallet=wallet))
+        # onchain history
+        full_history = cmds._run('onchain_history', (), wallet=wallet)['transactions']
+        self.assertEqual([funding_tx.txid(), spending_tx.txid()], [item['txid'] for item in full_history])
+        page1 = cmds._run('onchain_history', (), limit=1, wallet=wallet)
+        self.assertEqual(full_history[:1], page1['transactions'])
+        self.assertEqual(funding_tx.txid(), page1['next'])
+        page2 = cmds._run('onchain_history', (), limit=1, after=page1['next'], wallet=wallet)
+        self.assertEqual(full_history[1:], page2['transactions'])
+        self.assertIsNone(page2['next'])
+        with self.assertRaises(Exception):
+            cmds._run('onchain_history', (), after='00' * 32, wallet=wallet)
+        # addresses
+        all_addresses = cmds._run('listaddresses', (), balance=True, wallet=wallet)
+        pages = []
+        cursor = None
+        while True:
+            page = cmds._run('listaddresses', (), balance=True, limit=3, after=cursor, wallet=wallet)
+            pages.extend(page['addresses'])
+            cursor = page['next']
+            if cursor is None:
+                break
+        self.assertEqual([list(x) for x in all_addresses], pages)
+        # streaming to a file
+        path = os.path.join(self.electrum_path, 'history.ndjson')
+        self.assertEqual({'output_file': path, 'count': 2},
+                         cmds._run('onchain_history', (), output_file=path, wallet=wallet))
+        with open(path) as f:
+            self.assertEqual(full_history, [json.loads(line) for line in f])
+        with self.assertRaises(Exception):
+            cmds._run('listaddresses', (), output_file='relative_path', wallet=wallet)
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_pagination_of_history_with_fifo(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        wallet.receive_tx_callback(funding_tx.txid(), funding_tx, TX_HEIGHT_UNCONFIRMED)
+        cmds = Commands(config=self.config)
+        for i in range(2):
+            cmds._run('payto', (), destination="tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy", amount="0.00123456",
+                      feerate=50, addtransaction=True, wallet=wallet)
+        fx = mock.Mock(ccy='EUR', timestamp_rate=lambda timestamp: Decimal(100))
+        fx.get_cost_basis_method.return_value = 'fifo'
+
+        def get_page(after):
+            return take_page(wallet.get_detailed_history_items(fx=fx, after_txid=after),
+                             key=lambda item: item['txid'], limit=1)
+
+        full_history = list(wallet.get_detailed_history_items(fx=fx))
+        self.assertEqual(3, len(full_history))
+        with mock.patch.object(wallet, 'get_tx_item_fiat', wraps=wallet.get_tx_item_fiat) as get_tx_item_fiat:
+            page, cursor = get_page(None)
+            self.assertEqual(2, get_tx_item_fiat.call_count)  # one more, to know that there is a next page
+            pages = page
+            while cursor:
+                get_tx_item_fiat.reset_mock()
+                page, cursor = get_page(cursor)
+                pages += page
+                # the earlier transactions are not applied to the pool again
+                self.assertEqual(1 if cursor else 0, get_tx_item_fiat.call_count)
+            self.assertEqual(full_history, pages)
+            # after a change, the pool is computed again
+            wallet.cost_basis.invalidate(full_history[0]['txid'])
+            get_tx_item_fiat.reset_mock()
+            self.assertEqual(full_history[1:2], get_page(full_history[0]['txid'])[0])
+            self.assertEqual(3, get_tx_item_fiat.call_count)
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     def test_paytomany_multiple_max_spends(self, mock_save_db):
         wallet = restore_wallet_from_text('kit virtual quantum festival fortune inform ladder saddle filter soldier start ghost',
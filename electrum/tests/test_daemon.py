@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp import test_utils
+
+from electrum import daemon_client
+from electrum.daemon import AuthenticatedServer
+from electrum.metrics import LatencyStats
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+
+from . import ElectrumTestCase
+
+
+class EchoServer(AuthenticatedServer):
+
+    def __init__(self):
+        AuthenticatedServer.__init__(self, 'user', 'pass')
+        self.max_running = 0
+        self._running = 0
+        self.register_method(self.echo)
+        self.register_method(self.fail)
+        self.register_method(self.slow)
+        self.register_method(self.unserializable)
+
+    async def echo(self, x):
+        return x
+
+    async def fail(self):
+        raise Exception('failed')
+
+    async def unserializable(self):
+        return object()
+
+    async def slow(self, x):
+        self._running += 1
+        self.max_running = max(self.max_running, self._running)
+        await asyncio.sleep(0.01)
+        self._running -= 1
+        return x
+
+
+class TestAuthenticatedServer(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+
+    def tearDown(self):
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def _post(self, server: EchoServer, payload, *, auth=aiohttp.BasicAuth('user', 'pass')):
+        async def f():
+            app = web.Application()
+            app.router.add_post("/", server.handle)
+            async with test_utils.TestServer(app) as test_server:
+                async with aiohttp.ClientSession(auth=auth) as session:
+                    async with session.post(test_server.make_url("/"), data=json.dumps(payload)) as resp:
+                        return resp.status, await resp.text()
+        return asyncio.run_coroutine_threadsafe(f(), self.asyncio_loop).result(timeout=10)
+
+    def _make_server(self) -> EchoServer:
+        async def f():
+            return EchoServer()
+        return asyncio.run_coroutine_threadsafe(f(), self.asyncio_loop).result(timeout=10)
+
+    def test_single_request(self):
+        server = self._make_server()
+        status, text = self._post(server, {"jsonrpc": "2.0", "id": 1, "method": "echo", "params": [42]})
+        self.assertEqual(200, status)
+        self.assertEqual({"jsonrpc": "2.0", "id": 1, "result": 42}, json.loads(text))
+        status, text = self._post(server, {"jsonrpc": "2.0", "id": 1, "method": "echo", "params": [42]},
+                                  auth=aiohttp.BasicAuth('user', 'wrong'))
+        self.assertEqual(403, status)
+
+    def test_batch_request(self):
+        server = self._make_server()
+        server.BATCH_RESPONSE_CHUNK_SIZE = 100
+        batch = [{"jsonrpc": "2.0", "id": i, "method": "slow", "params": {"x": i}} for i in range(50)]
+        batch += [
+            {"jsonrpc": "2.0", "id": "a", "method": "fail"},
+            {"jsonrpc": "2.0", "id": "b", "method": "nonexistent"},
+            "garbage",
+            {"jsonrpc": "2.0", "id": "c", "method": "unserializable"},
+            {"jsonrpc": "2.0", "id": "d", "method": "echo", "params": [1]},
+        ]
+        status, text = self._post(server, batch)
+        self.assertEqual(200, status)
+        responses = json.loads(text)
+        self.assertEqual(len(batch), len(responses))
+        self.assertEqual(list(range(50)), [r['result'] for r in responses[:50]])
+        self.assertEqual(list(range(50)), [r['id'] for r in responses[:50]])
+        self.assertEqual('failed', responses[50]['error']['message'])
+        self.assertEqual(-32600, responses[51]['error']['code'])
+        self.assertEqual('b', responses[51]['id'])
+        self.assertEqual(-32600, responses[52]['error']['code'])
+        self.assertIsNone(responses[52]['id'])
+        # a result that cannot be encoded does not truncate the response
+        self.assertEqual(-32603, responses[53]['error']['code'])
+        self.assertEqual('c', responses[53]['id'])
+        self.assertEqual({"jsonrpc": "2.0", "id": "d", "result": 1}, responses[54])
+        # requests were executed concurrently, within the limit
+        self.assertLess(1, server.max_running)
+        self.assertLessEqual(server.max_running, server.MAX_CONCURRENT_BATCH_REQUESTS)
+        # empty batches are invalid
+        status, text = self._post(server, [])
+        self.assertEqual(500, status)
+
+    def test_rpc_stats(self):
+        server = self._make_server()
+        self._post(server, [{"jsonrpc": "2.0", "id": i, "method": "echo", "params": [i]} for i in range(3)])
+        self._post(server, {"jsonrpc": "2.0", "id": 1, "method": "fail"})
+        stats = server.rpc_stats.to_json()
+        self.assertEqual(['echo', 'fail'], list(stats))
+        self.assertEqual(3, stats['echo']['count'])
+        self.assertEqual(0, stats['echo']['errors'])
+        self.assertEqual(3, sum(stats['echo']['histogram'].values()))
+        self.assertEqual(1, stats['fail']['errors'])
+        self.assertEqual(len(LatencyStats.BUCKETS), len(stats['fail']['histogram']))
+        self.assertIn('+Inf', stats['fail']['histogram'])
+
+
+class TestDaemonClient(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path, 'rpcuser': 'user', 'rpcpassword': 'pass'})
+        self.sockpath = os.path.join(self.electrum_path, 'rpc_socket')
+        self._runner = None
+
+    def tearDown(self):
+        if self._runner:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.asyncio_loop).result(timeout=10)
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def _start_server(self):
+        async def f():
+            server = EchoServer()
+            app = web.Application()
+            app.router.add_post("/", server.handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.UnixSite(runner, self.sockpath).start()
+            return runner
+        self._runner = asyncio.run_coroutine_threadsafe(f(), self.asyncio_loop).result(timeout=10)
+
+    def _write_lockfile(self, create_time):
+        with open(daemon_client.get_lockfile(self.config), 'w') as f:
+            f.write(repr(('unix', self.sockpath, create_time)))
+
+    @unittest.skipUnless(hasattr(web, 'UnixSite') and sys.platform != 'win32', 'needs unix sockets')
+    def test_request(self):
+        self._start_server()
+        self._write_lockfile(time.time())
+        self.assertEqual([1, 'a'], daemon_client.request(self.config, 'echo', ([1, 'a'],)))
+        self.assertEqual("Error: {'code': 1, 'message': 'failed'}", daemon_client.request(self.config, 'fail'))
+        self.assertTrue(daemon_client.request(self.config, 'nonexistent').startswith('Error: '))
+
+    def test_daemon_not_running(self):
+        with self.assertRaises(daemon_client.DaemonNotRunning):
+            daemon_client.request(self.config, 'echo', (1,))
+        # stale lockfile
+        self._write_lockfile(time.time() - 10)
+        with self.assertRaises(daemon_client.DaemonNotRunning):
+            daemon_client.request(self.config, 'echo', (1,))
+
+
+class TestCommandLineClient(ElectrumTestCase):
+
+    RUN_ELECTRUM = os.path.join(os.path.dirname(__file__), '..', '..', 'run_electrum')
+    # modules that forwarding a command to the daemon must not import
+    HEAVY_MODULES = ('electrum.wallet', 'electrum.wallet_db', 'electrum.daemon', 'electrum.network',
+                     'electrum.lnworker', 'electrum.transaction', 'aiohttp', 'dns.resolver')
+
+    def test_forwarding_a_command_does_not_import_heavy_modules(self):
+        if not os.path.exists(self.RUN_ELECTRUM):
+            raise unittest.SkipTest('run_electrum not found')
+        code = (
+            "import json, runpy, sys\n"
+            "sys.argv = ['run_electrum', '-D', sys.argv[1], '--regtest', 'getinfo']\n"
+            "try:\n"
+            "    runpy.run_path(%r, run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(json.dumps(sorted(sys.modules)))\n"
+        ) % os.path.abspath(self.RUN_ELECTRUM)
+        p = subprocess.run([sys.executable, '-c', code, self.electrum_path],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+        lines = p.stdout.splitlines()
+        self.assertIn('Daemon not running', lines[0], p.stderr)
+        modules = json.loads(lines[-1])
+        self.assertIn('electrum.commands', modules)
+        self.assertEqual([], [m for m in self.HEAVY_MODULES if m in modules])
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, date
+from decimal import Decimal
+
+from electrum.exchange_rate import ExchangeBase, FxThread, HistoricalRates, timestamp_to_day
+
+from . import ElectrumTestCase
+
+
+class FakeExchange(ExchangeBase):
+    def __init__(self):
+        super().__init__(lambda: None, lambda: None)
+        self.quotes = {'TEST': Decimal('30000')}
+
+    def history_ccys(self):
+        return ['TEST']
+
+
+class FakeFxThread:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.ccy = 'TEST'
+        self.history_used_spot = False
+
+    timestamp_rate = FxThread.timestamp_rate
+    history_rate = FxThread.history_rate
+    _day_rate = FxThread._day_rate
+
+
+class TestHistoricalRates(ElectrumTestCase):
+
+    history = {'2021-01-01': 24000.5, '2021-01-03': 26000.1, '2021-01-04': '27000.75', 'garbage': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super().tearDown()
+
+    def test_day_index(self):
+        h = HistoricalRates.from_dict(self.history)
+        self.assertEqual(4, len(h))
+        day = date(2021, 1, 1).toordinal()
+        self.assertEqual(Decimal(24000.5), h.get_rate(day))
+        self.assertIsNone(h.get_rate(day + 1))
+        # not the exact value of the double
+        self.assertEqual(Decimal('26000.1'), h.get_rate(day + 2))
+        self.assertEqual(Decimal('27000.75'), h.get_rate(day + 3))
+        self.assertIsNone(h.get_rate(day - 1))
+        self.assertIsNone(h.get_rate(day + 4))
+        self.assertFalse(HistoricalRates.from_dict({}))
+
+    def test_serialization(self):
+        h = HistoricalRates.from_dict(self.history)
+        h2 = HistoricalRates.from_bytes(h.to_bytes())
+        self.assertEqual(h.first_day, h2.first_day)
+        self.assertEqual(h.rates.tobytes(), h2.rates.tobytes())
+        with self.assertRaises(ValueError):
+            HistoricalRates.from_bytes(h.to_bytes()[:-1])
+        with self.assertRaises(ValueError):
+            HistoricalRates.from_bytes(b'XXXX' + h.to_bytes()[4:])
+
+    def test_cache_files(self):
+        exchange = FakeExchange()
+        self.assertIsNone(exchange.read_historical_rates('TEST', self.cache_dir))
+        # json cache of older versions
+        filename = os.path.join(self.cache_dir, 'FakeExchange_TEST')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.history))
+        os.utime(filename, (1000, 1000))
+        h = exchange.read_historical_rates('TEST', self.cache_dir)
+        self.assertEqual(1000, h.timestamp)
+        self.assertIs(h, exchange.history['TEST'])
+        # binary cache takes precedence
+        exchange.write_historical_rates('TEST', self.cache_dir, HistoricalRates.from_dict({'2022-01-01': 1}))
+        h = FakeExchange().read_historical_rates('TEST', self.cache_dir)
+        self.assertEqual(date(2022, 1, 1).toordinal(), h.first_day)
+        self.assertAlmostEqual(time.time(), h.timestamp, delta=60)
+        # a corrupted binary cache is ignored
+        with open(filename + '.bin', 'wb') as f:
+            f.write(b'EFXR')
+        h = FakeExchange().read_historical_rates('TEST', self.cache_dir)
+        self.assertEqual(date(2021, 1, 1).toordinal(), h.first_day)
+
+    def test_timestamp_rate(self):
+        exchange = FakeExchange()
+        exchange.history['TEST'] = HistoricalRates.from_dict(self.history)
+        fx = FakeFxThread(exchange)
+        timestamps = [datetime(2021, 1, d, h).timestamp() for d in (1, 2, 3, 4) for h in (0, 12, 23)]
+        rates = [fx.timestamp_rate(t) for t in timestamps]
+        self.assertFalse(fx.history_used_spot)
+        self.assertEqual([Decimal(24000.5)] * 3, rates[0:3])
+        self.assertTrue(all(r.is_nan() for r in rates[3:6]))
+        self.assertEqual([Decimal('27000.75')] * 3, rates[9:12])
+        self.assertTrue(fx.timestamp_rate(None).is_nan())
+        # no rate for today yet: spot price
+        now = time.time()
+        self.assertEqual(Decimal('30000'), fx.timestamp_rate(now))
+        self.assertEqual(Decimal('30000'), fx.history_rate(datetime.today()))
+        self.assertTrue(fx.history_used_spot)
+        self.assertEqual(date.today().toordinal(), timestamp_to_day(now))
@@ -0,0 +1,155 @@
+from electrum.lnpayments import PaymentLedger
+from electrum.lnutil import UpdateAddHtlc, SENT, RECEIVED
+from electrum.lnworker import LNWallet
+
+from . import ElectrumTestCase
+
+
+class MockChannel:
+
+    def __init__(self, channel_id: bytes):
+        self.channel_id = channel_id
+        self.htlcs = {SENT: [], RECEIVED: []}
+        self.statuses = {}  # (direction, htlc_id) -> status
+
+    def add_htlc(self, direction, payment_hash: bytes, timestamp: int) -> UpdateAddHtlc:
+        htlc = UpdateAddHtlc(amount_msat=1000, payment_hash=payment_hash, cltv_expiry=500,
+                             timestamp=timestamp, htlc_id=len(self.htlcs[direction]))
+        self.htlcs[direction].append(htlc)
+        self.statuses[(direction, htlc.htlc_id)] = 'inflight'
+        return htlc
+
+    def get_htlcs_from_id(self, direction, htlc_id):
+        return self.htlcs[direction][htlc_id:]
+
+    def get_htlc_status(self, direction, htlc_id):
+        return self.statuses[(direction, htlc_id)]
+
+
+class MockLNWallet:
+
+    def __init__(self):
+        self.channels = {}
+
+
+class MockLNWalletWithHistory(MockLNWallet):
+
+    get_history_items = LNWallet.get_history_items
+
+    def __init__(self):
+        MockLNWallet.__init__(self)
+        self.payment_ledger = PaymentLedger(self)
+        self.onchain_history = {}
+
+    def get_onchain_history(self):
+        return {k: dict(v) for k, v in self.onchain_history.items()}
+
+    def get_lightning_history_item(self, payment_hash, plist):
+        return {
+            'payment_hash': payment_hash.hex(),
+            'timestamp': min(h.htlc.timestamp for h in plist),
+            'amount_msat': sum(int(h.direction) * h.htlc.amount_msat for h in plist),
+        }
+
+
+class TestPaymentLedger(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.lnworker = MockLNWallet()
+        self.ledger = PaymentLedger(self.lnworker)
+        self.chan1 = MockChannel(b'\x01' * 32)
+        self.chan2 = MockChannel(b'\x02' * 32)
+        self.lnworker.channels = {self.chan1.channel_id: self.chan1, self.chan2.channel_id: self.chan2}
+
+    def _settled_by_time(self):
+        return [(payment_hash, [(h.channel_id, h.htlc.htlc_id, h.direction) for h in htlcs])
+                for payment_hash, htlcs in self.ledger.get_settled_payments_by_time()]
+
+    def test_inflight_htlcs_get_settled(self):
+        chan1, chan2 = self.chan1, self.chan2
+        chan1.add_htlc(SENT, b'a' * 32, timestamp=20)
+        chan2.add_htlc(RECEIVED, b'b' * 32, timestamp=10)
+        self.assertEqual({b'a' * 32, b'b' * 32}, self.ledger.get_inflight_payment_hashes())
+        self.assertEqual([], self._settled_by_time())
+        # one settles, the other fails
+        chan1.statuses[(SENT, 0)] = 'settled'
+        chan2.statuses[(RECEIVED, 0)] = 'failed'
+        self.assertEqual(set(), self.ledger.get_inflight_payment_hashes())
+        self.assertEqual([(b'a' * 32, [(chan1.channel_id, 0, SENT)])], self._settled_by_time())
+        # a multi-part payment, with an older part settled later
+        chan1.add_htlc(RECEIVED, b'c' * 32, timestamp=30)
+        chan2.add_htlc(RECEIVED, b'c' * 32, timestamp=5)
+        chan1.statuses[(RECEIVED, 0)] = 'settled'
+        self.assertEqual([b'a' * 32, b'c' * 32], [k for k, v in self.ledger.get_settled_payments_by_time()])
+        chan2.statuses[(RECEIVED, 1)] = 'settled'
+        self.assertEqual(
+            [(b'c' * 32, [(chan1.channel_id, 0, RECEIVED), (chan2.channel_id, 1, RECEIVED)]),
+             (b'a' * 32, [(chan1.channel_id, 0, SENT)])],
+            self._settled_by_time())
+        self.assertEqual(2, len(self.ledger.get_settled_payment(b'c' * 32)))
+        self.assertEqual({b'a' * 32, b'c' * 32}, set(self.ledger.get_settled_payments()))
+
+    def test_removed_channel(self):
+        chan1, chan2 = self.chan1, self.chan2
+        chan1.add_htlc(SENT, b'a' * 32, timestamp=10)
+        chan2.add_htlc(SENT, b'b' * 32, timestamp=20)
+        chan1.statuses[(SENT, 0)] = 'settled'
+        chan2.statuses[(SENT, 0)] = 'settled'
+        self.assertEqual([b'a' * 32, b'b' * 32], [k for k, v in self.ledger.get_settled_payments_by_time()])
+        # the payments of a removed channel are forgotten
+        del self.lnworker.channels[chan1.channel_id]
+        self.assertEqual([(b'b' * 32, [(chan2.channel_id, 0, SENT)])], self._settled_by_time())
+        self.assertEqual([], self.ledger.get_settled_payment(b'a' * 32))
+
+    def test_settled_payments_after(self):
+        chan1, chan2 = self.chan1, self.chan2
+        for payment_hash, direction, timestamp in [(b'a', SENT, 10), (b'b', RECEIVED, 20),
+                                                   (b'c', RECEIVED, 20), (b'd', RECEIVED, 30)]:
+            chan1.add_htlc(direction, payment_hash * 32, timestamp=timestamp)
+        for key in list(chan1.statuses):
+            chan1.statuses[key] = 'settled'
+
+        def get_page(*cursor, limit):
+            balance, page = self.ledger.get_settled_payments_after(*cursor, limit=limit)
+            return balance, [(t, h[:1]) for t, h, htlcs in page]
+
+        self.assertEqual((0, [(10, b'a'), (20, b'b')]), get_page(limit=2))
+        self.assertEqual((-1000, [(20, b'b'), (20, b'c')]), get_page(10, b'a' * 32, limit=2))
+        self.assertEqual((0, [(20, b'c'), (30, b'd')]), get_page(20, b'b' * 32, limit=5))
+        self.assertEqual((1000, [(30, b'd')]), get_page(20, limit=5))
+        self.assertEqual((2000, []), get_page(30, b'd' * 32, limit=5))
+        # another part of 'c' settles, earlier than the first one
+        chan2.add_htlc(RECEIVED, b'c' * 32, timestamp=5)
+        chan2.statuses[(RECEIVED, 0)] = 'settled'
+        self.assertEqual((0, [(5, b'c'), (10, b'a'), (20, b'b')]), get_page(limit=3))
+        self.assertEqual((1000, [(20, b'b'), (30, b'd')]), get_page(10, b'a' * 32, limit=5))
+        self.assertEqual(10, self.ledger.get_timestamp(b'a' * 32))
+        self.assertIsNone(self.ledger.get_timestamp(b'e' * 32))
+
+    def test_history_items(self):
+        lnworker = MockLNWalletWithHistory()
+        chan = MockChannel(b'\x01' * 32)
+        lnworker.channels = {chan.channel_id: chan}
+        for payment_hash, direction, timestamp in [(b'a', RECEIVED, 10), (b'b', SENT, 20),
+                                                   (b'c', RECEIVED, 20), (b'd', RECEIVED, 40)]:
+            chan.add_htlc(direction, payment_hash * 32, timestamp=timestamp)
+            chan.statuses[(direction, chan.htlcs[direction][-1].htlc_id)] = 'settled'
+        lnworker.onchain_history = {
+            'open': {'txid': 'open', 'timestamp': 5, 'amount_msat': 10000},
+            'close': {'txid': 'close', 'timestamp': 20, 'amount_msat': -5000},
+            'swap': {'txid': 'swap', 'amount_msat': 0},
+            'unconfirmed': {'txid': 'unconfirmed', 'timestamp': None, 'amount_msat': 100},
+        }
+        # same order as sorting all the items by timestamp, with payments first
+        key = lambda item: item.get('payment_hash') or item['txid']
+        history = list(lnworker.get_history_items())
+        self.assertEqual(['open', (b'a' * 32).hex(), (b'b' * 32).hex(), (b'c' * 32).hex(), 'close',
+                          (b'd' * 32).hex(), 'swap', 'unconfirmed'],
+                         [key(item) for item in history])
+        self.assertEqual([10000, 11000, 10000, 11000, 6000, 7000, 7000, 7100], [item['balance_msat'] for item in history])
+        # starting after each item, reading one payment at a time
+        for i, item in enumerate(history):
+            self.assertEqual(history[i + 1:], list(lnworker.get_history_items(after=key(item), chunk_size=1)))
+        with self.assertRaises(Exception):
+            list(lnworker.get_history_items(after='00' * 32))
@@ -33,7 +33,8 @@ from electrum.lnmsg import encode_msg, decode_msg
 from electrum import lnmsg
 from electrum.logging import console_stderr_handler, Logger
 from electrum.lnworker import PaymentInfo, RECEIVED
-from electrum.lnonion import OnionFailureCode
+from electrum.lnonion import OnionFailureCode, OnionReplayCache
+from electrum.lnpayments import PaymentLedger
 from electrum.lnutil import derive_payment_secret_from_payment_preimage
 from electrum.lnutil import LOCAL, REMOTE
 from electrum.invoices import PR_PAID, PR_UNPAID
@@ -104,6 +105,9 @@ class MockWallet:
     def save_db(self):
         pass
 
+    def invalidate_request_status(self, key):
+        pass
+
     def add_transaction(self, tx):
         pass
 
@@ -155,6 +159,8 @@ class MockLNWallet(Logger, NetworkRetryManager[LNPeerAddr]):
         self.preimages = {}
         self.stopping_soon = False
         self.downstream_htlc_to_upstream_peer_map = {}
+        self.onion_replay_cache = OnionReplayCache()
+        self.payment_ledger = PaymentLedger(self)
 
         self.logger.info(f"created LNWallet[{name}] with nodeID={local_keypair.pubkey.hex()}")
 
@@ -564,9 +570,15 @@ class TestPeer(TestCaseForTestnet):
         p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
         async def pay(lnaddr, pay_req):
             self.assertEqual(PR_UNPAID, w2.get_payment_status(lnaddr.paymenthash))
+            self.assertEqual({}, w2.payment_ledger.get_settled_payments())
             result, log = await w1.pay_invoice(pay_req)
             self.assertTrue(result)
             self.assertEqual(PR_PAID, w2.get_payment_status(lnaddr.paymenthash))
+            # the ledger was updated incrementally, and agrees with the htlc logs
+            for w in (w1, w2):
+                self.assertEqual(w.get_payments(status='settled'), w.payment_ledger.get_settled_payments())
+                self.assertEqual([lnaddr.paymenthash], [k for k, v in w.payment_ledger.get_settled_payments_by_time()])
+                self.assertEqual(set(), w.payment_ledger.get_inflight_payment_hashes())
             raise PaymentDone()
         async def f():
             async with OldTaskGroup() as group:
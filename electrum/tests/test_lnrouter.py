@@ -8,7 +8,7 @@ from electrum.util import bh2u, bfh, create_and_start_event_loop
 from electrum.lnutil import ShortChannelID
 from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet,
                               process_onion_packet, _decode_onion_error, decode_onion_error,
-                              OnionFailureCode, OnionPacket)
+                              OnionFailureCode, OnionPacket, OnionReplayCache, ReplayedOnionPacket)
 from electrum import bitcoin, lnrouter
 from electrum.constants import BitcoinTestnet
 from electrum.simple_config import SimpleConfig
@@ -483,6 +483,39 @@ class Test_LNRouter(TestCaseForTestnet):
             self.assertEqual(hops_data[i].to_bytes(), processed_packet.hop_data.to_bytes())
             packet = processed_packet.next_packet
 
+    def test_process_onion_packet_replay(self):
+        privkey = bfh('3463a278617b3dd83f79bda7f97673f12609c54386e1f0d2b67b1c6354fda14e')
+        pubkey = bfh('03d75c0ee70f68d73d7d13aeb6261d8ace11416800860c7e59407afe4e2e2d42bb')
+        associated_data = bytes(32)
+        def make_packet(session_key):
+            hops_data = [OnionHopsDataSingle(is_tlv_payload=True, payload={
+                "amt_to_forward": {"amt_to_forward": 1000},
+                "outgoing_cltv_value": {"outgoing_cltv_value": 500},
+            })]
+            return new_onion_packet([pubkey], session_key, hops_data, associated_data)
+        packet = make_packet(b'\x41' * 32)
+        replay_cache = OnionReplayCache()
+        for i in range(2):  # pending HTLCs are processed again
+            processed = process_onion_packet(packet, associated_data, privkey, replay_cache=replay_cache, htlc_key=(b'chan1', 0))
+            self.assertTrue(processed.are_we_final)
+        with self.assertRaises(ReplayedOnionPacket):
+            process_onion_packet(packet, associated_data, privkey, replay_cache=replay_cache, htlc_key=(b'chan2', 0))
+        # other onions are not affected
+        process_onion_packet(make_packet(b'\x42' * 32), associated_data, privkey, replay_cache=replay_cache, htlc_key=(b'chan2', 0))
+        self.assertEqual(2, len(replay_cache))
+
+    def test_onion_replay_cache_is_bounded(self):
+        replay_cache = OnionReplayCache()
+        replay_cache.MAX_SIZE = 3
+        for i in range(4):
+            self.assertTrue(replay_cache.check_and_add(bytes([i]) * 32, i, now=100 + i))
+        self.assertEqual(3, len(replay_cache))
+        self.assertTrue(replay_cache.check_and_add(bytes([0]) * 32, 'other', now=104))  # forgotten
+        self.assertFalse(replay_cache.check_and_add(bytes([3]) * 32, 'other', now=105))
+        # old entries expire
+        self.assertTrue(replay_cache.check_and_add(bytes([3]) * 32, 'other', now=103 + replay_cache.WINDOW))
+        self.assertEqual(2, len(replay_cache))
+
     @needs_test_with_all_chacha20_implementations
     def test_decode_onion_error(self):
         # test vector from bolt-04
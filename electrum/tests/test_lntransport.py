@@ -97,3 +97,59 @@ class TestLNTransport(ElectrumTestCase):
                 await server.wait_closed()
 
         loop.run_until_complete(f())
+
+    def _make_transport_pair(self):
+        # two ends of an established connection, with the initiator's keys swapped
+        ck, k1, k2 = b'\x01' * 32, b'\x02' * 32, b'\x03' * 32
+        sender = LNTransport(b'\x04' * 32, LNPeerAddr('127.0.0.1', 9735, b'\x02' * 33), proxy=None)
+        receiver = LNResponderTransport(b'\x05' * 32, None, None)
+        sender.sk, sender.rk = k1, k2
+        receiver.sk, receiver.rk = k2, k1
+        sender.init_counters(ck)
+        receiver.init_counters(ck)
+        return sender, receiver
+
+    @needs_test_with_all_chacha20_implementations
+    def test_coalesced_writes_and_chunked_reads(self):
+        sender, receiver = self._make_transport_pair()
+        writes = []
+        class Writer:
+            def writelines(self, data):
+                writes.append(b''.join(data))
+        sender.writer = Writer()
+        # more than 1000 messages, so that keys get rotated
+        messages = [bytes([i % 256]) * (i % 300) for i in range(2500)]
+        async def send():
+            for msg in messages[:10]:
+                sender.send_bytes(msg)
+            self.assertEqual([], writes)
+            await asyncio.sleep(0)
+            self.assertEqual(1, len(writes))
+            for msg in messages[10:]:
+                sender.send_bytes(msg)
+            sender._flush_writes()
+        asyncio.get_event_loop().run_until_complete(send())
+        data = b''.join(writes)
+        self.assertEqual(len(data), sender.bytes_sent)
+        self.assertEqual(len(messages), sender.msgs_sent)
+
+        # deliver the stream in chunks that split headers and bodies anywhere
+        class Reader:
+            def __init__(self):
+                self.pos = 0
+                self.chunk_sizes = [1, 17, 2, 5000, 3, 70000, 18]
+            async def read(self, num_bytes):
+                size = min(num_bytes, self.chunk_sizes[self.pos % len(self.chunk_sizes)])
+                chunk = data[self.pos:self.pos + size]
+                self.pos += len(chunk)
+                return chunk
+        receiver.reader = Reader()
+        async def receive():
+            received = []
+            async for msg in receiver.read_messages():
+                received.append(msg)
+                if len(received) == len(messages):
+                    return received
+        self.assertEqual(messages, asyncio.get_event_loop().run_until_complete(receive()))
+        self.assertEqual(len(data), receiver.bytes_received)
+        self.assertEqual(len(messages), receiver.get_stats()['msgs_received'])
@@ -0,0 +1,318 @@
+import asyncio
+import os
+import sqlite3
+from unittest import mock
+
+from electrum import util
+from electrum.lnchannel import ChannelState
+from electrum.lnwatcher import LNWatcher, LNWalletWatcher, SweepStore
+from electrum.lnworker import LNWallet
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import Transaction
+from electrum.util import TxMinedInfo, create_and_start_event_loop
+
+from . import TestCaseForTestnet
+
+
+FUNDING_TX = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+FUNDING_ADDRESS = 'tb1q0c7ale3r9ezg4qus7vrnc73mypz069lt5a6u2m'
+OTHER_ADDRESS = 'tb1qyla7xurmc4l9hd3adu2hx0kgscndsxy2snf2gg'
+
+
+class MockNetwork:
+    def __init__(self, config, asyncio_loop=None):
+        self.config = config
+        self.asyncio_loop = asyncio_loop
+
+        self.local_height = 1000
+
+    def get_local_height(self):
+        return self.local_height
+
+
+class MockSynchronizer:
+    def add(self, address):
+        pass
+
+    def reset_request_counters(self):
+        pass
+
+
+class MockWatcher(LNWatcher):
+
+    def __init__(self, network):
+        LNWatcher.__init__(self, network)
+        self.channel_updates = []
+
+    async def do_breach_remedy(self, funding_outpoint, closing_tx, spenders):
+        return True
+
+    async def update_channel_state(self, *, funding_outpoint, **kwargs):
+        self.channel_updates.append(funding_outpoint)
+
+
+class MockChannel:
+    channel_id = bytes(32)
+
+    def __init__(self, htlc_expiry):
+        self.htlc_expiry = htlc_expiry
+
+    def get_state(self):
+        return ChannelState.OPEN
+
+    def update_onchain_state(self, **kwargs):
+        pass
+
+    def should_be_closed_due_to_expiring_htlcs(self, local_height):
+        return local_height >= self.htlc_expiry
+
+
+class MockLNWallet:
+    def __init__(self, network, chan):
+        self.network = network
+        self.chan = chan
+        self.wallet = mock.Mock()
+        self.wallet.diagnostic_name.return_value = 'wallet'
+        self.logger = mock.Mock()
+        self._peers = {}
+        self.force_closed = []
+
+    def channel_by_txo(self, txo):
+        return self.chan
+
+    async def schedule_force_closing(self, chan_id):
+        self.force_closed.append(chan_id)
+
+    on_channel_update = LNWallet.on_channel_update
+
+
+class MockWatchtower:
+    def __init__(self, bulk_reply=None, single_replies=()):
+        self.bulk_reply = bulk_reply
+        self.single_replies = list(single_replies)
+        self.bulk_inserts = []
+        self.single_inserts = []
+
+    async def get_ctn(self, outpoint, addr):
+        return 0
+
+    async def add_sweep_txs(self, sweep_txs):
+        self.bulk_inserts.append([ctn for outpoint, ctn, prevout, tx in sweep_txs])
+        return self.bulk_reply
+
+    async def add_sweep_tx(self, outpoint, ctn, prevout, tx):
+        self.single_inserts.append(ctn)
+        return self.single_replies.pop(0) if self.single_replies else None
+
+
+class MockWatchtowerClient:
+    WATCHTOWER_BATCH_SIZE = 2
+
+    def __init__(self):
+        self.logger = mock.Mock()
+
+    sync_channel_with_watchtower = LNWallet.sync_channel_with_watchtower
+    _add_sweep_txs_to_watchtower = LNWallet._add_sweep_txs_to_watchtower
+
+
+class TestLNWatcher(TestCaseForTestnet):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(util, 'trigger_callback')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.watcher = MockWatcher(MockNetwork(config))
+        self.addCleanup(util.unregister_callback, self.watcher.on_network_update)
+        self.watcher.synchronizer = MockSynchronizer()
+
+    def _event(self, event, *args):
+        asyncio.get_event_loop().run_until_complete(self.watcher.on_network_update(event, *args))
+
+    def test_only_affected_callbacks_are_run(self):
+        watcher = self.watcher
+        funding_outpoint = FUNDING_TX.txid() + ':0'
+        num_calls = 0
+        async def callback():
+            nonlocal num_calls
+            num_calls += 1
+        watcher.add_callback(OTHER_ADDRESS, callback)
+        watcher.add_channel(funding_outpoint, FUNDING_ADDRESS)
+        watcher.set_up_to_date(True)  # got the history of the new addresses
+        # new callbacks run on the next event
+        self._event('network_updated')
+        self.assertEqual((1, [funding_outpoint]), (num_calls, watcher.channel_updates))
+        # nothing changed
+        self._event('network_updated')
+        self.assertEqual((1, 1), (num_calls, len(watcher.channel_updates)))
+        # the funding tx pays to both addresses
+        watcher.receive_tx_callback(FUNDING_TX.txid(), FUNDING_TX, 100)
+        self._event('network_updated')
+        self.assertEqual((2, 2), (num_calls, len(watcher.channel_updates)))
+        # the channel is unconfirmed, so it is checked on each new block
+        self._event('blockchain_updated')
+        self.assertEqual((3, 3), (num_calls, len(watcher.channel_updates)))
+        # funding tx gets deeply mined
+        watcher.add_verified_tx(FUNDING_TX.txid(), TxMinedInfo(height=100, conf=0, timestamp=0, txpos=1, header_hash='00' * 32))
+        self._event('network_updated')
+        self.assertEqual((4, 4), (num_calls, len(watcher.channel_updates)))
+        # only the generic callback is run on new blocks and fee updates
+        self._event('blockchain_updated')
+        self._event('fee')
+        self.assertEqual((6, 4), (num_calls, len(watcher.channel_updates)))
+        watcher.remove_callback(OTHER_ADDRESS)
+        self._event('blockchain_updated')
+        self.assertEqual((6, 4), (num_calls, len(watcher.channel_updates)))
+
+    def test_callbacks_run_again_once_up_to_date(self):
+        watcher = self.watcher
+        watcher.add_channel(FUNDING_TX.txid() + ':0', FUNDING_ADDRESS)
+        self.assertFalse(watcher.is_up_to_date())
+        self._event('network_updated')
+        self.assertEqual([], watcher.channel_updates)
+        watcher.set_up_to_date(True)
+        self._event('wallet_updated', object())
+        self.assertEqual([], watcher.channel_updates)  # event for another wallet
+        self._event('wallet_updated', watcher)
+        self.assertEqual(1, len(watcher.channel_updates))
+
+    def test_open_channels_of_wallet_are_never_settled(self):
+        network = self.watcher.network
+        lnworker = MockLNWallet(network, MockChannel(htlc_expiry=1010))
+        watcher = LNWalletWatcher(lnworker, network)
+        self.addCleanup(util.unregister_callback, watcher.on_network_update)
+        watcher.synchronizer = MockSynchronizer()
+        watcher.add_channel(FUNDING_TX.txid() + ':0', FUNDING_ADDRESS)
+        watcher.set_up_to_date(True)
+        watcher.receive_tx_callback(FUNDING_TX.txid(), FUNDING_TX, 100)
+        watcher.add_verified_tx(FUNDING_TX.txid(), TxMinedInfo(height=100, conf=0, timestamp=0, txpos=1, header_hash='00' * 32))
+        run = asyncio.get_event_loop().run_until_complete
+        run(watcher.on_network_update('network_updated'))
+        self.assertTrue(watcher.is_deeply_mined(FUNDING_TX.txid()))
+        self.assertEqual([], lnworker.force_closed)
+        # the htlc expires in a later block
+        network.local_height = 1010
+        run(watcher.on_network_update('blockchain_updated'))
+        self.assertEqual([MockChannel.channel_id], lnworker.force_closed)
+
+
+class TestSweepStore(TestCaseForTestnet):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        self.path = os.path.join(self.electrum_path, 'watchtower_db')
+
+    def tearDown(self):
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop).result(timeout=10)
+
+    def _make_store(self) -> SweepStore:
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        async def f():
+            return SweepStore(self.path, MockNetwork(config, self.asyncio_loop))
+        store = self._run(f())
+        self.addCleanup(store.stop)
+        return store
+
+    def _stop_store(self, store: SweepStore):
+        async def f():
+            store.stop()
+            await store.stopped_event.wait()
+        self._run(f())
+        store.sql_thread.join(timeout=5)
+
+    def test_bulk_and_single_inserts(self):
+        store = self._make_store()
+        raw_tx = FUNDING_TX.serialize()
+        async def f():
+            self.assertEqual(0, await store.get_ctn('a:0', FUNDING_ADDRESS))
+            await store.add_sweep_txs([('a:0', ctn, f'{ctn}:0', raw_tx) for ctn in range(1, 101)])
+            await asyncio.gather(*[store.add_sweep_tx('b:0', 5, f'{i}:0', raw_tx) for i in range(10)])
+            with self.assertRaises(Exception):
+                await store.add_sweep_txs([('b:0', 6, '0:0', raw_tx), ('b:0', 6, '1:0', 'deadbeef')])
+            return (await store.get_ctn('a:0', FUNDING_ADDRESS),
+                    await store.get_ctn('b:0', OTHER_ADDRESS),
+                    await store.get_num_tx('a:0'),
+                    await store.get_sweep_tx('a:0', '42:0'),
+                    await store.list_sweep_tx(),
+                    await store.list_channels())
+        ctn_a, ctn_b, num_tx, sweep_txs, outpoints, channels = self._run(f())
+        self.assertEqual((100, 5, 100), (ctn_a, ctn_b, num_tx))
+        self.assertEqual([raw_tx], [tx.serialize() for tx in sweep_txs])
+        self.assertEqual({'a:0', 'b:0'}, outpoints)
+        self.assertEqual({('a:0', FUNDING_ADDRESS), ('b:0', OTHER_ADDRESS)}, set(channels))
+        self._stop_store(store)
+        conn = sqlite3.connect(self.path)
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT tx FROM sweep_txs WHERE funding_outpoint=? AND prevout=?",
+                            ('a:0', '42:0')).fetchall()
+        self.assertIn('USING INDEX', str(plan))
+        conn.close()
+
+    @staticmethod
+    async def _get_sweep_tx(store, funding_outpoint, prevout):
+        return await store.get_sweep_tx(funding_outpoint, prevout)
+
+    def test_old_rows_are_converted(self):
+        raw_tx = FUNDING_TX.serialize()
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE sweep_txs (funding_outpoint VARCHAR(34) NOT NULL, ctn INTEGER NOT NULL, prevout VARCHAR(34), tx VARCHAR)")
+        conn.execute("INSERT INTO sweep_txs VALUES (?,?,?,?)", ('a:0', 1, '1:0', bytes.fromhex(raw_tx)))
+        conn.commit()
+        conn.close()
+        store = self._make_store()
+        sweep_txs = self._run(self._get_sweep_tx(store, 'a:0', '1:0'))
+        self.assertEqual([raw_tx], [tx.serialize() for tx in sweep_txs])
+        self._stop_store(store)
+        # reopening does not convert again
+        store = self._make_store()
+        sweep_txs = self._run(self._get_sweep_tx(store, 'a:0', '1:0'))
+        self.assertEqual([raw_tx], [tx.serialize() for tx in sweep_txs])
+        self._stop_store(store)
+
+
+class TestWatchtowerSync(TestCaseForTestnet):
+
+    def _sync(self, watchtower):
+        chan = mock.Mock()
+        chan.funding_outpoint.to_str.return_value = 'a:0'
+        chan.get_oldest_unrevoked_ctn.return_value = 5
+        def create_sweeptxs(ctn):
+            tx = mock.Mock()
+            tx.inputs.return_value = [mock.Mock()]
+            return [tx]
+        chan.create_sweeptxs = create_sweeptxs
+        client = MockWatchtowerClient()
+        asyncio.get_event_loop().run_until_complete(client.sync_channel_with_watchtower(chan, watchtower))
+        return client
+
+    def test_bulk_inserts(self):
+        watchtower = MockWatchtower()
+        self._sync(watchtower)
+        self.assertEqual([[1, 2], [3, 4]], watchtower.bulk_inserts)
+        self.assertEqual([], watchtower.single_inserts)
+
+    def test_fallback_to_single_inserts_on_unknown_method(self):
+        watchtower = MockWatchtower(bulk_reply='Error: Invalid Request')
+        self._sync(watchtower)
+        self.assertEqual([1, 2, 3, 4], watchtower.single_inserts)
+        watchtower = MockWatchtower(bulk_reply="Error: {'code': -32601, 'message': 'Method not found'}")
+        self._sync(watchtower)
+        self.assertEqual([1, 2, 3, 4], watchtower.single_inserts)
+
+    def test_sync_stops_on_error(self):
+        watchtower = MockWatchtower(bulk_reply="Error: {'code': 1, 'message': 'database is locked'}")
+        client = self._sync(watchtower)
+        self.assertEqual([[1, 2]], watchtower.bulk_inserts)
+        self.assertEqual([], watchtower.single_inserts)
+        client.logger.warning.assert_called_once()
+        # a failed single insert
+        watchtower = MockWatchtower(bulk_reply='Error: Invalid Request', single_replies=[None, 'Error: disk full'])
+        self._sync(watchtower)
+        self.assertEqual([[1, 2]], watchtower.bulk_inserts)
+        self.assertEqual([1, 2], watchtower.single_inserts)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from unittest import mock
+
+from electrum import util
+from electrum.metrics import MetricsRegistry, LatencyStats, format_histogram, format_metric
+from electrum.util import CallbackManager, create_and_start_event_loop
+
+from . import ElectrumTestCase
+
+
+class TestPrometheusFormat(ElectrumTestCase):
+
+    def test_format_metric(self):
+        lines = format_metric('electrum_x_total', 'counter', 'Some help.',
+                              [({'event': 'a"b\\c\nd'}, 3), ({}, 4)])
+        self.assertEqual(['# HELP electrum_x_total Some help.',
+                          '# TYPE electrum_x_total counter',
+                          'electrum_x_total{event="a\\"b\\\\c\\nd"} 3',
+                          'electrum_x_total 4'], lines)
+
+    def test_format_histogram(self):
+        stats = LatencyStats()
+        stats.record(0.0005)
+        stats.record(0.002)
+        stats.record(20)
+        lines = format_histogram('electrum_y_seconds', 'Some help.', [({'method': 'm'}, stats)])
+        self.assertEqual('# TYPE electrum_y_seconds histogram', lines[1])
+        self.assertEqual('electrum_y_seconds_bucket{method="m",le="0.001"} 1', lines[2])
+        self.assertEqual('electrum_y_seconds_bucket{method="m",le="0.005"} 2', lines[3])
+        self.assertEqual('electrum_y_seconds_bucket{method="m",le="10"} 2', lines[-4])
+        self.assertEqual('electrum_y_seconds_bucket{method="m",le="+Inf"} 3', lines[-3])
+        self.assertEqual('electrum_y_seconds_sum{method="m"} 20.0025', lines[-2])
+        self.assertEqual('electrum_y_seconds_count{method="m"} 3', lines[-1])
+
+
+class TestCallbackMetrics(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        self.registry = MetricsRegistry()
+        patcher = mock.patch.object(util, 'metrics_registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def _trigger_and_wait(self, callback_mgr: CallbackManager, event: str, num_calls: int):
+        done = threading.Semaphore(0)
+        def on_done():
+            done.release()
+        callback_mgr.trigger_callback(event, on_done)
+        for i in range(num_calls):
+            self.assertTrue(done.acquire(timeout=5))
+
+    def test_trigger_callback(self):
+        callback_mgr = CallbackManager()
+        callback_mgr.asyncio_loop = self.asyncio_loop
+        def sync_callback(event, on_done):
+            on_done()
+        async def async_callback(event, on_done):
+            await asyncio.sleep(0.01)
+            on_done()
+        callback_mgr.register_callback(sync_callback, ['a', 'b'])
+        callback_mgr.register_callback(async_callback, ['a'])
+        # disabled: nothing is recorded
+        self._trigger_and_wait(callback_mgr, 'a', 2)
+        self.assertEqual([], [l for l in self.registry.to_prometheus() if not l.startswith('#')])
+        self.registry.enabled = True
+        self._trigger_and_wait(callback_mgr, 'a', 2)
+        self._trigger_and_wait(callback_mgr, 'a', 2)
+        self._trigger_and_wait(callback_mgr, 'b', 1)
+        # the durations are recorded once the callbacks have returned
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), self.asyncio_loop).result(timeout=5)
+        lines = self.registry.to_prometheus()
+        self.assertIn('electrum_event_triggers_total{event="a"} 2', lines)
+        self.assertIn('electrum_event_callbacks_total{event="a"} 4', lines)
+        self.assertIn('electrum_event_callbacks_total{event="b"} 1', lines)
+        sync_name = 'TestCallbackMetrics.test_trigger_callback.<locals>.sync_callback'
+        async_name = 'TestCallbackMetrics.test_trigger_callback.<locals>.async_callback'
+        self.assertIn(f'electrum_callback_duration_seconds_count{{event="a",callback="{sync_name}"}} 2', lines)
+        self.assertIn(f'electrum_callback_duration_seconds_count{{event="b",callback="{sync_name}"}} 1', lines)
+        self.assertIn(f'electrum_callback_duration_seconds_count{{event="a",callback="{async_name}"}} 2', lines)
+        # coroutines are timed until they return, including the time they were suspended
+        self.assertIn(f'electrum_callback_duration_seconds_bucket{{event="a",callback="{async_name}",le="0.005"}} 0', lines)
+
+    def test_profiler(self):
+        @util.profiler
+        def f():
+            return 42
+        self.assertEqual(42, f())
+        self.registry.enabled = True
+        self.assertEqual(42, f())
+        lines = self.registry.to_prometheus()
+        name = 'TestCallbackMetrics.test_profiler.<locals>.f'
+        self.assertIn(f'electrum_profiler_duration_seconds_count{{function="{name}"}} 1', lines)
@@ -1,12 +1,20 @@
 import asyncio
+import logging
 import tempfile
+import threading
 import unittest
+from unittest import mock
+
+from aiorpcx.session import SessionKind
 
 from electrum import constants
 from electrum.simple_config import SimpleConfig
 from electrum import blockchain
-from electrum.interface import Interface, ServerAddr
+from electrum.blockchain import hash_raw_header
+from electrum.interface import Interface, ServerAddr, NotificationSession, _HeaderChunkFetcher
+from electrum.network import RawTxCache
 from electrum.crypto import sha256
+from electrum.transaction import Transaction
 from electrum.util import bh2u
 
 from . import ElectrumTestCase
@@ -19,6 +27,9 @@ class MockNetwork:
     taskgroup = MockTaskGroup()
     asyncio_loop = asyncio.get_event_loop()
 
+    def __init__(self):
+        self.raw_tx_cache = RawTxCache(max_size=10_000)
+
 class MockInterface(Interface):
     def __init__(self, config):
         self.config = config
@@ -117,6 +128,203 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(self.interface.q.qsize(), 0)
 
 
+class MockSession:
+    def __init__(self):
+        self.requests = []
+
+    async def send_request(self, method, params, timeout=None):
+        self.requests.append((method, params, timeout))
+        await asyncio.sleep(0.01)
+        if method == 'blockchain.transaction.get':
+            return RAW_TX
+        return [{'tx_hash': TXID, 'height': 100}]
+
+
+class MockTransport:
+    kind = SessionKind.CLIENT
+
+
+class MockNotificationSession(NotificationSession):
+    async def send_request(self, method, params, timeout=None):
+        self.requests.append((method, params))
+        await asyncio.sleep(0.01)
+        return 'status'
+
+
+RAW_TX = '0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00'
+TXID = Transaction(RAW_TX).txid()
+
+
+class TestSharedRequests(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.interface = MockInterface(self.config)
+        self.interface.session = MockSession()
+
+    def test_concurrent_requests_are_shared(self):
+        ifa = self.interface
+        async def f():
+            return await asyncio.gather(*[ifa.get_transaction(TXID, timeout=5) for i in range(5)])
+        results = asyncio.get_event_loop().run_until_complete(f())
+        self.assertEqual([RAW_TX] * 5, results)
+        self.assertEqual([('blockchain.transaction.get', [TXID], 5)], ifa.session.requests)
+        self.assertEqual(4, ifa.num_shared_requests)
+        self.assertEqual({}, ifa._pending_requests)
+
+    def test_history_requests_are_not_shared(self):
+        # a request in flight might have been sent before the status changed
+        ifa = self.interface
+        sh = sha256(b'').hex()
+        async def f():
+            return await asyncio.gather(*[ifa.get_history_for_scripthash(sh) for i in range(2)])
+        results = asyncio.get_event_loop().run_until_complete(f())
+        self.assertEqual([[{'tx_hash': TXID, 'height': 100}]] * 2, results)
+        self.assertEqual(2, len(ifa.session.requests))
+        self.assertEqual(0, ifa.num_shared_requests)
+
+    def test_fetched_transactions_are_parsed_and_cached(self):
+        ifa = self.interface
+        tx = asyncio.get_event_loop().run_until_complete(ifa.get_parsed_transaction(TXID))
+        # already deserialized
+        self.assertIsNotNone(tx._inputs)
+        self.assertEqual(RAW_TX, ifa.network.raw_tx_cache.get(TXID))
+        # served from the cache
+        self.assertEqual(RAW_TX, asyncio.get_event_loop().run_until_complete(ifa.get_transaction(TXID)))
+        self.assertEqual(1, len(ifa.session.requests))
+
+    def test_parsed_transactions_are_not_shared(self):
+        ifa = self.interface
+        async def f():
+            return await asyncio.gather(*[ifa.get_parsed_transaction(TXID) for i in range(2)])
+        tx1, tx2 = asyncio.get_event_loop().run_until_complete(f())
+        self.assertEqual(1, len(ifa.session.requests))
+        self.assertIsNot(tx1, tx2)
+        self.assertEqual(TXID, tx1.txid())
+        self.assertEqual(TXID, tx2.txid())
+
+    def test_fetched_transactions_are_parsed_and_hashed_once(self):
+        ifa = self.interface
+        num_parsed = num_hashed = 0
+        deserialize, txid = Transaction.deserialize, Transaction.txid
+        def counting_deserialize(tx):
+            nonlocal num_parsed
+            num_parsed += tx._inputs is None
+            return deserialize(tx)
+        def counting_txid(tx):
+            nonlocal num_hashed
+            num_hashed += tx._cached_txid is None
+            return txid(tx)
+        async def f():
+            return await asyncio.gather(*[ifa.get_parsed_transaction(TXID) for i in range(2)])
+        with mock.patch.object(Transaction, 'deserialize', counting_deserialize), \
+                mock.patch.object(Transaction, 'txid', counting_txid):
+            txs = asyncio.get_event_loop().run_until_complete(f())
+            # what receive_tx_callback does with it
+            for tx in txs:
+                self.assertEqual(TXID, tx.txid())
+                tx.inputs()
+            # one tx per caller, each parsed and hashed once
+            self.assertEqual((2, 2), (num_parsed, num_hashed))
+            # served from the cache: parsed once, hashed when needed
+            tx = asyncio.get_event_loop().run_until_complete(ifa.get_parsed_transaction(TXID))
+            self.assertEqual(TXID, tx.txid())
+            self.assertEqual((3, 3), (num_parsed, num_hashed))
+        self.assertEqual(1, len(ifa.session.requests))
+
+    def test_raw_tx_cache_is_bounded(self):
+        cache = RawTxCache(max_size=10)
+        cache.add('a', '0000')
+        cache.add('b', '1111')
+        self.assertEqual('0000', cache.get('a'))
+        cache.add('c', '2222')  # evicts 'b', which is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(['a', 'c'], list(cache._raw_txs))
+        cache.add('d', '3' * 12)  # too large to be cached
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(2, len(cache))
+
+    def test_subscriptions_are_shared(self):
+        async def f():
+            session = MockNotificationSession(MockTransport(), interface=self.interface)
+            session.requests = []
+            queues = [asyncio.Queue() for i in range(4)]
+            await asyncio.gather(
+                *[session.subscribe('blockchain.scripthash.subscribe', ['sh1'], q) for q in queues],
+                session.subscribe('blockchain.scripthash.subscribe', ['sh2'], queues[0]))
+            # late subscribers are served from the cache
+            await session.subscribe('blockchain.scripthash.subscribe', ['sh1'], queues[1])
+            self.assertEqual([('blockchain.scripthash.subscribe', ['sh1']),
+                              ('blockchain.scripthash.subscribe', ['sh2'])],
+                             session.requests)
+            self.assertEqual(['sh1', 'status'], queues[3].get_nowait())
+            self.assertEqual({'blockchain.scripthash.subscribe': 2}, session.get_subscription_counts())
+            self.assertEqual(6, session.get_num_subscribers())
+            session.unsubscribe(queues[0])
+            self.assertEqual({'blockchain.scripthash.subscribe': 1}, session.get_subscription_counts())
+        asyncio.get_event_loop().run_until_complete(f())
+
+
+class MockChunkServer:
+    def __init__(self, network, name, *, fake=False, tip=10_000):
+        self.network = network
+        self.server = name
+        self.fake = fake
+        self.tip = tip
+        self.session = object()
+        self.ready = asyncio.Future()
+        self.ready.set_result(1)
+        self.got_disconnected = asyncio.Event()
+        self.logger = network.logger
+        self.chunks_sent = []
+
+    async def fetch_chunk(self, index, size):
+        await asyncio.sleep(0.001)
+        self.chunks_sent.append(index)
+        return self.get_header(index * 2016 + size - 1).hex() * size
+
+    async def get_block_header_hash(self, height):
+        return hash_raw_header(self.get_header(height).hex())
+
+    def get_header(self, height):
+        # not real headers, but distinct ones
+        return sha256(f"{self.fake} {height}")[:16] * 5
+
+
+class TestHeaderChunkFetcher(ElectrumTestCase):
+
+    def test_chunks_are_fetched_from_several_interfaces_and_checked(self):
+        network = MockNetwork()
+        network.logger = logging.getLogger(__name__)
+        network.interfaces_lock = threading.Lock()
+        main = MockChunkServer(network, 'main')
+        honest = MockChunkServer(network, 'honest')
+        liar = MockChunkServer(network, 'liar', fake=True)
+        lagging = MockChunkServer(network, 'lagging', tip=100)
+        network.interfaces = {x.server: x for x in (main, honest, liar, lagging)}
+        tip = 2016 * 6 + 9
+        fetcher = _HeaderChunkFetcher(main, tip=tip)
+        async def f():
+            chunks = []
+            for index in range(7):
+                size = 2016 if index < 6 else 10
+                chunks.append(await fetcher.get_chunk(index, size))
+            fetcher.clear()
+            return chunks
+        chunks = asyncio.get_event_loop().run_until_complete(f())
+        for index, chunk in enumerate(chunks):
+            size = 2016 if index < 6 else 10
+            self.assertEqual(main.get_header(index * 2016 + size - 1).hex() * size, chunk)
+        # all interfaces that have the chunks were used
+        self.assertTrue(honest.chunks_sent)
+        self.assertTrue(liar.chunks_sent)
+        self.assertEqual([], lagging.chunks_sent)
+        # chunks from the lying interface were fetched again from the main one
+        self.assertLessEqual(set(liar.chunks_sent), set(main.chunks_sent))
+        self.assertEqual(7, len(set(main.chunks_sent) | set(honest.chunks_sent)))
+
+
 if __name__=="__main__":
     constants.set_regtest()
     unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sqlite3
+from typing import Sequence, Tuple
+
+from electrum.sql_db import SqlDB, sql, sql_batched, sql_read
+from electrum.util import create_and_start_event_loop
+
+from . import ElectrumTestCase
+
+
+class KVStore(SqlDB):
+
+    def __init__(self, asyncio_loop, path):
+        SqlDB.__init__(self, asyncio_loop, path, commit_interval=100)
+        self.num_batches = 0
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v INTEGER)")
+        self.conn.commit()
+
+    @sql_batched
+    def put(self, rows: Sequence[Tuple[str, int]]):
+        self.num_batches += 1
+        self.conn.executemany("REPLACE INTO kv (k, v) VALUES (?,?)", rows)
+
+    @sql
+    def delete(self, k: str):
+        self.conn.execute("DELETE FROM kv WHERE k=?", (k,))
+
+    @sql
+    def get(self, k: str):
+        r = self.conn.execute("SELECT v FROM kv WHERE k=?", (k,)).fetchone()
+        return r[0] if r else None
+
+    @sql
+    def commit(self):
+        self.conn.commit()
+
+    @sql
+    def fail(self):
+        raise sqlite3.OperationalError("boom")
+
+    @sql_read
+    def count_committed(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+
+
+class TestSqlDB(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+
+    def tearDown(self):
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop).result(timeout=10)
+
+    def _make_db(self) -> KVStore:
+        async def f():
+            return KVStore(self.asyncio_loop, os.path.join(self.electrum_path, 'kv_db'))
+        return self._run(f())
+
+    def _stop_db(self, db: KVStore):
+        async def f():
+            db.stop()
+            await db.stopped_event.wait()
+        self._run(f())
+
+    def test_batched_writes_are_merged_and_ordered(self):
+        db = self._make_db()
+        async def f():
+            futs = [db.put(f"key{i}", i) for i in range(500)]
+            futs.append(db.delete("key7"))
+            futs.append(db.put("key8", 88))
+            await asyncio.gather(*futs)
+            return await db.get("key7"), await db.get("key8"), await db.get("key499")
+        self.assertEqual((None, 88, 499), self._run(f()))
+        # consecutive calls got merged into (much) fewer executemany calls
+        self.assertLess(db.num_batches, 500)
+        self._stop_db(db)
+
+    def test_exceptions_are_propagated(self):
+        db = self._make_db()
+        async def f():
+            with self.assertRaises(sqlite3.OperationalError):
+                await db.fail()
+            # the sql thread survives
+            await db.put("a", 1)
+            return await db.get("a")
+        self.assertEqual(1, self._run(f()))
+        self._stop_db(db)
+
+    def test_failing_call_does_not_fail_its_batch(self):
+        db = self._make_db()
+        async def f():
+            futs = [db.put(f"key{i}", i) for i in range(5)]
+            futs.append(db.put("bad", object()))  # cannot be bound
+            futs += [db.put(f"key{i}", i) for i in range(5, 10)]
+            results = await asyncio.gather(*futs, return_exceptions=True)
+            await db.commit()
+            return results, await db.count_committed(), await db.get("bad")
+        results, count, bad = self._run(f())
+        self.assertIsInstance(results[5], sqlite3.Error)
+        self.assertEqual([None] * 10, results[:5] + results[6:])
+        # the rows written before the failure were rolled back, and written once
+        self.assertEqual((10, None), (count, bad))
+        self._stop_db(db)
+
+    def test_readers_see_committed_data(self):
+        db = self._make_db()
+        async def f():
+            self.assertEqual(0, await db.count_committed())
+            await asyncio.gather(*[db.put(f"key{i}", i) for i in range(10)])
+            await db.commit()
+            return await db.count_committed()
+        self.assertEqual(10, self._run(f()))
+        self._stop_db(db)
+
+    def test_data_persisted_after_stop(self):
+        db = self._make_db()
+        async def f():
+            await asyncio.gather(*[db.put(f"key{i}", i) for i in range(10)])
+        self._run(f())
+        self._stop_db(db)
+        # stopped_event is set just before the sql thread returns
+        db.sql_thread.join(timeout=5)
+        self.assertFalse(db.sql_thread.is_alive())
+        conn = sqlite3.connect(db.path)
+        self.assertEqual(10, conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0])
+        self.assertEqual('wal', conn.execute("PRAGMA journal_mode").fetchone()[0])
+        conn.close()
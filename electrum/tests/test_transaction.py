@@ -1,3 +1,4 @@
+import random
 from typing import NamedTuple, Union
 
 from electrum import transaction, bitcoin
@@ -151,6 +152,83 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(tx.estimated_weight(), 561)
         self.assertEqual(tx.estimated_size(), 141)
 
+    def test_estimated_size_matches_serialization(self):
+        # the closed-form estimates must agree with serialize_to_network(estimate_size=True)
+        rng = random.Random(1)
+
+        def randbytes(n: int) -> bytes:
+            return bytes(rng.getrandbits(8) for _ in range(n))
+
+        def random_txin() -> PartialTxInput:
+            txin = PartialTxInput(prevout=TxOutpoint(txid=randbytes(32), out_idx=rng.randrange(4)))
+            txin.script_type = rng.choice(['p2pk', 'p2pkh', 'p2wpkh', 'p2wpkh-p2sh', 'p2sh',
+                                           'p2wsh', 'p2wsh-p2sh', 'address'])
+            pubkey_size = rng.choice([33, 33, 65])
+            num_pubkeys = rng.randint(1, 15) if txin.script_type in ('p2sh', 'p2wsh', 'p2wsh-p2sh') else 1
+            txin.pubkeys = [randbytes(pubkey_size) for _ in range(num_pubkeys)]
+            txin.num_sig = rng.randint(1, num_pubkeys)
+            h = randbytes(32)
+            if txin.script_type == 'address' or rng.random() < 0.3:
+                txin._trusted_address = rng.choice([
+                    bitcoin.hash160_to_p2pkh(h[:20]), bitcoin.hash160_to_p2sh(h[:20]),
+                    bitcoin.hash_to_segwit_addr(h[:20], witver=0), bitcoin.hash_to_segwit_addr(h, witver=0)])
+            if txin.script_type == 'p2wpkh-p2sh' and rng.random() < 0.5:
+                txin.redeem_script = bfh(bitcoin.p2wpkh_nested_script(txin.pubkeys[0].hex()))
+                txin._trusted_address = bitcoin.hash160_to_p2sh(bitcoin.hash_160(txin.redeem_script))
+            if rng.random() < 0.1:
+                txin.witness_sizehint = rng.randint(60, 300)
+            if rng.random() < 0.1:
+                txin.script_sig = randbytes(rng.randint(0, 300))
+            if rng.random() < 0.1:
+                txin.witness = randbytes(rng.randint(1, 300))
+            return txin
+
+        for i in range(300):
+            inputs = [random_txin() for _ in range(rng.randint(1, 5))]
+            outputs = [PartialTxOutput(scriptpubkey=randbytes(rng.choice([22, 23, 25, 34, 300])),
+                                       value=rng.randint(0, 10**8))
+                       for _ in range(rng.randint(1, 3))]
+            tx = PartialTransaction.from_io(inputs, outputs)
+            is_segwit_tx = tx.is_segwit(guess_for_address=True)
+            total_size = len(tx.serialize_to_network(estimate_size=True)) // 2
+            estimate = not tx.is_complete()
+            witness_size = 0
+            if tx.is_segwit(guess_for_address=estimate):
+                witness = ''.join(tx.serialize_witness(txin, estimate_size=estimate) for txin in inputs)
+                witness_size = len(witness) // 2 + 2
+            self.assertEqual(total_size, tx.estimated_total_size())
+            self.assertEqual(witness_size, tx.estimated_witness_size())
+            self.assertEqual(4 * total_size - 3 * witness_size, tx.estimated_weight())
+            for txin in inputs:
+                script = Transaction.input_script(txin, estimate_size=True)
+                input_weight = 4 * (len(Transaction.serialize_input(txin, script)) // 2)
+                if txin.is_segwit(guess_for_address=True):
+                    input_weight += len(Transaction.serialize_witness(txin, estimate_size=True)) // 2
+                else:
+                    input_weight += 1 if is_segwit_tx else 0
+                self.assertEqual(input_weight, Transaction.estimated_input_weight(txin, is_segwit_tx))
+
+    def test_legacy_preimage_with_shared_txdigest_fields(self):
+        inputs = []
+        for i in range(3):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([i]) * 32, out_idx=i))
+            txin.script_type = 'p2pkh'
+            txin.pubkeys = [bfh('02' + f'{i:02x}' * 32)]
+            txin.num_sig = 1
+            inputs.append(txin)
+        outputs = [PartialTxOutput.from_address_and_value('14gcRovpkCoGkCNBivQBvw7eso7eiNAbxG', 10_000)]
+        tx = PartialTransaction.from_io(inputs, outputs, locktime=700_000)
+        legacy_txdigest_fields = tx._calc_legacy_txdigest_fields()
+        for i, txin in enumerate(inputs):
+            # the preimage of a legacy input is the tx with all other scriptSigs emptied
+            txins = bitcoin.var_int(len(inputs)) + ''.join(
+                tx.serialize_input(other, tx.get_preimage_script(txin) if other is txin else '')
+                for other in inputs)
+            txouts = bitcoin.var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+            expected = '02000000' + txins + txouts + '60ae0a00' + '01000000'
+            self.assertEqual(expected, tx.serialize_preimage(i))
+            self.assertEqual(expected, tx.serialize_preimage(i, legacy_txdigest_fields=legacy_txdigest_fields))
+
     def test_version_field(self):
         tx = transaction.Transaction(v2_blob)
         self.assertEqual(tx.txid(), "b97f9180173ab141b61b9f944d841e60feec691d6daab4d4d932b24dd36606fe")
@@ -1,10 +1,18 @@
+import json
+import os
+import random
+from collections import OrderedDict
 from decimal import Decimal
+from unittest import mock
 
 from electrum.util import (format_satoshis, format_fee_satoshis, parse_URI,
                            is_hash256_str, chunks, is_ip_address, list_enabled_bits,
                            format_satoshis_plain, is_private_netaddress, is_hex_str,
                            is_integer, is_non_negative_integer, is_int_or_float,
-                           is_non_negative_int_or_float)
+                           is_non_negative_int_or_float, OrderedDictWithIndex,
+                           longest_increasing_subsequence, read_json_array_file, write_json_array_file,
+                           FileImportFailed)
+from electrum import util
 
 from . import ElectrumTestCase
 
@@ -292,3 +300,105 @@ class TestUtil(ElectrumTestCase):
         self.assertFalse(is_private_netaddress("[2a00:1450:400e:80d::200e]"))
         self.assertFalse(is_private_netaddress("8.8.8.8"))
         self.assertFalse(is_private_netaddress("example.com"))
+
+    def test_json_array_file(self):
+        path = os.path.join(self.electrum_path, 'items.json')
+        items = [{'a': 'x' * 40, 'b': [1, 2.5, None]}, 123456789, "s,]", True, [], {}]
+        with mock.patch.object(util, '_JSON_ARRAY_CHUNK_SIZE', 7):
+            for text in (json.dumps(items), json.dumps(items, indent=4) + '\n'):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                self.assertEqual(items, list(read_json_array_file(path)))
+            write_json_array_file(path, items)
+            with open(path, 'r', encoding='utf-8') as f:
+                self.assertEqual(items, json.load(f))
+            self.assertEqual(items, list(read_json_array_file(path)))
+            for text in ('', '{}', '[1, 2', '[1 2]', '[1,]', '[,1]', '[1] 2'):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                with self.assertRaises(FileImportFailed):
+                    list(read_json_array_file(path))
+
+
+class TestOrderedDictWithIndex(ElectrumTestCase):
+
+    def _check(self, d: OrderedDictWithIndex, keys: list):
+        self.assertEqual(keys, list(d))
+        self.assertEqual(keys[::-1], list(reversed(d)))
+        self.assertEqual(len(keys), len(d))
+        for pos, key in enumerate(keys):
+            self.assertEqual(pos, d.pos_from_key(key))
+            self.assertEqual(key, d.key_from_pos(pos))
+            self.assertEqual(d[key], d.value_from_pos(pos))
+
+    def test_dict_operations(self):
+        d = OrderedDictWithIndex([('a', 1), ('b', 2), ('c', 3)])
+        self._check(d, ['a', 'b', 'c'])
+        d['b'] = 20
+        self._check(d, ['a', 'b', 'c'])
+        self.assertEqual(20, d.value_from_pos(1))
+        self.assertEqual(1, d.pop('a'))
+        self._check(d, ['b', 'c'])
+        d.move_to_end('b')
+        self._check(d, ['c', 'b'])
+        d.move_to_end('b', last=False)
+        self._check(d, ['b', 'c'])
+        with self.assertRaises(KeyError):
+            d.move_to_end('a')
+        self._check(d, ['b', 'c'])
+        d.update({'d': 4, 'e': 5})
+        self._check(d, ['b', 'c', 'd', 'e'])
+        self.assertEqual(('e', 5), d.popitem())
+        self.assertEqual(('b', 20), d.popitem(last=False))
+        self._check(d, ['c', 'd'])
+        self.assertEqual([4, 3], list(reversed(d.values())))
+        self.assertEqual(OrderedDict([('c', 3), ('d', 4)]), d)
+        self.assertNotEqual(OrderedDict([('d', 4), ('c', 3)]), d)
+        self.assertEqual({'d': 4, 'c': 3}, d)
+        with self.assertRaises(KeyError):
+            d.pos_from_key('a')
+        with self.assertRaises(IndexError):
+            d.key_from_pos(2)
+        d.clear()
+        self._check(d, [])
+        with self.assertRaises(KeyError):
+            d.popitem()
+
+    def test_insert(self):
+        d = OrderedDictWithIndex()
+        d.insert(0, 'b', 2)
+        d.insert(0, 'a', 1)
+        d.insert(5, 'd', 4)
+        d.insert(2, 'c', 3)
+        self._check(d, ['a', 'b', 'c', 'd'])
+        d.insert(0, 'c', 30)  # moves an existing key
+        self._check(d, ['c', 'a', 'b', 'd'])
+        self.assertEqual(30, d['c'])
+
+    def test_random_operations_across_blocks(self):
+        rand = random.Random(1)
+        d = OrderedDictWithIndex()
+        keys = []
+        for i in range(5000):
+            if keys and rand.random() < 0.4:
+                key = rand.choice(keys)
+                keys.remove(key)
+                del d[key]
+            else:
+                pos = rand.randint(0, len(keys))
+                keys.insert(pos, i)
+                d.insert(pos, i, -i)
+        self.assertGreater(len(d._blocks), 1)
+        self._check(d, keys)
+        for key in list(keys):
+            d.move_to_end(key, last=False)
+        self._check(d, keys[::-1])
+        while d:
+            d.popitem(last=False)
+        self._check(d, [])
+
+    def test_longest_increasing_subsequence(self):
+        self.assertEqual([], longest_increasing_subsequence([]))
+        self.assertEqual([0, 1, 2], longest_increasing_subsequence([1, 2, 3]))
+        self.assertEqual(1, len(longest_increasing_subsequence([3, 2, 1])))
+        self.assertEqual([1, 2, 4, 5], longest_increasing_subsequence([3, 1, 2, 5, 4, 6]))
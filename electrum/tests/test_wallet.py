@@ -16,6 +16,7 @@ from electrum.exchange_rate import ExchangeBase, FxThread
 from electrum.util import TxMinedInfo, InvalidPassword
 from electrum.bitcoin import COIN
 from electrum.wallet_db import WalletDB
+from electrum.cost_basis import CostBasisLedger, FifoPool
 from electrum.simple_config import SimpleConfig
 from electrum import util
 
@@ -99,6 +100,7 @@ class FakeFxThread:
     timestamp_rate = FxThread.timestamp_rate
     ccy_amount_str = FxThread.ccy_amount_str
     history_rate = FxThread.history_rate
+    _day_rate = FxThread._day_rate
 
 class FakeWallet:
     def __init__(self, fiat_value):
@@ -106,6 +108,7 @@ class FakeWallet:
         self.fiat_value = fiat_value
         self.db = WalletDB("{}", manual_upgrades=True)
         self.db.transactions = self.db.verified_tx = {'abc':'Tx'}
+        self.cost_basis = CostBasisLedger(self)
 
     def get_tx_height(self, txid):
         # because we use a current timestamp, and history is empty,
@@ -152,6 +155,111 @@ class TestFiat(ElectrumTestCase):
         self.assertNotIn(ccy, self.fiat_value)
 
 
+class TestCostBasis(ElectrumTestCase):
+
+    class FakeDB:
+        def __init__(self):
+            self.txi = {}  # txid -> list of (prevout, value)
+
+        def get_txi_addresses(self, txid):
+            return ['addr'] if self.txi.get(txid) else []
+
+        def get_txi_addr(self, txid, addr):
+            return self.txi.get(txid, [])
+
+    class FakeWallet:
+        def __init__(self, db):
+            self.db = db
+            self.fiat_values = {}
+            self.prices = {}  # txid -> price per BTC when mined
+
+        def get_fiat_value(self, txid, ccy):
+            return self.fiat_values.get(txid)
+
+        def price_at_timestamp(self, txid, price_func):
+            return self.prices[txid]
+
+        def get_depending_transactions(self, txid):
+            spenders = {}
+            for t, inputs in self.db.txi.items():
+                for ser, v in inputs:
+                    spenders.setdefault(ser.split(':')[0], set()).add(t)
+            children = set()
+            todo = [txid]
+            while todo:
+                for t in spenders.get(todo.pop(), set()) - children:
+                    children.add(t)
+                    todo.append(t)
+            return children
+
+    def test_average_price_of_long_chain(self):
+        db = self.FakeDB()
+        wallet = self.FakeWallet(db)
+        ledger = CostBasisLedger(wallet)
+        wallet.prices = {'a': Decimal(100), 'b': Decimal(300)}
+        # a long chain of self-transfers, spending a coin received in 'a'
+        db.txi['t0'] = [('a:0', COIN)]
+        for i in range(1, 5000):
+            db.txi[f't{i}'] = [(f't{i-1}:0', COIN)]
+        self.assertEqual(Decimal(100), ledger.average_price('t4999', None, ccy))
+        self.assertEqual(Decimal(50), ledger.coin_price('t4999', None, ccy, COIN // 2))
+        self.assertTrue(ledger.average_price('a', None, ccy).is_nan())
+        # a tx spending the end of the chain and a coin received in 'b'
+        db.txi['c'] = [('t4999:0', COIN), ('b:0', COIN)]
+        self.assertEqual(Decimal(200), ledger.average_price('c', None, ccy))
+        # results are invalidated with the descendants
+        wallet.fiat_values['a'] = Decimal(500)
+        self.assertEqual(Decimal(200), ledger.average_price('c', None, ccy))
+        ledger.invalidate('a')
+        self.assertEqual(Decimal(500), ledger.average_price('t4989', None, ccy))
+        self.assertEqual(Decimal(400), ledger.average_price('c', None, ccy))
+        # results with missing rates are not kept
+        wallet.prices['b'] = Decimal('NaN')
+        ledger.invalidate('b')
+        self.assertTrue(ledger.average_price('c', None, ccy).is_nan())
+        wallet.prices['b'] = Decimal(100)
+        self.assertEqual(Decimal(300), ledger.average_price('c', None, ccy))
+
+    def test_wallet_is_called_without_ledger_lock(self):
+        db = self.FakeDB()
+        wallet = self.FakeWallet(db)
+        ledger = CostBasisLedger(wallet)
+        db.txi['t0'] = [('a:0', COIN)]
+        db.txi['t1'] = [('t0:0', COIN)]
+        def price_at_timestamp(txid, price_func):
+            # the wallet might be waiting for the ledger lock, while holding its own locks
+            self.assertFalse(ledger.lock._is_owned())
+            # the price changes while it is being computed
+            ledger.invalidate(txid)
+            return Decimal(100)
+        wallet.price_at_timestamp = price_at_timestamp
+        self.assertEqual(Decimal(100), ledger.average_price('t1', None, ccy))
+        # results computed across an invalidation are not kept
+        self.assertIsNone(ledger._get_cached(ccy, 't1'))
+        wallet.price_at_timestamp = lambda txid, price_func: Decimal(100)
+        self.assertEqual(Decimal(100), ledger.average_price('t1', None, ccy))
+        self.assertEqual(Decimal(100), ledger._get_cached(ccy, 't0'))
+
+    def test_fifo_pool(self):
+        fifo = FifoPool()
+        self.assertIsNone(fifo.apply(COIN, Decimal(100)))
+        self.assertIsNone(fifo.apply(COIN, Decimal(200)))
+        self.assertEqual(Decimal(300), fifo.holdings_cost)
+        # spends the first lot, and half of the second one
+        self.assertEqual(Decimal(200), fifo.apply(-COIN * 3 // 2, Decimal(-450)))
+        self.assertEqual(Decimal(100), fifo.holdings_cost)
+        self.assertEqual(Decimal(300), fifo.holdings_cost_before)
+        # spending more than is known: the rest has no gain
+        self.assertEqual(Decimal(100) + Decimal(200), fifo.apply(-COIN, Decimal(-400)))
+        self.assertEqual(Decimal(0), fifo.holdings_cost)
+        # lots without an exchange rate are left out, and priced when spent
+        self.assertIsNone(fifo.apply(COIN, Decimal('NaN')))
+        self.assertIsNone(fifo.apply(COIN, Decimal(100)))
+        self.assertEqual(Decimal(100), fifo.holdings_cost)
+        self.assertEqual(Decimal(100) + Decimal(300), fifo.apply(-COIN * 2, Decimal(-600)))
+        self.assertEqual(Decimal(0), fifo.holdings_cost)
+
+
 class TestCreateRestoreWallet(WalletTestCase):
 
     def test_create_new_wallet(self):
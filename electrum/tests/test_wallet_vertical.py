@@ -1,4 +1,5 @@
 import unittest
+import os
 from unittest import mock
 import shutil
 import tempfile
@@ -18,6 +19,8 @@ from electrum.util import (
 from electrum.transaction import (TxOutput, Transaction, PartialTransaction, PartialTxOutput,
                                   PartialTxInput, tx_from_any, TxOutpoint)
 from electrum.mnemonic import seed_type
+from electrum.invoices import PR_UNPAID, PR_UNCONFIRMED, PR_PAID, PR_EXPIRED, PR_UNKNOWN
+from electrum.util import TxMinedInfo
 
 from electrum.plugins.trustedcoin import trustedcoin
 
@@ -3322,6 +3325,146 @@ class TestWalletHistory_DoubleSpend(TestCaseForTestnet):
         self.assertEqual(999890, sum(w.get_balance()))
 
 
+class TestWalletRequests(TestCaseForTestnet):
+    transactions = TestWalletHistory_DoubleSpend.transactions
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+
+    def assert_statuses_are_consistent(self, w: Abstract_Wallet):
+        for key, req in w.receive_requests.items():
+            expected = w.check_expired_status(req, w.compute_request_status(req))
+            self.assertEqual(expected, w.get_request_status(key))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_request_statuses_follow_transactions(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txC = Transaction(self.transactions["2c9aa33d9c8ec649f9bfb84af027a5414b760be5231fe9eca4a95b9eb3f8a017"])
+        w.add_transaction(txA)
+        addr_c = txC.outputs()[0].address
+        other_addrs = [addr for addr in w.get_unused_addresses() if addr != addr_c]
+        # a request paid by txC, an expired request, and a request without expiry
+        req_c = w.add_payment_request(w.make_payment_request(addr_c, 999890, 'c', 3600))
+        req_expired = w.make_payment_request(other_addrs[0], 1000, 'expired', 60)
+        req_expired.time -= 120
+        w.add_payment_request(req_expired)
+        self.assertEqual(PR_EXPIRED, w.get_request_status(other_addrs[0]))
+        w.add_payment_request(w.make_payment_request(other_addrs[1], 1000, 'no expiry', 0))
+        self.assertEqual(PR_UNPAID, w.get_request_status(addr_c))
+        self.assertEqual(PR_UNPAID, w.get_request_status(other_addrs[1]))
+        self.assertEqual(3, len(w.get_unpaid_requests()))
+        unused = w.get_unused_addresses()
+        self.assertIn(other_addrs[0], unused)
+        self.assertNotIn(addr_c, unused)
+        self.assertNotIn(other_addrs[1], unused)
+        # local, then mined
+        w.add_transaction(txC)
+        self.assertEqual(PR_UNCONFIRMED, w.get_request_status(addr_c))
+        w.db.put('stored_height', 1005)
+        w.add_verified_tx(txC.txid(), TxMinedInfo(height=1000, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        self.assertEqual(PR_PAID, w.get_request_status(addr_c))
+        self.assertEqual([req_c], w.get_sorted_requests(status=PR_PAID))
+        self.assertEqual(2, len(w.get_unpaid_requests()))
+        self.assert_statuses_are_consistent(w)
+        # removing the parent of txC removes txC
+        w.remove_transaction(txA.txid())
+        self.assertEqual(PR_UNPAID, w.get_request_status(addr_c))
+        self.assertEqual([], w.get_sorted_requests(status=PR_PAID))
+        self.assert_statuses_are_consistent(w)
+        # an index built from the wallet file agrees
+        w.request_index.clear()
+        self.assert_statuses_are_consistent(w)
+        w.remove_payment_request(addr_c)
+        self.assertEqual(PR_UNKNOWN, w.get_request_status(addr_c))
+        self.assertEqual(2, len(w.get_unpaid_requests()))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_bulk_import_export(self, mock_save_db):
+        w1 = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                      path='if_this_exists_mocking_failed_648151893',
+                                      gap_limit=5,
+                                      config=self.config)['wallet']  # type: Abstract_Wallet
+        w2 = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                      path='if_this_exists_mocking_failed_648151894',
+                                      gap_limit=5,
+                                      config=self.config)['wallet']  # type: Abstract_Wallet
+        txC = Transaction(self.transactions["2c9aa33d9c8ec649f9bfb84af027a5414b760be5231fe9eca4a95b9eb3f8a017"])
+        addrs = w1.get_receiving_addresses()
+        for i, addr in enumerate(addrs):
+            w1.add_payment_request(w1.make_payment_request(addr, 1000 + i, f'request {i}', 3600))
+            w1.save_invoice(w1.make_payment_request(addr, 2000 + i, f'invoice {i}', 3600))
+        requests_path = os.path.join(self.electrum_path, 'requests.json')
+        invoices_path = os.path.join(self.electrum_path, 'invoices.json')
+        w1.export_requests(requests_path)
+        w1.export_invoices(invoices_path)
+        mock_save_db.reset_mock()
+        w2.import_requests(requests_path)
+        w2.import_invoices(invoices_path)
+        self.assertEqual(2, mock_save_db.call_count)  # one write per import
+        self.assertEqual(w1.receive_requests, w2.receive_requests)
+        self.assertEqual(w1.invoices, w2.invoices)
+        self.assertEqual('request 3', w2.get_label(addrs[3]))
+        self.assertEqual(len(addrs), len(w2.get_unpaid_requests()))
+        self.assertEqual(w1._get_relevant_invoice_keys_for_tx(txC), w2._get_relevant_invoice_keys_for_tx(txC))
+        self.assertEqual(1, len(w2._get_relevant_invoice_keys_for_tx(txC)))
+        # nothing is imported from a file with an invalid item
+        with open(requests_path, 'w', encoding='utf-8') as f:
+            f.write('[{"type": 0}]')
+        w2.clear_requests()
+        with self.assertRaises(Exception):
+            w2.import_requests(requests_path)
+        self.assertEqual({}, w2.receive_requests)
+
+
+class TestWalletFrozenCoins(TestCaseForTestnet):
+    transactions = TestWalletHistory_DoubleSpend.transactions
+
+    def setUp(self):
+        super().setUp()
+        # every unconfirmed coin counts as small
+        self.config = SimpleConfig({'electrum_path': self.electrum_path,
+                                    'unconf_utxo_freeze_threshold': 10 ** 10})
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_small_unconfirmed_coins(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txC = Transaction(self.transactions["2c9aa33d9c8ec649f9bfb84af027a5414b760be5231fe9eca4a95b9eb3f8a017"])
+        # without its parent, the input of txC is not known to be ours
+        w.add_transaction(txC)
+        coin_c, = w.get_utxos()
+        self.assertTrue(w.is_frozen_coin(coin_c))
+        self.assertEqual([], w.get_spendable_coins(None))
+        # the cached classification of txC is invalidated when its parent is added
+        w.add_transaction(txA)
+        coin_c, = [c for c in w.get_utxos() if c.prevout.txid.hex() == txC.txid()]
+        self.assertFalse(w.is_frozen_coin(coin_c))
+        self.assertEqual([coin_c.prevout], [c.prevout for c in w.get_spendable_coins(None)])
+        # manually frozen or unfrozen coins are not classified
+        w.set_frozen_state_of_coins([coin_c.prevout.to_str()], True)
+        self.assertTrue(w.is_frozen_coin(coin_c))
+        self.assertEqual([], w.get_spendable_coins(None))
+        # confirmed coins are fine
+        w.set_frozen_state_of_coins([coin_c.prevout.to_str()], False)
+        w.remove_transaction(txA.txid())
+        w.add_transaction(txC)
+        coin_c, = w.get_utxos()
+        w._frozen_coins.clear()
+        self.assertTrue(w.is_frozen_coin(coin_c))
+        w.db.put('stored_height', 1005)
+        w.add_verified_tx(txC.txid(), TxMinedInfo(height=1000, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        coin_c, = w.get_utxos()
+        self.assertFalse(w.is_frozen_coin(coin_c))
+
+
 class TestImportedWallet(TestCaseForTestnet):
     transactions = {
         # txn A funds addr1:
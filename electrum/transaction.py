@@ -39,6 +39,7 @@ from enum import IntEnum
 import itertools
 import binascii
 import copy
+import functools
 
 from . import ecc, bitcoin, constants, segwit_addr, bip32
 from .bip32 import BIP32Node
@@ -149,7 +150,7 @@ class TxOutput:
 
     @property
     def address(self) -> Optional[str]:
-        return get_address_from_output_script(self.scriptpubkey)  # TODO cache this?
+        return get_address_from_output_script(self.scriptpubkey)
 
     def get_ui_address_str(self) -> str:
         addr = self.address
@@ -183,6 +184,11 @@ class BIP143SharedTxDigestFields(NamedTuple):
     hashOutputs: str
 
 
+class LegacyTxDigestFields(NamedTuple):
+    txins: Sequence[str]  # each input serialized with an empty scriptSig
+    txouts: str           # all outputs serialized, including the count
+
+
 class TxOutpoint(NamedTuple):
     txid: bytes  # endianness same as hex string displayed; reverse of tx serialization order
     out_idx: int
@@ -523,6 +529,12 @@ def get_script_type_from_output_script(_bytes: bytes) -> Optional[str]:
     return None
 
 def get_address_from_output_script(_bytes: bytes, *, net=None) -> Optional[str]:
+    if net is None: net = constants.net
+    return _get_address_from_output_script(bytes(_bytes), net)
+
+
+@functools.lru_cache(maxsize=bitcoin.ADDRESS_CACHE_SIZE)
+def _get_address_from_output_script(_bytes: bytes, net) -> Optional[str]:
     try:
         decoded = [x for x in script_GetOp(_bytes)]
     except MalformedBitcoinScript:
@@ -583,6 +595,76 @@ def multisig_script(public_keys: Sequence[str], m: int) -> str:
     return construct_script([m, *public_keys, n, opcodes.OP_CHECKMULTISIG])
 
 
+def _var_int_size(i: int) -> int:
+    """Returns the byte size of var_int(i)."""
+    if i < 0xfd:
+        return 1
+    elif i <= 0xffff:
+        return 3
+    elif i <= 0xffffffff:
+        return 5
+    else:
+        return 9
+
+
+def _push_size(data_len: int) -> int:
+    """Returns the byte size of push_script(data), for data that is
+    not a "small integer" (i.e. data_len > 1).
+    """
+    if data_len < opcodes.OP_PUSHDATA1:
+        return 1 + data_len
+    elif data_len <= 0xff:
+        return 2 + data_len
+    elif data_len <= 0xffff:
+        return 3 + data_len
+    else:
+        return 5 + data_len
+
+
+# we guess that signatures will be 72 bytes long, see Transaction.get_siglist
+_ESTIMATED_SIG_SIZE = 72
+
+
+@functools.lru_cache(maxsize=None)
+def _estimated_txin_sizes_for_shape(txin_type: str, num_sig: int, num_pubkeys: int,
+                                    pubkey_size: int) -> Tuple[Optional[int], Optional[int]]:
+    """Returns the byte sizes of (scriptSig, witness) of a signed input,
+    as Transaction.input_script and Transaction.serialize_witness would
+    construct them with estimate_size=True.
+    `num_sig` and `num_pubkeys` are as in the txin (not clamped).
+    None means we cannot tell without serializing.
+    """
+    sig_push = _push_size(_ESTIMATED_SIG_SIZE)
+    num_sig_est = max(1, num_sig)
+    num_pubkeys_est = max(1, num_pubkeys)
+    if 1 <= num_sig <= num_pubkeys_est <= 15:
+        multisig_script_size = 3 + num_pubkeys_est * _push_size(pubkey_size)
+    else:
+        multisig_script_size = None  # multisig_script would raise
+    script_sig_size = None  # type: Optional[int]
+    witness_size = None  # type: Optional[int]
+    if txin_type == 'p2pk':
+        script_sig_size = sig_push
+        witness_size = 1
+    elif txin_type == 'p2pkh':
+        script_sig_size = sig_push + _push_size(pubkey_size)
+        witness_size = 1
+    elif txin_type == 'p2sh':
+        if multisig_script_size is not None:
+            script_sig_size = 1 + num_sig_est * sig_push + _push_size(multisig_script_size)
+        witness_size = 1
+    elif txin_type in ('p2wpkh', 'p2wpkh-p2sh'):
+        script_sig_size = 0 if txin_type == 'p2wpkh' else _push_size(22)
+        witness_size = 1 + (1 + _ESTIMATED_SIG_SIZE) + (1 + pubkey_size)
+    elif txin_type in ('p2wsh', 'p2wsh-p2sh'):
+        script_sig_size = 0 if txin_type == 'p2wsh' else _push_size(34)
+        if multisig_script_size is not None:
+            witness_size = (_var_int_size(2 + num_sig_est) + 1
+                            + num_sig_est * (1 + _ESTIMATED_SIG_SIZE)
+                            + _var_int_size(multisig_script_size) + multisig_script_size)
+    return script_sig_size, witness_size
+
+
 
 
 class Transaction:
@@ -607,6 +689,7 @@ class Transaction:
         self._version = 2
 
         self._cached_txid = None  # type: Optional[str]
+        self._cached_wtxid = None  # type: Optional[str]
 
     @property
     def locktime(self):
@@ -838,6 +921,12 @@ class Transaction:
                                           hashSequence=hashSequence,
                                           hashOutputs=hashOutputs)
 
+    def _calc_legacy_txdigest_fields(self) -> LegacyTxDigestFields:
+        txins = [self.serialize_input(txin, '') for txin in self.inputs()]
+        outputs = self.outputs()
+        txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+        return LegacyTxDigestFields(txins=txins, txouts=txouts)
+
     def is_segwit(self, *, guess_for_address=False):
         return any(txin.is_segwit(guess_for_address=guess_for_address)
                    for txin in self.inputs())
@@ -845,6 +934,7 @@ class Transaction:
     def invalidate_ser_cache(self):
         self._cached_network_ser = None
         self._cached_txid = None
+        self._cached_wtxid = None
 
     def serialize(self) -> str:
         if not self._cached_network_ser:
@@ -909,15 +999,17 @@ class Transaction:
         return self._cached_txid
 
     def wtxid(self) -> Optional[str]:
-        self.deserialize()
-        if not self.is_complete():
-            return None
-        try:
-            ser = self.serialize_to_network()
-        except UnknownTxinType:
-            # we might not know how to construct scriptSig/witness for some scripts
-            return None
-        return bh2u(sha256d(bfh(ser))[::-1])
+        if self._cached_wtxid is None:
+            self.deserialize()
+            if not self.is_complete():
+                return None
+            try:
+                ser = Transaction.serialize(self)
+            except UnknownTxinType:
+                # we might not know how to construct scriptSig/witness for some scripts
+                return None
+            self._cached_wtxid = bh2u(sha256d(bfh(ser))[::-1])
+        return self._cached_wtxid
 
     def add_info_from_wallet(self, wallet: 'Abstract_Wallet', **kwargs) -> None:
         return  # no-op
@@ -936,14 +1028,69 @@ class Transaction:
         weight = self.estimated_weight()
         return self.virtual_size_from_weight(weight)
 
+    @classmethod
+    def _estimated_txin_shape(cls, txin: 'PartialTxInput') -> Tuple[str, int, int, int]:
+        _type = txin.script_type
+        if _type in ('address', 'unknown'):
+            _type = cls.guess_txintype_from_address(txin.address)
+        try:
+            pubkey_size = len(txin.pubkeys[0])
+        except IndexError:
+            pubkey_size = 33  # guess it is compressed
+        return _type, txin.num_sig, len(txin.pubkeys), pubkey_size
+
+    @classmethod
+    def estimated_script_sig_size(cls, txin: TxInput) -> int:
+        """Return the byte size of input_script(txin, estimate_size=True),
+        without constructing the script.
+        """
+        if txin.script_sig is not None:
+            return len(txin.script_sig)
+        if txin.is_coinbase_input():
+            return 0
+        if isinstance(txin, PartialTxInput):
+            if txin.is_p2sh_segwit() and txin.redeem_script:
+                return _push_size(len(txin.redeem_script))
+            if txin.is_native_segwit():
+                return 0
+            size, _ = _estimated_txin_sizes_for_shape(*cls._estimated_txin_shape(txin))
+            if size is not None:
+                return size
+        return len(cls.input_script(txin, estimate_size=True)) // 2
+
+    @classmethod
+    def estimated_txin_witness_size(cls, txin: TxInput) -> int:
+        """Return the byte size of serialize_witness(txin, estimate_size=True),
+        without constructing the witness.
+        """
+        if txin.witness is not None:
+            return len(txin.witness)
+        if txin.is_coinbase_input():
+            return 0
+        if isinstance(txin, PartialTxInput):
+            if not txin.is_segwit():
+                return 1
+            if txin.witness_sizehint is not None:
+                return txin.witness_sizehint
+            _, size = _estimated_txin_sizes_for_shape(*cls._estimated_txin_shape(txin))
+            if size is not None:
+                return size
+        return len(cls.serialize_witness(txin, estimate_size=True)) // 2
+
+    @classmethod
+    def estimated_txin_size(cls, txin: TxInput) -> int:
+        """Return an estimate of the serialized input size in bytes, without witness."""
+        script_sig_size = cls.estimated_script_sig_size(txin)
+        # prevout + script len + script + sequence
+        return 36 + _var_int_size(script_sig_size) + script_sig_size + 4
+
     @classmethod
     def estimated_input_weight(cls, txin, is_segwit_tx):
         '''Return an estimate of serialized input weight in weight units.'''
-        script = cls.input_script(txin, estimate_size=True)
-        input_size = len(cls.serialize_input(txin, script)) // 2
+        input_size = cls.estimated_txin_size(txin)
 
         if txin.is_segwit(guess_for_address=True):
-            witness_size = len(cls.serialize_witness(txin, estimate_size=True)) // 2
+            witness_size = cls.estimated_txin_witness_size(txin)
         else:
             witness_size = 1 if is_segwit_tx else 0
 
@@ -972,20 +1119,40 @@ class Transaction:
         """Converts feerate from sat/kw to sat/vbyte."""
         return feerate_kw * 4 / 1000
 
+    def _estimated_sizes(self) -> Tuple[int, int]:
+        """Return the byte sizes of (base tx, witness incl. marker and flag)
+        as serialize_to_network(estimate_size=True) would create them,
+        but without serializing the tx.
+        """
+        self.deserialize()
+        inputs = self.inputs()
+        outputs = self.outputs()
+        base_size = 4 + _var_int_size(len(inputs))  # version, num inputs
+        base_size += sum(self.estimated_txin_size(txin) for txin in inputs)
+        base_size += _var_int_size(len(outputs))
+        base_size += sum(8 + _var_int_size(len(o.scriptpubkey)) + len(o.scriptpubkey) for o in outputs)
+        base_size += 4  # locktime
+        if not self.is_segwit(guess_for_address=True):
+            return base_size, 0
+        witness_size = sum(self.estimated_txin_witness_size(txin) for txin in inputs)
+        return base_size, witness_size + 2  # include marker and flag
+
     def estimated_total_size(self):
         """Return an estimated total transaction size in bytes."""
         if not self.is_complete() or self._cached_network_ser is None:
-            return len(self.serialize_to_network(estimate_size=True)) // 2
+            return sum(self._estimated_sizes())
         else:
             return len(self._cached_network_ser) // 2  # ASCII hex string
 
     def estimated_witness_size(self):
         """Return an estimate of witness size in bytes."""
         estimate = not self.is_complete()
-        if not self.is_segwit(guess_for_address=estimate):
+        if estimate:
+            return self._estimated_sizes()[1]
+        if not self.is_segwit():
             return 0
         inputs = self.inputs()
-        witness = ''.join(self.serialize_witness(x, estimate_size=estimate) for x in inputs)
+        witness = ''.join(self.serialize_witness(x) for x in inputs)
         witness_size = len(witness) // 2 + 2  # include marker and flag
         return witness_size
 
@@ -995,6 +1162,9 @@ class Transaction:
 
     def estimated_weight(self):
         """Return an estimate of transaction weight."""
+        if not self.is_complete():
+            base_tx_size, witness_size = self._estimated_sizes()
+            return 4 * base_tx_size + witness_size
         total_tx_size = self.estimated_total_size()
         base_tx_size = self.estimated_base_size()
         return 3 * base_tx_size + total_tx_size
@@ -1906,7 +2076,8 @@ class PartialTransaction(Transaction):
             return None
 
     def serialize_preimage(self, txin_index: int, *,
-                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> str:
+                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                           legacy_txdigest_fields: LegacyTxDigestFields = None) -> str:
         nVersion = int_to_hex(self.version, 4)
         nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
@@ -1940,16 +2111,29 @@ class PartialTransaction(Transaction):
             nSequence = int_to_hex(txin.nsequence, 4)
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
         else:
-            txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, preimage_script if txin_index==k else '')
-                                                   for k, txin in enumerate(inputs))
-            txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+            # note: all inputs but the one being signed are serialized the same way
+            #       for every txin_index, so they can be shared between calls
+            if legacy_txdigest_fields is None:
+                legacy_txdigest_fields = self._calc_legacy_txdigest_fields()
+            other_txins = legacy_txdigest_fields.txins
+            txins = (var_int(len(inputs))
+                     + ''.join(other_txins[:txin_index])
+                     + self.serialize_input(txin, preimage_script)
+                     + ''.join(other_txins[txin_index+1:]))
+            txouts = legacy_txdigest_fields.txouts
             preimage = nVersion + txins + txouts + nLocktime + nHashType
         return preimage
 
     def sign(self, keypairs) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
-        bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
-        for i, txin in enumerate(self.inputs()):
+        inputs = self.inputs()
+        bip143_shared_txdigest_fields = None
+        if any(txin.is_segwit() for txin in inputs):
+            bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        legacy_txdigest_fields = None
+        if not all(txin.is_segwit() for txin in inputs):
+            legacy_txdigest_fields = self._calc_legacy_txdigest_fields()
+        for i, txin in enumerate(inputs):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             for pubkey in pubkeys:
                 if txin.is_complete():
@@ -1958,19 +2142,23 @@ class PartialTransaction(Transaction):
                     continue
                 _logger.info(f"adding signature for {pubkey}")
                 sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)
+                sig = self.sign_txin(i, sec,
+                                     bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                                     legacy_txdigest_fields=legacy_txdigest_fields)
                 self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None) -> str:
+    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None,
+                  legacy_txdigest_fields=None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
         sighash_type = sighash.to_bytes(length=1, byteorder="big").hex()
         pre_hash = sha256d(bfh(self.serialize_preimage(txin_index,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)))
+                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                                                       legacy_txdigest_fields=legacy_txdigest_fields)))
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = bh2u(sig) + sighash_type
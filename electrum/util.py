@@ -21,10 +21,12 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import binascii
+import bisect
 import os, sys, re, json
 from collections import defaultdict, OrderedDict
+from collections.abc import Mapping, MutableMapping, KeysView, ValuesView, ItemsView
 from typing import (NamedTuple, Union, TYPE_CHECKING, Tuple, Optional, Callable, Any,
-                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set)
+                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set, Iterator)
 from datetime import datetime
 import decimal
 from decimal import Decimal
@@ -46,19 +48,23 @@ from ipaddress import IPv4Address, IPv6Address
 import random
 import secrets
 import functools
+import weakref
 from abc import abstractmethod, ABC
 
 import attr
-import aiohttp
-from aiohttp_socks import ProxyConnector, ProxyType
 import aiorpcx
 import certifi
-import dns.resolver
 
 from .i18n import _
 from .logging import get_logger, Logger
+from . import metrics
+from .metrics import registry as metrics_registry
+
+# note: aiohttp and dnspython are only imported where needed, as they are slow
+#       to import and not needed e.g. to forward a command to the daemon.
 
 if TYPE_CHECKING:
+    import aiohttp
     from .network import Network
     from .interface import Interface
     from .simple_config import SimpleConfig
@@ -435,6 +441,8 @@ def profiler(func):
         o = func(*args, **kw_args)
         t = time.time() - t0
         _profiler_logger.debug(f"{name} {t:,.4f}")
+        if metrics_registry.enabled:
+            metrics_registry.record_profiler(name, t)
         return o
     return lambda *args, **kw_args: do_profile(args, kw_args)
 
@@ -1144,6 +1152,101 @@ def write_json_file(path, data):
         raise FileExportFailed(e)
 
 
+_JSON_ARRAY_CHUNK_SIZE = 1 << 16
+
+
+def read_json_array_file(path) -> Iterator:
+    """Yields the items of the JSON array in a file, one at a time,
+    reading and parsing the file incrementally.
+    """
+    decoder = json.JSONDecoder()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            buf = ''
+            pos = 0
+            eof = False
+
+            def fill():
+                nonlocal buf, pos, eof
+                chunk = f.read(_JSON_ARRAY_CHUNK_SIZE)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+
+            def next_char() -> Optional[str]:
+                # skips whitespace, returns the next char without consuming it
+                nonlocal pos
+                while True:
+                    while pos < len(buf) and buf[pos].isspace():
+                        pos += 1
+                    if pos < len(buf):
+                        return buf[pos]
+                    if eof:
+                        return None
+                    fill()
+
+            if next_char() != '[':
+                raise ValueError('expected a JSON array')
+            pos += 1
+            expect_comma = False
+            after_comma = False
+            while True:
+                c = next_char()
+                if c == ']' and not after_comma:
+                    pos += 1
+                    break
+                if c is None:
+                    raise ValueError('unterminated JSON array')
+                if expect_comma:
+                    if c != ',':
+                        raise ValueError('expected a comma')
+                    pos += 1
+                    expect_comma = False
+                    after_comma = True
+                    continue
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()
+                    continue
+                if end == len(buf) and not eof:
+                    fill()  # the item might continue, e.g. a number
+                    continue
+                pos = end
+                expect_comma = True
+                after_comma = False
+                yield item
+            if next_char() is not None:
+                raise ValueError('extra data after JSON array')
+    except ValueError:
+        _logger.exception('')
+        raise FileImportFailed(_("Invalid JSON code."))
+    except OSError as e:
+        _logger.exception('')
+        raise FileImportFailed(e)
+
+
+def write_json_array_file(path, items: Iterable):
+    """Writes items as a JSON array, one item per line,
+    encoding one item at a time.
+    """
+    encoder = MyEncoder(sort_keys=True)
+    try:
+        with open(path, 'w+', encoding='utf-8') as f:
+            f.write('[')
+            sep = '\n'
+            for item in items:
+                f.write(sep)
+                f.write(encoder.encode(item))
+                sep = ',\n'
+            f.write('\n]\n')
+    except (IOError, os.error) as e:
+        _logger.exception('')
+        raise FileExportFailed(e)
+
+
 def make_dir(path, allow_symlink=True):
     """Make directory if it does not yet exist."""
     if not os.path.exists(path):
@@ -1202,6 +1305,8 @@ class TxMinedInfo(NamedTuple):
 
 
 def make_aiohttp_session(proxy: Optional[dict], headers=None, timeout=None):
+    import aiohttp
+    from aiohttp_socks import ProxyConnector, ProxyType
     if headers is None:
         headers = {'User-Agent': 'Electrum'}
     if timeout is None:
@@ -1305,8 +1410,12 @@ class NetworkJobOnDefaultServer(Logger, ABC):
     interface. Every time the main interface changes, the job is
     restarted, and some of its internals are reset.
     """
+    # all running jobs, for metrics
+    _instances = weakref.WeakSet()  # type: weakref.WeakSet[NetworkJobOnDefaultServer]
+
     def __init__(self, network: 'Network'):
         Logger.__init__(self)
+        NetworkJobOnDefaultServer._instances.add(self)
         asyncio.set_event_loop(network.asyncio_loop)
         self.network = network
         self.interface = None  # type: Interface
@@ -1345,6 +1454,7 @@ class NetworkJobOnDefaultServer(Logger, ABC):
     async def stop(self, *, full_shutdown: bool = True):
         if full_shutdown:
             unregister_callback(self._restart)
+            NetworkJobOnDefaultServer._instances.discard(self)
         await self.taskgroup.cancel_remaining()
 
     @log_exceptions
@@ -1362,6 +1472,13 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         self._requests_sent = 0
         self._requests_answered = 0
 
+    @classmethod
+    def get_request_counters(cls) -> Sequence[Tuple[str, str, int, int]]:
+        """(job class, diagnostic name, requests sent, requests answered) of each job.
+        Counters are reset when the job restarts."""
+        return [(type(job).__name__, job.diagnostic_name(), *job.num_requests_sent_and_answered())
+                for job in list(cls._instances)]
+
     def num_requests_sent_and_answered(self) -> Tuple[int, int]:
         return self._requests_sent, self._requests_answered
 
@@ -1395,66 +1512,233 @@ def create_and_start_event_loop() -> Tuple[asyncio.AbstractEventLoop,
     return loop, stopping_fut, loop_thread
 
 
-class OrderedDictWithIndex(OrderedDict):
-    """An OrderedDict that keeps track of the positions of keys.
+class _IndexBlock:
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys: list):
+        self.keys = keys
+        self.index = 0  # position of the block in OrderedDictWithIndex._blocks
+
+
+class _IndexKeysView(KeysView):
+    def __reversed__(self):
+        return reversed(self._mapping)
+
+
+class _IndexValuesView(ValuesView):
+    def __reversed__(self):
+        for key in reversed(self._mapping):
+            yield self._mapping[key]
+
+
+class _IndexItemsView(ItemsView):
+    def __reversed__(self):
+        for key in reversed(self._mapping):
+            yield key, self._mapping[key]
 
-    Note: very inefficient to modify contents, except to add new items.
+
+class OrderedDictWithIndex(MutableMapping):
+    """An ordered dict that keeps track of the positions of keys.
+
+    Keys are kept in order in blocks of bounded size, with a Fenwick tree
+    over the block sizes (a counted B-tree of height two). Looking up the
+    position of a key or the key at a position, and inserting or removing
+    a key anywhere, take O(log n) plus a scan of one block.
     """
 
-    def __init__(self):
-        super().__init__()
-        self._key_to_pos = {}
-        self._pos_to_key = {}
+    _MAX_BLOCK_SIZE = 256
+
+    def __init__(self, items=()):
+        self._values = {}
+        self._blocks = []  # type: List[_IndexBlock]
+        self._block_of = {}  # type: Dict[Any, _IndexBlock]
+        self._tree = [0]  # Fenwick tree over the block sizes, 1-based
+        self.update(items)
+
+    def _rebuild_tree(self):
+        n = len(self._blocks)
+        tree = [0] * (n + 1)
+        for i, block in enumerate(self._blocks):
+            block.index = i
+            tree[i + 1] += len(block.keys)
+            j = (i + 1) + ((i + 1) & -(i + 1))
+            if j <= n:
+                tree[j] += tree[i + 1]
+        self._tree = tree
+
+    def _tree_add(self, i, delta):
+        tree = self._tree
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, i):
+        """Number of keys in the blocks before block i."""
+        tree = self._tree
+        s = 0
+        while i > 0:
+            s += tree[i]
+            i -= i & -i
+        return s
 
-    def _recalc_index(self):
-        self._key_to_pos = {key: pos for (pos, key) in enumerate(self.keys())}
-        self._pos_to_key = {pos: key for (pos, key) in enumerate(self.keys())}
+    def _tree_find(self, pos):
+        """Returns the block containing position pos, and the offset in it."""
+        tree = self._tree
+        n = len(tree) - 1
+        i = 0
+        step = 1 << n.bit_length()
+        while step:
+            j = i + step
+            if j <= n and tree[j] <= pos:
+                i = j
+                pos -= tree[j]
+            step >>= 1
+        return self._blocks[i], pos
+
+    def _insert_key(self, pos, key):
+        if not self._blocks:
+            self._blocks.append(_IndexBlock([]))
+            self._rebuild_tree()
+        if pos >= len(self._block_of):
+            block = self._blocks[-1]
+            block.keys.append(key)
+        else:
+            block, offset = self._tree_find(pos)
+            block.keys.insert(offset, key)
+        self._block_of[key] = block
+        self._tree_add(block.index, 1)
+        if len(block.keys) > self._MAX_BLOCK_SIZE:
+            half = len(block.keys) // 2
+            new_block = _IndexBlock(block.keys[half:])
+            del block.keys[half:]
+            for k in new_block.keys:
+                self._block_of[k] = new_block
+            self._blocks.insert(block.index + 1, new_block)
+            self._rebuild_tree()
+
+    def _remove_key(self, key):
+        block = self._block_of.pop(key)
+        block.keys.remove(key)
+        if block.keys:
+            self._tree_add(block.index, -1)
+        else:
+            del self._blocks[block.index]
+            self._rebuild_tree()
 
     def pos_from_key(self, key):
-        return self._key_to_pos[key]
+        block = self._block_of[key]
+        return self._tree_prefix(block.index) + block.keys.index(key)
+
+    def key_from_pos(self, pos):
+        n = len(self._values)
+        if pos < 0:
+            pos += n
+        if not 0 <= pos < n:
+            raise IndexError(pos)
+        block, offset = self._tree_find(pos)
+        return block.keys[offset]
 
     def value_from_pos(self, pos):
-        key = self._pos_to_key[pos]
-        return self[key]
+        return self._values[self.key_from_pos(pos)]
+
+    def insert(self, pos, key, value):
+        """Inserts key at position pos, or moves it there if present."""
+        if key in self._values:
+            self._remove_key(key)
+        self._insert_key(max(0, pos), key)
+        self._values[key] = value
+
+    def move_to_end(self, key, last=True):
+        if key not in self._values:
+            raise KeyError(key)
+        self._remove_key(key)
+        self._insert_key(len(self._values) if last else 0, key)
+
+    def popitem(self, last=True):
+        if not self._values:
+            raise KeyError('dictionary is empty')
+        key = self.key_from_pos(-1 if last else 0)
+        return key, self.pop(key)
 
-    def popitem(self, *args, **kwargs):
-        ret = super().popitem(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def clear(self):
+        self._values.clear()
+        self._blocks.clear()
+        self._block_of.clear()
+        self._tree = [0]
 
-    def move_to_end(self, *args, **kwargs):
-        ret = super().move_to_end(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def copy(self):
+        return self.__class__(self.items())
 
-    def clear(self):
-        ret = super().clear()
-        self._recalc_index()
-        return ret
+    def __getitem__(self, key):
+        return self._values[key]
 
-    def pop(self, *args, **kwargs):
-        ret = super().pop(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def __setitem__(self, key, value):
+        if key not in self._values:
+            self._insert_key(len(self._values), key)
+        self._values[key] = value
 
-    def update(self, *args, **kwargs):
-        ret = super().update(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def __delitem__(self, key):
+        del self._values[key]
+        self._remove_key(key)
 
-    def __delitem__(self, *args, **kwargs):
-        ret = super().__delitem__(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def __contains__(self, key):
+        return key in self._values
 
-    def __setitem__(self, key, *args, **kwargs):
-        is_new_key = key not in self
-        ret = super().__setitem__(key, *args, **kwargs)
-        if is_new_key:
-            pos = len(self) - 1
-            self._key_to_pos[key] = pos
-            self._pos_to_key[pos] = key
-        return ret
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block.keys
+
+    def __reversed__(self):
+        for block in reversed(self._blocks):
+            yield from reversed(block.keys)
+
+    def keys(self):
+        return _IndexKeysView(self)
+
+    def values(self):
+        return _IndexValuesView(self)
+
+    def items(self):
+        return _IndexItemsView(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (OrderedDictWithIndex, OrderedDict)):
+            return len(self) == len(other) and all(
+                k1 == k2 and v1 == v2 for (k1, v1), (k2, v2) in zip(self.items(), other.items()))
+        if isinstance(other, Mapping):
+            return self._values == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self.items())!r})"
+
+
+def longest_increasing_subsequence(seq: Sequence) -> List[int]:
+    """Returns the indices of a longest strictly increasing subsequence of seq."""
+    tails = []  # tails[k]: index of the smallest tail of an increasing subsequence of length k+1
+    tail_values = []
+    prev = [None] * len(seq)
+    for i, x in enumerate(seq):
+        k = bisect.bisect_left(tail_values, x)
+        if k > 0:
+            prev[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(x)
+        else:
+            tails[k] = i
+            tail_values[k] = x
+    out = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        out.append(i)
+        i = prev[i]
+    out.reverse()
+    return out
 
 
 def multisig_type(wallet_type):
@@ -1499,6 +1783,7 @@ def list_enabled_bits(x: int) -> Sequence[int]:
 
 
 def resolve_dns_srv(host: str):
+    import dns.resolver
     srv_records = dns.resolver.resolve(host, 'SRV')
     # priority: prefer lower
     # weight: tie breaker; prefer higher
@@ -1550,6 +1835,9 @@ class CallbackManager:
             assert self.asyncio_loop.is_running(), "event loop not running"
         with self.callback_lock:
             callbacks = self.callbacks[event][:]
+        if metrics_registry.enabled:
+            self._trigger_callbacks_with_metrics(callbacks, event, *args)
+            return
         for callback in callbacks:
             # FIXME: if callback throws, we will lose the traceback
             if asyncio.iscoroutinefunction(callback):
@@ -1557,6 +1845,16 @@ class CallbackManager:
             else:
                 self.asyncio_loop.call_soon_threadsafe(callback, event, *args)
 
+    def _trigger_callbacks_with_metrics(self, callbacks, event, *args):
+        # same as above, but records the fan-out of the event and how long each callback takes
+        metrics_registry.record_trigger(event, len(callbacks))
+        for callback in callbacks:
+            if asyncio.iscoroutinefunction(callback):
+                coro = metrics_registry.timed_coroutine(event, metrics.callback_name(callback), callback(event, *args))
+                asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop)
+            else:
+                self.asyncio_loop.call_soon_threadsafe(metrics_registry.timed_callback(event, callback), event, *args)
+
 
 callback_mgr = CallbackManager()
 trigger_callback = callback_mgr.trigger_callback
@@ -1660,7 +1958,7 @@ class MySocksProxy(aiorpcx.SOCKSProxy):
 
 class JsonRPCClient:
 
-    def __init__(self, session: aiohttp.ClientSession, url: str):
+    def __init__(self, session: 'aiohttp.ClientSession', url: str):
         self.session = session
         self.url = url
         self._id = 0
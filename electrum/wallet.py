@@ -40,7 +40,7 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterator
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -71,17 +71,19 @@ from . import transaction, bitcoin, coinchooser, paymentrequest, ecc, bip32
 from .transaction import (Transaction, TxInput, UnknownTxinType, TxOutput,
                           PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint)
 from .plugin import run_hook
-from .address_synchronizer import (AddressSynchronizer, TX_HEIGHT_LOCAL,
+from .address_synchronizer import (AddressSynchronizer, TX_HEIGHT_LOCAL, HistoryItem,
                                    TX_HEIGHT_UNCONF_PARENT, TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_FUTURE)
 from .invoices import Invoice, OnchainInvoice, LNInvoice
 from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED, PR_UNCONFIRMED, PR_TYPE_ONCHAIN, PR_TYPE_LN
 from .contacts import Contacts
+from .cost_basis import CostBasisLedger, FifoPool, FifoCheckpoint
+from .request_index import RequestStatusIndex
 from .interface import NetworkException
 from .mnemonic import Mnemonic
 from .logging import get_logger
 from .lnworker import LNWallet
 from .paymentrequest import PaymentRequest
-from .util import read_json_file, write_json_file, UserFacingException
+from .util import read_json_file, write_json_file, read_json_array_file, write_json_array_file, UserFacingException
 
 if TYPE_CHECKING:
     from .network import Network
@@ -282,6 +284,10 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         assert self.config is not None, "config must not be None"
         self.db = db
         self.storage = storage
+        self.cost_basis = CostBasisLedger(self)
+        self.request_index = RequestStatusIndex(self)
+        # txid -> whether the tx has an is_mine input. See _is_coin_small_and_unconfirmed
+        self._txs_with_mine_inputs = {}  # type: Dict[str, bool]
         # load addresses needs to be called before constructor for sanity checks
         db.load_addresses(self.wallet_type)
         self.keystore = None  # type: Optional[KeyStore]  # will be set by load_keystore
@@ -306,7 +312,6 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         if self.db.get('wallet_type') is None:
             self.db.put('wallet_type', self.wallet_type)
         self.contacts = Contacts(self.db)
-        self._coin_price_cache = {}
 
         self.lnworker = None
 
@@ -385,6 +390,8 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     def clear_history(self):
         super().clear_history()
+        self.cost_basis.clear()
+        self.request_index.mark_all_dirty()
         self.save_db()
 
     def start_network(self, network):
@@ -508,6 +515,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             except:
                 # garbage. not resetting, but not saving either
                 return False
+        self.cost_basis.invalidate(txid)
         if reset:
             d = self.fiat_value.get(ccy, {})
             if d and txid in d:
@@ -735,8 +743,13 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         return balance
 
     def get_onchain_history(self, *, domain=None):
-        monotonic_timestamp = 0
-        for hist_item in self.get_history(domain=domain):
+        yield from self._get_onchain_history_items(self.get_history(domain=domain))
+
+    def _get_onchain_history_items(self, history: Sequence[HistoryItem], start: int = 0) -> Iterator[dict]:
+        """Yields the items of get_onchain_history, from position start of history."""
+        monotonic_timestamp = max((hist_item.tx_mined_status.timestamp or 999_999_999_999
+                                   for hist_item in history[:start]), default=0)
+        for hist_item in history[start:]:
             monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or 999_999_999_999))
             yield {
                 'txid': hist_item.txid,
@@ -798,12 +811,24 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         self.invoices[key] = invoice
         self.save_db()
 
+    def save_invoices(self, invoices: Sequence[Invoice]) -> None:
+        """Saves many invoices at once, with a single write to disk."""
+        keys = [self.get_key_for_outgoing_invoice(invoice) for invoice in invoices]
+        with self.lock, self.transaction_lock:
+            for key, invoice in zip(keys, invoices):
+                if not invoice.is_lightning():
+                    for txout in invoice.outputs:
+                        self._invoices_from_scriptpubkey_map[txout.scriptpubkey].add(key)
+                self.invoices[key] = invoice
+        self.save_db()
+
     def clear_invoices(self):
         self.invoices.clear()
         self.save_db()
 
     def clear_requests(self):
         self.receive_requests.clear()
+        self.request_index.clear()
         self.save_db()
 
     def get_invoices(self):
@@ -819,22 +844,20 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         return self.invoices.get(key)
 
     def import_requests(self, path):
-        data = read_json_file(path)
-        for x in data:
-            req = Invoice.from_json(x)
-            self.add_payment_request(req)
+        # all requests are validated before any is added
+        reqs = [Invoice.from_json(x) for x in read_json_array_file(path)]
+        self.add_payment_requests(reqs)
 
     def export_requests(self, path):
-        write_json_file(path, list(self.receive_requests.values()))
+        write_json_array_file(path, list(self.receive_requests.values()))
 
     def import_invoices(self, path):
-        data = read_json_file(path)
-        for x in data:
-            invoice = Invoice.from_json(x)
-            self.save_invoice(invoice)
+        # all invoices are validated before any is saved
+        invoices = [Invoice.from_json(x) for x in read_json_array_file(path)]
+        self.save_invoices(invoices)
 
     def export_invoices(self, path):
-        write_json_file(path, list(self.invoices.values()))
+        write_json_array_file(path, list(self.invoices.values()))
 
     def _get_relevant_invoice_keys_for_tx(self, tx: Transaction) -> Set[str]:
         relevant_invoice_keys = set()
@@ -909,6 +932,10 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
     def add_transaction(self, tx, *, allow_unrelated=False):
         is_known = bool(self.db.get_transaction(tx.txid()))
         tx_was_added = super().add_transaction(tx, allow_unrelated=allow_unrelated)
+        if tx_was_added:
+            self._invalidate_txs_with_mine_inputs(tx.txid())
+            self.cost_basis.invalidate(tx.txid())
+            self.request_index.mark_dirty(self.db.get_txo_addresses(tx.txid()))
         if tx_was_added and not is_known:
             self._maybe_set_tx_label_based_on_invoices(tx)
             if self.lnworker:
@@ -917,7 +944,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     @profiler
     def get_full_history(self, fx=None, *, onchain_domain=None, include_lightning=True):
-        transactions_tmp = OrderedDictWithIndex()
+        transactions_tmp = {}
         # add on-chain txns
         onchain_history = self.get_onchain_history(domain=onchain_domain)
         for tx_item in onchain_history:
@@ -953,12 +980,13 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             transactions_tmp[key] = tx_item
         # sort on-chain and LN stuff into new dict, by timestamp
         # (we rely on this being a *stable* sort)
-        transactions = OrderedDictWithIndex()
-        for k, v in sorted(list(transactions_tmp.items()),
-                           key=lambda x: x[1].get('monotonic_timestamp') or x[1].get('timestamp') or float('inf')):
-            transactions[k] = v
+        transactions = OrderedDictWithIndex(
+            sorted(transactions_tmp.items(),
+                   key=lambda x: x[1].get('monotonic_timestamp') or x[1].get('timestamp') or float('inf')))
         now = time.time()
         balance = 0
+        # with the fifo method, on-chain and lightning payments share the same pool of lots
+        fifo = self.get_fifo_pool(fx)
         for item in transactions.values():
             # add on-chain and lightning values
             value = Decimal(0)
@@ -973,39 +1001,74 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             if fx and fx.is_enabled() and fx.get_history_config():
                 txid = item.get('txid')
                 if not item.get('lightning') and txid:
-                    fiat_fields = self.get_tx_item_fiat(tx_hash=txid, amount_sat=value, fx=fx, tx_fee=item['fee_sat'])
+                    fiat_fields = self.get_tx_item_fiat(tx_hash=txid, amount_sat=value, fx=fx, tx_fee=item['fee_sat'], fifo=fifo)
                     item.update(fiat_fields)
                 else:
                     timestamp = item['timestamp'] or now
                     fiat_value = value / Decimal(bitcoin.COIN) * fx.timestamp_rate(timestamp)
                     item['fiat_value'] = Fiat(fiat_value, fx.ccy)
                     item['fiat_default'] = True
+                    acquisition_price = fifo.apply(value, fiat_value) if fifo else None
+                    if acquisition_price is not None:
+                        item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
+                        item['capital_gain'] = Fiat(-fiat_value - acquisition_price, fx.ccy)
         return transactions
 
-    @profiler
-    def get_detailed_history(
+    def get_detailed_history_items(
             self,
             from_timestamp=None,
             to_timestamp=None,
             fx=None,
             show_addresses=False,
             from_height=None,
-            to_height=None):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+            to_height=None,
+            after_txid: str = None,
+            fifo: FifoPool = None) -> Iterator[dict]:
+        """Yields the transactions of get_detailed_history, oldest first.
+        If after_txid is given, starts after that transaction.
+        Details are only computed for the yielded items.
+        With the 'fifo' method, all transactions are applied to fifo (created if not given).
+        """
         if (from_timestamp is not None or to_timestamp is not None) \
                 and (from_height is not None or to_height is not None):
             raise Exception('timestamp and block height based filtering cannot be used together')
-
         show_fiat = fx and fx.is_enabled() and fx.get_history_config()
-        out = []
-        income = 0
-        expenditures = 0
-        capital_gains = Decimal(0)
-        fiat_income = Decimal(0)
-        fiat_expenditures = Decimal(0)
+        # note: with the fifo method, the pool of lots only holds on-chain coins here
+        if fifo is None and show_fiat:
+            fifo = self.get_fifo_pool(fx)
+        generation = self.cost_basis.get_generation()
+        history = self.get_history()
+        start = 0
+        checkpoint = None  # type: Optional[FifoCheckpoint]
+        if after_txid is not None:
+            positions = {hist_item.txid: i for i, hist_item in enumerate(history)}
+            if after_txid not in positions:
+                raise Exception(f'transaction not in history: {after_txid}')
+            start = positions[after_txid] + 1
+            if fifo is not None:
+                # continue with the pool where the previous page stopped
+                checkpoint = self.cost_basis.get_fifo_checkpoint(fx.ccy, after_txid)
+                if checkpoint is not None and positions.get(checkpoint.txid, -1) >= start:
+                    start = positions[checkpoint.txid]
+                    fifo.restore(checkpoint.pool)
+                else:
+                    checkpoint = None
+                    for hist_item in history[:start]:
+                        self.get_tx_item_fiat(
+                            tx_hash=hist_item.txid, amount_sat=hist_item.delta, fx=fx, tx_fee=hist_item.fee, fifo=fifo)
         now = time.time()
-        for item in self.get_onchain_history():
+        last_txid = after_txid
+        for item in self._get_onchain_history_items(history, start):
+            tx_hash = item['txid']
+            fiat_fields = None
+            if checkpoint is not None:
+                # already applied to the pool
+                fiat_fields = checkpoint.fiat_fields
+                checkpoint = None
+            elif fifo is not None:
+                # all transactions are applied to the pool, including the ones not shown
+                fiat_fields = self.get_tx_item_fiat(
+                    tx_hash=tx_hash, amount_sat=item['bc_value'].value, fx=fx, tx_fee=item['fee_sat'], fifo=fifo)
             timestamp = item['timestamp']
             if from_timestamp and (timestamp or now) < from_timestamp:
                 continue
@@ -1016,7 +1079,6 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                 continue
             if to_height is not None and (height >= to_height or height <= 0):
                 continue
-            tx_hash = item['txid']
             tx = self.db.get_transaction(tx_hash)
             tx_fee = item['fee_sat']
             item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
@@ -1024,19 +1086,63 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                 item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
                 item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
                                            tx.outputs()))
+            # fiat computations
+            if show_fiat:
+                value = item['bc_value'].value
+                if fiat_fields is None:
+                    fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
+                item.update(fiat_fields)
+            try:
+                yield item
+            except GeneratorExit:
+                # the consumer stopped after last_txid (e.g. at the end of a page)
+                if fifo is not None and last_txid is not None:
+                    self.cost_basis.add_fifo_checkpoint(
+                        fx.ccy, last_txid, FifoCheckpoint(tx_hash, fiat_fields, fifo.copy()), generation=generation)
+                raise
+            last_txid = tx_hash
+
+    @profiler
+    def get_detailed_history(
+            self,
+            from_timestamp=None,
+            to_timestamp=None,
+            fx=None,
+            show_addresses=False,
+            from_height=None,
+            to_height=None):
+        # History with capital gains, using utxo pricing, or a pool of lots with the fifo method
+        show_fiat = fx and fx.is_enabled() and fx.get_history_config()
+        fifo = self.get_fifo_pool(fx) if show_fiat else None
+        holdings_cost = {}  # with fifo: acquisition price of the lots held at the start and at the end
+        out = []
+        income = 0
+        expenditures = 0
+        capital_gains = Decimal(0)
+        fiat_income = Decimal(0)
+        fiat_expenditures = Decimal(0)
+        for item in self.get_detailed_history_items(
+                from_timestamp=from_timestamp,
+                to_timestamp=to_timestamp,
+                fx=fx,
+                show_addresses=show_addresses,
+                from_height=from_height,
+                to_height=to_height,
+                fifo=fifo):
+            if fifo is not None:
+                # note: items are generated lazily, so the pool is right after this item
+                holdings_cost.setdefault('begin', fifo.holdings_cost_before)
+                holdings_cost['end'] = fifo.holdings_cost
             # fixme: use in and out values
             value = item['bc_value'].value
             if value < 0:
                 expenditures += -value
             else:
                 income += value
-            # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
+                fiat_value = item['fiat_value'].value
                 if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
+                    capital_gains += item['capital_gain'].value
                     fiat_expenditures += -fiat_value
                 else:
                     fiat_income += fiat_value
@@ -1077,7 +1183,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                 confirmed_spending_only=True,
                 nonlocal_only=True)
 
-            def summary_point(timestamp, height, balance, coins):
+            def summary_point(timestamp, height, balance, coins, fifo_holdings_cost):
                 date = timestamp_to_datetime(timestamp)
                 out = {
                     'date': date,
@@ -1085,7 +1191,10 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                     'BTC_balance': Satoshis(balance),
                 }
                 if show_fiat:
-                    ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
+                    if fifo_holdings_cost is not None:
+                        ap = fifo_holdings_cost
+                    else:
+                        ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
                     lp = self.liquidation_price(coins, fx.timestamp_rate, timestamp)
                     out['acquisition_price'] = Fiat(ap, fx.ccy)
                     out['liquidation_price'] = Fiat(lp, fx.ccy)
@@ -1094,8 +1203,8 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                     out['BTC_fiat_price'] = Fiat(fx.historical_value(COIN, date), fx.ccy)
                 return out
 
-            summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins)
-            summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins)
+            summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins, holdings_cost.get('begin'))
+            summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins, holdings_cost.get('end'))
             flow = {
                 'BTC_incoming': Satoshis(income),
                 'BTC_outgoing': Satoshis(expenditures)
@@ -1135,7 +1244,10 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             amount_sat: int,
             fx: 'FxThread',
             tx_fee: Optional[int],
+            fifo: FifoPool = None,
     ) -> Dict[str, Any]:
+        """If fifo is given, the transaction is applied to it, and capital gains
+        use the 'fifo' method. Otherwise, they use the 'average' method."""
         item = {}
         fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
         fiat_default = fiat_value is None
@@ -1147,14 +1259,25 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         item['fiat_value'] = Fiat(fiat_value, fx.ccy)
         item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee is not None else None
         item['fiat_default'] = fiat_default
-        if amount_sat < 0:
+        if fifo is not None:
+            acquisition_price = fifo.apply(amount_sat, fiat_value)
+        elif amount_sat < 0:
             acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
+        else:
+            acquisition_price = None
+        if acquisition_price is not None:
             liquidation_price = - fiat_value
             item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
             cg = liquidation_price - acquisition_price
             item['capital_gain'] = Fiat(cg, fx.ccy)
         return item
 
+    def get_fifo_pool(self, fx: Optional['FxThread']) -> Optional[FifoPool]:
+        """Returns a new FifoPool if capital gains are computed with the 'fifo' method."""
+        if fx and fx.get_cost_basis_method() == 'fifo':
+            return FifoPool()
+        return None
+
     def get_label(self, key: str) -> str:
         # key is typically: address / txid / LN-payment-hash-hex
         return self._labels.get(key) or ''
@@ -1486,15 +1609,27 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         if value_sats >= threshold:
             return False
         # if funding tx has any is_mine input, then UTXO is fine
-        funding_tx = self.db.get_transaction(utxo.prevout.txid.hex())
-        if funding_tx is None:
-            # we should typically have the funding tx available;
-            # might not have it e.g. while not up_to_date
-            return True
-        if any(self.is_mine(self.get_txin_address(txin))
-               for txin in funding_tx.inputs()):
-            return False
-        return True
+        funding_txid = utxo.prevout.txid.hex()
+        has_mine_input = self._txs_with_mine_inputs.get(funding_txid)
+        if has_mine_input is None:
+            funding_tx = self.db.get_transaction(funding_txid)
+            if funding_tx is None:
+                # we should typically have the funding tx available;
+                # might not have it e.g. while not up_to_date
+                return True
+            # looking up the addresses of the inputs needs the parent txs:
+            # cache the result until the tx, its parents, or our addresses change
+            has_mine_input = any(self.is_mine(self.get_txin_address(txin))
+                                 for txin in funding_tx.inputs())
+            self._txs_with_mine_inputs[funding_txid] = has_mine_input
+        return not has_mine_input
+
+    def _invalidate_txs_with_mine_inputs(self, tx_hash: str) -> None:
+        """tx_hash was added or removed: forget it and its children."""
+        self._txs_with_mine_inputs.pop(tx_hash, None)
+        for prevout_n in self.db.get_spent_outpoints(tx_hash):
+            spender = self.db.get_spent_outpoint(tx_hash, prevout_n)
+            self._txs_with_mine_inputs.pop(spender, None)
 
     def set_frozen_state_of_addresses(self, addrs: Sequence[str], freeze: bool) -> bool:
         """Set frozen state of the addresses to FREEZE, True or False"""
@@ -2053,10 +2188,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     def get_unused_addresses(self) -> Sequence[str]:
         domain = self.get_receiving_addresses()
-        # TODO we should index receive_requests by id
-        in_use_by_request = [k for k in self.receive_requests.keys()
-                             if self.get_request_status(k) != PR_EXPIRED]
-        in_use_by_request = set(in_use_by_request)
+        in_use_by_request = self.request_index.get_keys(exclude=PR_EXPIRED)
         return [addr for addr in domain if not self.is_used(addr)
                 and addr not in in_use_by_request]
 
@@ -2158,9 +2290,11 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         return self.check_expired_status(invoice, status)
 
     def get_request_status(self, key):
-        r = self.get_request(key)
-        if r is None:
-            return PR_UNKNOWN
+        return self.request_index.get_status(key)
+
+    def compute_request_status(self, r: Invoice) -> int:
+        """Status of a request, not considering its expiry.
+        Use get_request_status instead, which is indexed."""
         if r.is_lightning():
             assert isinstance(r, LNInvoice)
             status = self.lnworker.get_payment_status(bfh(r.rhash)) if self.lnworker else PR_UNKNOWN
@@ -2173,7 +2307,11 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                 status = PR_UNCONFIRMED
             else:
                 status = PR_PAID
-        return self.check_expired_status(r, status)
+        return status
+
+    def invalidate_request_status(self, key: str) -> None:
+        """To be called when the status of a lightning request might have changed."""
+        self.request_index.mark_dirty([key])
 
     def get_request(self, key):
         return self.receive_requests.get(key)
@@ -2261,13 +2399,46 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     def add_verified_tx(self, tx_hash, info):
         super().add_verified_tx(tx_hash, info)
+        self.cost_basis.invalidate(tx_hash)  # timestamp changed
+        self.request_index.mark_dirty(self.db.get_txo_addresses(tx_hash))
         self._update_request_statuses_touched_by_tx(tx_hash)
 
     def undo_verifications(self, blockchain, above_height):
         reorged_txids = super().undo_verifications(blockchain, above_height)
         for txid in reorged_txids:
+            self.cost_basis.invalidate(txid)
+            self.request_index.mark_dirty(self.db.get_txo_addresses(txid))
             self._update_request_statuses_touched_by_tx(txid)
 
+    def add_unverified_or_unconfirmed_tx(self, tx_hash, tx_height):
+        super().add_unverified_or_unconfirmed_tx(tx_hash, tx_height)
+        self.request_index.mark_dirty(self.db.get_txo_addresses(tx_hash))
+
+    def receive_history_callback(self, addr, hist, tx_fees):
+        old_hist = self.get_address_history(addr)
+        super().receive_history_callback(addr, hist, tx_fees)
+        # transactions that were dropped from the history became local
+        self.request_index.mark_dirty([addr])
+        for tx_hash, height in old_hist:
+            self.request_index.mark_dirty(self.db.get_txo_addresses(tx_hash))
+
+    def remove_transaction(self, tx_hash):
+        # note: invalidate first, while the descendants can still be found
+        self.cost_basis.invalidate(tx_hash)
+        with self.transaction_lock:
+            txids = {tx_hash} | self.get_depending_transactions(tx_hash)
+            addrs = set()
+            for txid in txids:
+                addrs.update(self.db.get_txo_addresses(txid))
+        super().remove_transaction(tx_hash)
+        self.request_index.mark_dirty(addrs)
+        self._txs_with_mine_inputs.clear()
+
+    def add_address(self, address):
+        super().add_address(address)
+        # inputs spending from the address are now is_mine
+        self._txs_with_mine_inputs.clear()
+
     def _update_request_statuses_touched_by_tx(self, tx_hash: str) -> None:
         # FIXME in some cases if tx2 replaces unconfirmed tx1 in the mempool, we are not called.
         #       For a given receive request, if tx1 touches it but tx2 does not, then
@@ -2343,11 +2514,22 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         key = self.get_key_for_receive_request(req, sanity_checks=True)
         message = req.message
         self.receive_requests[key] = req
+        self.request_index.add(key, req)
         self.set_label(key, message)  # should be a default label
         if write_to_disk:
             self.save_db()
         return req
 
+    def add_payment_requests(self, reqs: Sequence[Invoice]) -> None:
+        """Adds many payment requests at once, with a single write to disk."""
+        keys = [self.get_key_for_receive_request(req, sanity_checks=True) for req in reqs]
+        with self.lock:
+            for key, req in zip(keys, reqs):
+                self.receive_requests[key] = req
+                self.request_index.add(key, req)
+                self.set_label(key, req.message)  # should be a default label
+        self.save_db()
+
     def delete_request(self, key):
         """ lightning or on-chain """
         if key in self.receive_requests:
@@ -2367,18 +2549,20 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         if addr in self.receive_requests:
             found = True
             self.receive_requests.pop(addr)
+            self.request_index.remove(addr)
             self.save_db()
         return found
 
-    def get_sorted_requests(self) -> List[Invoice]:
+    def get_sorted_requests(self, *, status: int = None) -> List[Invoice]:
         """ sorted by timestamp """
-        out = [self.get_request(x) for x in self.receive_requests.keys()]
+        keys = self.receive_requests.keys() if status is None else self.request_index.get_keys(status=status)
+        out = [self.get_request(x) for x in keys]
         out = [x for x in out if x is not None]
         out.sort(key=lambda x: x.time)
         return out
 
     def get_unpaid_requests(self):
-        out = [self.get_request(x) for x in self.receive_requests.keys() if self.get_request_status(x) != PR_PAID]
+        out = [self.get_request(x) for x in self.request_index.get_keys(exclude=PR_PAID)]
         out = [x for x in out if x is not None]
         out.sort(key=lambda x: x.time)
         return out
@@ -2489,43 +2673,17 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     def average_price(self, txid, price_func, ccy) -> Decimal:
         """ Average acquisition price of the inputs of a transaction """
-        input_value = 0
-        total_price = 0
-        txi_addresses = self.db.get_txi_addresses(txid)
-        if not txi_addresses:
-            return Decimal('NaN')
-        for addr in txi_addresses:
-            d = self.db.get_txi_addr(txid, addr)
-            for ser, v in d:
-                input_value += v
-                total_price += self.coin_price(ser.split(':')[0], price_func, ccy, v)
-        return total_price / (input_value/Decimal(COIN))
+        return self.cost_basis.average_price(txid, price_func, ccy)
 
     def clear_coin_price_cache(self):
-        self._coin_price_cache = {}
+        self.cost_basis.clear()
 
     def coin_price(self, txid, price_func, ccy, txin_value) -> Decimal:
         """
         Acquisition price of a coin.
         This assumes that either all inputs are mine, or no input is mine.
         """
-        if txin_value is None:
-            return Decimal('NaN')
-        cache_key = "{}:{}:{}".format(str(txid), str(ccy), str(txin_value))
-        result = self._coin_price_cache.get(cache_key, None)
-        if result is not None:
-            return result
-        if self.db.get_txi_addresses(txid):
-            result = self.average_price(txid, price_func, ccy) * txin_value/Decimal(COIN)
-            self._coin_price_cache[cache_key] = result
-            return result
-        else:
-            fiat_value = self.get_fiat_value(txid, ccy)
-            if fiat_value is not None:
-                return fiat_value
-            else:
-                p = self.price_at_timestamp(txid, price_func)
-                return p * txin_value/Decimal(COIN)
+        return self.cost_basis.coin_price(txid, price_func, ccy, txin_value)
 
     def is_billing_address(self, addr):
         # overridden for TrustedCoin wallets
@@ -2785,6 +2943,7 @@ class Imported_Wallet(Simple_Wallet):
         self.set_frozen_state_of_addresses([address], False)
         pubkey = self.get_public_key(address)
         self.db.remove_imported_address(address)
+        self._txs_with_mine_inputs.clear()
         if pubkey:
             # delete key iff no other address uses it (e.g. p2pkh and p2wpkh for same key)
             for txin_type in bitcoin.WIF_SCRIPT_TYPES.keys():